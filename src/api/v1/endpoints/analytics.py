@@ -1,11 +1,27 @@
 """analytics endpoints: GET /analytics/*."""
 
+import inspect
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from src.core.deps import get_db
-from src.schemas.analytics import FailureRateItem, KycFunnelResponse, MonthlyActiveMerchantsResponse, ProductAdoptionResponse, TopMerchantResponse
-from src.services.analytics import AnalyticsService
+from src.core.config import settings
+from src.core.deps import get_async_db, get_db
+from src.db.async_base import async_engine
+from src.db.base import SessionLocal, engine
+from src.schemas.analytics import CacheStatsResponse, FailureRateItem, FunnelStageItem, KycFunnelResponse, MerchantOverlapResponse, MonthlyActiveMerchantsResponse, PoolStatsResponse, ProductAdoptionResponse, SummaryResponse, TopMerchantResponse
+from src.services.analytics import AnalyticsService, AsyncAnalyticsService
+from src.services.bitmap_index import BitmapIndexLoader, MerchantBitmapIndex
+from src.services.cache import AsyncCachedAnalyticsService, CachedAnalyticsService, DataVersionTracker, ResultCache, Revalidator, SharedResultCache, default_shared_cache_dir
+from src.services.column_snapshot import ColumnSnapshotStore
+from src.services.columnar import ColumnarAnalyticsService, ColumnarStore
+from src.services.hyperloglog import HyperLogLog
+from src.services.single_flight import AsyncSingleFlight, SingleFlight
 
 
 # the logger inherits basicConfig set up in main.py.
@@ -16,17 +32,166 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 
-def get_analytics_service(db: Session = Depends(get_db)) -> AnalyticsService:
+APPROX_DESCRIPTION = (
+    "estimate the counts from the HyperLogLog sketches kept by the importer, in constant time: "
+    f"standard error {HyperLogLog().standard_error:.2%} (about 95% of counts within twice that)"
+)
 
-    return AnalyticsService(db)
+
+def _create_result_cache() -> ResultCache | SharedResultCache | None:
+    """the cache configured in settings: None when analytics_cache_ttl is 0."""
+
+    if settings.analytics_cache_ttl <= 0:
+        return None
+
+    if settings.analytics_cache_backend == "shared":
+        return SharedResultCache(
+            settings.analytics_cache_dir or default_shared_cache_dir(),
+            settings.analytics_cache_max_entries,
+            settings.analytics_cache_ttl,
+            settings.analytics_cache_max_bytes,
+        )
+
+    return ResultCache(settings.analytics_cache_max_entries, settings.analytics_cache_ttl)
+
+
+def _bitmap_index() -> MerchantBitmapIndex | None:
+    """the current merchant bitmap index when the "bitmaps" source is configured and the importer has written one."""
+
+    return bitmap_indexes.current() if bitmap_indexes is not None else None
+
+
+def _create_service(db: Session, version: int | None = None) -> AnalyticsService:
+    """the AnalyticsService for settings.analytics_source on db; version is the data version, if already read."""
+
+    if column_store is not None:
+        return ColumnarAnalyticsService(db, column_store, data_versions, version)
+
+    return AnalyticsService(db, source=settings.analytics_source, bitmaps=_bitmap_index())
+
+
+def _create_column_store() -> ColumnarStore | ColumnSnapshotStore | None:
+    if settings.analytics_source != "columnar":
+        return None
+
+    if settings.columnar_store == "snapshot":
+        return ColumnSnapshotStore(settings.columnar_snapshot_dir)
+    return ColumnarStore(engine)
+
+
+@contextmanager
+def _background_service() -> Iterator[AnalyticsService]:
+    """an AnalyticsService on a session of its own, for recomputations that outlive the request that started them."""
+
+    db = SessionLocal()
+    try:
+        yield _create_service(db)
+
+    finally:
+        db.close()
+
+
+# the merchant bitmap index file, memory-mapped once per worker and reopened when the importer replaces it.
+bitmap_indexes = BitmapIndexLoader(settings.bitmap_index_path) if settings.analytics_source == "bitmaps" else None
+# with the "columnar" source, the importer's memory-mapped column snapshots or this worker's own numpy copy of
+# merchant_activities (loaded by the warm-up or on first use).
+column_store = _create_column_store()
+# the result cache of this worker process, used by all of its requests.
+result_cache = _create_result_cache()
+data_versions = DataVersionTracker(engine, settings.analytics_cache_version_interval)
+# identical analytics calls running at the same time in this worker share one query (on the event loop, with the
+# async driver; the warm-up and background recomputations use the threads' one either way).
+flights = SingleFlight()
+async_flights = AsyncSingleFlight()
+# with stale-while-revalidate on, stale results are served while these threads recompute them.
+revalidator = (
+    Revalidator(
+        result_cache, _background_service, settings.analytics_cache_soft_ttl, settings.analytics_revalidate_workers
+    )
+    if settings.analytics_stale_while_revalidate and result_cache is not None else None
+)
+
+
+def precompute_results() -> None:
+    """run every analytics query once through this worker's cache, for the start-up warm-up (the kyc funnel stands in for get_funnel), and the dashboard summary."""
+
+    if column_store is not None:
+        column_store.refresh()
+
+    with _background_service() as service:
+        cached = CachedAnalyticsService(service, result_cache, data_versions, flights)
+        cached.get_top_merchant()
+        cached.get_monthly_active_merchants()
+        cached.get_product_adoption()
+        cached.get_kyc_funnel()
+        cached.get_failure_rates()
+        cached.get_summary()
+
+
+def get_result_cache() -> ResultCache | SharedResultCache | None:
+
+    return result_cache
+
+
+def get_revalidator() -> Revalidator | None:
+
+    return revalidator
+
+
+def _set_staleness_headers(response: Response) -> Callable[[float, bool], None]:
+
+    def set_staleness_headers(age: float, stale: bool) -> None:
+        # Age: seconds since the result was computed; X-Analytics-Stale: whether a newer one is being computed.
+        response.headers["Age"] = str(int(age))
+        response.headers["X-Analytics-Stale"] = "true" if stale else "false"
+
+    return set_staleness_headers
+
+
+def get_analytics_service(
+    response: Response,
+    db: Session = Depends(get_db),
+    cache: ResultCache | SharedResultCache | None = Depends(get_result_cache),
+    revalidator: Revalidator | None = Depends(get_revalidator),
+) -> AnalyticsService | CachedAnalyticsService:
+
+    # the session is only used by a call that runs a query; a cache hit or a coalesced call never checks out a connection.
+    service = _create_service(db)
+    return CachedAnalyticsService(service, cache, data_versions, flights, revalidator, _set_staleness_headers(response))
+
+
+async def get_async_analytics_service(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    cache: ResultCache | SharedResultCache | None = Depends(get_result_cache),
+    revalidator: Revalidator | None = Depends(get_revalidator),
+) -> AsyncCachedAnalyticsService:
+
+    # the columnar source compares its columns with the data version: have it read in a thread, not on the loop.
+    service = AsyncAnalyticsService(db, _create_service, data_versions.current if column_store is not None else None)
+    return AsyncCachedAnalyticsService(
+        service, cache, data_versions, async_flights, revalidator, _set_staleness_headers(response)
+    )
+
+
+# the service the analytics endpoints use, for settings.database_driver.
+analytics_service = get_async_analytics_service if settings.database_driver == "async" else get_analytics_service
+
+
+async def _call(method: Callable[..., Any], *args, **kwargs) -> Any:
+    """await an async service's method on the event loop; run a sync one's in the threadpool, as a sync endpoint would."""
+
+    if inspect.iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+    return await run_in_threadpool(method, *args, **kwargs)
 
 
 @router.get("/top-merchant", response_model=TopMerchantResponse)
-def top_merchant(service: AnalyticsService = Depends(get_analytics_service)):
+async def top_merchant(service: AnalyticsService = Depends(analytics_service)):
     """merchant with highest total successful transaction amount across all products."""
 
     try:
-        return service.get_top_merchant()
+        return await _call(service.get_top_merchant)
 
     except RuntimeError as e:
         # log full error details server-side for developer debugging — never exposed to client.
@@ -40,11 +205,14 @@ def top_merchant(service: AnalyticsService = Depends(get_analytics_service)):
 
 
 @router.get("/monthly-active-merchants", response_model=MonthlyActiveMerchantsResponse)
-def monthly_active_merchants(service: AnalyticsService = Depends(get_analytics_service)):
+async def monthly_active_merchants(
+    approx: bool = Query(False, description=APPROX_DESCRIPTION),
+    service: AnalyticsService = Depends(analytics_service),
+):
     """unique merchants with at least one successful event per month."""
 
     try:
-        return service.get_monthly_active_merchants()
+        return await _call(service.get_monthly_active_merchants, approx=approx)
 
     except RuntimeError as e:
         # log full error details server-side for developer debugging — never exposed to client.
@@ -58,11 +226,14 @@ def monthly_active_merchants(service: AnalyticsService = Depends(get_analytics_s
 
 
 @router.get("/product-adoption", response_model=ProductAdoptionResponse)
-def product_adoption(service: AnalyticsService = Depends(get_analytics_service)):
+async def product_adoption(
+    approx: bool = Query(False, description=APPROX_DESCRIPTION),
+    service: AnalyticsService = Depends(analytics_service),
+):
     """unique merchant count per product (sorted by count, highest first)."""
 
     try:
-        return service.get_product_adoption()
+        return await _call(service.get_product_adoption, approx=approx)
 
     except RuntimeError as e:
         # log full error details server-side for developer debugging — never exposed to client.
@@ -76,11 +247,11 @@ def product_adoption(service: AnalyticsService = Depends(get_analytics_service))
 
 
 @router.get("/kyc-funnel", response_model=KycFunnelResponse)
-def kyc_funnel(service: AnalyticsService = Depends(get_analytics_service)):
+async def kyc_funnel(service: AnalyticsService = Depends(analytics_service)):
     """kyc conversion funnel (unique merchants at each stage, successful events only)."""
 
     try:
-        return service.get_kyc_funnel()
+        return await _call(service.get_kyc_funnel)
 
     except RuntimeError as e:
         # log full error details server-side for developer debugging — never exposed to client.
@@ -93,12 +264,77 @@ def kyc_funnel(service: AnalyticsService = Depends(get_analytics_service)):
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
 
 
+def _parse_stages(values: list[str]) -> list[tuple[str, str]]:
+    """PRODUCT:EVENT_TYPE query values as (product, event_type) stages."""
+
+    stages = []
+    for value in values:
+        product, _, event_type = value.partition(":")
+        if not product or not event_type:
+            raise HTTPException(status_code=422, detail=f"Stage must be PRODUCT:EVENT_TYPE, got {value!r}.")
+        stages.append((product, event_type))
+    return stages
+
+
+@router.get("/funnel", response_model=list[FunnelStageItem])
+async def funnel(
+    stage: list[str] = Query(..., description="a funnel stage as PRODUCT:EVENT_TYPE; repeat it for every stage, in order"),
+    ordered: bool = Query(False, description="count a merchant at a stage only after the earlier stages, by event time"),
+    start: datetime | None = Query(None, description="only events at or after this time"),
+    end: datetime | None = Query(None, description="only events before this time"),
+    service: AnalyticsService = Depends(analytics_service),
+):
+    """funnel over any (product, event_type) stages: unique merchants per stage, successful events only."""
+
+    stages = _parse_stages(stage)
+    try:
+        return await _call(service.get_funnel, stages, ordered=ordered, start=start, end=end)
+
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    except RuntimeError as e:
+        # log full error details server-side for developer debugging — never exposed to client.
+        logger.error("Service error in funnel endpoint: %s", e)
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable. Please try again later.")
+
+    except Exception as e:
+        # log full traceback server-side for unknown errors — never exposed to client.
+        logger.error("Unexpected error in funnel endpoint: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+
+@router.get("/merchant-overlap", response_model=MerchantOverlapResponse)
+async def merchant_overlap(
+    stage: list[str] = Query(..., description="a stage as PRODUCT:EVENT_TYPE; repeat it for every stage a merchant must have reached"),
+    service: AnalyticsService = Depends(analytics_service),
+):
+    """unique merchants with successful events at every given stage, e.g. KYC:DOCUMENT_SUBMITTED and KYC:TIER_UPGRADE."""
+
+    stages = _parse_stages(stage)
+    try:
+        return await _call(service.get_merchant_overlap, stages)
+
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    except RuntimeError as e:
+        # log full error details server-side for developer debugging — never exposed to client.
+        logger.error("Service error in merchant_overlap endpoint: %s", e)
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable. Please try again later.")
+
+    except Exception as e:
+        # log full traceback server-side for unknown errors — never exposed to client.
+        logger.error("Unexpected error in merchant_overlap endpoint: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+
 @router.get("/failure-rates", response_model=list[FailureRateItem])
-def failure_rates(service: AnalyticsService = Depends(get_analytics_service)):
+async def failure_rates(service: AnalyticsService = Depends(analytics_service)):
     """failure rate per product; exclude PENDING; sort by rate descending."""
 
     try:
-        return service.get_failure_rates()
+        return await _call(service.get_failure_rates)
 
     except RuntimeError as e:
         # log full error details server-side for developer debugging — never exposed to client.
@@ -108,4 +344,61 @@ def failure_rates(service: AnalyticsService = Depends(get_analytics_service)):
     except Exception as e:
         # log full traceback server-side for unknown errors — never exposed to client.
         logger.error("Unexpected error in failure_rates endpoint: %s", e, exc_info=True)
-        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+
+@router.get("/summary", response_model=SummaryResponse)
+async def summary(service: AnalyticsService = Depends(analytics_service)):
+    """top merchant, monthly active merchants, product adoption, kyc funnel and failure rates in one response."""
+
+    try:
+        return await _call(service.get_summary)
+
+    except RuntimeError as e:
+        # log full error details server-side for developer debugging — never exposed to client.
+        logger.error("Service error in summary endpoint: %s", e)
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable. Please try again later.")
+
+    except Exception as e:
+        # log full traceback server-side for unknown errors — never exposed to client.
+        logger.error("Unexpected error in summary endpoint: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+
+@router.get("/cache-stats", response_model=CacheStatsResponse)
+def cache_stats(
+    cache: ResultCache | SharedResultCache | None = Depends(get_result_cache),
+    revalidator: Revalidator | None = Depends(get_revalidator),
+):
+    """hit/miss counters of this worker's result cache, how many calls it coalesced and recomputed in the background, and the data version it serves."""
+
+    single_flight = (async_flights if settings.database_driver == "async" else flights).stats()
+    if cache is None:
+        return {
+            "enabled": False, "backend": None, "hits": 0, "misses": 0, "evictions": 0, "entries": 0,
+            "max_entries": 0, "ttl_seconds": 0.0, "size_bytes": None, "data_version": data_versions.current(),
+            "single_flight": single_flight, "revalidation": None,
+        }
+
+    return {
+        "enabled": True, **cache.stats(), "data_version": data_versions.current(), "single_flight": single_flight,
+        "revalidation": revalidator.stats() if revalidator is not None else None,
+    }
+
+
+def _pool_stats(pool) -> dict:
+    return {**pool.status_counts(), **pool.metrics.stats()}
+
+
+@router.get("/pool-stats", response_model=PoolStatsResponse)
+def pool_stats():
+    """connections checked out, idle and in overflow in this worker's database pools, how long checkouts waited for one, and how many timed out."""
+
+    return {
+        "driver": settings.database_driver,
+        "timeout_seconds": settings.db_pool_timeout,
+        "recycle_seconds": settings.db_pool_recycle,
+        "pre_ping": settings.db_pool_pre_ping,
+        "sync_pool": _pool_stats(engine.pool),
+        "async_pool": _pool_stats(async_engine.sync_engine.pool) if async_engine is not None else None,
+    }
\ No newline at end of file
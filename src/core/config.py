@@ -1,5 +1,6 @@
 """application configuration loaded from environment."""
 from pathlib import Path
+from typing import Literal
 from pydantic import ValidationError
 from pydantic_settings import BaseSettings
 
@@ -15,6 +16,61 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8080
 
+    # how the analytics endpoints reach the database: "sync" runs each request's queries in a worker thread on the
+    # psycopg2 engine; "async" awaits them on the event loop through an asyncpg engine (needs asyncpg), so a worker
+    # serves many concurrent requests without a thread each. the importer, warm-up and health check stay sync.
+    database_driver: Literal["sync", "async"] = "sync"
+
+    # connection pool of each engine, per worker process: db_pool_size connections kept open, up to db_max_overflow more
+    # opened under load, db_pool_timeout seconds a checkout waits for one before failing, and connections older than
+    # db_pool_recycle seconds replaced (-1: never). db_pool_pre_ping: "always" tests every connection on checkout (one
+    # round trip each), "idle" only those unused for more than db_pool_pre_ping_idle seconds, "never" none.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: Literal["always", "idle", "never"] = "always"
+    db_pool_pre_ping_idle: float = 30.0
+
+    # where AnalyticsService reads from: the raw merchant_activities table, the importer-maintained daily rollups,
+    # the materialized analytics views (live queries while the views are stale), the merchant bitmap index for
+    # distinct-merchant counts (live queries for the rest, and while the index lags behind the data), or numpy columns
+    # of merchant_activities held in each worker (live queries while they catch up with an import; needs numpy).
+    analytics_source: Literal["live", "rollup", "views", "bitmaps", "columnar"] = "live"
+
+    # the merchant bitmap index file: written by the importer, memory-mapped by the API (re-checked every second).
+    bitmap_index_path: Path = _PROJECT_ROOT / "data" / "merchant_bitmaps.idx"
+
+    # with the "columnar" source: "snapshot" memory-maps the versioned column files the importer writes under
+    # columnar_snapshot_dir (shared by every worker through the page cache, re-checked every second); "memory" has each
+    # worker load merchant_activities itself and read the new rows after every import.
+    columnar_store: Literal["snapshot", "memory"] = "snapshot"
+    columnar_snapshot_dir: Path = _PROJECT_ROOT / "data" / "columnar"
+
+    # per-process cache of analytics results: an entry lives at most analytics_cache_ttl seconds (0 turns the cache off)
+    # and is dropped once an import bumps the data version, which is re-read every analytics_cache_version_interval seconds.
+    analytics_cache_ttl: float = 300.0
+    analytics_cache_max_entries: int = 256
+    analytics_cache_version_interval: float = 1.0
+
+    # "memory" keeps the cache inside each worker; "shared" keeps one cache for every worker on the host, as files in
+    # analytics_cache_dir (default: under /dev/shm), bounded by analytics_cache_max_bytes as well as max_entries.
+    analytics_cache_backend: Literal["memory", "shared"] = "memory"
+    analytics_cache_dir: Path | None = None
+    analytics_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # stale-while-revalidate: keep serving a cached result computed at an older data version or more than
+    # analytics_cache_soft_ttl seconds ago while analytics_revalidate_workers background threads recompute it.
+    # analytics_cache_ttl stays the hard limit: past it a request recomputes synchronously.
+    analytics_stale_while_revalidate: bool = False
+    analytics_cache_soft_ttl: float = 30.0
+    analytics_revalidate_workers: int = 2
+
+    # warm-up when a worker starts: open analytics_warmup_connections pooled connections and precompute every analytics
+    # result; the health check answers 503 until it has finished.
+    analytics_warmup: bool = True
+    analytics_warmup_connections: int = 5
+
     model_config = {
         "env_file": _PROJECT_ROOT / ".env",
         "env_file_encoding": "utf-8",
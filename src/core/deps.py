@@ -1,6 +1,8 @@
 """shared dependencies for the API (the DB session)."""
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from src.db.async_base import AsyncSessionLocal
 from src.db.base import SessionLocal
 
 
@@ -17,3 +19,14 @@ def get_db() -> Generator[Session, None, None]:
     # ensure the session is closed after a request has been processsed, even if an error occurs.
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """yield an asyncpg database session (DATABASE_DRIVER=async); ensure it is closed after request."""
+
+    if AsyncSessionLocal is None:
+        raise RuntimeError("get_async_db requires DATABASE_DRIVER=async.")
+
+    # the session is closed when the block exits, even if an error occurs.
+    async with AsyncSessionLocal() as db:
+        yield db
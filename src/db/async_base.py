@@ -0,0 +1,39 @@
+"""async sqlalchemy engine and session factory on asyncpg, used by the analytics endpoints when DATABASE_DRIVER=async."""
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from src.core.config import settings
+from src.db.pool import pin_session_time_zone, ping_idle_connections, pool_options
+
+
+def async_database_url(database_url: str) -> URL:
+    """DATABASE_URL for the asyncpg driver: postgresql:// (or postgresql+<any driver>://) becomes postgresql+asyncpg://."""
+
+    url = make_url(database_url)
+    if url.get_backend_name() != "postgresql":
+        raise ValueError(f"DATABASE_DRIVER=async needs a postgresql DATABASE_URL, got {url.drivername}")
+    return url.set(drivername="postgresql+asyncpg")
+
+
+def create_async_db_engine(database_url: str) -> AsyncEngine:
+    try:
+        import asyncpg  # noqa: F401
+
+    except ImportError:
+        raise RuntimeError("DATABASE_DRIVER=async requires the 'asyncpg' package (pip install asyncpg).") from None
+
+    # the database was already checked reachable when src.db.base was imported; a check here would need an event loop.
+    engine = create_async_engine(async_database_url(database_url), echo=False, **pool_options(settings, asyncio=True))
+    pin_session_time_zone(engine.sync_engine)
+    if settings.db_pool_pre_ping == "idle":
+        ping_idle_connections(engine.sync_engine, settings.db_pool_pre_ping_idle)
+    return engine
+
+
+# with the sync driver nothing is created, so asyncpg need not be installed.
+async_engine = create_async_db_engine(settings.database_url) if settings.database_driver == "async" else None
+
+# create async session factory; expire_on_commit off, since results are read after the session is done with.
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    if async_engine is not None else None
+)
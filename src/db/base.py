@@ -4,14 +4,19 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.exc import OperationalError
 from src.core.config import settings
+from src.db.pool import pin_session_time_zone, ping_idle_connections, pool_options
 
 
 # create SQLAlchemy engine and session factory.
 engine = create_engine(
     settings.database_url,
-    pool_pre_ping=True,
     echo=False,
+    **pool_options(settings),
 )
+pin_session_time_zone(engine)
+
+if settings.db_pool_pre_ping == "idle":
+    ping_idle_connections(engine, settings.db_pool_pre_ping_idle)
 
 
 # verify the database is reachable at startup (check if it is alive).
@@ -0,0 +1,191 @@
+"""
+connection pool configuration and instrumentation: the pool settings as create_engine arguments, the "idle" pre-ping
+strategy, the UTC session time zone, and QueuePools that record how long each checkout waited and how many timed out.
+"""
+import threading
+import time
+from typing import TYPE_CHECKING
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+if TYPE_CHECKING:
+    from src.core.config import Settings
+
+
+# upper bounds (ms) of the checkout wait-time histogram buckets; a last, unbounded bucket follows.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_CHECKED_IN_AT = "checked_in_at"
+
+# the TimeZone of every session: date_trunc, ::date and naive timestamps are read in it, on the database and in python.
+SESSION_TIME_ZONE = "UTC"
+
+
+class PoolMetrics:
+    """
+    checkout counters of one pool: a histogram of the time spent getting a connection (waiting for one to be returned,
+    or opening a new one), checkouts that gave up after the pool timeout, and the pings of the "idle" pre-ping strategy.
+    safe to update from every thread that checks out a connection.
+    """
+
+    def __init__(self) -> None:
+        self.checkouts = self.timeouts = self.pings = self.ping_failures = 0
+        self.wait_seconds = self.max_wait_seconds = 0.0
+        self._buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._lock = threading.Lock()
+
+
+    def observe_wait(self, seconds: float) -> None:
+        bucket = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if seconds * 1000 <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self._buckets[bucket] += 1
+
+
+    def observe_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+
+    def observe_ping(self, ok: bool) -> None:
+        with self._lock:
+            self.pings += 1
+            self.ping_failures += not ok
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            # cumulative, as in a prometheus histogram: checkouts that waited at most le_ms (None: every checkout).
+            cumulative, buckets = 0, []
+            for bound, count in zip((*WAIT_BUCKETS_MS, None), self._buckets):
+                cumulative += count
+                buckets.append({"le_ms": bound, "count": cumulative})
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms": {
+                    "mean": self.wait_seconds * 1000 / self.checkouts if self.checkouts else 0.0,
+                    "max": self.max_wait_seconds * 1000,
+                    "buckets": buckets,
+                },
+                "pings": self.pings,
+                "ping_failures": self.ping_failures,
+            }
+
+
+class _InstrumentedPool:
+    """times every checkout of the QueuePool it is mixed into; the metrics outlive engine.dispose(), which recreates the pool."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+
+        except exc.TimeoutError:
+            self.metrics.observe_timeout()
+            raise
+
+        self.metrics.observe_wait(time.perf_counter() - started)
+        return record
+
+
+    def status_counts(self) -> dict:
+        """connections checked out now, idle in the pool, and opened beyond pool_size (the overflow)."""
+
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(0, self.overflow()),
+            "max_overflow": self._max_overflow,
+        }
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    """the sync engine's pool."""
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    """the asyncpg engine's pool (DATABASE_DRIVER=async)."""
+
+
+def pool_options(settings: "Settings", asyncio: bool = False) -> dict:
+    """create_engine (or create_async_engine) keyword arguments for the pool configured in settings."""
+
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if asyncio else InstrumentedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping == "always",
+    }
+
+
+def ping_idle_connections(engine: Engine, idle: float) -> None:
+    """
+    the "idle" pre-ping strategy: ping a connection on checkout only if it sat in the pool for more than `idle` seconds,
+    since a connection returned moments ago is all but certainly still alive. a connection that fails the ping is
+    discarded and the checkout retried with another (the pool tries three times), as pool_pre_ping does on every checkout.
+    """
+
+    @event.listens_for(engine, "checkin")
+    def checked_in(dbapi_connection, record) -> None:
+        record.info[_CHECKED_IN_AT] = time.monotonic()
+
+
+    @event.listens_for(engine, "checkout")
+    def checked_out(dbapi_connection, record, proxy) -> None:
+        checked_in_at = record.info.pop(_CHECKED_IN_AT, None)
+        if checked_in_at is None or time.monotonic() - checked_in_at <= idle:
+            return
+
+        metrics = getattr(engine.pool, "metrics", None)
+        try:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+
+        except Exception:
+            if metrics is not None:
+                metrics.observe_ping(False)
+            raise exc.DisconnectionError() from None
+
+        if metrics is not None:
+            metrics.observe_ping(True)
+
+
+def pin_session_time_zone(engine: Engine) -> None:
+    """
+    set TimeZone to SESSION_TIME_ZONE on every connection the engine opens, whatever the server (or PGTZ) defaults to,
+    so the months and days the queries bucket by, and the zone naive CSV timestamps are stored in, match the columnar
+    engine and the importer's sketches, which work in UTC. SET is used rather than a startup option, which PGTZ overrides.
+    """
+
+    @event.listens_for(engine, "connect")
+    def connected(dbapi_connection, record) -> None:
+        # in autocommit, so the pool's rollback on checkin does not undo it.
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"SET TIME ZONE '{SESSION_TIME_ZONE}'")
+        finally:
+            cursor.close()
+            dbapi_connection.autocommit = autocommit
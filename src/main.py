@@ -1,12 +1,17 @@
 """fastapi application entrypoint - Moniepoint Analytics API."""
+import asyncio
 import logging
 import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from src.api.v1.router import api_router
+from src.api.v1.endpoints.analytics import precompute_results, revalidator
+from src.core.config import settings
+from src.services.warmup import WarmUp
 from sqlalchemy import text              
 from sqlalchemy.exc import OperationalError  
 from src.db.base import engine       
+from src.db.async_base import async_engine
 
 
 # configure logging.
@@ -23,10 +28,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# warm-up of this worker, reported by the health check.
+warmup = WarmUp(
+    engine, settings.analytics_warmup_connections, precompute_results,
+    enabled=settings.analytics_warmup, async_engine=async_engine,
+)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # warm up in a thread so the health check can answer (503, warming up) in the meantime; the asyncpg connections
+    # (DATABASE_DRIVER=async) are opened on this event loop, the one that serves the requests.
+    warming = asyncio.create_task(asyncio.to_thread(warmup.run, asyncio.get_running_loop()))
+
     yield
 
+    if not warming.done():
+        logger.info("shutting down before warm-up finished.")
+
+    # drop queued background recomputations rather than holding up shutdown for them.
+    if revalidator is not None:
+        revalidator.shutdown()
+
+    # close the asyncpg connections (DATABASE_DRIVER=async) while the event loop still runs.
+    if async_engine is not None:
+        await async_engine.dispose()
+
 
 # initialize the fastapi application with metadata and lifespan handler.
 app = FastAPI(
@@ -65,10 +92,10 @@ async def log_requests(request: Request, call_next):
 app.include_router(api_router)
 
 
-# health check endpoint - verifies the API is running and the database is reachable.
+# health check endpoint - verifies the API is running, warmed up and the database is reachable.
 @app.get("/")
-def root():
-    """health check endpoint: verifies API is running and database is reachable."""
+def root(response: Response):
+    """health check endpoint: verifies API is running and database is reachable; 503 until warm-up has finished."""
 
     try:
         # attempt a lightweight DB ping to confirm the database is reachable.
@@ -81,8 +108,16 @@ def root():
         logger.error("health check failed: database is unreachable.")
         db_status = "unreachable"
 
+    # a load balancer routes traffic to this worker only once warm-up has finished.
+    if not warmup.ready:
+        response.status_code = 503
+        status = "warming up"
+    else:
+        status = "ok" if db_status == "ok" else "degraded"
+
     return {
         "service": "Moniepoint Analytics API",
-        "status": "ok" if db_status == "ok" else "degraded",
+        "status": status,
         "database": db_status,
+        "warmup": warmup.state,
     }
\ No newline at end of file
@@ -1,4 +1,10 @@
-"""SQLAlchemy ORM models."""
-from src.models.activity import Activity
-
-__all__ = ["Activity"]
+"""SQLAlchemy ORM models."""
+from src.models.activity import Activity
+from src.models.analytics_views import ViewRefresh
+from src.models.daily_rollup import DailyRollup
+from src.models.data_version import DataVersion
+from src.models.import_manifest import ImportManifest
+from src.models.merchant_bitmap_update import MerchantBitmapUpdate
+from src.models.merchant_sketch import MerchantSketch
+
+__all__ = ["Activity", "DailyRollup", "DataVersion", "ImportManifest", "MerchantBitmapUpdate", "MerchantSketch", "ViewRefresh"]
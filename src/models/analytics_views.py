@@ -0,0 +1,100 @@
+"""Materialized analytics views: one pre-computed result shape per analytics endpoint, refreshed by the importer."""
+from datetime import datetime
+from typing import NamedTuple
+from sqlalchemy import BigInteger, DateTime, Numeric, Select, String, and_, case, column, func, select, table
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import TableClause
+from src.db.base import Base
+from src.models.activity import Activity
+
+
+class MaterializedView(NamedTuple):
+    """a view's name and columns (for reading it), its defining query, and the unique key REFRESH ... CONCURRENTLY needs."""
+
+    table: TableClause
+    query: Select
+    key: tuple[str, ...]
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+
+_month = func.date_trunc("month", Activity.event_timestamp)
+_successful_kyc = and_(Activity.product == "KYC", Activity.status == "SUCCESS")
+
+
+MERCHANT_TOTALS = MaterializedView(
+    table("mv_merchant_totals", column("merchant_id", String), column("total", Numeric)),
+    select(Activity.merchant_id, func.sum(Activity.amount).label("total"))
+    .where(Activity.status == "SUCCESS")
+    .group_by(Activity.merchant_id),
+    ("merchant_id",),
+)
+
+MONTHLY_ACTIVE_MERCHANTS = MaterializedView(
+    table("mv_monthly_active_merchants", column("month", String), column("merchant_count", BigInteger)),
+    select(
+        func.to_char(_month, "YYYY-MM").label("month"),
+        func.count(func.distinct(Activity.merchant_id)).label("merchant_count"),
+    )
+    .where(and_(Activity.status == "SUCCESS", Activity.event_timestamp.isnot(None)))
+    .group_by(_month),
+    ("month",),
+)
+
+PRODUCT_ADOPTION = MaterializedView(
+    table("mv_product_adoption", column("product", String), column("merchant_count", BigInteger)),
+    select(Activity.product, func.count(func.distinct(Activity.merchant_id)).label("merchant_count"))
+    .group_by(Activity.product),
+    ("product",),
+)
+
+KYC_STAGE_COUNTS = MaterializedView(
+    table("mv_kyc_stage_counts", column("event_type", String), column("merchant_count", BigInteger)),
+    select(Activity.event_type, func.count(func.distinct(Activity.merchant_id)).label("merchant_count"))
+    .where(_successful_kyc)
+    .group_by(Activity.event_type),
+    ("event_type",),
+)
+
+PRODUCT_FAILURE_COUNTS = MaterializedView(
+    table(
+        "mv_product_failure_counts",
+        column("product", String),
+        column("failed", BigInteger),
+        column("succeeded", BigInteger),
+    ),
+    select(
+        Activity.product,
+        func.sum(case((Activity.status == "FAILED", 1), else_=0)).label("failed"),
+        func.sum(case((Activity.status == "SUCCESS", 1), else_=0)).label("succeeded"),
+    )
+    .where(Activity.status.in_(["SUCCESS", "FAILED"]))
+    .group_by(Activity.product),
+    ("product",),
+)
+
+# every view, in the order the importer creates and refreshes them.
+ANALYTICS_VIEWS = (
+    MERCHANT_TOTALS,
+    MONTHLY_ACTIVE_MERCHANTS,
+    PRODUCT_ADOPTION,
+    KYC_STAGE_COUNTS,
+    PRODUCT_FAILURE_COUNTS,
+)
+
+
+class ViewRefresh(Base):
+    """
+    freshness of one materialized view. every import bumps data_version before its rows commit, and a refresh
+    records the version it started from; while the two differ the view is stale and readers use live queries.
+    the importer tracks the rollups and the bitmap index here too, for imports under sources that skip their upkeep.
+    """
+
+    __tablename__ = "analytics_view_refreshes"
+
+    view_name: Mapped[str] = mapped_column(String(63), primary_key=True)
+    data_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    refreshed_version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    refreshed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,31 @@
+"""Daily rollup model: merchant activity pre-aggregated per day, merchant, product, event type and status."""
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import BigInteger, Date, Index, Numeric, String
+from sqlalchemy.orm import Mapped, mapped_column
+from src.db.base import Base
+
+
+# day value for events without a timestamp (they still count everywhere except monthly active merchants).
+NO_TIMESTAMP_DAY = "-infinity"
+
+
+class DailyRollup(Base):
+    """
+    event counts and amount sums for one (day, merchant, product, event_type, status) group.
+    maintained by the importer in the same statement that inserts the raw rows, so it always matches merchant_activities.
+    """
+
+    __tablename__ = "merchant_daily_rollups"
+    __table_args__ = (
+        # covers the per-product queries (adoption, KYC funnel) with index-only scans; the primary key leads with day.
+        Index("ix_merchant_daily_rollups_product", "product", "event_type", "status", "merchant_id"),
+    )
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # event_timestamp::date, or -infinity when it is NULL
+    merchant_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    product: Mapped[str] = mapped_column(String(64), primary_key=True)
+    event_type: Mapped[str] = mapped_column(String(64), primary_key=True)
+    status: Mapped[str] = mapped_column(String(32), primary_key=True)
+    event_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    amount_sum: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False, default=0)
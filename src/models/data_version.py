@@ -0,0 +1,22 @@
+"""Data version model: a counter the importer bumps whenever it commits new activity data."""
+from datetime import datetime
+from sqlalchemy import BigInteger, DateTime, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from src.db.base import Base
+
+
+# the table holds a single row with this id.
+DATA_VERSION_ID = 1
+
+
+class DataVersion(Base):
+    """
+    version of the data in merchant_activities, bumped after every committed file.
+    cached analytics results remember the version they were computed at and are not served once it moves on.
+    """
+
+    __tablename__ = "analytics_data_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, default=DATA_VERSION_ID)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
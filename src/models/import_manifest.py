@@ -0,0 +1,24 @@
+"""Import manifest model: one row per CSV file loaded by the importer."""
+from datetime import datetime
+from sqlalchemy import BigInteger, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+from src.db.base import Base
+
+
+class ImportManifest(Base):
+    """
+    what the importer last loaded from a file, so unchanged files can be skipped and appended ones resumed.
+    while a file is being imported the row doubles as its checkpoint (completed_at is NULL).
+    """
+
+    __tablename__ = "import_manifest"
+
+    file_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    file_mtime: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)  # sha256 of bytes [0, file_size)
+    byte_offset: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # end of the last committed batch
+    row_number: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # data rows read up to byte_offset
+    rows_processed: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    rows_skipped: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # NULL while in progress
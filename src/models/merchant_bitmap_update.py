@@ -0,0 +1,21 @@
+"""Merchant bitmap update model: (month, product, event_type, status, merchant) memberships not yet in the bitmap index."""
+from sqlalchemy import BigInteger, Identity, String
+from sqlalchemy.orm import Mapped, mapped_column
+from src.db.base import Base
+
+
+class MerchantBitmapUpdate(Base):
+    """
+    one merchant that gained a key of the merchant bitmap index (src/services/bitmap_index.py).
+    written by the importer in the same statement that inserts the raw rows; the index update applies and deletes them.
+    append-only (no unique key), so parallel import workers never wait on each other's rows; repeats are harmless.
+    """
+
+    __tablename__ = "merchant_bitmap_updates"
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    month: Mapped[str] = mapped_column(String(7), nullable=False)  # YYYY-MM, or "" when event_timestamp is NULL
+    product: Mapped[str] = mapped_column(String(64), nullable=False)
+    event_type: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(String(32), nullable=False)
+    merchant_id: Mapped[str] = mapped_column(String(32), nullable=False)
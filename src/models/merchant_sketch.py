@@ -0,0 +1,22 @@
+"""Merchant sketch model: a HyperLogLog sketch of the merchant_ids seen per month and per product."""
+from sqlalchemy import LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+from src.db.base import Base
+
+
+# the sketched dimensions: month (YYYY-MM, successful events with a timestamp, as monthly active merchants counts them)
+# and product (every event, as product adoption counts them).
+SKETCH_DIMENSIONS = ("month", "product")
+
+
+class MerchantSketch(Base):
+    """
+    HyperLogLog registers (src/services/hyperloglog.py) over the merchant_ids of one month or product.
+    merged by the importer in the same transaction that inserts the raw rows; a sketch is a fixed 16 KiB whatever it counts.
+    """
+
+    __tablename__ = "merchant_sketches"
+
+    dimension: Mapped[str] = mapped_column(String(16), primary_key=True)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    registers: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
@@ -36,3 +36,112 @@ class FailureRateItem(BaseModel):
 
     product: str
     failure_rate: float
+
+
+class SummaryResponse(BaseModel):
+    """every dashboard result in one response: each field is the response of its own endpoint."""
+
+    top_merchant: TopMerchantResponse
+    monthly_active_merchants: MonthlyActiveMerchantsResponse
+    product_adoption: ProductAdoptionResponse
+    kyc_funnel: KycFunnelResponse
+    failure_rates: list[FailureRateItem]
+
+
+class FunnelStageItem(BaseModel):
+    """one stage of a funnel: unique merchants that reached it, and the share of the previous stage's merchants."""
+
+    product: str
+    event_type: str
+    merchants: int
+    conversion_rate: float
+
+
+class OverlapStageItem(BaseModel):
+    """one stage of a merchant overlap."""
+
+    product: str
+    event_type: str
+
+
+class MerchantOverlapResponse(BaseModel):
+    """unique merchants that reached every one of the stages (successful events only)."""
+
+    stages: list[OverlapStageItem]
+    merchants: int
+
+
+class SingleFlightStatsResponse(BaseModel):
+    """calls that ran a query, calls that waited for an identical one instead, and calls running now."""
+
+    calls: int
+    coalesced: int
+    failures: int
+    in_flight: int
+
+
+class RevalidationStatsResponse(BaseModel):
+    """stale-while-revalidate: the soft ttl, background recomputations finished and failed, and those queued or running."""
+
+    soft_ttl_seconds: float
+    refreshes: int
+    failures: int
+    pending: int
+
+
+class CacheStatsResponse(BaseModel):
+    """counters of this worker's analytics result cache (entries and size_bytes cover every worker for "shared")."""
+
+    enabled: bool
+    backend: str | None
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    size_bytes: int | None
+    data_version: int
+    single_flight: SingleFlightStatsResponse
+    revalidation: RevalidationStatsResponse | None
+
+
+class PoolWaitBucket(BaseModel):
+    """checkouts that waited at most le_ms for a connection (le_ms None: every checkout)."""
+
+    le_ms: float | None
+    count: int
+
+
+class PoolWaitResponse(BaseModel):
+    """time checkouts spent getting a connection: mean, max and a cumulative histogram, in milliseconds."""
+
+    mean: float
+    max: float
+    buckets: list[PoolWaitBucket]
+
+
+class PoolResponse(BaseModel):
+    """one connection pool: connections checked out, idle and opened beyond size now, and its checkout counters."""
+
+    size: int
+    checked_out: int
+    idle: int
+    overflow: int
+    max_overflow: int
+    checkouts: int
+    timeouts: int
+    wait_ms: PoolWaitResponse
+    pings: int
+    ping_failures: int
+
+
+class PoolStatsResponse(BaseModel):
+    """this worker's database connection pools and their settings (async_pool only with the async driver)."""
+
+    driver: str
+    timeout_seconds: float
+    recycle_seconds: int
+    pre_ping: str
+    sync_pool: PoolResponse
+    async_pool: PoolResponse | None
@@ -0,0 +1,107 @@
+"""
+benchmark a dashboard load against a running API: the five analytics endpoints called one after another, the five
+called at the same time (as a browser does), and the one /analytics/summary call.
+run from project root: python -m src.scripts.benchmark_summary [--url URL] [--loads N] [--clients N]
+start the API with ANALYTICS_CACHE_TTL=0 to compare the queries; with the cache on, both mostly measure cache hits.
+"""
+import argparse
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+# the endpoints a dashboard load calls separately.
+DASHBOARD_ENDPOINTS = (
+    "/analytics/top-merchant",
+    "/analytics/monthly-active-merchants",
+    "/analytics/product-adoption",
+    "/analytics/kyc-funnel",
+    "/analytics/failure-rates",
+)
+
+SUMMARY_ENDPOINT = "/analytics/summary"
+
+
+def _get(client: httpx.Client, path: str) -> None:
+    client.get(path).raise_for_status()
+
+
+def separate_sequential(client: httpx.Client, pool: ThreadPoolExecutor) -> None:
+    for path in DASHBOARD_ENDPOINTS:
+        _get(client, path)
+
+
+def separate_concurrent(client: httpx.Client, pool: ThreadPoolExecutor) -> None:
+    for future in [pool.submit(_get, client, path) for path in DASHBOARD_ENDPOINTS]:
+        future.result()
+
+
+def summary(client: httpx.Client, pool: ThreadPoolExecutor) -> None:
+    _get(client, SUMMARY_ENDPOINT)
+
+
+SCENARIOS: dict[str, Callable[[httpx.Client, ThreadPoolExecutor], None]] = {
+    "5 calls, sequential": separate_sequential,
+    "5 calls, concurrent": separate_concurrent,
+    "1 summary call": summary,
+}
+
+
+def run_scenario(url: str, load: Callable, loads: int, clients: int, warmup: int = 2) -> dict:
+    """time `loads` dashboard loads spread over `clients` concurrent clients; returns latency percentiles in ms."""
+
+    limits = httpx.Limits(max_connections=clients * len(DASHBOARD_ENDPOINTS))
+    with httpx.Client(base_url=url, limits=limits, timeout=60.0) as client, \
+            ThreadPoolExecutor(clients * len(DASHBOARD_ENDPOINTS)) as pool, ThreadPoolExecutor(clients) as loaders:
+        for _ in range(warmup):
+            load(client, pool)
+
+        def timed() -> float:
+            started = time.perf_counter()
+            load(client, pool)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = sorted(future.result() * 1000 for future in [loaders.submit(timed) for _ in range(loads)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "loads_per_second": loads / elapsed,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="compare five analytics calls with one /analytics/summary call.")
+    parser.add_argument("--url", default="http://localhost:8080", help="base URL of the running API")
+    parser.add_argument("--loads", type=int, default=50, help="dashboard loads per scenario")
+    parser.add_argument("--clients", type=int, default=1, help="dashboard loads running at the same time")
+    args = parser.parse_args(argv)
+    if args.loads < 1 or args.clients < 1:
+        parser.error("--loads and --clients must be at least 1")
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    print(f"{args.loads} dashboard loads per scenario, {args.clients} at a time, against {args.url}")
+    print(f"{'scenario':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'loads/s':>10}")
+    try:
+        for name, load in SCENARIOS.items():
+            result = run_scenario(args.url, load, args.loads, args.clients)
+            print(
+                f"{name:<22}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}"
+                f"{result['p95_ms']:>10.1f}{result['loads_per_second']:>10.1f}"
+            )
+
+    except httpx.HTTPError as e:
+        print(f"Benchmark failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
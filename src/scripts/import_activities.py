@@ -1,167 +1,1972 @@
-"""
-import CSV activity files into PostgreSQL.
-handles malformed rows by skipping them and continuing.
-run from project root: python -m src.scripts.import_activities
-"""
-import csv
-import re
-import sys
-from decimal import Decimal, InvalidOperation
-from pathlib import Path
-from uuid import UUID
-from sqlalchemy.dialects.postgresql import insert as pg_insert
-from sqlalchemy.orm import Session
-from src.core.config import settings
-from src.db.base import Base, SessionLocal, engine
-from src.models import Activity
-
-# extract the pattern to match files like activities_20240101.csv, activities_20240102.csv and so on.
-CSV_PATTERN = re.compile(r"activities_(\d{8})\.csv")
-
-
-def parse_timestamp(value: str) -> str | None:
-    if not value or not value.strip():
-        return None
-    return value.strip()
-
-
-def parse_amount(value: str) -> Decimal | None:
-    if value is None or (isinstance(value, str) and not value.strip()):
-        return Decimal("0")
-    
-    try:
-        return Decimal(str(value).strip()).quantize(Decimal("0.01"))
-    
-    except (InvalidOperation, ValueError):
-        return None
-
-
-def parse_uuid(value: str) -> UUID | None:
-    if not value or not str(value).strip():
-        return None
-    try:
-        return UUID(str(value).strip())
-    except (ValueError, TypeError):
-        return None
-
-
-def row_to_activity(row: dict) -> dict | None:
-
-    event_id = parse_uuid(row.get("event_id", ""))
-    if event_id is None:
-        return None
-    
-    merchant_id = (row.get("merchant_id") or "").strip()
-    if not merchant_id:
-        return None
-    
-    product = (row.get("product") or "").strip()
-    if not product:
-        return None
-    
-    event_type = (row.get("event_type") or "").strip()
-    if not event_type:
-        return None
-    
-    status = (row.get("status") or "").strip()
-    if not status:
-        return None
-    
-    amount = parse_amount(row.get("amount", "0"))
-    if amount is None:
-        return None
-
-    ts_raw = parse_timestamp(row.get("event_timestamp", ""))
-    event_timestamp = None
-    if ts_raw:
-        try:
-            from datetime import datetime
-            event_timestamp = datetime.fromisoformat(ts_raw.replace("Z", "+00:00"))
-        except Exception:
-            pass
-
-    return {
-        "event_id": event_id,
-        "merchant_id": merchant_id,
-        "event_timestamp": event_timestamp,
-        "product": product,
-        "event_type": event_type,
-        "amount": amount,
-        "status": status,
-        "channel": (row.get("channel") or "").strip() or None,
-        "region": (row.get("region") or "").strip() or None,
-        "merchant_tier": (row.get("merchant_tier") or "").strip() or None,
-    }
-
-
-def import_csv_file(path: Path, db: Session) -> tuple[int, int]:
-    """import one CSV. uses ON CONFLICT DO NOTHING so re-runs skip existing event_ids."""
-    processed = 0
-    skipped = 0
-    batch = []
-    batch_size = 5000
-
-    with open(path, newline="", encoding="utf-8", errors="replace") as file_object:
-        reader = csv.DictReader(file_object)
-
-        if reader.fieldnames is None:
-            return 0, 0
-        for row in reader:
-            record = row_to_activity(row)
-            if record is None:
-                skipped += 1
-                continue
-            batch.append(record)
-
-            if len(batch) >= batch_size:
-                stmt = pg_insert(Activity).values(batch).on_conflict_do_nothing(
-                    index_elements=["event_id"]
-                )
-                db.execute(stmt)
-                db.commit()
-                processed += len(batch)
-                batch = []
-        if batch:
-            stmt = pg_insert(Activity).values(batch).on_conflict_do_nothing(
-                index_elements=["event_id"]
-            )
-            db.execute(stmt)
-            db.commit()
-            processed += len(batch)
-    return processed, skipped
-
-
-def run_import(data_dir: Path | None = None) -> None:
-
-    data_dir = data_dir or settings.data_dir
-    if not data_dir.is_dir():
-        print(f"Data directory not found: {data_dir}", file=sys.stderr)
-        sys.exit(1)
-
-    Base.metadata.create_all(bind=engine)
-    csv_files = sorted(
-        p for p in data_dir.iterdir()
-        if p.is_file() and CSV_PATTERN.match(p.name)
-    )
-    if not csv_files:
-        print(f"No activities_YYYYMMDD.csv files in {data_dir}", file=sys.stderr)
-        sys.exit(1)
-
-    total_processed = 0
-    total_skipped = 0
-    db = SessionLocal()
-
-    try:
-        for path in csv_files:
-            processed, skipped = import_csv_file(path, db)
-            total_processed += processed
-            total_skipped += skipped
-            print(f"  {path.name}: {processed} rows processed, {skipped} skipped (malformed)")
-        print(f"Done. Total processed: {total_processed}, total skipped (malformed): {total_skipped}")
-
-    finally:
-        db.close()
-
-
-if __name__ == "__main__":
-    run_import()
+"""
+import CSV activity files into PostgreSQL.
+handles malformed rows by skipping them and continuing.
+run from project root: python -m src.scripts.import_activities [--mode insert|copy] [--workers N] [--queue-depth N] [--force] [--bulk]
+merchant_daily_rollups are kept in step with every insert when ANALYTICS_SOURCE reads them, and the merchant_sketches
+with every file; recompute both with --rebuild-rollups.
+the materialized analytics views are refreshed (concurrently, readers are not blocked) and the merchant bitmap index
+updated with the new rows at the end of every run that read any, as is the columnar snapshot when the API reads one.
+add --profile for per-phase timings and throughput, and --report FILE to write them as JSON.
+keep ingesting new and growing files as they land: python -m src.scripts.import_activities --watch [--interval SECONDS]
+sources may also be given explicitly (plain, .csv.gz or .csv.zst files, or - for stdin):
+    zcat activities_20240101.csv.gz | python -m src.scripts.import_activities -
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import queue
+import re
+import struct
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+from uuid import UUID
+from sqlalchemy import Date, bindparam, cast, column, create_engine, case, delete, func, inspect, literal, literal_column, select, table, text, tuple_, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+from src.core.config import settings
+from src.db.base import Base, SessionLocal, engine
+from src.db.pool import pin_session_time_zone, ping_idle_connections, pool_options
+from src.models import Activity, DailyRollup, DataVersion, ImportManifest, MerchantBitmapUpdate, MerchantSketch, ViewRefresh
+from src.models.analytics_views import ANALYTICS_VIEWS
+from src.models.daily_rollup import NO_TIMESTAMP_DAY
+from src.models.data_version import DATA_VERSION_ID
+from src.scripts.import_metrics import ImportMetrics, format_report
+from src.scripts.sources import STDIN, compression_of, open_source, skip_to
+from src.services.bitmap_index import BitmapIndexBuilder, MerchantBitmapIndex
+from src.services.column_snapshot import current_snapshot, open_snapshot, write_snapshot
+from src.services.columnar import load_columns
+from src.services.hyperloglog import DEFAULT_PRECISION, HyperLogLog
+
+# extract the pattern to match files like activities_20240101.csv, activities_20240102.csv.gz and so on.
+CSV_PATTERN = re.compile(r"activities_(\d{8})\.csv(\.gz|\.zst)?$")
+
+# number of CSV rows validated together and sent to the database per round trip.
+BATCH_SIZE = 5000
+
+# import paths selectable from the command line: batched INSERT statements or COPY via a staging table.
+IMPORT_MODES = ("insert", "copy")
+
+# unlogged staging table used by the COPY path (no WAL, no indexes, so COPY is cheap).
+STAGING_TABLE = "merchant_activities_staging"
+
+# columns streamed through COPY, in the order they are written to the staging table.
+COPY_COLUMNS = (
+    "event_id",
+    "merchant_id",
+    "event_timestamp",
+    "product",
+    "event_type",
+    "amount",
+    "status",
+    "channel",
+    "region",
+    "merchant_tier",
+)
+
+
+def parse_timestamp(value: str) -> str | None:
+    if not value or not value.strip():
+        return None
+    return value.strip()
+
+
+def parse_amount(value: str) -> Decimal | None:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return Decimal("0")
+    
+    try:
+        return Decimal(str(value).strip()).quantize(Decimal("0.01"))
+    
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def parse_uuid(value: str) -> UUID | None:
+    if not value or not str(value).strip():
+        return None
+    try:
+        return UUID(str(value).strip())
+    except (ValueError, TypeError):
+        return None
+
+
+def row_to_activity(row: dict) -> dict | None:
+
+    event_id = parse_uuid(row.get("event_id", ""))
+    if event_id is None:
+        return None
+    
+    merchant_id = (row.get("merchant_id") or "").strip()
+    if not merchant_id:
+        return None
+    
+    product = (row.get("product") or "").strip()
+    if not product:
+        return None
+    
+    event_type = (row.get("event_type") or "").strip()
+    if not event_type:
+        return None
+    
+    status = (row.get("status") or "").strip()
+    if not status:
+        return None
+    
+    amount = parse_amount(row.get("amount", "0"))
+    if amount is None:
+        return None
+
+    ts_raw = parse_timestamp(row.get("event_timestamp", ""))
+    event_timestamp = None
+    if ts_raw:
+        try:
+            event_timestamp = datetime.fromisoformat(ts_raw.replace("Z", "+00:00"))
+        except Exception:
+            pass
+
+    return {
+        "event_id": event_id,
+        "merchant_id": merchant_id,
+        "event_timestamp": event_timestamp,
+        "product": product,
+        "event_type": event_type,
+        "amount": amount,
+        "status": status,
+        "channel": (row.get("channel") or "").strip() or None,
+        "region": (row.get("region") or "").strip() or None,
+        "merchant_tier": (row.get("merchant_tier") or "").strip() or None,
+    }
+
+
+# shared constants for validate_batch (parse_amount rebuilds them on every call).
+_CENTS = Decimal("0.01")
+_ZERO = Decimal("0")
+
+# index used for columns missing from the header; always past the end of the row, so the field reads as absent.
+_ABSENT = sys.maxsize
+
+
+@lru_cache(maxsize=65536)
+def _amount_from_text(value: str) -> Decimal | None:
+    """parse_amount for a stripped, non-blank string. cached: amounts repeat heavily, and Decimal is immutable."""
+    try:
+        return Decimal(value).quantize(_CENTS)
+
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def validate_batch(rows: list[list[str]], header: list[str]) -> tuple[tuple[list, ...], bytearray]:
+    """
+    validate a chunk of raw csv.reader rows in one pass, without building a dict per row.
+    returns one list per COPY_COLUMNS entry (accepted rows only, in input order) and a mask with 1 for each rejected row.
+    accept/reject decisions and values are the same as row_to_activity on the equivalent csv.DictReader rows.
+    """
+
+    # later duplicates win, as they do in csv.DictReader.
+    position = {name: index for index, name in enumerate(header)}
+    i_event_id, i_merchant_id, i_timestamp, i_product, i_event_type, i_amount, i_status, i_channel, i_region, i_tier = (
+        position.get(column, _ABSENT) for column in COPY_COLUMNS
+    )
+
+    # row_to_activity reads a missing amount column as "0" but a short row's amount as None (both mean zero).
+    amount_default = None if "amount" in position else "0"
+
+    columns = tuple([] for _ in COPY_COLUMNS)
+    event_ids, merchant_ids, timestamps, products, event_types, amounts, statuses, channels, regions, tiers = columns
+    rejected = bytearray(len(rows))
+
+    for r, row in enumerate(rows):
+        n = len(row)
+
+        # event_id: same rules as parse_uuid.
+        value = row[i_event_id] if i_event_id < n else None
+        event_id = None
+        if value:
+            value = value.strip()
+            if value:
+                try:
+                    event_id = UUID(value)
+                except (ValueError, TypeError):
+                    pass
+        if event_id is None:
+            rejected[r] = 1
+            continue
+
+        merchant_id = ((row[i_merchant_id] if i_merchant_id < n else None) or "").strip()
+        product = ((row[i_product] if i_product < n else None) or "").strip()
+        event_type = ((row[i_event_type] if i_event_type < n else None) or "").strip()
+        status = ((row[i_status] if i_status < n else None) or "").strip()
+        if not (merchant_id and product and event_type and status):
+            rejected[r] = 1
+            continue
+
+        # amount: same rules as parse_amount (blank or absent is zero, unparseable rejects the row).
+        value = row[i_amount] if i_amount < n else amount_default
+        if value is None:
+            amount = _ZERO
+        else:
+            value = value.strip()
+            amount = _amount_from_text(value) if value else _ZERO
+            if amount is None:
+                rejected[r] = 1
+                continue
+
+        # event_timestamp: an unparseable value is stored as NULL, the row is still accepted.
+        value = row[i_timestamp] if i_timestamp < n else None
+        event_timestamp = None
+        if value:
+            value = value.strip()
+            if value:
+                try:
+                    event_timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                except Exception:
+                    pass
+
+        event_ids.append(event_id)
+        merchant_ids.append(merchant_id)
+        timestamps.append(event_timestamp)
+        products.append(product)
+        event_types.append(event_type)
+        amounts.append(amount)
+        statuses.append(status)
+        channels.append(((row[i_channel] if i_channel < n else None) or "").strip() or None)
+        regions.append(((row[i_region] if i_region < n else None) or "").strip() or None)
+        tiers.append(((row[i_tier] if i_tier < n else None) or "").strip() or None)
+
+    return columns, rejected
+
+
+class Batch(NamedTuple):
+    """validated rows from one chunk of raw CSV rows, plus where that chunk ends in the file."""
+
+    rows: list[tuple]
+    end_offset: int  # byte offset just past the last CSV row of the chunk
+    rows_read: int  # raw data rows in the chunk (accepted + rejected)
+    skipped: int  # rejected rows in the chunk
+    columns: tuple[list, ...] | None = None  # the same rows as one list per COPY_COLUMNS entry, as validated
+
+
+def _decoded_lines(file_object, end_offset: int | None, position: list[int]) -> Iterator[str]:
+    """
+    decode a binary stream line by line, stopping at end_offset (the size the file had when it was planned).
+    position[0] is the stream offset to start counting from and always holds the offset just past the last line handed out.
+    """
+
+    for line in file_object:
+        if end_offset is not None and position[0] + len(line) > end_offset:
+            line = line[:end_offset - position[0]]
+        position[0] += len(line)
+        if line:
+            yield line.decode("utf-8", errors="replace")
+        if end_offset is not None and position[0] >= end_offset:
+            return
+
+
+def _read_batches(
+    path: Path,
+    counts: dict,
+    start_offset: int = 0,
+    end_offset: int | None = None,
+    decompress_thread: bool = False,
+    metrics: ImportMetrics | None = None,
+) -> Iterator[Batch]:
+    """
+    parse one CSV source into a Batch per BATCH_SIZE raw rows; counts["skipped"] tracks bad rows.
+    start_offset/end_offset restrict parsing to a byte range of the data (the header is always read from the top).
+    for compressed sources offsets count decompressed bytes.
+    """
+    chunk = []
+    batch_size = BATCH_SIZE
+    position = [0]
+    passed_over = 0
+    metrics = metrics if metrics is not None else ImportMetrics()
+
+    with open_source(path, decompress_thread) as file_object:
+        try:
+            with metrics.phase("parse"):
+                header = next(csv.reader(_decoded_lines(file_object, end_offset, position)), None)
+                if header is None:
+                    return
+
+                # resume mid-file: jump (or, in a compressed stream, read) to the first byte not imported yet.
+                if start_offset > position[0]:
+                    skip_to(file_object, position[0], start_offset)
+                    passed_over = start_offset - position[0]
+                    position[0] = start_offset
+
+            # csv.reader pulls lines lazily, so after each row position[0] is exactly where that row ends.
+            reader = csv.reader(_decoded_lines(file_object, end_offset, position))
+
+            # parse time is taken per chunk and stops at each yield, so the consumer's time is not counted.
+            parse_started = time.perf_counter()
+            for row in reader:
+                # blank lines are not rows (csv.DictReader skips them too).
+                if not row:
+                    continue
+                chunk.append(row)
+
+                if len(chunk) >= batch_size:
+                    metrics.add("parse", time.perf_counter() - parse_started)
+                    yield _validated_batch(chunk, header, counts, position[0], metrics)
+                    chunk = []
+                    parse_started = time.perf_counter()
+            metrics.add("parse", time.perf_counter() - parse_started)
+            if chunk:
+                yield _validated_batch(chunk, header, counts, position[0], metrics)
+
+        finally:
+            metrics.record_bytes(position[0] - passed_over)
+
+
+def _validated_batch(
+    chunk: list[list[str]],
+    header: list[str],
+    counts: dict,
+    end_offset: int,
+    metrics: ImportMetrics,
+) -> Batch:
+    """validate one raw chunk; accepted rows become tuples in COPY_COLUMNS order."""
+
+    with metrics.phase("validate"):
+        columns, rejected = validate_batch(chunk, header)
+        skipped = rejected.count(1)
+        counts["skipped"] += skipped
+        return Batch(list(zip(*columns)), end_offset, len(chunk), skipped, columns)
+
+
+# grouping columns of merchant_daily_rollups, in primary key order.
+ROLLUP_KEYS = ("day", "merchant_id", "product", "event_type", "status")
+
+
+def _rollup_groups(source) -> tuple:
+    """the rollup key expressions over a selectable with merchant_activities' columns."""
+
+    day = func.coalesce(cast(source.c.event_timestamp, Date), literal_column(f"'{NO_TIMESTAMP_DAY}'::date"))
+    return day, source.c.merchant_id, source.c.product, source.c.event_type, source.c.status
+
+
+def _rollup_upsert(groups: tuple, source):
+    """INSERT ... ON CONFLICT DO UPDATE adding the counts and amount sums of `source` to merchant_daily_rollups."""
+
+    # sorted groups make concurrent workers lock rollup rows in the same order, so they cannot deadlock.
+    grouped = (
+        select(*groups, func.count(), func.sum(source.c.amount))
+        .group_by(*groups)
+        .order_by(*groups)
+    )
+    stmt = pg_insert(DailyRollup).from_select([*ROLLUP_KEYS, "event_count", "amount_sum"], grouped)
+    return stmt.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEYS),
+        set_={
+            "event_count": DailyRollup.event_count + stmt.excluded.event_count,
+            "amount_sum": DailyRollup.amount_sum + stmt.excluded.amount_sum,
+        },
+    )
+
+
+# columns of merchant_bitmap_updates: the key of a merchant bitmap, then the merchant.
+BITMAP_KEYS = ("month", "product", "event_type", "status", "merchant_id")
+
+
+def _bitmap_update_insert(source):
+    """INSERT of the distinct bitmap memberships of `source` into merchant_bitmap_updates."""
+
+    month = func.coalesce(func.to_char(func.date_trunc("month", source.c.event_timestamp), "YYYY-MM"), "")
+    memberships = select(month, source.c.product, source.c.event_type, source.c.status, source.c.merchant_id).distinct()
+    return pg_insert(MerchantBitmapUpdate).from_select(BITMAP_KEYS, memberships)
+
+
+def _insert_with_rollups(insert_stmt, rollups: bool = True, bitmaps: bool = True):
+    """
+    turn an INSERT INTO merchant_activities ... ON CONFLICT DO NOTHING into one statement that also adds
+    the rows it actually inserted (never the duplicates it skipped) to merchant_daily_rollups, and their
+    bitmap memberships to merchant_bitmap_updates (each unless turned off).
+    all three tables change in the same statement, so they are committed (or rolled back) together.
+    """
+
+    if not (rollups or bitmaps):
+        return insert_stmt
+
+    inserted = insert_stmt.returning(
+        Activity.event_timestamp, Activity.merchant_id, Activity.product,
+        Activity.event_type, Activity.status, Activity.amount,
+    ).cte("inserted")
+
+    # a data-modifying CTE must sit at the top level of the statement, hence add_cte.
+    if not rollups:
+        return _bitmap_update_insert(inserted).add_cte(inserted)
+    bitmap_updates = [_bitmap_update_insert(inserted).cte("bitmap_updates")] if bitmaps else []
+    return _rollup_upsert(_rollup_groups(inserted), inserted).add_cte(inserted, *bitmap_updates)
+
+
+@lru_cache(maxsize=None)
+def _batch_insert(rollups: bool = True, bitmaps: bool = True):
+    """
+    the insert path's statement: INSERT INTO merchant_activities ... SELECT FROM unnest(...) with one array parameter
+    per column, so a batch binds its validated column lists as they are (no dict per row) and the SQL never changes.
+    """
+
+    arrays = [cast(bindparam(name), ARRAY(Activity.__table__.c[name].type)) for name in COPY_COLUMNS]
+    rows = func.unnest(*arrays).table_valued(*COPY_COLUMNS).render_derived()
+    stmt = _insert_with_rollups(
+        pg_insert(Activity)
+        .from_select(COPY_COLUMNS, select(*rows.c))
+        .on_conflict_do_nothing(index_elements=["event_id"]),
+        rollups, bitmaps,
+    )
+    # the parameters are bound once, as arrays: "raw" keeps the orm from reading them as one row per dict.
+    return stmt.execution_options(dml_strategy="raw")
+
+
+def rebuild_rollups(db: Session) -> None:
+    """
+    recompute merchant_daily_rollups from merchant_activities (backfill or repair). the caller commits.
+    the old rows are deleted rather than truncated: TRUNCATE's exclusive lock would block the API's reads until commit.
+    """
+
+    activities = Activity.__table__
+    db.execute(delete(DailyRollup))
+    db.execute(_rollup_upsert(_rollup_groups(activities), activities))
+
+
+# positions, in COPY_COLUMNS rows, of the columns the merchant sketches read.
+_SKETCH_COLUMNS = tuple(COPY_COLUMNS.index(name) for name in ("merchant_id", "event_timestamp", "product", "status"))
+
+
+def _sketch_month(timestamp: datetime) -> str:
+    # every session runs in UTC (src.db.pool.pin_session_time_zone): a naive timestamp is stored as UTC, and
+    # date_trunc('month', event_timestamp) buckets by the UTC month.
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime("%Y-%m")
+
+
+def sketch_members(rows: list[tuple]) -> dict[tuple[str, str], set[str]]:
+    """
+    the merchant_ids each merchant sketch ((dimension, key)) gains from a chunk of validated rows (COPY_COLUMNS order):
+    every row's under its product, successful rows with a timestamp under their month.
+    """
+
+    i_merchant, i_timestamp, i_product, i_status = _SKETCH_COLUMNS
+    members: dict[tuple[str, str], set[str]] = {}
+    for row in rows:
+        members.setdefault(("product", row[i_product]), set()).add(row[i_merchant])
+        if row[i_status] == "SUCCESS" and row[i_timestamp] is not None:
+            members.setdefault(("month", _sketch_month(row[i_timestamp])), set()).add(row[i_merchant])
+    return members
+
+
+def merge_sketches(db: Session, members: dict[tuple[str, str], set[str]]) -> None:
+    """
+    add merchant_ids to the merchant sketches in the caller's transaction. missing sketches are created empty first,
+    then every sketch is locked in key order before it is merged, so concurrent workers neither lose updates nor deadlock.
+    re-adding a merchant changes nothing, so rows skipped as duplicates may safely be added again.
+    """
+
+    if not members:
+        return
+
+    keys = sorted(members)
+    empty = bytes(1 << DEFAULT_PRECISION)
+    db.execute(
+        pg_insert(MerchantSketch)
+        .values([{"dimension": dimension, "key": key, "registers": empty} for dimension, key in keys])
+        .on_conflict_do_nothing()
+    )
+    rows = db.execute(
+        select(MerchantSketch.dimension, MerchantSketch.key, MerchantSketch.registers)
+        .where(tuple_(MerchantSketch.dimension, MerchantSketch.key).in_(keys))
+        .order_by(MerchantSketch.dimension, MerchantSketch.key)
+        .with_for_update()
+    ).all()
+
+    merged = []
+    for dimension, key, registers in rows:
+        sketch = HyperLogLog.from_bytes(registers)
+        sketch.update(members[(dimension, key)])
+        merged.append({"dimension": dimension, "key": key, "registers": sketch.to_bytes()})
+    db.execute(update(MerchantSketch), merged)
+
+
+def rebuild_sketches(db: Session) -> None:
+    """recompute merchant_sketches from merchant_activities (backfill or repair). the caller commits."""
+
+    month = func.to_char(func.date_trunc("month", Activity.event_timestamp), "YYYY-MM")
+    queries = (
+        select(literal("month"), month, Activity.merchant_id)
+        .where(Activity.status == "SUCCESS", Activity.event_timestamp.isnot(None))
+        .distinct(),
+        select(literal("product"), Activity.product, Activity.merchant_id).distinct(),
+    )
+
+    members: dict[tuple[str, str], set[str]] = {}
+    for query in queries:
+        for dimension, key, merchant_id in db.execute(query):
+            members.setdefault((dimension, key), set()).add(merchant_id)
+
+    # deleted, not truncated, so the API's approximate counts keep reading the old sketches until commit.
+    db.execute(delete(MerchantSketch))
+    merge_sketches(db, members)
+
+
+def _prefix_sketch_members(path: Path, end_offset: int) -> dict[tuple[str, str], set[str]]:
+    """the merchant sketch memberships of a file's rows before end_offset, re-read from the file itself."""
+
+    members: dict[tuple[str, str], set[str]] = {}
+    for batch in _read_batches(path, {"skipped": 0}, end_offset=end_offset):
+        for key, merchant_ids in sketch_members(batch.rows).items():
+            members.setdefault(key, set()).update(merchant_ids)
+    return members
+
+
+def _bitmap_memberships_from_rollups():
+    """every bitmap membership, read from merchant_daily_rollups (a rollup day lies in its events' month)."""
+
+    month = case(
+        (DailyRollup.day == literal_column(f"'{NO_TIMESTAMP_DAY}'::date"), ""),
+        else_=func.to_char(DailyRollup.day, "YYYY-MM"),
+    )
+    return select(
+        month, DailyRollup.product, DailyRollup.event_type, DailyRollup.status, DailyRollup.merchant_id
+    ).distinct()
+
+
+def update_bitmap_index(path: Path | None = None, rebuild: bool = False) -> tuple[str, int, int]:
+    """
+    bring the merchant bitmap index file up to date: apply (and delete) the pending merchant_bitmap_updates to it or,
+    with rebuild or without a readable index, recompute it from merchant_daily_rollups.
+    one repeatable read snapshot gives both the data version the index is stamped with and the rows it takes in, so
+    rows committed meanwhile stay pending for the next update. returns (how, number of keys, data version).
+    """
+
+    path = path or settings.bitmap_index_path
+    index = None
+    if not rebuild:
+        try:
+            index = MerchantBitmapIndex(path)
+
+        except FileNotFoundError:
+            pass
+
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Merchant bitmap index {path} is unreadable, rebuilding it: {e}", file=sys.stderr)
+
+    with SessionLocal() as db:
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        version = db.execute(select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ID)).scalar() or 0
+
+        # an index ahead of the data was built from another (or a since restored) database: start over.
+        if index is not None and index.data_version > version:
+            index = None
+
+        if index is None:
+            how = "rebuilt"
+            memberships = db.execute(_bitmap_memberships_from_rollups()).all()
+            db.execute(delete(MerchantBitmapUpdate))
+        else:
+            how = "updated"
+            memberships = db.execute(
+                delete(MerchantBitmapUpdate).returning(
+                    MerchantBitmapUpdate.month, MerchantBitmapUpdate.product, MerchantBitmapUpdate.event_type,
+                    MerchantBitmapUpdate.status, MerchantBitmapUpdate.merchant_id,
+                )
+            ).all()
+            if not memberships and index.data_version == version:
+                db.rollback()
+                return "unchanged", len(index.keys()), version
+
+        builder = BitmapIndexBuilder(index)
+        for month, product, event_type, status, merchant_id in memberships:
+            builder.add((month, product, event_type, status), merchant_id)
+
+        # the file is in place before the updates are deleted: a failure in between only re-applies them next time.
+        keys = builder.write(path, version)
+        db.commit()
+    return how, keys, version
+
+
+def update_column_snapshot(root: Path | None = None) -> tuple[str, int, int]:
+    """
+    write a new columnar snapshot if the data version has moved past the current one: the rows added since it was
+    written are appended to its (memory-mapped) columns, or every row is read if there is none or it cannot be used.
+    the version and the rows come from one repeatable read snapshot. returns (how, number of rows, data version).
+    """
+
+    root = root or settings.columnar_snapshot_dir
+    previous = None
+    directory = current_snapshot(root)
+    if directory is not None:
+        try:
+            previous = open_snapshot(directory)
+
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"Columnar snapshot {directory} is unreadable, rebuilding it: {e}", file=sys.stderr)
+
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+        columns, full = load_columns(connection, previous)
+
+    if columns is previous:
+        return "unchanged", columns.rows, columns.version
+
+    write_snapshot(root, columns)
+    return "rebuilt" if full else "updated", columns.rows, columns.version
+
+
+def _column_snapshots_enabled() -> bool:
+    """the importer writes columnar snapshots only for an API that reads them."""
+
+    return settings.analytics_source == "columnar" and settings.columnar_store == "snapshot"
+
+
+def _rollups_enabled() -> bool:
+    """inserts keep merchant_daily_rollups only for the sources that read them ("bitmaps" rebuilds its index from them)."""
+
+    return settings.analytics_source in ("rollup", "bitmaps")
+
+
+def _bitmap_index_enabled() -> bool:
+    """inserts log merchant_bitmap_updates, and runs update the merchant bitmap index, only for an API that reads it."""
+
+    return settings.analytics_source == "bitmaps"
+
+
+# derived data the inserts keep up only when it is enabled: an import without its upkeep marks it stale in
+# analytics_view_refreshes, as it does the views, and the next run that needs it rebuilds it first.
+ROLLUPS = DailyRollup.__tablename__
+BITMAP_INDEX = "merchant_bitmap_index"
+
+
+def _unmaintained() -> list[str]:
+    enabled = {ROLLUPS: _rollups_enabled(), BITMAP_INDEX: _bitmap_index_enabled()}
+    return [name for name, kept in enabled.items() if not kept]
+
+
+def _mark_fresh(db: Session, name: str) -> None:
+    db.execute(
+        update(ViewRefresh)
+        .where(ViewRefresh.view_name == name)
+        .values(refreshed_version=ViewRefresh.data_version, refreshed_at=func.now())
+    )
+
+
+def _catch_up_derived_data() -> None:
+    """
+    rebuild the rollups or the bitmap index if they are enabled but imports that ran without their upkeep (under a
+    source that does not read them) left them stale.
+    """
+
+    names = (ROLLUPS, BITMAP_INDEX)
+    with SessionLocal() as db:
+        # new entries start fresh: until now every import kept both up.
+        db.execute(
+            pg_insert(ViewRefresh)
+            .values([
+                {"view_name": name, "data_version": 0, "refreshed_version": 0, "refreshed_at": func.now()}
+                for name in names
+            ])
+            .on_conflict_do_nothing(index_elements=["view_name"])
+        )
+        stale = set(db.execute(
+            select(ViewRefresh.view_name)
+            .where(ViewRefresh.view_name.in_(names), ViewRefresh.data_version != ViewRefresh.refreshed_version)
+        ).scalars())
+        if ROLLUPS in stale and _rollups_enabled():
+            print(f"Rebuilding {ROLLUPS}: rows were imported without them")
+            rebuild_rollups(db)
+            _mark_fresh(db, ROLLUPS)
+        db.commit()
+
+    # the index is rebuilt from the rollups, which are up to date by now (the bitmaps source needs both).
+    if BITMAP_INDEX in stale and _bitmap_index_enabled():
+        print("Rebuilding the merchant bitmap index: rows were imported without it")
+        update_bitmap_index(rebuild=True)
+        with SessionLocal() as db:
+            _mark_fresh(db, BITMAP_INDEX)
+            db.commit()
+
+
+def _create_tables(catch_up: bool = True) -> None:
+    """
+    create missing tables and analytics views; a rollup or sketch table created next to existing activity data is
+    backfilled from it (a new view is filled by its CREATE). catch_up also rebuilds the enabled derived data
+    imports left stale.
+    """
+
+    rollups_existed = inspect(engine).has_table(DailyRollup.__tablename__)
+    sketches_existed = inspect(engine).has_table(MerchantSketch.__tablename__)
+    Base.metadata.create_all(bind=engine)
+    if not rollups_existed:
+        with SessionLocal() as db:
+            rebuild_rollups(db)
+            db.commit()
+    if not sketches_existed:
+        with SessionLocal() as db:
+            rebuild_sketches(db)
+            db.commit()
+    create_analytics_views()
+    if catch_up:
+        _catch_up_derived_data()
+
+
+def create_analytics_views() -> None:
+    """create each materialized view with the unique index REFRESH MATERIALIZED VIEW CONCURRENTLY requires."""
+
+    with engine.begin() as connection:
+        for view in ANALYTICS_VIEWS:
+            query = view.query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+            connection.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view.name} AS {query}"))
+            connection.execute(
+                text(f"CREATE UNIQUE INDEX IF NOT EXISTS {view.name}_key ON {view.name} ({', '.join(view.key)})")
+            )
+
+        # a view that is new was just filled, so it starts fresh; existing views keep their versions.
+        connection.execute(
+            pg_insert(ViewRefresh)
+            .values([
+                {"view_name": view.name, "data_version": 0, "refreshed_version": 0, "refreshed_at": func.now()}
+                for view in ANALYTICS_VIEWS
+            ])
+            .on_conflict_do_nothing(index_elements=["view_name"])
+        )
+
+
+def bump_data_version(db: Session) -> None:
+    """
+    advance the data version that cached analytics results are checked against.
+    called with a file's final commit, so the API only recomputes once the whole file is in.
+    """
+
+    stmt = pg_insert(DataVersion).values(id=DATA_VERSION_ID, version=1, updated_at=func.now())
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"version": DataVersion.version + 1, "updated_at": stmt.excluded.updated_at},
+        )
+    )
+
+
+def mark_views_stale(db: Session) -> None:
+    """
+    bump every view's data_version, so readers stop trusting the views until they are refreshed, and that of the
+    derived data this import will not keep up, so it is rebuilt once a source needs it.
+    callers commit this before the rows that change the data.
+    """
+
+    names = [view.name for view in ANALYTICS_VIEWS] + _unmaintained()
+    db.execute(
+        update(ViewRefresh)
+        .where(ViewRefresh.view_name.in_(names))
+        .values(data_version=ViewRefresh.data_version + 1)
+    )
+
+
+def refresh_analytics_views() -> int:
+    """
+    refresh each stale materialized view concurrently: readers keep seeing the previous contents until it completes.
+    a view is marked fresh at the data_version read before its refresh started, so an import that begins
+    meanwhile leaves it stale. views no import touched since their last refresh are left alone.
+    returns the number of views refreshed.
+    """
+
+    refreshed = 0
+    for view in ANALYTICS_VIEWS:
+        with engine.begin() as connection:
+            version, refreshed_version = connection.execute(
+                select(ViewRefresh.data_version, ViewRefresh.refreshed_version).where(ViewRefresh.view_name == view.name)
+            ).one()
+            if refreshed_version == version:
+                continue
+            connection.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view.name}"))
+            connection.execute(
+                update(ViewRefresh)
+                .where(ViewRefresh.view_name == view.name)
+                .values(refreshed_version=version, refreshed_at=func.now())
+            )
+            refreshed += 1
+    return refreshed
+
+
+def run_rebuild_rollups() -> None:
+    """
+    recompute merchant_daily_rollups and merchant_sketches from scratch in one transaction, then the merchant bitmap
+    index from the new rollups. readers are not blocked: they see the old rows until the commit.
+    """
+
+    # everything is rebuilt below anyway, whatever the configured source.
+    _create_tables(catch_up=False)
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rebuild_rollups(db)
+        rebuild_sketches(db)
+        _mark_fresh(db, ROLLUPS)
+        count = db.execute(select(func.count()).select_from(DailyRollup)).scalar()
+        sketches = db.execute(select(func.count()).select_from(MerchantSketch)).scalar()
+        db.commit()
+    _, keys, _ = update_bitmap_index(rebuild=True)
+    with SessionLocal() as db:
+        _mark_fresh(db, BITMAP_INDEX)
+        db.commit()
+    print(
+        f"Rebuilt {DailyRollup.__tablename__}: {count} rows, {MerchantSketch.__tablename__}: {sketches} sketches "
+        f"and the merchant bitmap index: {keys} bitmaps in {time.perf_counter() - started:.2f}s"
+    )
+
+
+# sentinel telling the writer thread that the parser has finished.
+_END_OF_BATCHES = object()
+
+
+def _write_batches(
+    batches: Iterator[Batch],
+    flush: Callable[[Batch], None],
+    queue_depth: int = 0,
+) -> int:
+    """
+    flush every batch and return the number of rows written.
+    with queue_depth > 0, parsing (this thread) and flushing (a writer thread) overlap through a bounded queue:
+    the parser blocks once queue_depth batches are waiting, so at most queue_depth + 2 batches are in memory.
+    """
+
+    processed = 0
+    if queue_depth <= 0:
+        for batch in batches:
+            flush(batch)
+            processed += len(batch.rows)
+        return processed
+
+    pending = queue.Queue(maxsize=queue_depth)
+    failed = threading.Event()
+    errors = []
+
+    def writer() -> None:
+        while True:
+            batch = pending.get()
+            if batch is _END_OF_BATCHES:
+                return
+
+            # after a failure keep draining so the parser never blocks on a full queue.
+            if failed.is_set():
+                continue
+            try:
+                flush(batch)
+            except BaseException as e:
+                errors.append(e)
+                failed.set()
+
+    thread = threading.Thread(target=writer, name="import-writer", daemon=True)
+    thread.start()
+
+    try:
+        for batch in batches:
+            if failed.is_set():
+                break
+            pending.put(batch)
+            processed += len(batch.rows)
+
+    finally:
+        pending.put(_END_OF_BATCHES)
+        thread.join()
+
+    # surface the writer's error in the caller, exactly as the synchronous path would.
+    if errors:
+        raise errors[0]
+    return processed
+
+
+def import_csv_file(
+    path: Path,
+    db: Session,
+    queue_depth: int = 0,
+    start_offset: int = 0,
+    end_offset: int | None = None,
+    checkpoint: Callable[[Batch], None] | None = None,
+    decompress_thread: bool = False,
+    metrics: ImportMetrics | None = None,
+) -> tuple[int, int]:
+    """
+    import one CSV. uses ON CONFLICT DO NOTHING so re-runs skip existing event_ids.
+    checkpoint(batch), if given, runs inside each batch's transaction just before its commit.
+    the merchant sketches are merged once for the whole file, in a last transaction of their own, so the batches
+    never lock sketch rows and parallel workers do not wait on each other.
+    """
+    counts = {"skipped": 0}
+    members: dict[tuple[str, str], set[str]] = {}
+    metrics = metrics if metrics is not None else ImportMetrics()
+    insert = _batch_insert(_rollups_enabled(), _bitmap_index_enabled())
+
+    def flush(batch: Batch) -> None:
+        started = time.perf_counter()
+        if batch.rows:
+            with metrics.phase("build"):
+                params = dict(zip(COPY_COLUMNS, batch.columns))
+            with metrics.phase("execute"):
+                db.execute(insert, params)
+            with metrics.phase("sketch"):
+                for key, merchant_ids in sketch_members(batch.rows).items():
+                    members.setdefault(key, set()).update(merchant_ids)
+        if checkpoint is not None:
+            with metrics.phase("checkpoint"):
+                checkpoint(batch)
+        with metrics.phase("commit"):
+            db.commit()
+        metrics.record_batch(time.perf_counter() - started)
+
+    batches = _read_batches(path, counts, start_offset, end_offset, decompress_thread, metrics)
+    processed = _write_batches(batches, flush, queue_depth)
+
+    if members:
+        with metrics.phase("sketch"):
+            merge_sketches(db, members)
+        with metrics.phase("commit"):
+            db.commit()
+    return processed, counts["skipped"]
+
+
+def _copy_rows(
+    cursor,
+    rows: list[tuple],
+    staging_table: str = STAGING_TABLE,
+    metrics: ImportMetrics | None = None,
+) -> None:
+    """stream one chunk of validated rows (in COPY_COLUMNS order) into the staging table with COPY ... FROM STDIN."""
+
+    metrics = metrics if metrics is not None else ImportMetrics()
+
+    # serialize the chunk as CSV; None is written as an empty unquoted field, which COPY reads as NULL.
+    with metrics.phase("build"):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        buffer.seek(0)
+
+    with metrics.phase("execute"):
+        cursor.copy_expert(
+            f"COPY {staging_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+
+def import_csv_file_copy(
+    path: Path,
+    db: Session,
+    staging_table: str = STAGING_TABLE,
+    queue_depth: int = 0,
+    start_offset: int = 0,
+    end_offset: int | None = None,
+    checkpoint: Callable[[Batch], None] | None = None,
+    decompress_thread: bool = False,
+    metrics: ImportMetrics | None = None,
+) -> tuple[int, int]:
+    """
+    import one CSV with COPY into an unlogged staging table, then merge with ON CONFLICT DO NOTHING.
+    the file is one transaction, so checkpoint(batch), called per batch, is committed together with the merge.
+    """
+    counts = {"skipped": 0}
+    cursors = []
+    flushed = []
+    members: dict[tuple[str, str], set[str]] = {}
+    metrics = metrics if metrics is not None else ImportMetrics()
+
+    def copy_batch(batch: Batch) -> None:
+        # prepare the staging table on the first rows, so files without valid rows never create it.
+        if not cursors:
+
+            # the staging table mirrors merchant_activities without its primary key and indexes.
+            with metrics.phase("execute"):
+                db.execute(text(
+                    f"CREATE UNLOGGED TABLE IF NOT EXISTS {staging_table} "
+                    f"(LIKE {Activity.__tablename__} INCLUDING DEFAULTS)"
+                ))
+                db.execute(text(f"TRUNCATE {staging_table}"))
+
+                # borrow the raw psycopg2 cursor of the session's connection so COPY runs in the same transaction.
+                cursors.append(db.connection().connection.cursor())
+
+        # every chunk lands in the same staging table; chunking only keeps memory bounded.
+        _copy_rows(cursors[0], batch.rows, staging_table, metrics)
+
+    def flush(batch: Batch) -> None:
+        started = time.perf_counter()
+        flushed.append(batch.end_offset)
+        if checkpoint is not None:
+            with metrics.phase("checkpoint"):
+                checkpoint(batch)
+        if batch.rows:
+            copy_batch(batch)
+            with metrics.phase("sketch"):
+                for key, merchant_ids in sketch_members(batch.rows).items():
+                    members.setdefault(key, set()).update(merchant_ids)
+        metrics.record_batch(time.perf_counter() - started)
+
+    try:
+        batches = _read_batches(path, counts, start_offset, end_offset, decompress_thread, metrics)
+        processed = _write_batches(batches, flush, queue_depth)
+
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+    if not flushed:
+        return 0, counts["skipped"]
+
+    # merge the whole file in one statement; duplicates (in the file or already loaded) are skipped.
+    if processed:
+        staging = table(staging_table, *(column(name) for name in COPY_COLUMNS))
+        with metrics.phase("merge"):
+            db.execute(_insert_with_rollups(
+                pg_insert(Activity)
+                .from_select(COPY_COLUMNS, select(*staging.c))
+                .on_conflict_do_nothing(index_elements=["event_id"]),
+                _rollups_enabled(), _bitmap_index_enabled(),
+            ))
+            db.execute(text(f"TRUNCATE {staging_table}"))
+        with metrics.phase("sketch"):
+            merge_sketches(db, members)
+    with metrics.phase("commit"):
+        db.commit()
+    return processed, counts["skipped"]
+
+
+class FileResult(NamedTuple):
+    """
+    outcome of one file: action is import (new or forced), reimport (changed), resume (appended),
+    recover (continued from the checkpoint of an interrupted run) or skip.
+    """
+
+    processed: int
+    skipped: int
+    action: str = "import"
+    error: str | None = None
+    start_offset: int = 0
+    seconds: float = 0.0  # wall time spent on the file
+    bytes_read: int = 0  # (decompressed) bytes parsed
+    metrics: dict | None = None  # ImportMetrics.to_dict() of a pool worker, merged by the parent
+
+
+def _file_mtime(stat) -> datetime:
+    return datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+
+# bytes before the end of a watched file's hashed prefix that are read again to check it was not rewritten.
+_HASH_TAIL = 1 << 16
+
+
+class HashState(NamedTuple):
+    """sha256 of a file's first `size` bytes, kept by the watcher so the next poll hashes only the bytes appended."""
+
+    size: int
+    digest: "hashlib._Hash"
+    tail: bytes  # the _HASH_TAIL bytes before size
+
+
+def _read_tail(file_object, end: int) -> bytes:
+    file_object.seek(max(0, end - _HASH_TAIL))
+    return file_object.read(end - max(0, end - _HASH_TAIL))
+
+
+def _hash_prefix(path: Path, split: int, size: int, hashes: dict[str, HashState] | None = None) -> tuple[str, str]:
+    """
+    sha256 of bytes [0, split) and of bytes [0, size) in a single read of the file. with hashes (the watcher's states,
+    by file name), a file hashed up to split before is read from split on only, if its last _HASH_TAIL bytes before
+    split are unchanged, and its state moves to size.
+    """
+
+    with open(path, "rb") as file_object:
+        state = hashes.get(path.name) if hashes is not None else None
+        if state is not None and state.size == split <= size and _read_tail(file_object, split) == state.tail:
+            digest, prefix, position = state.digest.copy(), state.digest.hexdigest(), split
+        else:
+            digest, prefix, position = hashlib.sha256(), None, 0
+            file_object.seek(0)
+
+        while position < size:
+            if prefix is None and position == split:
+                prefix = digest.hexdigest()
+
+            # never read across split, so the prefix digest can be taken on a chunk boundary.
+            limit = split if position < split else size
+            chunk = file_object.read(min(1 << 20, limit - position))
+            if not chunk:
+                break
+            digest.update(chunk)
+            position += len(chunk)
+
+        if hashes is not None:
+            hashes[path.name] = HashState(position, digest.copy(), _read_tail(file_object, position))
+
+    full = digest.hexdigest()
+    return (prefix if prefix is not None else full), full
+
+
+def _complete_size(path: Path, size: int) -> int:
+    """bytes of the file up to and including its last newline, so a row still being written is left for later."""
+
+    end = size
+    with open(path, "rb") as file_object:
+        while end > 0:
+            start = max(0, end - (1 << 16))
+            file_object.seek(start)
+            newline = file_object.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def plan_import(
+    path: Path,
+    entry: ImportManifest | None,
+    size: int,
+    mtime: datetime,
+    hashes: dict[str, HashState] | None = None,
+) -> tuple[str, int, str]:
+    """
+    compare a file with its manifest entry and return (action, start offset, sha256 of its first `size` bytes).
+    unchanged files are skipped, files that only grew resume at the recorded byte offset, anything else is re-read.
+    hashes is passed on to _hash_prefix.
+    """
+
+    if entry is None:
+        return "import", 0, _hash_prefix(path, size, size, hashes)[1]
+
+    # an interrupted run: continue from its last committed batch if the bytes it was reading are still there.
+    if entry.completed_at is None:
+        if entry.file_size <= size:
+            prefix, full = _hash_prefix(path, entry.file_size, size, hashes)
+            if prefix == entry.content_hash:
+                return "recover", entry.byte_offset, full
+        return "reimport", 0, _hash_prefix(path, size, size, hashes)[1]
+
+    # same size and mtime: trust the manifest without reading the file.
+    if entry.file_size == size and entry.file_mtime == mtime:
+        return "skip", entry.byte_offset, entry.content_hash
+
+    if entry.file_size <= size:
+        prefix, full = _hash_prefix(path, entry.file_size, size, hashes)
+        if prefix == entry.content_hash:
+            return ("skip" if entry.file_size == size else "resume"), entry.byte_offset, full
+        return "reimport", 0, full
+
+    return "reimport", 0, _hash_prefix(path, size, size, hashes)[1]
+
+
+def _write_manifest(
+    db: Session,
+    path: Path,
+    size: int,
+    mtime: datetime,
+    content_hash: str,
+    byte_offset: int,
+    row_number: int,
+    processed: int,
+    skipped: int,
+    completed: bool,
+) -> None:
+    """upsert a file's manifest entry: a checkpoint (completed=False) or the final record. the caller commits."""
+
+    values = {
+        "file_name": path.name,
+        "file_size": size,
+        "file_mtime": mtime,
+        "content_hash": content_hash,
+        "byte_offset": byte_offset,
+        "row_number": row_number,
+        "rows_processed": processed,
+        "rows_skipped": skipped,
+        "completed_at": datetime.now(timezone.utc) if completed else None,
+    }
+    stmt = pg_insert(ImportManifest).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["file_name"],
+        set_={key: stmt.excluded[key] for key in values if key != "file_name"},
+    )
+    db.execute(stmt)
+
+
+def import_file(
+    path: Path,
+    db: Session,
+    mode: str = "insert",
+    queue_depth: int = 0,
+    staging_table: str = STAGING_TABLE,
+    force: bool = False,
+    decompress_thread: bool = False,
+    complete_lines: bool = False,
+    metrics: ImportMetrics | None = None,
+    hashes: dict[str, HashState] | None = None,
+) -> FileResult:
+    """
+    import one file according to its manifest entry (skip, resume, recover or full read) and update the manifest.
+    every committed insert batch also commits a checkpoint, so an interrupted file restarts at its last batch.
+    a COPY file is committed whole, so it is only recorded once, when it is done.
+    stdin has no identity to remember, so it is always read in full and never recorded in the manifest.
+    complete_lines stops a plain file at its last newline (for files that are still being appended to).
+    hashes keeps the files' content hashes between calls, so a grown file is hashed from where it was (see _hash_prefix).
+    """
+
+    metrics = metrics if metrics is not None else ImportMetrics()
+    started = time.perf_counter()
+    bytes_before = metrics.bytes_read
+
+    if path == STDIN:
+        mark_views_stale(db)
+        db.commit()
+        processed, skipped = _import_source(
+            path, db, mode, queue_depth, staging_table, decompress_thread=decompress_thread, metrics=metrics
+        )
+        if processed:
+            bump_data_version(db)
+            db.commit()
+        return FileResult(
+            processed, skipped, seconds=time.perf_counter() - started, bytes_read=metrics.bytes_read - bytes_before
+        )
+
+    stat = path.stat()
+    size, mtime = stat.st_size, _file_mtime(stat)
+    compressed = compression_of(path) is not None
+    if complete_lines and not compressed:
+        size = _complete_size(path, size)
+    entry = db.get(ImportManifest, path.name)
+
+    if force:
+        action, start_offset, content_hash = "import", 0, _hash_prefix(path, size, size, hashes)[1]
+    else:
+        action, start_offset, content_hash = plan_import(path, entry, size, mtime, hashes)
+
+    if action == "skip":
+        # same content under a new mtime: remember the mtime so the next run takes the fast path.
+        if entry.file_mtime != mtime:
+            entry.file_mtime = mtime
+            db.commit()
+        return FileResult(0, 0, action)
+
+    # rows may be committed from here on (in insert mode batch by batch), so readers stop trusting the views first.
+    mark_views_stale(db)
+    db.commit()
+
+    # a resumed or recovered file carries on from the totals already committed for it.
+    if action in ("resume", "recover"):
+        progress = {"rows": entry.row_number, "processed": entry.rows_processed, "skipped": entry.rows_skipped}
+    else:
+        progress = {"rows": 0, "processed": 0, "skipped": 0}
+
+    # plain files stop at the size they were planned with; a compressed file's size says nothing about its data.
+    end_offset = None if compressed else size
+    progress["offset"] = start_offset
+
+    def tally(batch: Batch) -> None:
+        progress["offset"] = batch.end_offset
+        progress["rows"] += batch.rows_read
+        progress["processed"] += len(batch.rows)
+        progress["skipped"] += batch.skipped
+
+    def checkpoint(batch: Batch) -> None:
+        tally(batch)
+        _write_manifest(
+            db, path, size, mtime, content_hash, batch.end_offset,
+            progress["rows"], progress["processed"], progress["skipped"], completed=False,
+        )
+
+    # a checkpoint inside a COPY file's single transaction would only be overwritten before anyone could read it.
+    processed, skipped = _import_source(
+        path, db, mode, queue_depth, staging_table, start_offset, end_offset,
+        tally if mode == "copy" else checkpoint, decompress_thread, metrics,
+    )
+
+    # sketches are merged once a file is read, so those of the rows an interrupted run committed never were.
+    if action == "recover" and start_offset:
+        with metrics.phase("sketch"):
+            merge_sketches(db, _prefix_sketch_members(path, start_offset))
+
+    # offsets into a compressed file are positions in its decompressed data, so record where reading stopped.
+    _write_manifest(
+        db, path, size, mtime, content_hash, progress["offset"] if compressed else size,
+        progress["rows"], progress["processed"], progress["skipped"], completed=True,
+    )
+    if processed:
+        bump_data_version(db)
+    db.commit()
+    return FileResult(
+        processed, skipped, action, start_offset=start_offset,
+        seconds=time.perf_counter() - started, bytes_read=metrics.bytes_read - bytes_before,
+    )
+
+
+def _import_source(
+    path: Path,
+    db: Session,
+    mode: str,
+    queue_depth: int,
+    staging_table: str,
+    start_offset: int = 0,
+    end_offset: int | None = None,
+    checkpoint: Callable[[Batch], None] | None = None,
+    decompress_thread: bool = False,
+    metrics: ImportMetrics | None = None,
+) -> tuple[int, int]:
+    """run the insert or copy path over one source."""
+
+    if mode == "copy":
+        return import_csv_file_copy(
+            path, db, staging_table=staging_table, queue_depth=queue_depth, start_offset=start_offset,
+            end_offset=end_offset, checkpoint=checkpoint, decompress_thread=decompress_thread, metrics=metrics,
+        )
+    return import_csv_file(
+        path, db, queue_depth=queue_depth, start_offset=start_offset, end_offset=end_offset,
+        checkpoint=checkpoint, decompress_thread=decompress_thread, metrics=metrics,
+    )
+
+
+# per-process state for --workers: each worker opens its own engine and session factory.
+_worker_session_factory = None
+_worker_staging_table = STAGING_TABLE
+
+
+def _init_worker(slots) -> None:
+    """process pool initializer: give the worker its own engine and a private COPY staging table."""
+    global _worker_session_factory, _worker_staging_table
+
+    # drop pooled connections inherited from the parent without closing them under the parent's feet.
+    engine.dispose(close=False)
+
+    # built like the API's engine, so the pool settings, pre-ping strategy and session time zone apply to the workers too.
+    worker_engine = create_engine(settings.database_url, echo=False, **pool_options(settings))
+    pin_session_time_zone(worker_engine)
+    if settings.db_pool_pre_ping == "idle":
+        ping_idle_connections(worker_engine, settings.db_pool_pre_ping_idle)
+    _worker_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
+    # number workers 1..N so staging tables are reused across runs instead of piling up per pid.
+    with slots.get_lock():
+        slots.value += 1
+        _worker_staging_table = f"{STAGING_TABLE}_{slots.value}"
+
+
+def _import_file_in_worker(
+    path: Path,
+    mode: str,
+    queue_depth: int = 0,
+    force: bool = False,
+    decompress_thread: bool = False,
+) -> FileResult:
+    """
+    import one file inside a pool worker; errors are returned, never raised, so siblings keep going.
+    the file's metrics travel back with the result.
+    """
+
+    db = _worker_session_factory()
+    metrics = ImportMetrics()
+
+    try:
+        result = import_file(
+            path, db, mode=mode, queue_depth=queue_depth, staging_table=_worker_staging_table,
+            force=force, decompress_thread=decompress_thread, metrics=metrics,
+        )
+        return result._replace(metrics=metrics.to_dict())
+
+    except Exception as e:
+        db.rollback()
+        return FileResult(0, 0, error=f"{type(e).__name__}: {e}")
+
+    finally:
+        db.close()
+
+
+def _import_files_parallel(
+    csv_files: list[Path],
+    mode: str,
+    workers: int,
+    queue_depth: int = 0,
+    force: bool = False,
+    decompress_thread: bool = False,
+) -> Iterator[tuple[Path, FileResult]]:
+    """yield (path, result) per file, in input order, from a process pool."""
+
+    slots = multiprocessing.Value("i", 0)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(slots,)) as pool:
+
+        # map keeps submission order, so output is identical no matter which worker finishes first.
+        count = len(csv_files)
+        results = pool.map(
+            _import_file_in_worker,
+            csv_files, [mode] * count, [queue_depth] * count, [force] * count, [decompress_thread] * count,
+        )
+        yield from zip(csv_files, results)
+
+
+def _import_files_sequential(
+    csv_files: list[Path],
+    mode: str,
+    queue_depth: int = 0,
+    force: bool = False,
+    decompress_thread: bool = False,
+    metrics: ImportMetrics | None = None,
+) -> Iterator[tuple[Path, FileResult]]:
+    """yield (path, result) per file using one session on the shared engine."""
+
+    db = SessionLocal()
+
+    try:
+        for path in csv_files:
+            yield path, import_file(
+                path, db, mode=mode, queue_depth=queue_depth, force=force,
+                decompress_thread=decompress_thread, metrics=metrics,
+            )
+
+    finally:
+        db.close()
+
+
+def _secondary_indexes() -> list:
+    """the indexes declared on the Activity model (the primary key is not among them)."""
+    return sorted(Activity.__table__.indexes, key=lambda index: index.name)
+
+
+def drop_secondary_indexes() -> None:
+    """drop the secondary indexes so a bulk load only maintains the primary key (needed for ON CONFLICT)."""
+
+    with engine.begin() as connection:
+        for index in _secondary_indexes():
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def rebuild_secondary_indexes() -> None:
+    """
+    recreate the model's secondary indexes with CREATE INDEX CONCURRENTLY, so the API can keep reading meanwhile.
+    an index left INVALID by an interrupted concurrent build is dropped and built again.
+    """
+
+    table = Activity.__tablename__
+
+    # CONCURRENTLY cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        invalid = set(connection.execute(
+            text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE i.indrelid = CAST(:table AS regclass) AND NOT i.indisvalid"
+            ),
+            {"table": table},
+        ).scalars())
+
+        for index in _secondary_indexes():
+            if index.name in invalid:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+            columns = ", ".join(column.name for column in index.columns)
+            connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table} ({columns})"))
+
+
+def analyze_activities() -> None:
+    """refresh planner statistics for merchant_activities after a bulk load."""
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"ANALYZE {Activity.__tablename__}"))
+
+
+@contextmanager
+def _timed(phases: dict, name: str) -> Iterator[None]:
+    """add the wall time of the block to phases[name]."""
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def _report_results(
+    results: Iterator[tuple[Path, FileResult]],
+    metrics: ImportMetrics,
+    profile: bool = False,
+) -> tuple[int, int, int, list[str]]:
+    """
+    print one line per file and return (processed, skipped, unchanged files, failed file names).
+    per-file throughput goes into metrics.files (and, with profile, onto each line); worker metrics are merged.
+    """
+
+    total_processed = 0
+    total_skipped = 0
+    unchanged = 0
+    failed = []
+
+    for path, result in results:
+        name = "<stdin>" if path == STDIN else path.name
+        if result.metrics is not None:
+            metrics.merge(result.metrics)
+        if result.error is not None:
+            failed.append(name)
+            print(f"  {name}: FAILED ({result.error})", file=sys.stderr)
+            continue
+        if result.action == "skip":
+            unchanged += 1
+            print(f"  {name}: unchanged since last import, skipped")
+            continue
+        total_processed += result.processed
+        total_skipped += result.skipped
+        note = {
+            "resume": f" [appended, resumed at byte {result.start_offset}]",
+            "recover": f" [interrupted earlier, resumed from checkpoint at byte {result.start_offset}]",
+            "reimport": " [changed, re-imported]",
+        }.get(result.action, "")
+
+        rows_per_second = result.processed / result.seconds if result.seconds else 0.0
+        mb_per_second = result.bytes_read / (1024 * 1024) / result.seconds if result.seconds else 0.0
+        metrics.files.append({
+            "name": name,
+            "action": result.action,
+            "rows_processed": result.processed,
+            "rows_skipped": result.skipped,
+            "bytes_read": result.bytes_read,
+            "seconds": round(result.seconds, 4),
+            "rows_per_second": round(rows_per_second, 1),
+            "mb_per_second": round(mb_per_second, 3),
+        })
+        if profile:
+            note += f" in {result.seconds:.2f}s ({rows_per_second:,.0f} rows/s, {mb_per_second:.2f} MB/s)"
+        print(f"  {name}: {result.processed} rows processed, {result.skipped} skipped (malformed){note}")
+
+    return total_processed, total_skipped, unchanged, failed
+
+
+def run_import(
+    data_dir: Path | None = None,
+    mode: str = "insert",
+    workers: int = 1,
+    queue_depth: int = 0,
+    force: bool = False,
+    sources: list[Path] | None = None,
+    decompress_thread: bool = False,
+    bulk: bool = False,
+    profile: bool = False,
+    report: Path | None = None,
+) -> None:
+    """
+    import every activities CSV in data_dir, or exactly the given sources (files or STDIN) in order.
+    bulk drops the secondary indexes for the load, then rebuilds them concurrently and runs ANALYZE.
+    profile prints per-phase timings, throughput, peak RSS and batch latency percentiles; report writes them as JSON.
+    """
+
+    data_dir = data_dir or settings.data_dir
+    if not sources and not data_dir.is_dir():
+        print(f"Data directory not found: {data_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if mode not in IMPORT_MODES:
+        print(f"Unknown import mode: {mode} (expected one of {', '.join(IMPORT_MODES)})", file=sys.stderr)
+        sys.exit(1)
+
+    if workers < 1:
+        print(f"--workers must be at least 1 (got {workers})", file=sys.stderr)
+        sys.exit(1)
+
+    if queue_depth < 0:
+        print(f"--queue-depth must be 0 or more (got {queue_depth})", file=sys.stderr)
+        sys.exit(1)
+
+    if sources:
+        missing = [str(p) for p in sources if p != STDIN and not p.is_file()]
+        if missing:
+            print(f"Source file(s) not found: {', '.join(missing)}", file=sys.stderr)
+            sys.exit(1)
+
+        # stdin can be read only once, by this process.
+        if STDIN in sources and (workers > 1 or sources.count(STDIN) > 1):
+            print("stdin (-) can be given once and cannot be combined with --workers", file=sys.stderr)
+            sys.exit(1)
+
+    _create_tables()
+
+    if sources:
+        csv_files = list(sources)
+    else:
+        csv_files = sorted(
+            p for p in data_dir.iterdir()
+            if p.is_file() and CSV_PATTERN.match(p.name)
+        )
+    if not csv_files:
+        print(f"No activities_YYYYMMDD.csv[.gz|.zst] files in {data_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    phases = {}
+    metrics = ImportMetrics()
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    if bulk:
+        with _timed(phases, "drop indexes"):
+            drop_secondary_indexes()
+
+    if workers > 1:
+        results = _import_files_parallel(
+            csv_files, mode, min(workers, len(csv_files)), queue_depth, force, decompress_thread
+        )
+    else:
+        results = _import_files_sequential(csv_files, mode, queue_depth, force, decompress_thread, metrics)
+
+    try:
+        with _timed(phases, "load"):
+            total_processed, total_skipped, unchanged, failed = _report_results(results, metrics, profile)
+
+    finally:
+        # the table must never be left without its indexes, even if the load failed or was interrupted.
+        if bulk:
+            # end the load's session first: a concurrent build waits for every open transaction on the table.
+            results.close()
+            with _timed(phases, "rebuild indexes"):
+                rebuild_secondary_indexes()
+            with _timed(phases, "analyze"):
+                analyze_activities()
+
+    # only the views a file was read for are stale, and without new rows the index and snapshot are current.
+    views_started = time.perf_counter()
+    views = refresh_analytics_views()
+    run_phases = {**phases, "refresh views": time.perf_counter() - views_started}
+    if total_processed:
+        if _bitmap_index_enabled():
+            bitmaps_started = time.perf_counter()
+            bitmaps, keys, _ = update_bitmap_index()
+            run_phases["bitmap index"] = time.perf_counter() - bitmaps_started
+        if _column_snapshots_enabled():
+            snapshot_started = time.perf_counter()
+            snapshot, rows, _ = update_column_snapshot()
+            run_phases["columnar snapshot"] = time.perf_counter() - snapshot_started
+
+    print(f"Done. Total processed: {total_processed}, total skipped (malformed): {total_skipped}")
+    if unchanged:
+        print(f"Unchanged files skipped: {unchanged} (use --force to re-import them)")
+    elapsed = time.perf_counter() - started
+    print(f"Elapsed: {elapsed:.2f}s (mode: {mode}, workers: {workers})")
+    if views:
+        print(f"Analytics views refreshed in {run_phases['refresh views']:.2f}s")
+    else:
+        print("Analytics views up to date, not refreshed")
+    if "bitmap index" in run_phases:
+        print(f"Merchant bitmap index {bitmaps} in {run_phases['bitmap index']:.2f}s ({keys} bitmaps)")
+    if "columnar snapshot" in run_phases:
+        print(f"Columnar snapshot {snapshot} in {run_phases['columnar snapshot']:.2f}s ({rows} rows)")
+    if bulk:
+        print("Bulk load phases: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items()))
+
+    if profile or report is not None:
+        summary = metrics.report(
+            elapsed, total_processed, total_skipped,
+            mode=mode, workers=workers, queue_depth=queue_depth, bulk=bulk,
+            started_at=started_at.isoformat(timespec="seconds"),
+            run_phases={name: round(seconds, 4) for name, seconds in run_phases.items()},
+        )
+        if profile:
+            print("\n".join(format_report(summary)))
+        if report is not None:
+            report.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+            print(f"Import report written to {report}")
+
+    if failed:
+        print(f"{len(failed)} file(s) failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _watch_cycle(
+    data_dir: Path,
+    db: Session,
+    mode: str,
+    queue_depth: int,
+    decompress_thread: bool,
+    observed: dict,
+    imported: dict,
+    hashes: dict[str, HashState] | None = None,
+) -> tuple[int, int]:
+    """
+    one poll of the watched directory: import every file that is new or changed since it was last imported.
+    hashes carries each file's content hash to the next poll, which then hashes only the bytes appended since.
+    returns (rows processed, rows skipped) for the cycle.
+    """
+
+    processed = skipped = 0
+    for path in sorted(p for p in data_dir.iterdir() if p.is_file() and CSV_PATTERN.match(p.name)):
+        stat = path.stat()
+        key = (stat.st_size, stat.st_mtime_ns)
+        previous = observed.get(path.name)
+        observed[path.name] = key
+
+        # stat is unchanged since the last import: nothing to do, not even a manifest lookup.
+        if imported.get(path.name) == key:
+            continue
+
+        # a compressed file cannot be read until it is complete, so wait until it stops changing for one interval.
+        if compression_of(path) is not None and previous != key:
+            continue
+
+        # the views are not refreshed per poll (that would cost more than the poll): import_file marks them stale
+        # before it reads a file, and readers use live queries until watch_import's next throttled refresh.
+        started = time.perf_counter()
+        try:
+            result = import_file(
+                path, db, mode=mode, queue_depth=queue_depth,
+                decompress_thread=decompress_thread, complete_lines=True, hashes=hashes,
+            )
+
+        except OperationalError:
+            raise
+
+        except Exception as e:
+            # a broken file is retried only once it changes again; the other files keep flowing.
+            db.rollback()
+            imported[path.name] = key
+            print(f"  {path.name}: FAILED ({type(e).__name__}: {e})", file=sys.stderr)
+            continue
+
+        imported[path.name] = key
+        if result.action == "skip" or not (result.processed or result.skipped):
+            continue
+
+        elapsed = time.perf_counter() - started
+        processed += result.processed
+        skipped += result.skipped
+        print(
+            f"  {time.strftime('%H:%M:%S')} {path.name}: +{result.processed} rows, {result.skipped} skipped "
+            f"(malformed) in {elapsed:.2f}s ({result.processed / elapsed if elapsed else 0:,.0f} rows/s)",
+            flush=True,
+        )
+
+    return processed, skipped
+
+
+def watch_import(
+    data_dir: Path | None = None,
+    mode: str = "insert",
+    interval: float = 2.0,
+    queue_depth: int = 0,
+    decompress_thread: bool = False,
+    refresh_views_every: float = 60.0,
+) -> None:
+    """
+    poll data_dir every `interval` seconds and ingest new and growing files until interrupted (Ctrl-C).
+    each poll is a micro-batch bounded by time (the interval) and each commit by size (BATCH_SIZE rows);
+    a growing plain file is read up to its last complete line and resumed from there on the next poll.
+    rows are ingested on one connection held across polls and replaced only when the database drops it.
+    the analytics views are refreshed after a poll that read rows, at most once every `refresh_views_every` seconds
+    (0: never), since a refresh rereads merchant_activities however few rows the poll added.
+    """
+
+    data_dir = data_dir or settings.data_dir
+    if not data_dir.is_dir():
+        print(f"Data directory not found: {data_dir}", file=sys.stderr)
+        sys.exit(1)
+
+    if mode not in IMPORT_MODES:
+        print(f"Unknown import mode: {mode} (expected one of {', '.join(IMPORT_MODES)})", file=sys.stderr)
+        sys.exit(1)
+
+    if interval <= 0:
+        print(f"--interval must be greater than 0 (got {interval})", file=sys.stderr)
+        sys.exit(1)
+
+    if refresh_views_every < 0:
+        print(f"--refresh-views-every must be 0 or more (got {refresh_views_every})", file=sys.stderr)
+        sys.exit(1)
+
+    _create_tables()
+    print(f"Watching {data_dir} every {interval:g}s (mode: {mode}); press Ctrl-C to stop", flush=True)
+
+    observed, imported, hashes = {}, {}, {}
+    total_processed = total_skipped = 0
+    busy = 0.0
+    connection = db = None
+    views_stale, views_refreshed_at = False, None
+    started = time.perf_counter()
+
+    try:
+        while True:
+            cycle_started = time.perf_counter()
+            try:
+                # ingest on one connection held across polls: no pool checkout (and pre-ping) per commit.
+                if connection is None:
+                    connection = engine.connect()
+                    db = Session(bind=connection, autoflush=False)
+
+                processed, skipped = _watch_cycle(
+                    data_dir, db, mode, queue_depth, decompress_thread, observed, imported, hashes
+                )
+                if processed:
+                    # unlike the views, the index is updated per poll: it costs little more than the rows it takes in.
+                    # both updates check out a pooled connection of their own for their repeatable read snapshot.
+                    if _bitmap_index_enabled():
+                        update_bitmap_index()
+                    if _column_snapshots_enabled():
+                        update_column_snapshot()
+
+                # a poll that read a file left the views stale; refresh them once the last refresh is old enough.
+                views_stale = views_stale or bool(processed or skipped)
+                if views_stale and refresh_views_every and (
+                    views_refreshed_at is None or time.perf_counter() - views_refreshed_at >= refresh_views_every
+                ):
+                    views_started = time.perf_counter()
+                    views = refresh_analytics_views()
+                    views_stale, views_refreshed_at = False, time.perf_counter()
+                    if views:
+                        print(f"  analytics views refreshed in {views_refreshed_at - views_started:.2f}s", flush=True)
+
+            except OperationalError as e:
+                # the connection is gone (or could not be opened): retry on the next poll; checkpoints make it cheap.
+                print(f"Database connection lost, reconnecting: {e.orig}", file=sys.stderr)
+                if db is not None:
+                    db.close()
+                if connection is not None:
+                    connection.invalidate()
+                    connection.close()
+                connection = db = None
+                imported.clear()
+                processed = skipped = 0
+
+            if processed or skipped:
+                busy += time.perf_counter() - cycle_started
+                total_processed += processed
+                total_skipped += skipped
+                print(
+                    f"  total: {total_processed} rows processed, {total_skipped} skipped (malformed), "
+                    f"{total_processed / busy if busy else 0:,.0f} rows/s while ingesting",
+                    flush=True,
+                )
+            time.sleep(interval)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        if connection is not None:
+            db.close()
+            connection.close()
+
+    print(f"Stopped. Total processed: {total_processed}, total skipped (malformed): {total_skipped}")
+    print(f"Watched for {time.perf_counter() - started:.2f}s, ingesting for {busy:.2f}s (mode: {mode})")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """command-line options for the importer."""
+
+    parser = argparse.ArgumentParser(description="Import activities_YYYYMMDD.csv files into PostgreSQL.")
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        type=Path,
+        help="CSV sources to import instead of scanning --data-dir: plain, .gz or .zst files, "
+        "or - to read (optionally gzip/zstd compressed) CSV from stdin.",
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=None,
+        help="directory containing the CSV files (default: settings.data_dir).",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=IMPORT_MODES,
+        default="insert",
+        help="insert: batched INSERT ... ON CONFLICT statements (default); "
+        "copy: COPY into an unlogged staging table, then one INSERT ... SELECT per file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes importing files in parallel, each with its own connection (default: 1).",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=0,
+        help="overlap parsing and database writes: a writer thread flushes batches while the parser fills "
+        "the next ones, with at most N batches queued (default: 0, parse and write in turn).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="re-import every file from the top, ignoring the import manifest.",
+    )
+    parser.add_argument(
+        "--decompress-thread",
+        action="store_true",
+        help="decompress .gz/.zst sources and stdin on a background thread, overlapping it with CSV parsing.",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="for large initial loads: drop the secondary indexes, load, rebuild them with "
+        "CREATE INDEX CONCURRENTLY and ANALYZE merchant_activities, reporting the time of each phase.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print per-file rows/s and MB/s, cumulative time per phase (parse, validate, build, execute, "
+        "checkpoint, merge, commit), batch latency percentiles and peak RSS.",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="write the same measurements as a JSON report to FILE, e.g. to compare releases.",
+    )
+    parser.add_argument(
+        "--rebuild-rollups",
+        action="store_true",
+        help=(
+            "recompute merchant_daily_rollups and merchant_sketches from merchant_activities, and the merchant bitmap index "
+            "from the rollups, and exit (no files are imported)."
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running: poll --data-dir and ingest new and growing files as they appear (stop with Ctrl-C).",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between polls in --watch mode (default: 2).",
+    )
+    parser.add_argument(
+        "--refresh-views-every",
+        type=float,
+        default=60.0,
+        metavar="SECONDS",
+        help="in --watch mode, refresh the analytics views after a poll that read rows, at most once every SECONDS "
+        "(default: 60; 0: never). a refresh rereads the whole table, so the endpoints answer with the live queries "
+        "for up to that long after new rows arrive.",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.rebuild_rollups:
+        run_rebuild_rollups()
+    elif not args.watch:
+        run_import(
+            args.data_dir, mode=args.mode, workers=args.workers, queue_depth=args.queue_depth, force=args.force,
+            sources=args.sources, decompress_thread=args.decompress_thread, bulk=args.bulk,
+            profile=args.profile, report=args.report,
+        )
+    elif args.sources or args.workers != 1:
+        print("--watch polls --data-dir on one connection; it takes no sources or --workers", file=sys.stderr)
+        sys.exit(1)
+    else:
+        watch_import(
+            args.data_dir, mode=args.mode, interval=args.interval,
+            queue_depth=args.queue_depth, decompress_thread=args.decompress_thread,
+            refresh_views_every=args.refresh_views_every,
+        )
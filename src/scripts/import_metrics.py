@@ -0,0 +1,165 @@
+"""
+throughput instrumentation for the CSV importer: cumulative phase timers, batch latencies, bytes read and peak RSS.
+timings are taken per batch, never per row, so collecting them costs next to nothing and is always on;
+--profile prints the summary and --report writes it as JSON.
+"""
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then reported as unknown.
+    resource = None
+
+
+# phases in the order a batch goes through them; others (e.g. added later) are listed after these.
+PHASES = (
+    "parse",  # read, decompress, decode and split CSV rows
+    "validate",  # validate_batch and building row tuples
+    "build",  # INSERT statement construction, or CSV serialization for COPY
+    "execute",  # statement / COPY round trips to the database
+    "checkpoint",  # manifest checkpoint writes
+    "merge",  # COPY mode: staging table -> merchant_activities
+    "commit",
+)
+
+_MB = 1024 * 1024
+
+
+def peak_rss_bytes() -> int | None:
+    """peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """nearest-rank percentile of an already sorted list (0.0 for an empty one)."""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ImportMetrics:
+    """
+    counters for one import run (or, in a pool worker, one file).
+    safe to update from the parser and writer threads at once.
+    """
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self.batch_latencies: list[float] = []
+        self.bytes_read = 0
+        self.peak_rss = peak_rss_bytes()
+        self.files: list[dict] = []
+        self._lock = threading.Lock()
+
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """add the wall time of the block to phase `name`."""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+
+    def record_batch(self, seconds: float) -> None:
+        """time from handing a batch to the database to its commit."""
+        with self._lock:
+            self.batch_latencies.append(seconds)
+
+
+    def record_bytes(self, count: int) -> None:
+        with self._lock:
+            self.bytes_read += count
+
+
+    def to_dict(self) -> dict:
+        """the counters as plain data, e.g. to send them back from a pool worker."""
+
+        return {
+            "phases": dict(self.phases),
+            "batch_latencies": list(self.batch_latencies),
+            "bytes_read": self.bytes_read,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+
+    def merge(self, other: dict) -> None:
+        """fold in the counters of another process (see to_dict)."""
+
+        for name, seconds in other["phases"].items():
+            self.add(name, seconds)
+        with self._lock:
+            self.batch_latencies.extend(other["batch_latencies"])
+            self.bytes_read += other["bytes_read"]
+            if other["peak_rss_bytes"] is not None:
+                self.peak_rss = max(self.peak_rss or 0, other["peak_rss_bytes"])
+
+
+    def report(self, elapsed: float, processed: int, skipped: int, **run) -> dict:
+        """machine-readable summary of the run; `run` adds context such as mode and workers."""
+
+        latencies = sorted(self.batch_latencies)
+        own_rss = peak_rss_bytes()
+        peak = max(rss for rss in (self.peak_rss, own_rss, 0) if rss is not None)
+        ordered = [name for name in PHASES if name in self.phases] + sorted(set(self.phases) - set(PHASES))
+
+        return {
+            **run,
+            "elapsed_seconds": round(elapsed, 4),
+            "rows_processed": processed,
+            "rows_skipped": skipped,
+            "bytes_read": self.bytes_read,
+            "rows_per_second": round(processed / elapsed, 1) if elapsed else 0.0,
+            "mb_per_second": round(self.bytes_read / _MB / elapsed, 3) if elapsed else 0.0,
+            "peak_rss_bytes": peak or None,
+            "phases": {name: round(self.phases[name], 4) for name in ordered},
+            "batch_latency_ms": {
+                "count": len(latencies),
+                "p50": round(percentile(latencies, 0.50) * 1000, 3),
+                "p90": round(percentile(latencies, 0.90) * 1000, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            },
+            "files": self.files,
+        }
+
+
+def format_report(report: dict) -> list[str]:
+    """human-readable lines for a report built by ImportMetrics.report."""
+
+    phases = report["phases"]
+    measured = sum(phases.values())
+    lines = ["Profile (phase times are cumulative across threads and workers):"]
+    for name, seconds in phases.items():
+        share = seconds / measured * 100 if measured else 0.0
+        lines.append(f"  {name:<11} {seconds:9.2f}s  {share:5.1f}%")
+
+    latency = report["batch_latency_ms"]
+    lines.append(
+        f"  batch latency: p50 {latency['p50']:.1f}ms, p90 {latency['p90']:.1f}ms, "
+        f"p99 {latency['p99']:.1f}ms, max {latency['max']:.1f}ms ({latency['count']} batches)"
+    )
+    lines.append(
+        f"  throughput: {report['rows_per_second']:,.0f} rows/s, {report['mb_per_second']:.2f} MB/s "
+        f"({report['bytes_read'] / _MB:.1f} MB read)"
+    )
+    rss = report["peak_rss_bytes"]
+    lines.append(f"  peak RSS: {rss / _MB:.1f} MB" if rss else "  peak RSS: unknown on this platform")
+    return lines
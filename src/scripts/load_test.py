@@ -0,0 +1,110 @@
+"""
+load test of running APIs at rising concurrency: each client sends one request after another for a fixed time, and
+requests per second and latency percentiles are reported per API and concurrency level. point it at one API started
+with DATABASE_DRIVER=sync and one with DATABASE_DRIVER=async to compare the two drivers.
+run from project root: python -m src.scripts.load_test --url sync=http://localhost:8080 --url async=http://localhost:8081
+    [--path PATH ...] [--concurrency N ...] [--duration SECONDS]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import httpx
+
+DEFAULT_PATHS = ("/analytics/kyc-funnel",)
+DEFAULT_CONCURRENCY = (1, 16, 64, 256)
+
+
+async def _client(client: httpx.AsyncClient, paths: list[str], until: float, latencies: list[float], errors: list[str]) -> None:
+    """send requests, cycling through paths, until the deadline; record each latency or error."""
+
+    i = 0
+    while time.perf_counter() < until:
+        started = time.perf_counter()
+        try:
+            response = await client.get(paths[i % len(paths)])
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        i += 1
+
+
+async def run_level(url: str, paths: list[str], concurrency: int, duration: float) -> dict:
+    """run `concurrency` clients against url for `duration` seconds; returns throughput and latency percentiles in ms."""
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120.0) as client:
+        # one request first, so connection set-up and a cold first query are not measured.
+        (await client.get(paths[0])).raise_for_status()
+
+        latencies: list[float] = []
+        errors: list[str] = []
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(_client(client, paths, started + duration, latencies, errors) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) if latencies else 0.0,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def _labelled_url(value: str) -> tuple[str, str]:
+    """LABEL=URL, or a bare URL labelled with itself."""
+
+    label, _, url = value.partition("=")
+    return (label, url) if url else (value, value)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="load test running APIs at rising concurrency.")
+    parser.add_argument(
+        "--url", action="append", type=_labelled_url, metavar="[LABEL=]URL",
+        help="base URL of a running API; repeat it to compare several (default: http://localhost:8080)",
+    )
+    parser.add_argument("--path", action="append", help=f"endpoint to request; repeat it to cycle through several (default: {DEFAULT_PATHS[0]})")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY), help="clients sending at the same time, one run per value")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each run lasts")
+    args = parser.parse_args(argv)
+    if any(n < 1 for n in args.concurrency) or args.duration <= 0:
+        parser.error("--concurrency must be at least 1 and --duration positive")
+    args.url = args.url or [_labelled_url("http://localhost:8080")]
+    args.path = args.path or list(DEFAULT_PATHS)
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    print(f"{', '.join(args.path)}: {args.duration:g}s per run")
+    print(f"{'api':<12}{'clients':>8}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    try:
+        for concurrency in args.concurrency:
+            for label, url in args.url:
+                result = asyncio.run(run_level(url, args.path, concurrency, args.duration))
+                print(
+                    f"{label:<12}{concurrency:>8}{result['requests_per_second']:>10.1f}{result['mean_ms']:>10.1f}"
+                    f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+                )
+
+    except httpx.HTTPError as e:
+        print(f"Load test failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
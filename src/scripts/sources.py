@@ -0,0 +1,192 @@
+"""
+input sources for the CSV importer: plain files, .csv.gz, .csv.zst and stdin ("-").
+compressed data is decompressed on the fly with bounded memory, optionally on a background thread.
+"""
+import gzip
+import io
+import queue
+import sys
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst sources (pip install zstandard).
+    zstandard = None
+
+
+# the path that stands for standard input on the command line.
+STDIN = Path("-")
+
+# leading bytes that identify a compressed stream when there is no file name to go by (stdin).
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# decompressed bytes handed from the background thread per chunk, and how many chunks may wait.
+CHUNK_SIZE = 1 << 20
+CHUNK_QUEUE_DEPTH = 4
+
+
+def compression_of(path: Path) -> str | None:
+    """'gzip', 'zstd' or None for a file, judged by its suffix."""
+
+    if path.suffix == ".gz":
+        return "gzip"
+    if path.suffix == ".zst":
+        return "zstd"
+    return None
+
+
+def _sniff(stream: io.BufferedReader) -> str | None:
+    """'gzip', 'zstd' or None for a stream, judged by its magic bytes (without consuming them)."""
+
+    head = stream.peek(4)[:4]
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def _decompressing(raw, compression: str | None):
+    """wrap a binary stream so reads return decompressed bytes."""
+
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("reading .zst sources requires the 'zstandard' package (pip install zstandard).")
+        # read_across_frames: a file appended to with `zstd >>` holds several frames, like a multi-member gzip.
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        return io.BufferedReader(reader, buffer_size=CHUNK_SIZE)
+
+    return raw
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    read a stream on a background thread and hand the bytes over through a bounded queue.
+    zlib and zstd release the GIL while decompressing, so this overlaps decompression with CSV parsing;
+    at most CHUNK_QUEUE_DEPTH chunks of CHUNK_SIZE bytes are buffered.
+    """
+
+    def __init__(self, source, chunk_size: int = CHUNK_SIZE, depth: int = CHUNK_QUEUE_DEPTH) -> None:
+        super().__init__()
+        self._chunks = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._pending = memoryview(b"")
+        self._eof = False
+        self._error = None
+        self._position = 0
+        self._thread = threading.Thread(
+            target=self._fill, args=(source, chunk_size), name="import-decompress", daemon=True
+        )
+        self._thread.start()
+
+    def _fill(self, source, chunk_size: int) -> None:
+        try:
+            while not self._stop.is_set():
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                self._put(chunk)
+
+        except BaseException as e:
+            self._error = e
+
+        finally:
+            # an empty chunk marks the end of the stream (or the point where it failed).
+            self._put(b"")
+
+    def _put(self, chunk: bytes) -> None:
+        # poll so a reader that closes early never leaves this thread blocked on a full queue.
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if not chunk:
+                self._eof = True
+                if self._error is not None:
+                    raise self._error
+                return 0
+            self._pending = memoryview(chunk)
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        self._position += size
+        return size
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+
+@contextmanager
+def open_source(path: Path, decompress_thread: bool = False) -> Iterator[io.BufferedIOBase]:
+    """
+    open a source as a binary stream of (decompressed) CSV bytes.
+    path may be a plain, .gz or .zst file, or STDIN; stdin compression is detected from its magic bytes.
+    """
+
+    if path == STDIN:
+        raw = sys.stdin.buffer
+        compression = _sniff(raw)
+        owned = None
+    else:
+        raw = owned = open(path, "rb")
+        compression = compression_of(path)
+
+    try:
+        stream = _decompressing(raw, compression)
+
+        # plain files are already read through the OS page cache; a thread only helps when there is work to do.
+        if decompress_thread and (compression is not None or path == STDIN):
+            stream = io.BufferedReader(ThreadedReader(stream), buffer_size=CHUNK_SIZE)
+
+        try:
+            yield stream
+        finally:
+            if stream is not raw:
+                stream.close()
+
+    finally:
+        if owned is not None:
+            owned.close()
+
+
+def skip_to(stream, position: int, offset: int) -> None:
+    """advance a stream from `position` to byte `offset`, seeking when it can and reading otherwise."""
+
+    if offset <= position:
+        return
+    if stream.seekable():
+        stream.seek(offset)
+        return
+
+    # compressed or piped data: decompress and discard, a chunk at a time.
+    remaining = offset - position
+    while remaining > 0:
+        chunk = stream.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
@@ -1,30 +1,134 @@
 """business logic for moniepoint analytics services: the queries and aggregations."""
-from sqlalchemy import case, func, select, and_
+import asyncio
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+from sqlalchemy import Numeric, and_, case, cast, func, literal, literal_column, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
-from src.models import Activity
+from sqlalchemy.sql import TableClause
+from src.models import Activity, DailyRollup, DataVersion, MerchantSketch, ViewRefresh
+from src.models.analytics_views import (
+    KYC_STAGE_COUNTS,
+    MERCHANT_TOTALS,
+    MONTHLY_ACTIVE_MERCHANTS,
+    PRODUCT_ADOPTION,
+    PRODUCT_FAILURE_COUNTS,
+)
+from src.models.daily_rollup import NO_TIMESTAMP_DAY
+from src.models.data_version import DATA_VERSION_ID
+from src.services.bitmap_index import MerchantBitmapIndex
+from src.services.hyperloglog import HyperLogLog
+
+
+# where the service can read from (see Settings.analytics_source).
+ANALYTICS_SOURCES = ("live", "rollup", "views", "bitmaps")
+
+# the KYC funnel as (product, event_type) stages, in funnel order.
+KYC_STAGES = (
+    ("KYC", "DOCUMENT_SUBMITTED"),
+    ("KYC", "VERIFICATION_COMPLETED"),
+    ("KYC", "TIER_UPGRADE"),
+)
+
+# the results of get_summary, by response field: each is what the service method get_<field> returns.
+SUMMARY_PARTS = ("top_merchant", "monthly_active_merchants", "product_adoption", "kyc_funnel", "failure_rates")
+
+# upper bound on funnel stages per request (each ordered stage adds a join).
+MAX_FUNNEL_STAGES = 10
 
 
 class AnalyticsService:
-    """service for analytics queries over merchant activity data."""
+    """
+    service for analytics queries over merchant activity data.
+    source "live" scans merchant_activities; "rollup" reads merchant_daily_rollups, which returns the same
+    results at a cost that grows with days x merchants instead of events; "views" reads the materialized
+    analytics views while they are fresh and falls back to the live queries while an import has made them stale.
+    "bitmaps" answers distinct-merchant counts with bitmap operations on the merchant bitmap index while it is at the
+    current data version, and everything else (or everything, while the index lags) with the live queries.
+    """
 
-    def __init__(self, db: Session) -> None:
+    def __init__(self, db: Session, source: str = "live", bitmaps: MerchantBitmapIndex | None = None) -> None:
 
-        # initialize the db session.
+        if source not in ANALYTICS_SOURCES:
+            raise ValueError(f"unknown analytics source: {source} (expected one of {', '.join(ANALYTICS_SOURCES)})")
+
+        # initialize the db session and the table the queries read from.
         self._db = db
+        self._source = source
+        self._bitmaps = bitmaps
+
+
+    def _fresh_view(self, view) -> TableClause | None:
+        """the view to read from, or None when the source is not "views" or the view is stale (or not created yet)."""
+
+        if self._source != "views":
+            return None
+
+        try:
+            fresh = self._db.execute(
+                select(ViewRefresh.data_version == ViewRefresh.refreshed_version)
+                .where(ViewRefresh.view_name == view.name)
+            ).scalar()
+
+        except OperationalError:
+            raise RuntimeError("Database is unreachable. Please try again later.")
+
+        except SQLAlchemyError:
+            # e.g. the importer has not created the views yet: answer live, on a clean transaction.
+            self._db.rollback()
+            return None
+
+        return view.table if fresh else None
+
+
+    def _fresh_bitmaps(self) -> MerchantBitmapIndex | None:
+        """the bitmap index, or None when the source is not "bitmaps" or the index is not at the current data version."""
+
+        if self._source != "bitmaps" or self._bitmaps is None:
+            return None
+
+        try:
+            version = self._db.execute(
+                select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ID)
+            ).scalar()
+
+        except OperationalError:
+            raise RuntimeError("Database is unreachable. Please try again later.")
+
+        except SQLAlchemyError:
+            # e.g. nothing was imported yet: answer live, on a clean transaction.
+            self._db.rollback()
+            return None
+
+        return self._bitmaps if (version or 0) == self._bitmaps.data_version else None
 
 
     def get_top_merchant(self) -> dict:
         """method for merchant with highest total successful transaction amount across all products."""
 
         # subquery to calculate total successful volume per merchant (to return merchant with highest total volume).
-        subq = (
-            select(Activity.merchant_id, func.sum(Activity.amount).label("total"))
-            .where(Activity.status == "SUCCESS")
-            .group_by(Activity.merchant_id)
-            .order_by(func.sum(Activity.amount).desc())
-            .limit(1)
-        )
+        view = self._fresh_view(MERCHANT_TOTALS)
+        if view is not None:
+            subq = select(view.c.merchant_id, view.c.total).order_by(view.c.total.desc()).limit(1)
+
+        elif self._source == "rollup":
+            subq = (
+                select(DailyRollup.merchant_id, func.sum(DailyRollup.amount_sum).label("total"))
+                .where(DailyRollup.status == "SUCCESS")
+                .group_by(DailyRollup.merchant_id)
+                .order_by(func.sum(DailyRollup.amount_sum).desc())
+                .limit(1)
+            )
+        else:
+            subq = (
+                select(Activity.merchant_id, func.sum(Activity.amount).label("total"))
+                .where(Activity.status == "SUCCESS")
+                .group_by(Activity.merchant_id)
+                .order_by(func.sum(Activity.amount).desc())
+                .limit(1)
+            )
 
         try:
             # execute the subquery and fetch the top row.
@@ -50,27 +154,62 @@ class AnalyticsService:
         return {"merchant_id": row.merchant_id, "total_volume": round(total, 2)}
 
 
-    def get_monthly_active_merchants(self) -> dict[str, int]:
-        """method for unique merchants with at least one successful event per month."""
+    def get_monthly_active_merchants(self, approx: bool = False) -> dict[str, int]:
+        """
+        method for unique merchants with at least one successful event per month.
+        approx estimates the counts from the importer's HyperLogLog sketches instead of counting distinct rows.
+        """
+
+        if approx:
+            return dict(sorted(self._sketch_counts("month").items()))
+
+        bitmaps = self._fresh_bitmaps()
+        if bitmaps is not None:
+            # events without a timestamp sit under the month "" and are not counted.
+            counts = bitmaps.count_by("month", status="SUCCESS")
+            return {month: count for month, count in sorted(counts.items()) if month}
+
+        view = self._fresh_view(MONTHLY_ACTIVE_MERCHANTS)
+        if view is not None:
+            stmt = select(view.c.month, view.c.merchant_count.label("count")).order_by(view.c.month)
+
+        elif self._source == "rollup":
+            # a rollup day lies in the same month as its events; events without a timestamp are not counted.
+            month = func.date_trunc("month", DailyRollup.day)
+            stmt = (
+                select(
+                    func.to_char(month, "YYYY-MM").label("month"),
+                    func.count(func.distinct(DailyRollup.merchant_id)).label("count"),
+                )
+                .where(
+                    and_(
+                        DailyRollup.status == "SUCCESS",
+                        DailyRollup.day != literal_column(f"'{NO_TIMESTAMP_DAY}'::date"),
+                    )
+                )
+                .group_by(month)
+                .order_by(month)
+            )
 
-        # use date_trunc to group by month (truncated-timestamp) and extract month in YYYY-MM format.
-        month = func.date_trunc("month", Activity.event_timestamp)
+        else:
+            # use date_trunc to group by month (truncated-timestamp) and extract month in YYYY-MM format.
+            month = func.date_trunc("month", Activity.event_timestamp)
 
-        # query to count unique merchants per month (with at least a succssful event) and sort by month.
-        stmt = (
-            select(
-                func.to_char(month, "YYYY-MM").label("month"),
-                func.count(func.distinct(Activity.merchant_id)).label("count"),
-            )
-            .where(
-                and_(
-                    Activity.status == "SUCCESS",
-                    Activity.event_timestamp.isnot(None),
+            # query to count unique merchants per month (with at least a succssful event) and sort by month.
+            stmt = (
+                select(
+                    func.to_char(month, "YYYY-MM").label("month"),
+                    func.count(func.distinct(Activity.merchant_id)).label("count"),
                 )
+                .where(
+                    and_(
+                        Activity.status == "SUCCESS",
+                        Activity.event_timestamp.isnot(None),
+                    )
+                )
+                .group_by(month)
+                .order_by(month)
             )
-            .group_by(month)
-            .order_by(month)
-        )
 
         try:
             # execute the query.
@@ -85,18 +224,38 @@ class AnalyticsService:
         return {row.month: row.count for row in rows}
 
 
-    def get_product_adoption(self) -> dict[str, int]:
-        """method for unique merchant count per product, sorted by count descending."""
+    def get_product_adoption(self, approx: bool = False) -> dict[str, int]:
+        """
+        method for unique merchant count per product, sorted by count descending.
+        approx estimates the counts from the importer's HyperLogLog sketches instead of counting distinct rows.
+        """
 
-        # query to count unique merchants per products and sort in a descending order.
-        stmt = (
-            select(
-                Activity.product,
-                func.count(func.distinct(Activity.merchant_id)).label("count"),
+        if approx:
+            counts = self._sketch_counts("product")
+            return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+        bitmaps = self._fresh_bitmaps()
+        if bitmaps is not None:
+            counts = bitmaps.count_by("product")
+            return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+        view = self._fresh_view(PRODUCT_ADOPTION)
+        if view is not None:
+            stmt = select(view.c.product, view.c.merchant_count.label("count")).order_by(view.c.merchant_count.desc())
+
+        else:
+            # the rollup has the same product and merchant_id columns, so the query only changes its table.
+            source = DailyRollup if self._source == "rollup" else Activity
+
+            # query to count unique merchants per products and sort in a descending order.
+            stmt = (
+                select(
+                    source.product,
+                    func.count(func.distinct(source.merchant_id)).label("count"),
+                )
+                .group_by(source.product)
+                .order_by(func.count(func.distinct(source.merchant_id)).desc())
             )
-            .group_by(Activity.product)
-            .order_by(func.count(func.distinct(Activity.merchant_id)).desc())
-        )
 
         try:
             # execute the query.
@@ -114,28 +273,39 @@ class AnalyticsService:
     def get_kyc_funnel(self) -> dict[str, int]:
         """method for KYC conversion funnel: unique merchants at each stage (successful events only)."""
 
-        # condition to filter only successful KYC events.
-        kyc_success = and_(Activity.product == "KYC", Activity.status == "SUCCESS")
+        bitmaps = self._fresh_bitmaps()
+        if bitmaps is not None:
+            docs, verif, tier = (
+                bitmaps.select(product=product, event_type=event_type, status="SUCCESS").bit_count()
+                for product, event_type in KYC_STAGES
+            )
+            return {"documents_submitted": docs, "verifications_completed": verif, "tier_upgrades": tier}
 
-        try:
-            # count unique merchants at each KYC stage using condition aggregations.
-            docs = self._db.execute(
-                select(func.count(func.distinct(Activity.merchant_id))).where(
-                    and_(kyc_success, Activity.event_type == "DOCUMENT_SUBMITTED")
-                )
-            ).scalar() or 0
+        view = self._fresh_view(KYC_STAGE_COUNTS)
+        if view is not None:
+            try:
+                # the view holds one row per KYC stage (event type) that has successful events.
+                rows = self._db.execute(select(view.c.event_type, view.c.merchant_count)).all()
 
-            verif = self._db.execute(
-                select(func.count(func.distinct(Activity.merchant_id))).where(
-                    and_(kyc_success, Activity.event_type == "VERIFICATION_COMPLETED")
-                )
-            ).scalar() or 0
+            except OperationalError:
+                raise RuntimeError("Database is unreachable. Please try again later.")
 
-            tier = self._db.execute(
-                select(func.count(func.distinct(Activity.merchant_id))).where(
-                    and_(kyc_success, Activity.event_type == "TIER_UPGRADE")
-                )
-            ).scalar() or 0
+            except SQLAlchemyError as e:
+                raise RuntimeError(f"A database error occurred while fetching KYC funnel: {e}")
+
+            stages = {row.event_type: row.merchant_count for row in rows}
+            return {
+                "documents_submitted": stages.get("DOCUMENT_SUBMITTED", 0),
+                "verifications_completed": stages.get("VERIFICATION_COMPLETED", 0),
+                "tier_upgrades": stages.get("TIER_UPGRADE", 0),
+            }
+
+        # the rollup has the same product, status, event_type and merchant_id columns.
+        source = DailyRollup if self._source == "rollup" else Activity
+
+        try:
+            # all three stages in one scan of the successful KYC events.
+            docs, verif, tier = self._db.execute(self._stage_counts(source, KYC_STAGES)).one()
 
         except OperationalError:
             raise RuntimeError("Database is unreachable. Please try again later.")
@@ -144,35 +314,175 @@ class AnalyticsService:
             raise RuntimeError(f"A database error occurred while fetching KYC funnel: {e}")
 
         return {
-            "documents_submitted": docs,
-            "verifications_completed": verif,
-            "tier_upgrades": tier,
+            "documents_submitted": docs or 0,
+            "verifications_completed": verif or 0,
+            "tier_upgrades": tier or 0,
         }
 
 
-    def get_failure_rates(self) -> list[dict]:
-        """method for failure rate per product: (FAILED / (SUCCESS + FAILED)) * 100; exclude PENDING; sort descending."""
+    def get_funnel(
+        self,
+        stages: list[tuple[str, str]],
+        ordered: bool = False,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[dict]:
+        """
+        method for a funnel over any ordered (product, event_type) stages: unique merchants per stage, successful
+        events only, optionally within [start, end). unordered, each stage counts every merchant that reached it
+        (as the KYC funnel does); ordered, a merchant counts at a stage only after reaching every earlier stage,
+        each at or after the previous one by event_timestamp.
+        """
+
+        self._check_funnel(stages, start, end)
+
+        # the rollups and bitmaps keep no timestamps, so only an unordered, unbounded funnel can read them.
+        unbounded = not ordered and start is None and end is None
+        bitmaps = self._fresh_bitmaps() if unbounded else None
+        if bitmaps is not None:
+            counts = [
+                bitmaps.select(product=product, event_type=event_type, status="SUCCESS").bit_count()
+                for product, event_type in stages
+            ]
+        else:
+            if self._source == "rollup" and unbounded:
+                stmt = self._stage_counts(DailyRollup, stages)
+            elif ordered:
+                stmt = self._ordered_stage_counts(stages, start, end)
+            else:
+                stmt = self._stage_counts(Activity, stages, start, end)
+
+            try:
+                counts = [count or 0 for count in self._db.execute(stmt).one()]
+
+            except OperationalError:
+                raise RuntimeError("Database is unreachable. Please try again later.")
+
+            except SQLAlchemyError as e:
+                raise RuntimeError(f"A database error occurred while fetching funnel: {e}")
+
+        return self._funnel_stages(stages, counts)
+
+
+    def _check_funnel(self, stages, start: datetime | None, end: datetime | None) -> None:
 
-        # use conditional aggregation to count failed transactions.
-        failed = func.sum(case((Activity.status == "FAILED", 1), else_=0))
+        if not stages:
+            raise ValueError("a funnel needs at least one stage")
 
-        # use conditional aggregation to count successful transactions.
-        success = func.sum(case((Activity.status == "SUCCESS", 1), else_=0))
+        if len(stages) > MAX_FUNNEL_STAGES:
+            raise ValueError(f"a funnel has at most {MAX_FUNNEL_STAGES} stages (got {len(stages)})")
 
-        # total resolved transactions per product (FAILED + SUCCESS); it is used as denominator in failure rate formula.
-        total_resolved = failed + success
+        if start is not None and end is not None and start >= end:
+            raise ValueError("start must be before end")
 
-        # calculate failure rate and handle division by zero error with nullif.
-        rate_expr = (100.0 * failed / func.nullif(total_resolved, 0)).label("failure_rate")
 
-        # query products with their failure rates (excluding PENDING scenarios).
-        stmt = (
-            select(Activity.product, rate_expr)
-            .where(Activity.status.in_(["SUCCESS", "FAILED"]))
-            .group_by(Activity.product)
-            .order_by(rate_expr.desc())
+    def _funnel_stages(self, stages, counts: list[int]) -> list[dict]:
+        """the funnel response from the unique merchants per stage."""
+
+        # conversion from the previous stage, as a percentage (the first stage converts from itself).
+        return [
+            {
+                "product": product,
+                "event_type": event_type,
+                "merchants": count,
+                "conversion_rate": round(100.0 * count / previous, 1) if previous else 0.0,
+            }
+            for (product, event_type), count, previous in zip(stages, counts, [counts[0]] + counts[:-1])
+        ]
+
+
+    def get_merchant_overlap(self, stages: list[tuple[str, str]]) -> dict:
+        """
+        method for the merchants that reached every one of the (product, event_type) stages, successful events only,
+        e.g. merchants who submitted documents and also upgraded tier: an AND of the stages' bitmaps with the
+        "bitmaps" source, otherwise one grouped scan keeping the merchants that have every stage.
+        """
+
+        stages = self._overlap_stages(stages)
+        stage_items = [{"product": product, "event_type": event_type} for product, event_type in stages]
+
+        bitmaps = self._fresh_bitmaps()
+        if bitmaps is not None:
+            merchants = bitmaps.select(product=stages[0][0], event_type=stages[0][1], status="SUCCESS")
+            for product, event_type in stages[1:]:
+                merchants &= bitmaps.select(product=product, event_type=event_type, status="SUCCESS")
+            return {"stages": stage_items, "merchants": merchants.bit_count()}
+
+        # the rollup has the same product, event_type, status and merchant_id columns.
+        source = DailyRollup if self._source == "rollup" else Activity
+        merchants = (
+            select(source.merchant_id)
+            .where(
+                and_(
+                    source.status == "SUCCESS",
+                    tuple_(source.product, source.event_type).in_(stages),
+                )
+            )
+            .group_by(source.merchant_id)
+            .having(func.count(func.distinct(tuple_(source.product, source.event_type))) == len(stages))
+            .subquery("merchants")
         )
 
+        try:
+            count = self._db.execute(select(func.count()).select_from(merchants)).scalar()
+
+        except OperationalError:
+            raise RuntimeError("Database is unreachable. Please try again later.")
+
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"A database error occurred while fetching merchant overlap: {e}")
+
+        return {"stages": stage_items, "merchants": count or 0}
+
+
+    def _overlap_stages(self, stages) -> list[tuple[str, str]]:
+
+        # a stage given twice does not narrow the overlap.
+        stages = list(dict.fromkeys(stages))
+        if not stages:
+            raise ValueError("an overlap needs at least one stage")
+
+        if len(stages) > MAX_FUNNEL_STAGES:
+            raise ValueError(f"an overlap has at most {MAX_FUNNEL_STAGES} stages (got {len(stages)})")
+        return stages
+
+
+    def get_failure_rates(self) -> list[dict]:
+        """method for failure rate per product: (FAILED / (SUCCESS + FAILED)) * 100; exclude PENDING; sort descending."""
+
+        view = self._fresh_view(PRODUCT_FAILURE_COUNTS)
+        if view is not None:
+            # the view already holds the FAILED and SUCCESS counts per product; only the rate is left to compute.
+            rate_expr = (
+                100.0 * view.c.failed / func.nullif(view.c.failed + view.c.succeeded, 0)
+            ).label("failure_rate")
+            stmt = select(view.c.product, rate_expr).order_by(rate_expr.desc())
+
+        else:
+            # a rollup row stands for event_count events; a raw row for one.
+            source = DailyRollup if self._source == "rollup" else Activity
+            events = DailyRollup.event_count if self._source == "rollup" else 1
+
+            # use conditional aggregation to count failed transactions.
+            failed = func.sum(case((source.status == "FAILED", events), else_=0))
+
+            # use conditional aggregation to count successful transactions.
+            success = func.sum(case((source.status == "SUCCESS", events), else_=0))
+
+            # total resolved transactions per product (FAILED + SUCCESS); it is used as denominator in failure rate formula.
+            total_resolved = failed + success
+
+            # calculate failure rate and handle division by zero error with nullif.
+            rate_expr = (100.0 * failed / func.nullif(total_resolved, 0)).label("failure_rate")
+
+            # query products with their failure rates (excluding PENDING scenarios).
+            stmt = (
+                select(source.product, rate_expr)
+                .where(source.status.in_(["SUCCESS", "FAILED"]))
+                .group_by(source.product)
+                .order_by(rate_expr.desc())
+            )
+
         try:
             # execute the query and format results.
             rows = self._db.execute(stmt).all()
@@ -190,4 +500,268 @@ class AnalyticsService:
             ]
 
         except (TypeError, ValueError) as e:
-            raise RuntimeError(f"Unexpected data format in failure rates result: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Unexpected data format in failure rates result: {e}")
+
+
+    def get_summary(self) -> dict:
+        """
+        method for every dashboard result at once: top merchant, monthly active merchants, product adoption, kyc funnel
+        and failure rates. the "live" source computes them in one statement that groups the events once and derives
+        every result from the groups, rather than scanning merchant_activities once per result; the other sources
+        already read small precomputed data per result, so they combine their own answers.
+        """
+
+        if self._source != "live":
+            return {part: getattr(self, f"get_{part}")() for part in SUMMARY_PARTS}
+
+        try:
+            rows = self._db.execute(self._summary_statement()).all()
+
+        except OperationalError:
+            raise RuntimeError("Database is unreachable. Please try again later.")
+
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"A database error occurred while fetching the summary: {e}")
+
+        parts: dict[str, list] = {part: [] for part in SUMMARY_PARTS}
+        for row in rows:
+            parts[row.part].append(row)
+
+        top = parts["top_merchant"][0] if parts["top_merchant"] else None
+        stages = {row.key: int(row.value) for row in parts["kyc_funnel"]}
+        months = sorted(parts["monthly_active_merchants"], key=lambda row: row.key)
+        adoption = sorted(parts["product_adoption"], key=lambda row: row.value, reverse=True)
+
+        # sorted by the exact rate, as the failure rates query orders before it rounds.
+        rates = sorted(
+            ((100.0 * float(row.value) / float(row.total), row.key) for row in parts["failure_rates"] if row.total),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        return {
+            "top_merchant": {
+                "merchant_id": top.key if top is not None else None,
+                "total_volume": round(float(top.value or 0), 2) if top is not None else 0.00,
+            },
+            "monthly_active_merchants": {row.key: int(row.value) for row in months},
+            "product_adoption": {row.key: int(row.value) for row in adoption},
+            "kyc_funnel": {
+                "documents_submitted": stages.get("DOCUMENT_SUBMITTED", 0),
+                "verifications_completed": stages.get("VERIFICATION_COMPLETED", 0),
+                "tier_upgrades": stages.get("TIER_UPGRADE", 0),
+            },
+            "failure_rates": [{"product": product, "failure_rate": round(rate, 1)} for rate, product in rates],
+        }
+
+
+    def _summary_statement(self):
+        """
+        the summary as (part, key, value, total) rows. one grouped CTE (per merchant, product, event type, status and
+        month: about a sixth of the events on the sample data) reads the table once; each part is a small aggregate
+        over it.
+        """
+
+        keys = (Activity.merchant_id, Activity.product, Activity.event_type, Activity.status)
+        month = func.date_trunc("month", Activity.event_timestamp)
+        grouped = (
+            select(*keys, month.label("month"), func.sum(Activity.amount).label("amount"), func.count().label("events"))
+            .group_by(*keys, month)
+            .cte("grouped")
+        )
+        g = grouped.c
+        success = g.status == "SUCCESS"
+        merchants = func.count(func.distinct(g.merchant_id))
+
+        def part(name: str, key, value, total=None):
+            return (
+                literal(name).label("part"),
+                key.label("key"),
+                cast(value, Numeric).label("value"),
+                cast(total, Numeric).label("total"),
+            )
+
+        top = (
+            select(g.merchant_id, func.sum(g.amount).label("total"))
+            .where(success)
+            .group_by(g.merchant_id)
+            .order_by(func.sum(g.amount).desc())
+            .limit(1)
+            .subquery("top")
+        )
+        kyc_event_types = [event_type for _, event_type in KYC_STAGES]
+        failed = func.sum(g.events).filter(g.status == "FAILED")
+        return union_all(
+            select(*part("top_merchant", top.c.merchant_id, top.c.total)),
+            select(*part("monthly_active_merchants", func.to_char(g.month, "YYYY-MM"), merchants))
+            .where(and_(success, g.month.isnot(None)))
+            .group_by(g.month),
+            select(*part("product_adoption", g.product, merchants)).group_by(g.product),
+            select(*part("kyc_funnel", g.event_type, merchants))
+            .where(and_(success, g.product == "KYC", g.event_type.in_(kyc_event_types)))
+            .group_by(g.event_type),
+            select(*part("failure_rates", g.product, failed, func.sum(g.events)))
+            .where(g.status.in_(["SUCCESS", "FAILED"]))
+            .group_by(g.product),
+        )
+
+
+    def _sketch_counts(self, dimension: str) -> dict[str, int]:
+        """estimated unique merchants per key of a sketched dimension: one small read, whatever the number of events."""
+
+        try:
+            rows = self._db.execute(
+                select(MerchantSketch.key, MerchantSketch.registers).where(MerchantSketch.dimension == dimension)
+            ).all()
+
+        except OperationalError:
+            raise RuntimeError("Database is unreachable. Please try again later.")
+
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"A database error occurred while reading merchant sketches: {e}")
+
+        return {row.key: HyperLogLog.from_bytes(row.registers).count() for row in rows}
+
+
+    def _stage_counts(self, source, stages, start: datetime | None = None, end: datetime | None = None):
+        """one row with the unique merchants of every stage, counted in a single scan with FILTER clauses."""
+
+        stmt = select(
+            *(
+                func.count(func.distinct(source.merchant_id))
+                .filter(and_(source.product == product, source.event_type == event_type))
+                .label(f"stage_{i}")
+                for i, (product, event_type) in enumerate(stages)
+            )
+        ).where(
+            and_(
+                source.status == "SUCCESS",
+                tuple_(source.product, source.event_type).in_(list(stages)),
+            )
+        )
+
+        # windows apply to the raw events only (see get_funnel).
+        if start is not None:
+            stmt = stmt.where(Activity.event_timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(Activity.event_timestamp < end)
+        return stmt
+
+
+    def _ordered_stage_counts(self, stages, start: datetime | None = None, end: datetime | None = None):
+        """
+        one row with the merchants that reached each stage in order. a single scan groups each merchant's stage event
+        times into one array per stage; a chain of LATERAL lookups then takes, per merchant, the earliest time at each
+        stage that is at or after the time at the stage before (NULL once a stage is missed).
+        """
+
+        conditions = [
+            Activity.status == "SUCCESS",
+            Activity.event_timestamp.isnot(None),
+            tuple_(Activity.product, Activity.event_type).in_(list(stages)),
+        ]
+        if start is not None:
+            conditions.append(Activity.event_timestamp >= start)
+        if end is not None:
+            conditions.append(Activity.event_timestamp < end)
+
+        merchants = (
+            select(
+                *(
+                    func.array_agg(Activity.event_timestamp)
+                    .filter(and_(Activity.product == product, Activity.event_type == event_type))
+                    .label(f"stage_{i}")
+                    for i, (product, event_type) in enumerate(stages)
+                )
+            )
+            .where(and_(*conditions))
+            .group_by(Activity.merchant_id)
+            .subquery("merchant_stages")
+        )
+
+        stmt = select().select_from(merchants)
+        reached = []
+        for i in range(len(stages)):
+            times = (
+                func.unnest(merchants.c[f"stage_{i}"])
+                .table_valued("event_timestamp")
+                .render_derived(name=f"times_{i}")
+            )
+            stage = select(func.min(times.c.event_timestamp).label("reached_at")).select_from(times)
+            if reached:
+                stage = stage.where(times.c.event_timestamp >= reached[-1].c.reached_at)
+            stage = stage.lateral(f"reached_{i}")
+            stmt = stmt.join(stage, literal_column("true"))
+            reached.append(stage)
+
+        return stmt.add_columns(
+            *(func.count(stage.c.reached_at).label(f"stage_{i}") for i, stage in enumerate(reached))
+        )
+
+
+
+class AsyncAnalyticsService:
+    """
+    an AnalyticsService on an asyncpg session (DATABASE_DRIVER=async): the same queries, awaited on the event loop
+    instead of blocking a worker thread. each call runs the sync service, built by create_service on the session's
+    sync facade, through AsyncSession.run_sync, so every statement is executed by asyncpg and no query is duplicated.
+    with current_version (DataVersionTracker.current, which can block on its own connection), the data version is
+    read in a worker thread before each call and passed to create_service as version, instead of on the event loop.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        create_service: Callable[..., AnalyticsService],
+        current_version: Callable[[], int] | None = None,
+    ) -> None:
+
+        # initialize the async db session and the factory of the service that builds the queries.
+        self._db = db
+        self._create_service = create_service
+        self._current_version = current_version
+
+
+    async def _run(self, name: str, *args, **kwargs) -> Any:
+        if self._current_version is None:
+            return await self._db.run_sync(lambda db: getattr(self._create_service(db), name)(*args, **kwargs))
+
+        version = await asyncio.to_thread(self._current_version)
+        return await self._db.run_sync(lambda db: getattr(self._create_service(db, version), name)(*args, **kwargs))
+
+
+    async def get_top_merchant(self) -> dict:
+        return await self._run("get_top_merchant")
+
+
+    async def get_monthly_active_merchants(self, approx: bool = False) -> dict[str, int]:
+        return await self._run("get_monthly_active_merchants", approx=approx)
+
+
+    async def get_product_adoption(self, approx: bool = False) -> dict[str, int]:
+        return await self._run("get_product_adoption", approx=approx)
+
+
+    async def get_kyc_funnel(self) -> dict[str, int]:
+        return await self._run("get_kyc_funnel")
+
+
+    async def get_funnel(
+        self,
+        stages: list[tuple[str, str]],
+        ordered: bool = False,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[dict]:
+        return await self._run("get_funnel", stages, ordered=ordered, start=start, end=end)
+
+
+    async def get_merchant_overlap(self, stages: list[tuple[str, str]]) -> dict:
+        return await self._run("get_merchant_overlap", stages)
+
+
+    async def get_failure_rates(self) -> list[dict]:
+        return await self._run("get_failure_rates")
+
+
+    async def get_summary(self) -> dict:
+        return await self._run("get_summary")
\ No newline at end of file
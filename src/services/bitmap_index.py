@@ -0,0 +1,302 @@
+"""
+merchant bitmap index: one compressed bitmap of dense merchant ids per (month, product, event_type, status) key.
+distinct-merchant counts become popcounts and "merchants at A and B" an AND of two bitmaps, with no SQL scan.
+
+file layout (little-endian), written by the importer and memory-mapped by the API:
+    header     magic, data_version, merchant count, key count, length of the merchant dictionary
+    merchants  the merchant_ids, newline separated: dense id i is the i-th line
+    directory  per key: length + the key's fields joined by \\x1f, cardinality, offset and length of its bitmap
+    bitmaps    roaring-style: per 2**16 ids that hold any member, a container header (high 16 bits, kind, payload
+               length) and either a sorted uint16 array (at most 4096 members) or a 8 KiB bitmap
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"MBITMAP1"
+
+# (month as YYYY-MM, "" for events without a timestamp; product; event_type; status)
+BitmapKey = tuple[str, str, str, str]
+KEY_FIELDS = ("month", "product", "event_type", "status")
+
+_HEADER = struct.Struct("<8sQIIQ")
+_ENTRY = struct.Struct("<IQQ")
+_KEY_LENGTH = struct.Struct("<H")
+_CONTAINER = struct.Struct("<HBI")
+_SEPARATOR = "\x1f"
+
+CHUNK_BITS = 1 << 16
+ARRAY_MAX = 4096
+ARRAY, BITMAP = 0, 1
+_CHUNK_MASK = (1 << CHUNK_BITS) - 1
+_CHUNK_BYTES = CHUNK_BITS // 8
+
+
+def bits_of(ids) -> int:
+    """the bitmap (a python int, bit i set for dense id i) of an iterable of dense ids."""
+
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _array_positions(chunk: bytes) -> array:
+    positions = array("H")
+    for i, byte in enumerate(chunk):
+        while byte:
+            low = byte & -byte
+            positions.append(i * 8 + low.bit_length() - 1)
+            byte ^= low
+    return positions
+
+
+def encode_bitmap(bits: int) -> bytes:
+    """the roaring-style containers of a bitmap: an array container where it is sparse, a bitmap container elsewhere."""
+
+    parts = []
+    high = 0
+    while bits:
+        chunk = bits & _CHUNK_MASK
+        if chunk:
+            payload = chunk.to_bytes(_CHUNK_BYTES, "little")
+            if chunk.bit_count() <= ARRAY_MAX:
+                positions = _array_positions(payload)
+                if sys.byteorder != "little":
+                    positions.byteswap()
+                parts.append(_CONTAINER.pack(high, ARRAY, len(positions) * 2) + positions.tobytes())
+            else:
+                parts.append(_CONTAINER.pack(high, BITMAP, len(payload)) + payload)
+        bits >>= CHUNK_BITS
+        high += 1
+    return b"".join(parts)
+
+
+def decode_bitmap(data) -> int:
+    bits = 0
+    offset = 0
+    while offset < len(data):
+        high, kind, length = _CONTAINER.unpack_from(data, offset)
+        offset += _CONTAINER.size
+        payload = data[offset:offset + length]
+        offset += length
+        if kind == ARRAY:
+            positions = array("H")
+            positions.frombytes(payload)
+            if sys.byteorder != "little":
+                positions.byteswap()
+            chunk = bits_of(positions)
+        elif kind == BITMAP:
+            chunk = int.from_bytes(payload, "little")
+        else:
+            raise ValueError(f"unknown container kind {kind}")
+        bits |= chunk << (high * CHUNK_BITS)
+    return bits
+
+
+def write_index(path: Path, data_version: int, merchants: list[str], bitmaps: dict[BitmapKey, int]) -> None:
+    """write an index file atomically: readers see the previous file or this one, never a partial one."""
+
+    merchant_blob = "\n".join(merchants).encode()
+    keys = sorted(key for key, bits in bitmaps.items() if bits)
+    encoded_keys = [_SEPARATOR.join(key).encode() for key in keys]
+    blobs = [encode_bitmap(bitmaps[key]) for key in keys]
+
+    directory_size = sum(_KEY_LENGTH.size + len(key) + _ENTRY.size for key in encoded_keys)
+    offset = _HEADER.size + len(merchant_blob) + directory_size
+    parts = [_HEADER.pack(MAGIC, data_version, len(merchants), len(keys), len(merchant_blob)), merchant_blob]
+    for key, encoded, blob in zip(keys, encoded_keys, blobs):
+        parts.append(_KEY_LENGTH.pack(len(encoded)) + encoded + _ENTRY.pack(bitmaps[key].bit_count(), offset, len(blob)))
+        offset += len(blob)
+    parts.extend(blobs)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(b"".join(parts))
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates the file private to the importer; the API may run as another user.
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+
+
+class MerchantBitmapIndex:
+    """
+    a memory-mapped index file. only the header and directory are read up front; a bitmap is decoded on first use
+    and kept, so the pages of bitmaps nobody asks for are never touched.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size < _HEADER.size:
+                raise ValueError(f"{path} is not a merchant bitmap index")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # identifies the file on disk: the importer replaces it, so a new index is a new inode.
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.path = path
+
+        magic, self.data_version, self.merchant_count, key_count, merchants_length = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a merchant bitmap index")
+
+        self._merchants_at = (_HEADER.size, _HEADER.size + merchants_length)
+        self._directory: dict[BitmapKey, tuple[int, int, int]] = {}
+        offset = self._merchants_at[1]
+        for _ in range(key_count):
+            (length,) = _KEY_LENGTH.unpack_from(self._map, offset)
+            offset += _KEY_LENGTH.size
+            key = tuple(bytes(self._map[offset:offset + length]).decode().split(_SEPARATOR))
+            offset += length
+            self._directory[key] = _ENTRY.unpack_from(self._map, offset)
+            offset += _ENTRY.size
+        self._decoded: dict[BitmapKey, int] = {}
+
+
+    def keys(self) -> list[BitmapKey]:
+        return list(self._directory)
+
+
+    def merchants(self) -> list[str]:
+        """the merchant_ids by dense id."""
+
+        start, end = self._merchants_at
+        blob = bytes(self._map[start:end]).decode()
+        return blob.split("\n") if blob else []
+
+
+    def cardinality(self, key: BitmapKey) -> int:
+        entry = self._directory.get(key)
+        return entry[0] if entry else 0
+
+
+    def bitmap(self, key: BitmapKey) -> int:
+        bits = self._decoded.get(key)
+        if bits is None:
+            entry = self._directory.get(key)
+            if entry is None:
+                return 0
+            _, offset, length = entry
+            bits = self._decoded[key] = decode_bitmap(memoryview(self._map)[offset:offset + length])
+        return bits
+
+
+    def _matching(self, filters: dict[str, str | None]) -> list[BitmapKey]:
+        wanted = [(KEY_FIELDS.index(name), value) for name, value in filters.items() if value is not None]
+        return [key for key in self._directory if all(key[i] == value for i, value in wanted)]
+
+
+    def select(self, **filters: str | None) -> int:
+        """the union of the bitmaps of every key matching filters (month=, product=, event_type=, status=)."""
+
+        bits = 0
+        for key in self._matching(filters):
+            bits |= self.bitmap(key)
+        return bits
+
+
+    def count_by(self, field: str, **filters: str | None) -> dict[str, int]:
+        """unique merchants per value of one key field, over the keys matching filters."""
+
+        i = KEY_FIELDS.index(field)
+        groups: dict[str, int] = {}
+        for key in self._matching(filters):
+            groups[key[i]] = groups.get(key[i], 0) | self.bitmap(key)
+        return {value: bits.bit_count() for value, bits in groups.items()}
+
+
+class BitmapIndexBuilder:
+    """
+    builds the next index: starts from an existing one (or empty), gives merchants it has not seen the next dense ids
+    and adds members to bitmaps. adding a merchant that is already a member changes nothing.
+    """
+
+    def __init__(self, index: MerchantBitmapIndex | None = None) -> None:
+        self._index = index
+        self.merchants = index.merchants() if index is not None else []
+        self._ids = {merchant_id: i for i, merchant_id in enumerate(self.merchants)}
+        self._added: dict[BitmapKey, set[int]] = {}
+
+
+    def add(self, key: BitmapKey, merchant_id: str) -> None:
+        i = self._ids.get(merchant_id)
+        if i is None:
+            i = self._ids[merchant_id] = len(self.merchants)
+            self.merchants.append(merchant_id)
+        self._added.setdefault(key, set()).add(i)
+
+
+    def bitmaps(self) -> dict[BitmapKey, int]:
+        bitmaps = {key: self._index.bitmap(key) for key in self._index.keys()} if self._index is not None else {}
+        for key, ids in self._added.items():
+            bitmaps[key] = bitmaps.get(key, 0) | bits_of(ids)
+        return bitmaps
+
+
+    def write(self, path: Path, data_version: int) -> int:
+        """write the index stamped with data_version; returns the number of keys."""
+
+        bitmaps = self.bitmaps()
+        write_index(path, data_version, self.merchants, bitmaps)
+        return len(bitmaps)
+
+
+class BitmapIndexLoader:
+    """
+    the API's view of the index file: opened on first use and reopened once the importer has replaced it,
+    checking the file at most every `interval` seconds. a missing or unreadable file gives None (answer from SQL).
+    """
+
+    def __init__(self, path: Path, interval: float = 1.0) -> None:
+        self.path = path
+        self._interval = interval
+        self._index: MerchantBitmapIndex | None = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+
+    def current(self) -> MerchantBitmapIndex | None:
+        now = time.monotonic()
+        if now - self._checked < self._interval:
+            return self._index
+
+        with self._lock:
+            if now - self._checked < self._interval:
+                return self._index
+            self._checked = now
+
+            try:
+                stat = self.path.stat()
+                if self._index is None or self._index.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                    # the previous map is unmapped once the last request using it lets go of it.
+                    self._index = MerchantBitmapIndex(self.path)
+
+            except FileNotFoundError:
+                self._index = None
+
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("cannot read merchant bitmap index %s: %s", self.path, e)
+                self._index = None
+
+            return self._index
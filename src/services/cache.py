@@ -0,0 +1,632 @@
+"""
+result caches for AnalyticsService: LRU-bounded, TTL-limited, and invalidated when the importer bumps the data version.
+ResultCache lives in one process; SharedResultCache is shared by every worker process on the host.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, NamedTuple
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from src.models import DataVersion
+from src.models.data_version import DATA_VERSION_ID
+from src.services.analytics import AnalyticsService, AsyncAnalyticsService
+from src.services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    """a cached result and the data version and time (clock seconds) it was computed at."""
+
+    value: Any
+    version: int
+    stored_at: float
+
+
+class ResultCache:
+    """
+    in-process cache of analytics results, safe to share between request threads.
+    an entry is served only while it is younger than ttl seconds and was computed at the current data version;
+    beyond max_entries the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable, version: int) -> CacheEntry | None:
+        """the entry for key if it is still valid at this data version, else None (and the outdated entry is dropped)."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and self._clock() - entry.stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+
+    def get_stale(self, key: Hashable) -> CacheEntry | None:
+        """the entry for key while it is younger than ttl, whatever data version it was computed at."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry.stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+
+    def age(self, entry: CacheEntry) -> float:
+        """seconds since entry was computed."""
+
+        return self._clock() - entry.stored_at
+
+
+    def put(self, key: Hashable, value: Any, version: int) -> None:
+        with self._lock:
+            self._entries[key] = CacheEntry(value, version, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "backend": "memory",
+                "size_bytes": None,
+            }
+
+
+def default_shared_cache_dir() -> Path:
+    """/dev/shm (memory-backed, so entries never touch a disk) where the host has it, else the temp directory."""
+
+    shm = Path("/dev/shm")
+    return (shm if shm.is_dir() else Path(tempfile.gettempdir())) / "moniepoint-analytics-cache"
+
+
+class SharedResultCache:
+    """
+    result cache shared by every worker process on the host: one JSON file per entry in a directory.
+    a put writes a temporary file and renames it over the entry, so a reader in any process sees the old entry
+    or the new one whole, never a torn one. a hit touches the file's mtime, and beyond max_entries or max_bytes
+    the least recently used files are removed. hit/miss/eviction counters are this process's own.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_entries: int = 256,
+        ttl: float = 300.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+
+    def _path(self, key: Hashable) -> Path:
+        return self.directory / f"{hashlib.sha256(repr(key).encode()).hexdigest()}.json"
+
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    def _load(self, path: Path) -> dict | None:
+        try:
+            return json.loads(path.read_bytes())
+
+        except FileNotFoundError:
+            return None
+
+        except ValueError:
+            # not written by this class (publishing is atomic): drop it.
+            path.unlink(missing_ok=True)
+            return None
+
+
+    def _hit(self, path: Path, data: dict) -> CacheEntry:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._count("hits")
+        return CacheEntry(data["value"], data["version"], data["stored_at"])
+
+
+    def get(self, key: Hashable, version: int) -> CacheEntry | None:
+        """the entry for key if it is still valid at this data version, else None."""
+
+        path = self._path(key)
+        data = self._load(path)
+        if data is None:
+            self._count("misses")
+            return None
+
+        expired = self._clock() - data["stored_at"] >= self.ttl
+        if data["key"] != repr(key) or data["version"] != version or expired:
+            # another worker may already be on a newer version than this one: only remove entries that are older.
+            if expired or data["version"] < version:
+                path.unlink(missing_ok=True)
+            self._count("misses")
+            return None
+
+        return self._hit(path, data)
+
+
+    def get_stale(self, key: Hashable) -> CacheEntry | None:
+        """the entry for key while it is younger than ttl, whatever data version it was computed at."""
+
+        path = self._path(key)
+        data = self._load(path)
+        if data is None or data["key"] != repr(key):
+            self._count("misses")
+            return None
+
+        if self._clock() - data["stored_at"] >= self.ttl:
+            path.unlink(missing_ok=True)
+            self._count("misses")
+            return None
+
+        return self._hit(path, data)
+
+
+    def age(self, entry: CacheEntry) -> float:
+        """seconds since entry was computed."""
+
+        return self._clock() - entry.stored_at
+
+
+    def put(self, key: Hashable, value: Any, version: int) -> None:
+        payload = json.dumps(
+            {"key": repr(key), "version": version, "stored_at": self._clock(), "value": value}
+        ).encode()
+        if len(payload) > self.max_bytes:
+            return
+
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix=".put-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_object:
+                file_object.write(payload)
+            os.replace(temporary, self._path(key))
+
+        except BaseException:
+            Path(temporary).unlink(missing_ok=True)
+            raise
+
+        self._evict()
+
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        """(mtime, size, path) of every entry, oldest first; a file removed meanwhile by another process is skipped."""
+
+        entries = []
+        for item in os.scandir(self.directory):
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+
+            if item.name.endswith(".json"):
+                entries.append((stat.st_mtime, stat.st_size, Path(item.path)))
+            elif item.name.endswith(".tmp") and time.time() - stat.st_mtime > 60:
+                # left behind by a worker that died mid-put.
+                Path(item.path).unlink(missing_ok=True)
+        return sorted(entries)
+
+
+    def _evict(self) -> None:
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total -= size
+            self._count("evictions")
+
+
+    def clear(self) -> None:
+        for _, _, path in self._scan():
+            path.unlink(missing_ok=True)
+
+
+    def stats(self) -> dict:
+        entries = self._scan()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "backend": "shared",
+                "size_bytes": sum(size for _, size, _ in entries),
+            }
+
+
+class DataVersionTracker:
+    """
+    the current data version, read on a connection of its own at most once every `interval` seconds,
+    so checking it costs a cache hit nothing most of the time and never uses the request's session.
+    one caller at a time re-reads it; the others keep the last version meanwhile instead of queueing behind its connect.
+    """
+
+    def __init__(self, engine: Engine, interval: float = 1.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self._engine = engine
+        self._interval = interval
+        self._clock = clock
+        self._version = 0
+        self._checked_at: float | None = None
+        self._refresh_lock = threading.Lock()
+
+
+    def _fresh(self, now: float) -> bool:
+        return self._checked_at is not None and now - self._checked_at < self._interval
+
+
+    def current(self) -> int:
+        if self._fresh(self._clock()):
+            return self._version
+
+        # everyone waits for the very first read, which has no last version to fall back on.
+        if not self._refresh_lock.acquire(blocking=self._checked_at is None):
+            return self._version
+
+        try:
+            now = self._clock()
+            if self._fresh(now):
+                return self._version
+
+            try:
+                with self._engine.connect() as connection:
+                    version = connection.execute(
+                        select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ID)
+                    ).scalar()
+
+            except OperationalError:
+                # keep the last known version and try again an interval later, so an outage costs each interval one
+                # connect attempt rather than one per request; a query that misses the cache reports the outage itself.
+                version = self._version
+
+            except SQLAlchemyError:
+                # the importer has not created the table yet: nothing has been imported under versioning.
+                version = None
+
+            self._version = version or 0
+            self._checked_at = now
+            return self._version
+
+        finally:
+            self._refresh_lock.release()
+
+
+class Revalidator:
+    """
+    recomputes stale cached results in background threads, for stale-while-revalidate serving. each refresh runs on
+    an AnalyticsService of its own (the request that found the stale entry has already been answered), and a key
+    already being refreshed is not queued again. a failed refresh is logged and the stale result stays in place.
+    """
+
+    def __init__(
+        self,
+        cache: ResultCache | SharedResultCache,
+        service_factory: Callable[[], AbstractContextManager[AnalyticsService]],
+        soft_ttl: float = 30.0,
+        workers: int = 2,
+    ) -> None:
+        self.cache = cache
+        self.soft_ttl = soft_ttl
+        self.refreshes = self.failures = 0
+        self._service_factory = service_factory
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="analytics-revalidate")
+        self._pending: set[Hashable] = set()
+        self._lock = threading.Lock()
+
+
+    def is_stale(self, entry: CacheEntry, version: int) -> bool:
+        """computed before the current data version, or more than soft_ttl seconds ago."""
+
+        return entry.version != version or self.cache.age(entry) >= self.soft_ttl
+
+
+    def submit(self, key: Hashable, version: int, name: str, args: tuple, kwargs: dict) -> None:
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+
+        self._executor.submit(self._refresh, key, version, name, args, kwargs)
+
+
+    def _refresh(self, key: Hashable, version: int, name: str, args: tuple, kwargs: dict) -> None:
+        try:
+            with self._service_factory() as service:
+                value = getattr(service, name)(*args, **kwargs)
+            self.cache.put(key, value, version)
+            with self._lock:
+                self.refreshes += 1
+
+        except Exception:
+            logger.exception("background recomputation of %s failed; serving the stale result", name)
+            with self._lock:
+                self.failures += 1
+
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "soft_ttl_seconds": self.soft_ttl,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "pending": len(self._pending),
+            }
+
+
+class CachedAnalyticsService:
+    """
+    AnalyticsService behind a ResultCache or SharedResultCache. a hit returns the cached result without touching the wrapped
+    service (or its database session); a miss runs the query and caches the result at the version read before it.
+    with a SingleFlight, identical calls that miss at the same time run the query once and share its result;
+    cache may be None to only coalesce.
+    with a Revalidator, a result computed at an older data version or more than soft_ttl seconds ago is still served
+    (until the cache's ttl, which becomes the hard limit) while it is recomputed in the background.
+    on_served, if given, is called with the age in seconds of each cached result served and whether it was stale.
+    """
+
+    def __init__(
+        self,
+        service: AnalyticsService,
+        cache: ResultCache | SharedResultCache | None,
+        versions: DataVersionTracker,
+        flights: SingleFlight | None = None,
+        revalidator: Revalidator | None = None,
+        on_served: Callable[[float, bool], None] | None = None,
+    ) -> None:
+        self._service = service
+        self._cache = cache
+        self._versions = versions
+        self._flights = flights
+        self._revalidator = revalidator
+        self._on_served = on_served
+
+
+    def _cached(self, name: str, *args, **kwargs) -> Any:
+        key = (name, args, tuple(sorted(kwargs.items())))
+        if self._cache is None:
+            return self._run(key, lambda: getattr(self._service, name)(*args, **kwargs))
+
+        version = self._versions.current()
+        entry = self._hit(key, version, name, args, kwargs)
+        if entry is not None:
+            return entry.value
+
+        def compute() -> Any:
+            # an import that commits while this runs bumps the version again, so the result is never served as newer.
+            value = getattr(self._service, name)(*args, **kwargs)
+            self._cache.put(key, value, version)
+            return value
+
+        value = self._run((key, version), compute)
+        self._served(0.0, False)
+        return value
+
+
+    def _hit(self, key: Hashable, version: int, name: str, args: tuple, kwargs: dict) -> CacheEntry | None:
+        """the cached entry to serve for key at version, if any (queueing its recomputation when it is stale)."""
+
+        if self._revalidator is not None:
+            entry = self._cache.get_stale(key)
+            if entry is not None:
+                stale = self._revalidator.is_stale(entry, version)
+                if stale:
+                    self._revalidator.submit(key, version, name, args, kwargs)
+                self._served(self._cache.age(entry), stale)
+            return entry
+
+        entry = self._cache.get(key, version)
+        if entry is not None:
+            self._served(self._cache.age(entry), False)
+        return entry
+
+
+    def _run(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        if self._flights is None:
+            return compute()
+        return self._flights.do(key, compute)
+
+
+    def _served(self, age: float, stale: bool) -> None:
+        if self._on_served is not None:
+            self._on_served(age, stale)
+
+
+    def get_top_merchant(self) -> dict:
+        return self._cached("get_top_merchant")
+
+
+    def get_monthly_active_merchants(self, approx: bool = False) -> dict[str, int]:
+        return self._cached("get_monthly_active_merchants", approx=approx)
+
+
+    def get_product_adoption(self, approx: bool = False) -> dict[str, int]:
+        return self._cached("get_product_adoption", approx=approx)
+
+
+    def get_kyc_funnel(self) -> dict[str, int]:
+        return self._cached("get_kyc_funnel")
+
+
+    def get_funnel(
+        self,
+        stages: list[tuple[str, str]],
+        ordered: bool = False,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[dict]:
+        stages = tuple(tuple(stage) for stage in stages)
+        return self._cached("get_funnel", stages, ordered=ordered, start=start, end=end)
+
+
+    def get_merchant_overlap(self, stages: list[tuple[str, str]]) -> dict:
+        stages = tuple(tuple(stage) for stage in stages)
+        return self._cached("get_merchant_overlap", stages)
+
+
+    def get_failure_rates(self) -> list[dict]:
+        return self._cached("get_failure_rates")
+
+
+    def get_summary(self) -> dict:
+        return self._cached("get_summary")
+
+
+
+class AsyncCachedAnalyticsService(CachedAnalyticsService):
+    """
+    CachedAnalyticsService in front of an AsyncAnalyticsService, for the async database driver: the same caching,
+    with a miss awaited on the event loop and coalesced by an AsyncSingleFlight. the cache, the data version tracker
+    and the revalidator are the ones the sync path uses; the version check and the cache reads and writes can block
+    (on the database, or on the shared cache's files), so they run in a worker thread rather than on the event loop.
+    """
+
+    def __init__(
+        self,
+        service: AsyncAnalyticsService,
+        cache: ResultCache | SharedResultCache | None,
+        versions: DataVersionTracker,
+        flights: AsyncSingleFlight | None = None,
+        revalidator: Revalidator | None = None,
+        on_served: Callable[[float, bool], None] | None = None,
+    ) -> None:
+        super().__init__(service, cache, versions, None, revalidator, on_served)
+        self._async_flights = flights
+
+
+    async def _cached(self, name: str, *args, **kwargs) -> Any:
+        key = (name, args, tuple(sorted(kwargs.items())))
+        if self._cache is None:
+            return await self._run(key, lambda: getattr(self._service, name)(*args, **kwargs))
+
+        version, entry = await asyncio.to_thread(self._lookup, key, name, args, kwargs)
+        if entry is not None:
+            return entry.value
+
+        async def compute() -> Any:
+            value = await getattr(self._service, name)(*args, **kwargs)
+            await asyncio.to_thread(self._cache.put, key, value, version)
+            return value
+
+        value = await self._run((key, version), compute)
+        self._served(0.0, False)
+        return value
+
+
+    def _lookup(self, key: Hashable, name: str, args: tuple, kwargs: dict) -> tuple[int, CacheEntry | None]:
+        """the current data version and the cached entry to serve at it; both in one trip to a worker thread."""
+
+        version = self._versions.current()
+        return version, self._hit(key, version, name, args, kwargs)
+
+
+    async def _run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self._async_flights is None:
+            return await compute()
+        return await self._async_flights.do(key, compute)
+
+
+    async def get_top_merchant(self) -> dict:
+        return await self._cached("get_top_merchant")
+
+
+    async def get_monthly_active_merchants(self, approx: bool = False) -> dict[str, int]:
+        return await self._cached("get_monthly_active_merchants", approx=approx)
+
+
+    async def get_product_adoption(self, approx: bool = False) -> dict[str, int]:
+        return await self._cached("get_product_adoption", approx=approx)
+
+
+    async def get_kyc_funnel(self) -> dict[str, int]:
+        return await self._cached("get_kyc_funnel")
+
+
+    async def get_funnel(
+        self,
+        stages: list[tuple[str, str]],
+        ordered: bool = False,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[dict]:
+        stages = tuple(tuple(stage) for stage in stages)
+        return await self._cached("get_funnel", stages, ordered=ordered, start=start, end=end)
+
+
+    async def get_merchant_overlap(self, stages: list[tuple[str, str]]) -> dict:
+        stages = tuple(tuple(stage) for stage in stages)
+        return await self._cached("get_merchant_overlap", stages)
+
+
+    async def get_failure_rates(self) -> list[dict]:
+        return await self._cached("get_failure_rates")
+
+
+    async def get_summary(self) -> dict:
+        return await self._cached("get_summary")
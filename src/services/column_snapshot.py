@@ -0,0 +1,238 @@
+"""
+columnar snapshots: immutable, versioned copies of ActivityColumns on disk, written by the importer and memory-mapped
+by the API, so every uvicorn worker shares one copy of the columns through the page cache and starts without a scan.
+
+layout of a snapshot root:
+    CURRENT                   the name of the current snapshot directory, replaced atomically
+    v<data version>-<suffix>  one directory per snapshot, never modified once CURRENT names it:
+        manifest.json         data version, row count and the table position the rows were read up to
+        <column>.col          one file per column (little-endian): magic, numpy dtype, row count, dictionary length;
+                              the dictionary (string columns: their values, newline separated, code i is the i-th line);
+                              then the values, 8-byte aligned
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from src.services.columnar import STRING_COLUMNS, ActivityColumns, np
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"MCOLUMN1"
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+
+# number of snapshots kept (the current one included): readers still on the previous one keep their maps either way.
+KEEP_SNAPSHOTS = 2
+
+_HEADER = struct.Struct("<8s8sQQ")
+_ALIGNMENT = 8
+
+
+def _column_file(directory: Path, name: str) -> Path:
+    return directory / f"{name}.col"
+
+
+def write_column(path: Path, values: "np.ndarray", dictionary: list[str] | None = None) -> None:
+    dictionary_blob = "\n".join(dictionary).encode() if dictionary else b""
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    header = _HEADER.pack(MAGIC, values.dtype.str.encode(), len(values), len(dictionary_blob))
+    padding = -(len(header) + len(dictionary_blob)) % _ALIGNMENT
+    with open(path, "wb") as file:
+        file.write(header + dictionary_blob + b"\0" * padding)
+        file.write(values.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_column(path: Path) -> tuple["np.ndarray", list[str]]:
+    """
+    the values of a column file as a read-only array over a memory map of it (no copy: pages are read on first use
+    and shared with every other process mapping the file), and its dictionary.
+    """
+
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < _HEADER.size:
+            raise ValueError(f"{path} is not a snapshot column")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, dtype, rows, dictionary_length = _HEADER.unpack_from(mapped)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a snapshot column")
+
+    start = _HEADER.size + dictionary_length
+    blob = bytes(mapped[_HEADER.size:start]).decode()
+    dtype = np.dtype(dtype.rstrip(b"\0").decode())
+    values = np.frombuffer(mapped, dtype=dtype, count=rows, offset=start + -start % _ALIGNMENT)
+    return values, blob.split("\n") if blob else []
+
+
+def write_snapshot(root: Path, columns: ActivityColumns, keep: int = KEEP_SNAPSHOTS) -> Path:
+    """
+    write columns as a new snapshot directory under root and make it the current one, then delete all but the newest
+    `keep` snapshots. readers see the previous snapshot or this one, never a partial one.
+    """
+
+    root.mkdir(parents=True, exist_ok=True)
+    temporary = Path(tempfile.mkdtemp(dir=root, prefix=f".v{columns.version:012d}-"))
+    try:
+        for name in STRING_COLUMNS:
+            write_column(_column_file(temporary, name), columns.codes[name], columns.dictionaries[name])
+        write_column(_column_file(temporary, "amount"), columns.amount)
+        write_column(_column_file(temporary, "timestamp"), columns.timestamp)
+        manifest = {
+            "data_version": columns.version,
+            "rows": columns.rows,
+            "filenode": columns.filenode,
+            "last_ctid": columns.last_ctid,
+        }
+        (temporary / MANIFEST).write_text(json.dumps(manifest) + "\n", encoding="utf-8")
+
+        # mkdtemp creates the directory private to the importer; the API may run as another user.
+        os.chmod(temporary, 0o755)
+        for path in temporary.iterdir():
+            os.chmod(path, 0o644)
+        directory = root / temporary.name[1:]
+        os.rename(temporary, directory)
+
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    descriptor, pointer = tempfile.mkstemp(dir=root, prefix=f".{CURRENT}.", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            file.write(directory.name + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(pointer, 0o644)
+        os.replace(pointer, root / CURRENT)
+
+    except BaseException:
+        Path(pointer).unlink(missing_ok=True)
+        raise
+
+    # a worker still mapping a deleted snapshot keeps reading it until it lets go: unlinking does not unmap.
+    snapshots = sorted(path for path in root.iterdir() if path.is_dir() and path.name.startswith("v"))
+    for old in snapshots[:-keep] if keep > 0 else snapshots:
+        if old != directory:
+            shutil.rmtree(old, ignore_errors=True)
+    return directory
+
+
+def current_snapshot(root: Path) -> Path | None:
+    """the current snapshot directory under root, or None if nothing has been written yet."""
+
+    try:
+        name = (root / CURRENT).read_text(encoding="utf-8").strip()
+
+    except FileNotFoundError:
+        return None
+    return root / name if name else None
+
+
+def open_snapshot(directory: Path) -> ActivityColumns:
+    """the columns of a snapshot directory, memory-mapped: opening costs a few syscalls whatever the row count."""
+
+    if np is None:
+        raise RuntimeError("the columnar analytics engine requires the 'numpy' package (pip install numpy).")
+
+    manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+    codes, dictionaries = {}, {}
+    for name in STRING_COLUMNS:
+        codes[name], dictionaries[name] = read_column(_column_file(directory, name))
+    amount, _ = read_column(_column_file(directory, "amount"))
+    timestamp, _ = read_column(_column_file(directory, "timestamp"))
+    if any(len(values) != manifest["rows"] for values in (*codes.values(), amount, timestamp)):
+        raise ValueError(f"{directory}: the columns do not hold {manifest['rows']} rows")
+
+    return ActivityColumns(
+        codes, dictionaries, amount, timestamp,
+        version=manifest["data_version"], filenode=manifest["filenode"], last_ctid=manifest["last_ctid"],
+    )
+
+
+class ColumnSnapshotStore:
+    """
+    the API's view of the current snapshot: opened on first use and reopened once the importer has made another
+    snapshot current, checking CURRENT at most every `interval` seconds. it stands in for a ColumnarStore (columns,
+    refresh(), request_refresh(), stats()); with no readable snapshot, columns is None and the live queries answer.
+    """
+
+    def __init__(self, root: Path, interval: float = 1.0) -> None:
+        if np is None:
+            raise RuntimeError("the columnar analytics engine requires the 'numpy' package (pip install numpy).")
+
+        self.root = root
+        self._interval = interval
+        self._directory: Path | None = None
+        self._columns: ActivityColumns | None = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+        self.refreshes = self.failures = 0
+
+
+    @property
+    def columns(self) -> ActivityColumns | None:
+        now = time.monotonic()
+        if now - self._checked < self._interval:
+            return self._columns
+
+        with self._lock:
+            if now - self._checked < self._interval:
+                return self._columns
+            self._checked = now
+
+            try:
+                directory = current_snapshot(self.root)
+                if directory is None:
+                    self._directory = self._columns = None
+                elif directory != self._directory:
+                    # the previous maps are unmapped once the last request using them lets go of them.
+                    self._columns = open_snapshot(directory)
+                    self._directory = directory
+                    self.refreshes += 1
+                    logger.info(
+                        "columnar snapshot %s: data version %d, %d rows",
+                        directory.name, self._columns.version, self._columns.rows,
+                    )
+
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                # e.g. the snapshot was pruned between reading CURRENT and opening it: keep the last one, retry later.
+                self.failures += 1
+                logger.warning("cannot open columnar snapshot under %s: %s", self.root, e)
+
+            return self._columns
+
+
+    def refresh(self) -> ActivityColumns | None:
+        """check for a new snapshot now."""
+
+        self._checked = float("-inf")
+        return self.columns
+
+
+    def request_refresh(self) -> None:
+        """
+        nothing to do: the importer writes the snapshots, and the next check (at most `interval` seconds away) opens
+        a new one. opening it is cheap, so there is no background work.
+        """
+
+
+    def stats(self) -> dict:
+        columns = self._columns
+        return {
+            "snapshot": self._directory.name if self._directory is not None else None,
+            "rows": columns.rows if columns is not None else 0,
+            "data_version": columns.version if columns is not None else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,419 @@
+"""
+in-memory columnar engine: merchant_activities held as numpy column arrays in the API worker, and the analytics
+queries answered as vectorized group-bys over them instead of a database round trip per request.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from src.models import DataVersion
+from src.models.data_version import DATA_VERSION_ID
+from src.services.analytics import KYC_STAGES, SUMMARY_PARTS, AnalyticsService
+from src.services.cache import DataVersionTracker
+
+if TYPE_CHECKING:
+    from src.services.column_snapshot import ColumnSnapshotStore
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed for the "columnar" analytics source (pip install numpy).
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# the dictionary-encoded columns, in the order the loader selects them.
+STRING_COLUMNS = ("merchant_id", "product", "event_type", "status")
+
+# int64 value of NaT: event_timestamp NULL.
+_NAT = -(2 ** 63)
+
+# amounts in minor units (kobo) and timestamps in UTC microseconds, so both arrive as plain integers. months are then
+# UTC months, as date_trunc gives in the UTC sessions of src.db.pool.pin_session_time_zone.
+_SELECT_ROWS = f"""
+SELECT merchant_id, product, event_type, status, (amount * 100)::bigint,
+       coalesce((extract(epoch FROM event_timestamp) * 1000000)::bigint, {_NAT})
+FROM merchant_activities
+WHERE ctid > %(after)s::tid
+"""
+
+# where the rows end in the snapshot: the table's file (a rewrite gives a new one), its last tuple and its row count.
+_SELECT_POSITION = text(
+    "SELECT pg_relation_filenode('merchant_activities'), max(ctid)::text, count(*) FROM merchant_activities"
+)
+
+# before the first tuple of any table.
+_START = "(0,0)"
+
+
+class ActivityColumns:
+    """
+    an immutable copy of merchant_activities as columns. merchant_id, product, event_type and status are codes into
+    their dictionaries (append-only, so an incremental load keeps every existing code); amount is int64 minor units
+    and timestamp datetime64[us] in UTC (NaT when missing). version is the data version the rows were read at.
+    """
+
+    def __init__(
+        self,
+        codes: dict[str, "np.ndarray"],
+        dictionaries: dict[str, list[str]],
+        amount: "np.ndarray",
+        timestamp: "np.ndarray",
+        version: int = 0,
+        filenode: int | None = None,
+        last_ctid: str = _START,
+    ) -> None:
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.amount = amount
+        self.timestamp = timestamp
+        self.version = version
+        self.filenode = filenode
+        self.last_ctid = last_ctid
+        self._lookup = {name: {value: i for i, value in enumerate(values)} for name, values in dictionaries.items()}
+
+
+    @property
+    def rows(self) -> int:
+        return len(self.amount)
+
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple], previous: "ActivityColumns | None" = None, **position) -> "ActivityColumns":
+        """
+        the columns of previous with rows (merchant_id, product, event_type, status, amount in minor units,
+        timestamp in microseconds or _NAT) appended; values not seen before get the next codes of their dictionary.
+        """
+
+        if np is None:
+            raise RuntimeError("the columnar analytics engine requires the 'numpy' package (pip install numpy).")
+
+        columns = list(zip(*rows)) if rows else [()] * 6
+        codes, dictionaries = {}, {}
+        for i, name in enumerate(STRING_COLUMNS):
+            values = list(previous.dictionaries[name]) if previous is not None else []
+            lookup = dict(previous._lookup[name]) if previous is not None else {}
+            new = np.fromiter((lookup.setdefault(value, len(lookup)) for value in columns[i]), np.int32, len(rows))
+            values.extend(list(lookup)[len(values):])
+            codes[name] = np.concatenate([previous.codes[name], new]) if previous is not None else new
+            dictionaries[name] = values
+
+        amount = np.fromiter(columns[4], np.int64, len(rows))
+        timestamp = np.fromiter(columns[5], np.int64, len(rows)).view("datetime64[us]")
+        if previous is not None:
+            amount = np.concatenate([previous.amount, amount])
+            timestamp = np.concatenate([previous.timestamp, timestamp])
+        return cls(codes, dictionaries, amount, timestamp, **position)
+
+
+    def code(self, column: str, value: str) -> int:
+        """the code of value in column, or -1 (matching no row) when no row has it."""
+
+        return self._lookup[column].get(value, -1)
+
+
+def load_columns(connection: Connection, previous: ActivityColumns | None = None) -> tuple[ActivityColumns, bool]:
+    """
+    the columns at the current data version, read on connection (which should be in a repeatable read transaction, so
+    the version and the rows come from one snapshot): previous itself if it is at that version, previous with the rows
+    added since it was read appended, or every row if there is no previous, it is ahead of the data, the table was
+    rewritten (new file) or the row count does not match (an insert reused freed space).
+    returns (columns, whether every row was read).
+    """
+
+    if np is None:
+        raise RuntimeError("the columnar analytics engine requires the 'numpy' package (pip install numpy).")
+
+    version = connection.execute(select(DataVersion.version).where(DataVersion.id == DATA_VERSION_ID)).scalar() or 0
+    if previous is not None and previous.version == version:
+        return previous, False
+
+    # columns ahead of the data were read from another (or a since restored) database: start over.
+    if previous is not None and previous.version > version:
+        previous = None
+
+    filenode, last_ctid, count = connection.execute(_SELECT_POSITION).one()
+    position = {"version": version, "filenode": filenode, "last_ctid": last_ctid or _START}
+    cursor = connection.connection.cursor()
+    try:
+        if previous is not None and previous.filenode == filenode:
+            cursor.execute(_SELECT_ROWS, {"after": previous.last_ctid})
+            columns = ActivityColumns.from_rows(cursor.fetchall(), previous, **position)
+            if columns.rows == count:
+                return columns, False
+
+        cursor.execute(_SELECT_ROWS, {"after": _START})
+        return ActivityColumns.from_rows(cursor.fetchall(), **position), True
+
+    finally:
+        cursor.close()
+
+
+class ColumnarStore:
+    """
+    the current ActivityColumns of one worker, loaded from the database. refresh() reads only the rows added since the
+    last load (see load_columns): rows are never updated or deleted, so new ones sit past the last tuple read.
+    refreshes run one at a time; queries keep using the previous columns meanwhile.
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        if np is None:
+            raise RuntimeError("the columnar analytics engine requires the 'numpy' package (pip install numpy).")
+
+        self._engine = engine
+        self.columns: ActivityColumns | None = None
+        self.refreshes = self.full_loads = self.failures = 0
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+
+    def refresh(self) -> ActivityColumns:
+        with self._refresh_lock:
+            started = time.perf_counter()
+            previous = self.columns
+            with self._engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+                columns, full = load_columns(connection, previous)
+            if columns is previous:
+                return previous
+
+            self.columns = columns
+            self.refreshes += 1
+            self.full_loads += full
+            new = columns.rows - (previous.rows if previous is not None and not full else 0)
+            logger.info(
+                "columnar store at data version %d: %d rows (%d new) in %.2fs",
+                columns.version, columns.rows, new, time.perf_counter() - started,
+            )
+            return columns
+
+
+    def request_refresh(self) -> None:
+        """refresh in a background thread, unless one is already running."""
+
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh_in_background, name="columnar-refresh", daemon=True)
+            self._thread.start()
+
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+
+        except Exception:
+            # the next request that finds the store behind tries again; until then the live queries answer.
+            self.failures += 1
+            logger.exception("columnar store refresh failed")
+
+
+    def stats(self) -> dict:
+        columns = self.columns
+        return {
+            "rows": columns.rows if columns is not None else 0,
+            "data_version": columns.version if columns is not None else None,
+            "refreshes": self.refreshes,
+            "full_loads": self.full_loads,
+            "failures": self.failures,
+        }
+
+
+def _utc_micros(value: datetime) -> "np.datetime64":
+    # every session runs in UTC (src.db.pool.pin_session_time_zone), so a naive bound means UTC there as well.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "us")
+
+
+class ColumnarAnalyticsService(AnalyticsService):
+    """
+    AnalyticsService answered from a ColumnarStore, or the memory-mapped ColumnSnapshotStore, while its columns are at
+    the current data version. while they lag (an import has landed and the refresh or the next snapshot has not
+    finished, or nothing is loaded yet) it requests a refresh and answers with the live queries, as the "views" source
+    does. approx counts and ordered funnels always run on the database. version is the current data version when the
+    caller has read it already (the async path, off the event loop); otherwise versions is asked on each call.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        store: "ColumnarStore | ColumnSnapshotStore",
+        versions: DataVersionTracker,
+        version: int | None = None,
+    ) -> None:
+        super().__init__(db, source="live")
+        self._store = store
+        self._versions = versions
+        self._version = version
+
+
+    def _columns(self) -> ActivityColumns | None:
+        columns = self._store.columns
+        version = self._version if self._version is not None else self._versions.current()
+        if columns is None or columns.version != version:
+            self._store.request_refresh()
+            return None
+        return columns
+
+
+    def _merchants(self, columns: ActivityColumns, mask: "np.ndarray") -> "np.ndarray":
+        """a boolean array over merchant codes: which merchants have a row in mask."""
+
+        merchants = columns.codes["merchant_id"][mask]
+        return np.bincount(merchants, minlength=len(columns.dictionaries["merchant_id"])) > 0
+
+
+    def _seen(self, columns: ActivityColumns, groups: "np.ndarray", group_count: int, merchants: "np.ndarray") -> "np.ndarray":
+        """
+        a group x merchant boolean matrix marking each (groups[i], merchants[i]) pair: a distinct count per group
+        is then a row sum, with no sort (groups run from 0 to group_count - 1).
+        """
+
+        seen = np.zeros((group_count, len(columns.dictionaries["merchant_id"])), dtype=bool)
+        seen[groups, merchants] = True
+        return seen
+
+
+    def _stage_mask(self, columns: ActivityColumns, product: str, event_type: str) -> "np.ndarray":
+        """the successful rows of one (product, event_type) stage."""
+
+        return (
+            (columns.codes["product"] == columns.code("product", product))
+            & (columns.codes["event_type"] == columns.code("event_type", event_type))
+            & (columns.codes["status"] == columns.code("status", "SUCCESS"))
+        )
+
+
+    def get_top_merchant(self) -> dict:
+        columns = self._columns()
+        if columns is None:
+            return super().get_top_merchant()
+
+        success = columns.codes["status"] == columns.code("status", "SUCCESS")
+        if not success.any():
+            return {"merchant_id": None, "total_volume": 0.00}
+
+        # float64 sums of minor units are exact up to 2**53 kobo.
+        totals = np.bincount(columns.codes["merchant_id"][success], weights=columns.amount[success])
+        top = int(totals.argmax())
+        return {"merchant_id": columns.dictionaries["merchant_id"][top], "total_volume": round(totals[top] / 100, 2)}
+
+
+    def get_monthly_active_merchants(self, approx: bool = False) -> dict[str, int]:
+        columns = self._columns()
+        if approx or columns is None:
+            return super().get_monthly_active_merchants(approx=approx)
+
+        mask = (columns.codes["status"] == columns.code("status", "SUCCESS")) & ~np.isnat(columns.timestamp)
+        if not mask.any():
+            return {}
+
+        months = columns.timestamp[mask].astype("datetime64[M]").astype(np.int64)
+        first = months.min()
+        active = self._seen(columns, months - first, int(months.max() - first) + 1, columns.codes["merchant_id"][mask])
+        return {
+            str(np.datetime64(int(first + offset), "M")): int(count)
+            for offset, count in enumerate(active.sum(axis=1))
+            if count
+        }
+
+
+    def get_product_adoption(self, approx: bool = False) -> dict[str, int]:
+        columns = self._columns()
+        if approx or columns is None:
+            return super().get_product_adoption(approx=approx)
+
+        products = columns.dictionaries["product"]
+        counts = self._seen(columns, columns.codes["product"], len(products), columns.codes["merchant_id"]).sum(axis=1)
+        adoption = {product: int(count) for product, count in zip(products, counts) if count}
+        return dict(sorted(adoption.items(), key=lambda item: item[1], reverse=True))
+
+
+    def get_kyc_funnel(self) -> dict[str, int]:
+        columns = self._columns()
+        if columns is None:
+            return super().get_kyc_funnel()
+
+        docs, verif, tier = (
+            int(self._merchants(columns, self._stage_mask(columns, product, event_type)).sum())
+            for product, event_type in KYC_STAGES
+        )
+        return {"documents_submitted": docs, "verifications_completed": verif, "tier_upgrades": tier}
+
+
+    def get_funnel(
+        self,
+        stages: list[tuple[str, str]],
+        ordered: bool = False,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[dict]:
+        self._check_funnel(stages, start, end)
+        columns = self._columns() if not ordered else None
+        if columns is None:
+            return super().get_funnel(stages, ordered=ordered, start=start, end=end)
+
+        # NaT compares false, so a window leaves out events without a timestamp, as the SQL comparison does.
+        window = np.ones(columns.rows, dtype=bool)
+        if start is not None:
+            window &= columns.timestamp >= _utc_micros(start)
+        if end is not None:
+            window &= columns.timestamp < _utc_micros(end)
+
+        counts = [
+            int(self._merchants(columns, self._stage_mask(columns, product, event_type) & window).sum())
+            for product, event_type in stages
+        ]
+        return self._funnel_stages(stages, counts)
+
+
+    def get_merchant_overlap(self, stages: list[tuple[str, str]]) -> dict:
+        stages = self._overlap_stages(stages)
+        columns = self._columns()
+        if columns is None:
+            return super().get_merchant_overlap(stages)
+
+        merchants = self._merchants(columns, self._stage_mask(columns, *stages[0]))
+        for product, event_type in stages[1:]:
+            merchants &= self._merchants(columns, self._stage_mask(columns, product, event_type))
+        return {
+            "stages": [{"product": product, "event_type": event_type} for product, event_type in stages],
+            "merchants": int(merchants.sum()),
+        }
+
+
+    def get_summary(self) -> dict:
+        if self._columns() is None:
+            return super().get_summary()
+        return {part: getattr(self, f"get_{part}")() for part in SUMMARY_PARTS}
+
+
+    def get_failure_rates(self) -> list[dict]:
+        columns = self._columns()
+        if columns is None:
+            return super().get_failure_rates()
+
+        products = columns.codes["product"]
+        status = columns.codes["status"]
+        product_count = len(columns.dictionaries["product"])
+        failed = np.bincount(products[status == columns.code("status", "FAILED")], minlength=product_count)
+        succeeded = np.bincount(products[status == columns.code("status", "SUCCESS")], minlength=product_count)
+        resolved = failed + succeeded
+
+        # sorted by the exact rate, as the query orders before it rounds.
+        rates = sorted(
+            (
+                (100.0 * int(failed[i]) / int(resolved[i]), product)
+                for i, product in enumerate(columns.dictionaries["product"])
+                if resolved[i]
+            ),
+            key=lambda item: item[0],
+            reverse=True,
+        )
+        return [{"product": product, "failure_rate": round(rate, 1)} for rate, product in rates]
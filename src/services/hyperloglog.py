@@ -0,0 +1,88 @@
+"""HyperLogLog: a fixed-size, mergeable sketch that estimates how many distinct values were added to it."""
+import hashlib
+import math
+from collections import Counter
+from collections.abc import Iterable
+
+
+# 2**14 one-byte registers (16 KiB per sketch): standard error 1.04 / sqrt(2**14), about 0.81%.
+DEFAULT_PRECISION = 14
+
+
+def _hash(value: str) -> int:
+    """64-bit hash of value; stable across processes and python versions (unlike hash())."""
+
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch (Flajolet et al., with linear counting for small cardinalities) over 64-bit hashes.
+    adding a value twice changes nothing, and merging two sketches gives the sketch of the union, so a sketch
+    can be built batch by batch and by several import workers. count() costs the same however many values were added.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: bytes | None = None) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision must be between 4 and 18, got {precision}")
+
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) != self.size:
+            raise ValueError(f"expected {self.size} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+
+    @property
+    def standard_error(self) -> float:
+        """relative standard error of count(): about 68% of estimates lie within this fraction of the true count."""
+
+        return 1.04 / math.sqrt(self.size)
+
+
+    def add(self, value: str) -> None:
+        hashed = _hash(value)
+        index = hashed & (self.size - 1)
+        rest = hashed >> self.precision
+
+        # rank: position of the first 1 bit in the remaining 64 - precision bits (all zero ranks one past the end).
+        bits = 64 - self.precision
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """make this the sketch of the union of both."""
+
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        # registers take few distinct values, so sum 2**-rank per rank rather than per register.
+        ranks = Counter(self.registers)
+        estimate = alpha * size * size / sum(count * 2.0 ** -rank for rank, count in ranks.items())
+
+        # small cardinalities: linear counting over the empty registers is more accurate than the raw estimate.
+        empty = ranks[0]
+        if estimate <= 2.5 * size and empty:
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(int(math.log2(len(data))), data)
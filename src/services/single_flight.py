@@ -0,0 +1,127 @@
+"""single-flight coalescing: concurrent identical calls run once and every caller gets that one result."""
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class _Call:
+    """one call in flight: waiters block on done, then read value or error."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    runs at most one call per key at a time. a caller that arrives while a call with the same key is running
+    does not run its own: it waits for that call and returns its result, or raises its exception.
+    only calls that overlap are coalesced; nothing is kept once a call finishes.
+    """
+
+    def __init__(self) -> None:
+        self.calls = self.coalesced = self.failures = 0
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = function()
+            return call.value
+
+        except BaseException as error:
+            call.error = error
+            with self._lock:
+                self.failures += 1
+            raise
+
+        finally:
+            # remove the call before waking the waiters, so a caller arriving from now on starts a fresh one.
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "in_flight": len(self._calls),
+            }
+
+
+
+class _AsyncCall:
+    """one coroutine call in flight: waiters await done, then read value or error."""
+
+    def __init__(self) -> None:
+        self.done = asyncio.Event()
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop (the async database driver): a caller that arrives while an
+    identical call is being awaited awaits that call's result instead of running its own. no lock is needed, as
+    everything between two awaits runs without interruption.
+    """
+
+    def __init__(self) -> None:
+        self.calls = self.coalesced = self.failures = 0
+        self._calls: dict[Hashable, _AsyncCall] = {}
+
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+            await call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        call = self._calls[key] = _AsyncCall()
+        self.calls += 1
+        try:
+            call.value = await function()
+            return call.value
+
+        except BaseException as error:
+            call.error = error
+            self.failures += 1
+            raise
+
+        finally:
+            # remove the call before waking the waiters, so a caller arriving from now on starts a fresh one.
+            del self._calls[key]
+            call.done.set()
+
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "in_flight": len(self._calls),
+        }
@@ -0,0 +1,114 @@
+"""start-up warm-up of one worker: pooled connections opened and analytics results precomputed before it takes traffic."""
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable
+from typing import Literal
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+logger = logging.getLogger(__name__)
+
+
+WarmUpState = Literal["disabled", "pending", "running", "done", "failed"]
+
+
+class WarmUp:
+    """
+    opens `connections` pooled connections at once (so they stay in the pool) and then runs precompute, which fills the
+    result cache. with async_engine (DATABASE_DRIVER=async), whose pool serves the requests, its pool is filled as well.
+    state tells the health check whether this has finished; a failed warm-up is logged and the worker serves anyway,
+    paying the cold costs on first use as it would without warm-up.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        connections: int,
+        precompute: Callable[[], None],
+        enabled: bool = True,
+        async_engine: AsyncEngine | None = None,
+    ) -> None:
+        self._engine = engine
+        self._async_engine = async_engine
+        self._connections = connections
+        self._precompute = precompute
+        self.state: WarmUpState = "pending" if enabled else "disabled"
+        self.seconds: float | None = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("disabled", "done", "failed")
+
+
+    def open_connections(self) -> int:
+        """check out the connections together, then return them; the pool keeps at most its pool_size of them open."""
+
+        count = min(self._connections, self._engine.pool.size())
+        opened = []
+        try:
+            for _ in range(count):
+                connection = self._engine.connect()
+                opened.append(connection)
+                connection.execute(text("SELECT 1"))
+
+        finally:
+            for connection in opened:
+                connection.close()
+        return count
+
+
+    async def open_async_connections(self) -> int:
+        """open_connections for the async engine; asyncpg connections belong to the event loop that opens them."""
+
+        count = min(self._connections, self._async_engine.sync_engine.pool.size())
+        opened = []
+        try:
+            for _ in range(count):
+                connection = await self._async_engine.connect()
+                opened.append(connection)
+                await connection.execute(text("SELECT 1"))
+
+        finally:
+            for connection in opened:
+                await connection.close()
+        return count
+
+
+    def run(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        """
+        warm up, blocking (the lifespan runs this in a thread). the async engine's connections are opened on loop,
+        the event loop that will serve the requests, so they are only warmed when it is given.
+        """
+
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "running"
+
+        start = time.perf_counter()
+        try:
+            connections = self.open_connections()
+            if self._async_engine is not None and loop is not None:
+                connections += asyncio.run_coroutine_threadsafe(self.open_async_connections(), loop).result()
+            self._precompute()
+
+        except Exception:
+            # never leave the worker reporting "running" (503) for good.
+            logger.exception("warm-up failed; serving without it")
+            self.state = "failed"
+
+        else:
+            self.state = "done"
+            logger.info(
+                "warm-up finished in %.2fs: %d connections opened, analytics results precomputed",
+                time.perf_counter() - start, connections,
+            )
+
+        finally:
+            self.seconds = time.perf_counter() - start
@@ -6,19 +6,28 @@ endpoint coverage includes:
   - GET /analytics/monthly-active-merchants
   - GET /analytics/product-adoption
   - GET /analytics/kyc-funnel
+  - GET /analytics/funnel
+  - GET /analytics/merchant-overlap
   - GET /analytics/failure-rates
+  - GET /analytics/summary
+  - GET /analytics/cache-stats
+  - GET /analytics/pool-stats
 
 all tests use a mocked AnalyticsService so no real DB connection is required or utilized.
 run test with: uv run pytest tests/ -v
 """
 
 import re
+import threading
 import pytest
 from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
 from src.main import app
+from src.api.v1.endpoints.analytics import analytics_service, flights, get_result_cache, get_revalidator
 from src.core.deps import get_db
 from src.services.analytics import AnalyticsService
+from src.services.cache import AsyncCachedAnalyticsService, ResultCache, Revalidator
+from src.services.warmup import WarmUp
 
 
 
@@ -42,7 +51,13 @@ def client(mock_service):
     mock_db = MagicMock()
     app.dependency_overrides[get_db] = lambda: mock_db
 
-    with patch("src.api.v1.endpoints.analytics.AnalyticsService", return_value=mock_service):
+    # every test sees its own mock results, never one cached by an earlier test.
+    app.dependency_overrides[get_result_cache] = lambda: None
+
+    # no start-up warm-up: it would run real queries.
+    warmup = WarmUp(MagicMock(), 0, MagicMock(), enabled=False)
+
+    with patch("src.api.v1.endpoints.analytics.AnalyticsService", return_value=mock_service), patch("src.main.warmup", warmup):
         with TestClient(app) as c:
             yield c
 
@@ -147,6 +162,16 @@ class TestMonthlyActiveMerchants:
         assert data["2024-02"] == 15
 
 
+    def test_exact_by_default_and_approx_on_request(self, client, mock_service):
+        mock_service.get_monthly_active_merchants.return_value = {"2024-01": 10}
+
+        client.get("/analytics/monthly-active-merchants")
+        client.get("/analytics/monthly-active-merchants", params={"approx": "true"})
+        assert [c.kwargs for c in mock_service.get_monthly_active_merchants.call_args_list] == [
+            {"approx": False}, {"approx": True},
+        ]
+
+
     def test_month_keys_are_yyyy_mm_format(self, client, mock_service):
         """all month keys must match YYYY-MM format."""
 
@@ -208,6 +233,12 @@ class TestProductAdoption:
 
     ALL_PRODUCTS = {"POS", "AIRTIME", "BILLS", "CARD_PAYMENT", "SAVINGS", "MONIEBOOK", "KYC"}
 
+    def test_approx_passed_to_service(self, client, mock_service):
+        mock_service.get_product_adoption.return_value = {"POS": 500}
+        assert client.get("/analytics/product-adoption?approx=true").json() == {"POS": 500}
+        assert mock_service.get_product_adoption.call_args.kwargs == {"approx": True}
+
+
     def test_returns_200_with_all_products(self, client, mock_service):
         """happy path: all 7 products appear in the response."""
 
@@ -331,6 +362,101 @@ class TestKycFunnel:
 
 
 
+class TestFunnel:
+    """test for GET /analytics/funnel."""
+
+
+    STAGES = [
+        {"product": "KYC", "event_type": "DOCUMENT_SUBMITTED", "merchants": 100, "conversion_rate": 100.0},
+        {"product": "KYC", "event_type": "TIER_UPGRADE", "merchants": 40, "conversion_rate": 40.0},
+    ]
+
+
+    def test_stages_passed_in_order(self, client, mock_service):
+        """happy path: repeated stage params become ordered (product, event_type) pairs."""
+
+        mock_service.get_funnel.return_value = self.STAGES
+        resp = client.get(
+            "/analytics/funnel",
+            params={"stage": ["KYC:DOCUMENT_SUBMITTED", "KYC:TIER_UPGRADE"], "ordered": "true", "start": "2024-01-01T00:00:00"},
+        )
+        assert resp.status_code == 200
+        assert resp.json() == self.STAGES
+
+        args, kwargs = mock_service.get_funnel.call_args
+        assert list(args[0]) == [("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")]
+        assert kwargs["ordered"] is True
+        assert kwargs["start"].year == 2024
+        assert kwargs["end"] is None
+
+
+    def test_stage_is_required(self, client, mock_service):
+        assert client.get("/analytics/funnel").status_code == 422
+
+
+    def test_malformed_stage_returns_422(self, client, mock_service):
+        resp = client.get("/analytics/funnel", params={"stage": "KYC"})
+        assert resp.status_code == 422
+        mock_service.get_funnel.assert_not_called()
+
+
+    def test_invalid_funnel_returns_422(self, client, mock_service):
+        """the service's validation errors (e.g. start after end) are client errors."""
+
+        mock_service.get_funnel.side_effect = ValueError("start must be before end")
+        resp = client.get("/analytics/funnel", params={"stage": "KYC:TIER_UPGRADE"})
+        assert resp.status_code == 422
+        assert resp.json()["detail"] == "start must be before end"
+
+
+    def test_service_error_returns_503(self, client, mock_service):
+        mock_service.get_funnel.side_effect = RuntimeError("Database is unreachable.")
+        resp = client.get("/analytics/funnel", params={"stage": "KYC:TIER_UPGRADE"})
+        assert resp.status_code == 503
+
+
+
+class TestMerchantOverlap:
+    """test for GET /analytics/merchant-overlap."""
+
+
+    RESULT = {
+        "stages": [
+            {"product": "KYC", "event_type": "DOCUMENT_SUBMITTED"},
+            {"product": "KYC", "event_type": "TIER_UPGRADE"},
+        ],
+        "merchants": 2053,
+    }
+
+
+    def test_returns_overlap(self, client, mock_service):
+        mock_service.get_merchant_overlap.return_value = self.RESULT
+        resp = client.get("/analytics/merchant-overlap", params={"stage": ["KYC:DOCUMENT_SUBMITTED", "KYC:TIER_UPGRADE"]})
+        assert resp.status_code == 200
+        assert resp.json() == self.RESULT
+        assert list(mock_service.get_merchant_overlap.call_args.args[0]) == [
+            ("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE"),
+        ]
+
+
+    def test_malformed_stage_returns_422(self, client, mock_service):
+        assert client.get("/analytics/merchant-overlap", params={"stage": "KYC:"}).status_code == 422
+        mock_service.get_merchant_overlap.assert_not_called()
+
+
+    def test_too_many_stages_returns_422(self, client, mock_service):
+        mock_service.get_merchant_overlap.side_effect = ValueError("an overlap has at most 10 stages (got 11)")
+        resp = client.get("/analytics/merchant-overlap", params={"stage": "KYC:TIER_UPGRADE"})
+        assert resp.status_code == 422
+
+
+    def test_service_error_returns_503(self, client, mock_service):
+        mock_service.get_merchant_overlap.side_effect = RuntimeError("Database is unreachable.")
+        resp = client.get("/analytics/merchant-overlap", params={"stage": "KYC:TIER_UPGRADE"})
+        assert resp.status_code == 503
+
+
+
 class TestFailureRates:
     """test for GET /analytics/failure-rates."""
 
@@ -428,6 +554,217 @@ class TestFailureRates:
 
 
 
+class TestSummary:
+    """test for GET /analytics/summary."""
+
+
+    SUMMARY = {
+        "top_merchant": {"merchant_id": "MRC-001", "total_volume": 98765.43},
+        "monthly_active_merchants": {"2024-01": 120, "2024-02": 95},
+        "product_adoption": {"POS": 80, "KYC": 40},
+        "kyc_funnel": {"documents_submitted": 40, "verifications_completed": 30, "tier_upgrades": 10},
+        "failure_rates": [{"product": "POS", "failure_rate": 12.5}],
+    }
+
+
+    def test_returns_every_result_in_one_response(self, client, mock_service):
+        mock_service.get_summary.return_value = self.SUMMARY
+        resp = client.get("/analytics/summary")
+        assert resp.status_code == 200
+        assert resp.json() == self.SUMMARY
+        mock_service.get_summary.assert_called_once()
+
+
+    def test_service_error_returns_503(self, client, mock_service):
+        mock_service.get_summary.side_effect = RuntimeError("Database is unreachable.")
+        resp = client.get("/analytics/summary")
+        assert resp.status_code == 503
+        assert "Database" not in resp.text
+
+
+
+class TestResultCache:
+    """test for the result cache in front of the service, and GET /analytics/cache-stats."""
+
+
+    @pytest.fixture
+    def cache(self):
+        cache = ResultCache(max_entries=8, ttl=60.0)
+        app.dependency_overrides[get_result_cache] = lambda: cache
+        return cache
+
+
+    @pytest.fixture(autouse=True)
+    def data_version(self):
+        with patch("src.api.v1.endpoints.analytics.data_versions") as versions:
+            versions.current.return_value = 3
+            yield versions
+
+
+    def test_repeated_request_is_served_from_cache(self, client, mock_service, cache):
+        mock_service.get_top_merchant.return_value = {"merchant_id": "MRC-001", "total_volume": 1.0}
+
+        first = client.get("/analytics/top-merchant").json()
+        second = client.get("/analytics/top-merchant").json()
+
+        assert first == second
+        mock_service.get_top_merchant.assert_called_once()
+
+
+    def test_new_data_version_recomputes(self, client, mock_service, cache, data_version):
+        mock_service.get_top_merchant.return_value = {"merchant_id": "MRC-001", "total_volume": 1.0}
+        client.get("/analytics/top-merchant")
+
+        data_version.current.return_value = 4
+        mock_service.get_top_merchant.return_value = {"merchant_id": "MRC-002", "total_volume": 2.0}
+        assert client.get("/analytics/top-merchant").json()["merchant_id"] == "MRC-002"
+
+
+    def test_cache_stats(self, client, mock_service, cache):
+        mock_service.get_failure_rates.return_value = []
+        client.get("/analytics/failure-rates")
+        client.get("/analytics/failure-rates")
+
+        data = client.get("/analytics/cache-stats").json()
+        assert data["enabled"] is True
+        assert (data["hits"], data["misses"], data["entries"]) == (1, 1, 1)
+        assert data["data_version"] == 3
+
+
+    def test_cache_stats_when_disabled(self, client, mock_service):
+        data = client.get("/analytics/cache-stats").json()
+        assert data["enabled"] is False
+        assert data["hits"] == 0
+        assert set(data["single_flight"]) == {"calls", "coalesced", "failures", "in_flight"}
+
+
+    def test_identical_concurrent_requests_share_one_query(self, client, mock_service):
+        release = threading.Event()
+        mock_service.get_failure_rates.side_effect = lambda: release.wait() and [{"product": "POS", "failure_rate": 1.0}]
+        before = flights.stats()["coalesced"]
+
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(client.get("/analytics/failure-rates"))) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        while flights.stats()["coalesced"] - before < 3:
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert [r.json() for r in responses] == [[{"product": "POS", "failure_rate": 1.0}]] * 4
+        mock_service.get_failure_rates.assert_called_once()
+
+
+
+class TestStaleWhileRevalidate:
+    """test for stale-while-revalidate serving and its staleness headers."""
+
+
+    @pytest.fixture
+    def cache(self):
+        cache = ResultCache(max_entries=8, ttl=60.0)
+        app.dependency_overrides[get_result_cache] = lambda: cache
+        return cache
+
+
+    @pytest.fixture
+    def revalidator(self, cache):
+        revalidator = MagicMock(spec=Revalidator)
+        revalidator.is_stale.side_effect = lambda entry, version: entry.version != version
+        revalidator.stats.return_value = {"soft_ttl_seconds": 30.0, "refreshes": 0, "failures": 0, "pending": 1}
+        app.dependency_overrides[get_revalidator] = lambda: revalidator
+        return revalidator
+
+
+    @pytest.fixture(autouse=True)
+    def data_version(self):
+        with patch("src.api.v1.endpoints.analytics.data_versions") as versions:
+            versions.current.return_value = 3
+            yield versions
+
+
+    def test_fresh_result_headers(self, client, mock_service, cache, revalidator):
+        mock_service.get_product_adoption.return_value = {"POS": 1}
+        resp = client.get("/analytics/product-adoption")
+
+        assert resp.headers["Age"] == "0"
+        assert resp.headers["X-Analytics-Stale"] == "false"
+
+
+    def test_stale_result_served_and_recomputation_queued(self, client, mock_service, cache, revalidator, data_version):
+        mock_service.get_product_adoption.return_value = {"POS": 1}
+        client.get("/analytics/product-adoption")
+
+        data_version.current.return_value = 4
+        resp = client.get("/analytics/product-adoption")
+        assert resp.json() == {"POS": 1}
+        assert resp.headers["X-Analytics-Stale"] == "true"
+        mock_service.get_product_adoption.assert_called_once()
+        assert revalidator.submit.call_args.args[:3] == (("get_product_adoption", (), (("approx", False),)), 4, "get_product_adoption")
+
+
+    def test_cache_stats_reports_revalidation(self, client, mock_service, cache, revalidator):
+        assert client.get("/analytics/cache-stats").json()["revalidation"]["pending"] == 1
+
+
+
+class TestPoolStats:
+    """test for GET /analytics/pool-stats."""
+
+
+    def test_reports_the_sync_pool(self, client):
+        data = client.get("/analytics/pool-stats").json()
+
+        assert data["driver"] == "sync"
+        assert data["async_pool"] is None
+        pool = data["sync_pool"]
+        assert {"checked_out", "idle", "overflow", "checkouts", "timeouts"} <= set(pool)
+        assert pool["wait_ms"]["buckets"][-1]["le_ms"] is None
+        assert pool["wait_ms"]["buckets"][-1]["count"] == pool["checkouts"]
+
+
+
+class TestAsyncDriver:
+    """the endpoints with the service of the async database driver, whose calls are awaited."""
+
+
+    @pytest.fixture
+    def async_service(self):
+        service = MagicMock(spec=AsyncCachedAnalyticsService)
+        app.dependency_overrides[analytics_service] = lambda: service
+        return service
+
+
+    def test_result_is_awaited(self, client, async_service):
+        async_service.get_top_merchant.return_value = {"merchant_id": "MRC-001", "total_volume": 1.0}
+        resp = client.get("/analytics/top-merchant")
+
+        assert resp.status_code == 200
+        assert resp.json()["merchant_id"] == "MRC-001"
+        async_service.get_top_merchant.assert_awaited_once()
+
+
+    def test_parameters_passed_through(self, client, async_service):
+        async_service.get_funnel.return_value = []
+        client.get("/analytics/funnel?stage=KYC:DOCUMENT_SUBMITTED&stage=KYC:TIER_UPGRADE&ordered=true")
+        assert async_service.get_funnel.await_args.kwargs["ordered"] is True
+
+
+    def test_invalid_funnel_returns_422(self, client, async_service):
+        async_service.get_funnel.side_effect = ValueError("start must be before end")
+        assert client.get("/analytics/funnel?stage=KYC:DOCUMENT_SUBMITTED").status_code == 422
+
+
+    def test_runtime_error_returns_503(self, client, async_service):
+        async_service.get_summary.side_effect = RuntimeError("Database is unreachable.")
+        assert client.get("/analytics/summary").status_code == 503
+
+
+
 class TestGeneral:
     """general test or cross-cutting tests."""
 
@@ -438,6 +775,19 @@ class TestGeneral:
         assert resp.status_code == 200
 
 
+    def test_health_check_reports_warm_up(self, client, mock_service):
+        assert client.get("/").json()["warmup"] == "disabled"
+
+
+    def test_health_check_unavailable_while_warming_up(self, client, mock_service):
+        """a load balancer must not route traffic to a worker that is still warming up."""
+
+        with patch("src.main.warmup.state", "running"):
+            resp = client.get("/")
+        assert resp.status_code == 503
+        assert (resp.json()["status"], resp.json()["warmup"]) == ("warming up", "running")
+
+
     def test_all_endpoints_return_json(self, client, mock_service):
         """every analytics endpoint must respond with application/json."""
 
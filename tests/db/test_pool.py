@@ -0,0 +1,170 @@
+"""
+unit tests for the connection pool configuration and instrumentation (src/db/pool.py).
+
+the pools run on in-memory sqlite engines, so no postgres connection is required.
+
+run the test with: uv run pytest tests/db/test_pool.py -v
+"""
+
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from src.db.pool import (
+    WAIT_BUCKETS_MS,
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    PoolMetrics,
+    ping_idle_connections,
+    pool_options,
+)
+
+
+def make_engine(**kwargs):
+    return create_engine("sqlite://", poolclass=InstrumentedQueuePool, **kwargs)
+
+
+def pool_settings(**overrides):
+    values = {
+        "db_pool_size": 3, "db_max_overflow": 2, "db_pool_timeout": 1.5, "db_pool_recycle": 600, "db_pool_pre_ping": "always",
+    }
+    return SimpleNamespace(**{**values, **overrides})
+
+
+
+class TestPoolMetrics:
+
+
+    def test_waits_go_to_cumulative_buckets(self):
+        metrics = PoolMetrics()
+        for seconds in (0.0005, 0.003, 0.003, 20.0):
+            metrics.observe_wait(seconds)
+
+        stats = metrics.stats()
+        counts = {bucket["le_ms"]: bucket["count"] for bucket in stats["wait_ms"]["buckets"]}
+        assert (counts[1], counts[5], counts[10000], counts[None]) == (1, 3, 3, 4)
+        assert len(stats["wait_ms"]["buckets"]) == len(WAIT_BUCKETS_MS) + 1
+        assert stats["checkouts"] == 4
+        assert stats["wait_ms"]["max"] == pytest.approx(20_000.0)
+
+
+    def test_no_checkouts(self):
+        stats = PoolMetrics().stats()
+        assert stats["wait_ms"]["mean"] == 0.0
+        assert stats["wait_ms"]["buckets"][-1] == {"le_ms": None, "count": 0}
+
+
+    def test_pings(self):
+        metrics = PoolMetrics()
+        metrics.observe_ping(True)
+        metrics.observe_ping(False)
+        assert (metrics.stats()["pings"], metrics.stats()["ping_failures"]) == (2, 1)
+
+
+
+class TestInstrumentedQueuePool:
+
+
+    def test_checkouts_are_timed(self):
+        engine = make_engine(pool_size=2, max_overflow=0)
+        for _ in range(3):
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+
+        assert engine.pool.metrics.checkouts == 3
+        assert engine.pool.status_counts() == {"size": 2, "checked_out": 0, "idle": 1, "overflow": 0, "max_overflow": 0}
+
+
+    def test_status_counts_while_checked_out(self):
+        engine = make_engine(pool_size=1, max_overflow=2)
+        first, second = engine.connect(), engine.connect()
+        assert engine.pool.status_counts() == {"size": 1, "checked_out": 2, "idle": 0, "overflow": 1, "max_overflow": 2}
+        first.close()
+        second.close()
+
+
+    def test_pool_timeout_is_counted(self):
+        engine = make_engine(pool_size=1, max_overflow=0, pool_timeout=0.01)
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+
+        assert (engine.pool.metrics.timeouts, engine.pool.metrics.checkouts) == (1, 1)
+
+
+    def test_metrics_survive_dispose(self):
+        engine = make_engine()
+        engine.connect().close()
+        metrics = engine.pool.metrics
+        engine.dispose()
+
+        assert engine.pool.metrics is metrics
+        engine.connect().close()
+        assert metrics.checkouts == 2
+
+
+
+class TestPoolOptions:
+
+
+    def test_settings_become_engine_arguments(self):
+        options = pool_options(pool_settings())
+        assert options == {
+            "poolclass": InstrumentedQueuePool, "pool_size": 3, "max_overflow": 2, "pool_timeout": 1.5,
+            "pool_recycle": 600, "pool_pre_ping": True,
+        }
+
+
+    @pytest.mark.parametrize("strategy", ["idle", "never"])
+    def test_only_always_pings_every_checkout(self, strategy):
+        assert pool_options(pool_settings(db_pool_pre_ping=strategy))["pool_pre_ping"] is False
+
+
+    def test_async_pool(self):
+        pool_class = pool_options(pool_settings(), asyncio=True)["poolclass"]
+        assert pool_class is InstrumentedAsyncQueuePool
+        assert issubclass(pool_class, AsyncAdaptedQueuePool)
+
+
+
+class TestPingIdleConnections:
+
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = SimpleNamespace(now=1000.0)
+        monkeypatch.setattr("src.db.pool.time.monotonic", lambda: clock.now)
+        return clock
+
+
+    def test_recently_returned_connection_not_pinged(self, clock):
+        engine = make_engine(pool_size=1)
+        ping_idle_connections(engine, idle=30)
+        engine.connect().close()
+        clock.now += 10
+        engine.connect().close()
+        assert engine.pool.metrics.pings == 0
+
+
+    def test_idle_connection_pinged(self, clock):
+        engine = make_engine(pool_size=1)
+        ping_idle_connections(engine, idle=30)
+        engine.connect().close()
+        clock.now += 31
+        engine.connect().close()
+        assert (engine.pool.metrics.pings, engine.pool.metrics.ping_failures) == (1, 0)
+
+
+    def test_dead_connection_replaced(self, clock):
+        engine = make_engine(pool_size=1)
+        ping_idle_connections(engine, idle=30)
+        connection = engine.connect()
+        dead = connection.connection.dbapi_connection
+        connection.close()
+        dead.close()
+        clock.now += 31
+
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+            assert connection.connection.dbapi_connection is not dead
+        assert engine.pool.metrics.ping_failures == 1
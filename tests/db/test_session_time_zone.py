@@ -0,0 +1,103 @@
+"""
+tests of the UTC session time zone (pin_session_time_zone in src/db/pool.py) against the database in DATABASE_URL,
+with PGTZ set so the server default is Africa/Lagos (UTC+1). the rows go to a temporary merchant_activities, which
+shadows the real table for the test's connection only. the columnar comparison is skipped when numpy is not installed.
+
+run the test with: uv run pytest tests/db/test_session_time_zone.py -v
+"""
+
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from src.core.config import settings
+from src.db.pool import pin_session_time_zone
+from src.services.analytics import AnalyticsService
+
+STAGE = ("KYC", "DOCUMENT_SUBMITTED")
+
+# in the first hour of a month in Lagos, which is still the previous month in UTC; the naive one is stored in the session zone.
+TIMESTAMPS = ("2024-01-01 00:30:00+01", "2024-01-01 00:30:00", "2024-01-15 12:00:00+01", "2024-02-01 00:15:00+01")
+
+
+@pytest.fixture
+def lagos(monkeypatch):
+    monkeypatch.setenv("PGTZ", "Africa/Lagos")
+
+
+def make_engine(pinned: bool = True):
+    engine = create_engine(settings.database_url, poolclass=NullPool)
+    if pinned:
+        pin_session_time_zone(engine)
+    return engine
+
+
+@pytest.fixture
+def connection(lagos):
+    """a connection of a pinned engine, holding the TIMESTAMPS rows in a temporary merchant_activities."""
+
+    with make_engine().connect() as connection:
+        connection.execute(text("CREATE TEMPORARY TABLE merchant_activities (LIKE public.merchant_activities)"))
+        for i, timestamp in enumerate(TIMESTAMPS):
+            connection.execute(
+                text(
+                    "INSERT INTO merchant_activities (event_id, merchant_id, event_timestamp, product, event_type, amount, status) "
+                    "VALUES (gen_random_uuid(), :merchant, :timestamp, :product, :event_type, 0, 'SUCCESS')"
+                ),
+                {"merchant": f"MRC-{i}", "timestamp": timestamp, "product": STAGE[0], "event_type": STAGE[1]},
+            )
+        yield connection
+        connection.rollback()
+
+
+
+class TestPinSessionTimeZone:
+
+
+    def test_server_default_is_overridden(self, lagos):
+        with make_engine(pinned=False).connect() as connection:
+            assert connection.execute(text("SHOW TimeZone")).scalar() == "Africa/Lagos"
+
+        with make_engine().connect() as connection:
+            assert connection.execute(text("SHOW TimeZone")).scalar() == "UTC"
+            connection.rollback()
+            assert connection.execute(text("SHOW TimeZone")).scalar() == "UTC"
+
+
+    def test_months_are_utc_months(self, connection):
+        live = AnalyticsService(Session(bind=connection), source="live")
+        assert live.get_monthly_active_merchants() == {"2023-12": 1, "2024-01": 3}
+
+
+
+class TestColumnarMatchesLive:
+
+
+    @pytest.fixture
+    def services(self, connection):
+        pytest.importorskip("numpy")
+        from src.services.columnar import ColumnarAnalyticsService, ColumnarStore, load_columns
+
+        columns, _ = load_columns(connection)
+        store = MagicMock(spec=ColumnarStore)
+        store.columns = columns
+        versions = MagicMock()
+        versions.current.return_value = columns.version
+        db = Session(bind=connection)
+        return ColumnarAnalyticsService(db, store, versions), AnalyticsService(db, source="live")
+
+
+    def test_monthly_active_merchants(self, services):
+        columnar, live = services
+        assert columnar.get_monthly_active_merchants() == live.get_monthly_active_merchants()
+
+
+    @pytest.mark.parametrize("start, end", [
+        (datetime(2024, 1, 1), datetime(2024, 2, 1)),
+        (datetime.fromisoformat("2024-01-01T00:00:00+01:00"), datetime.fromisoformat("2024-02-01T00:00:00+01:00")),
+    ])
+    def test_funnel_window(self, services, start, end):
+        columnar, live = services
+        assert columnar.get_funnel([STAGE], start=start, end=end) == live.get_funnel([STAGE], start=start, end=end)
@@ -0,0 +1,250 @@
+"""
+parity tests for the batch validator (validate_batch in src/scripts/import_activities.py).
+
+validate_batch must accept and reject exactly the rows that the per-row functions
+(row_to_activity, parse_uuid, parse_amount, parse_timestamp) accept and reject, and
+produce the same values for accepted rows.
+
+run the test with: uv run pytest tests/scripts/test_batch_validation.py -v
+"""
+
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import pytest
+from src.scripts.import_activities import (
+    COPY_COLUMNS,
+    parse_amount,
+    parse_timestamp,
+    parse_uuid,
+    row_to_activity,
+    validate_batch,
+)
+
+
+HEADER = list(COPY_COLUMNS)
+
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+
+UUID = "8a380d57-6b3d-40e1-b505-aeb1d462cac3"
+
+
+def comparable(value):
+    """Decimal('NaN') != Decimal('NaN'), so compare amounts by their exact string form."""
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def reference(text: str) -> list[dict | None]:
+    """run the per-row path (csv.DictReader + row_to_activity) over CSV text."""
+    return [row_to_activity(row) for row in csv.DictReader(io.StringIO(text))]
+
+
+def batched(text: str) -> list[dict | None]:
+    """run validate_batch over the same CSV text and expand it back to row_to_activity's shape."""
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader)
+    rows = [row for row in reader if row]
+    columns, rejected = validate_batch(rows, header)
+
+    accepted = iter(zip(*columns))
+    return [None if flag else dict(zip(COPY_COLUMNS, next(accepted))) for flag in rejected]
+
+
+def assert_parity(text: str) -> None:
+    expected = reference(text)
+    actual = batched(text)
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        if want is None:
+            assert got is None
+        else:
+            assert got is not None
+            assert {k: comparable(v) for k, v in got.items()} == {k: comparable(v) for k, v in want.items()}
+
+
+def csv_text(*rows, header=HEADER) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def row(**overrides) -> list[str]:
+    """a valid row in HEADER order with selected fields replaced."""
+    values = {
+        "event_id": UUID,
+        "merchant_id": "MRC-000001",
+        "event_timestamp": "2024-01-01T00:00:23",
+        "product": "POS",
+        "event_type": "CARD_TRANSACTION",
+        "amount": "1000.00",
+        "status": "SUCCESS",
+        "channel": "POS",
+        "region": "LAGOS",
+        "merchant_tier": "VERIFIED",
+    }
+    values.update(overrides)
+    return [values[column] for column in HEADER]
+
+
+
+class TestEventIdParity:
+
+    CASES = [
+        UUID,
+        UUID.upper(),
+        f"  {UUID}  ",
+        "{" + UUID + "}",
+        f"urn:uuid:{UUID}",
+        UUID.replace("-", ""),
+        UUID[:-1],
+        UUID + "0",
+        "not-a-uuid",
+        "",
+        "   ",
+        "8a380d57_6b3d_40e1_b505_aeb1d462cac3",
+    ]
+
+
+    @pytest.mark.parametrize("value", CASES)
+    def test_matches_parse_uuid(self, value):
+        """a row is rejected exactly when parse_uuid rejects its event_id, and the parsed value matches."""
+
+        columns, rejected = validate_batch([row(event_id=value)], HEADER)
+        expected = parse_uuid(value)
+
+        if expected is None:
+            assert rejected[0] == 1
+        else:
+            assert rejected[0] == 0
+            assert columns[0] == [expected]
+
+
+
+class TestAmountParity:
+
+    CASES = [
+        "1000.00", "210.8", "  12.345 ", "0", "-0", "-5.5", "1e10", "1_000",
+        "", "   ", "abc", "NaN", "Infinity", "sNaN", "1e400", "0x10", "1,000.00",
+    ]
+
+
+    @pytest.mark.parametrize("value", CASES)
+    def test_matches_parse_amount(self, value):
+        """a row is rejected exactly when parse_amount returns None, and accepted amounts are identical."""
+
+        columns, rejected = validate_batch([row(amount=value)], HEADER)
+        expected = parse_amount(value)
+
+        if expected is None:
+            assert rejected[0] == 1
+        else:
+            assert rejected[0] == 0
+            assert str(columns[5][0]) == str(expected)
+
+
+    def test_repeated_amounts_share_one_decimal(self):
+        """identical amount strings are parsed once per process, not once per row."""
+
+        columns, _ = validate_batch([row(amount="250.00"), row(amount="250.00")], HEADER)
+        assert columns[5][0] is columns[5][1]
+
+
+
+class TestTimestampParity:
+
+    CASES = [
+        "2024-01-01T00:00:23",
+        "2024-01-01T00:00:23Z",
+        " 2024-01-01T00:00:23+01:00 ",
+        "2024-01-01",
+        "",
+        "   ",
+        "yesterday",
+        "2024-13-01T00:00:00",
+    ]
+
+
+    @pytest.mark.parametrize("value", CASES)
+    def test_matches_parse_timestamp(self, value):
+        """unparseable timestamps become None but never reject the row (same as row_to_activity)."""
+
+        columns, rejected = validate_batch([row(event_timestamp=value)], HEADER)
+        assert rejected[0] == 0
+
+        raw = parse_timestamp(value)
+        try:
+            expected = datetime.fromisoformat(raw.replace("Z", "+00:00")) if raw else None
+        except ValueError:
+            expected = None
+        assert columns[2] == [expected]
+
+
+
+class TestRowParity:
+
+
+    def test_required_fields(self):
+        """blank merchant_id, product, event_type or status reject the row."""
+
+        assert_parity(csv_text(
+            row(),
+            row(merchant_id=""),
+            row(product="  "),
+            row(event_type=""),
+            row(status=" "),
+            row(merchant_id="  MRC-000002  ", channel=" ", region="", merchant_tier="  GOLD "),
+        ))
+
+
+    def test_short_and_long_rows(self):
+        """rows with too few or too many fields behave like csv.DictReader + row_to_activity."""
+
+        full = row()
+        assert_parity(csv_text(full[:6], full[:5], full[:7], full + ["extra", "fields"], full[:1]))
+
+
+    def test_header_without_optional_or_amount_columns(self):
+        """a missing amount column means zero; missing optional columns mean NULL."""
+
+        header = ["event_id", "merchant_id", "product", "event_type", "status"]
+        assert_parity(csv_text([UUID, "MRC-1", "POS", "CARD_TRANSACTION", "SUCCESS"], header=header))
+
+
+    def test_reordered_and_duplicate_header(self):
+        """columns are found by name; a duplicated name takes the last value like csv.DictReader."""
+
+        header = ["status", "amount", "event_id", "merchant_id", "product", "event_type", "amount"]
+        assert_parity(csv_text(
+            ["SUCCESS", "abc", UUID, "MRC-1", "POS", "X", "5.00"],
+            ["SUCCESS", "5.00", UUID, "MRC-1", "POS", "X", "abc"],
+            header=header,
+        ))
+
+
+    def test_mask_marks_rejected_positions(self):
+        """the mask has one entry per input row and columns hold accepted rows only."""
+
+        columns, rejected = validate_batch(
+            [row(), row(event_id="bad"), row(merchant_id="MRC-2"), row(amount="x")], HEADER
+        )
+        assert list(rejected) == [0, 1, 0, 1]
+        assert columns[1] == ["MRC-000001", "MRC-2"]
+        assert all(len(column) == 2 for column in columns)
+
+
+    def test_empty_batch(self):
+        columns, rejected = validate_batch([], HEADER)
+        assert len(rejected) == 0
+        assert all(column == [] for column in columns)
+
+
+    @pytest.mark.skipif(not DATA_DIR.is_dir(), reason="sample data not available")
+    def test_sample_data_file(self):
+        """a full sample file (including its malformed rows) gives identical results on both paths."""
+
+        path = sorted(DATA_DIR.glob("activities_*.csv"))[0]
+        assert_parity(path.read_text(encoding="utf-8", errors="replace"))
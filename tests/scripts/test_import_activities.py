@@ -0,0 +1,1780 @@
+"""
+unit tests for the CSV importer (src/scripts/import_activities.py).
+
+the sqlalchemy session (and the raw psycopg2 cursor behind it) is mocked,
+so no rows are written to a real database.
+
+run the test with: uv run pytest tests/scripts/test_import_activities.py -v
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import multiprocessing
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from src.scripts import import_activities
+from src.scripts.import_activities import (
+    COPY_COLUMNS,
+    STAGING_TABLE,
+    Batch,
+    FileResult,
+    CSV_PATTERN,
+    _read_batches,
+    _write_batches,
+    import_csv_file,
+    import_csv_file_copy,
+    import_file,
+    merge_sketches,
+    parse_args,
+    plan_import,
+    run_import,
+    sketch_members,
+    watch_import,
+)
+from src.services.bitmap_index import MerchantBitmapIndex
+from src.services.column_snapshot import current_snapshot, open_snapshot
+from src.services.columnar import ActivityColumns
+from src.services.hyperloglog import HyperLogLog
+
+
+HEADER = "event_id,merchant_id,event_timestamp,product,event_type,amount,status,channel,region,merchant_tier\n"
+
+VALID_ROW = "8a380d57-6b3d-40e1-b505-aeb1d462cac3,MRC-000001,2024-01-01T00:00:23,POS,CARD_TRANSACTION,1000.00,SUCCESS,POS,LAGOS,VERIFIED\n"
+
+NULL_TIMESTAMP_ROW = "21ad4ba2-531f-4cfe-873f-9f9f36056fde,MRC-000002,,AIRTIME,AIRTIME_PURCHASE,210.8,FAILED,,,\n"
+
+BAD_UUID_ROW = "not-a-uuid,MRC-000003,2024-01-01T00:00:23,POS,CARD_TRANSACTION,5.00,SUCCESS,POS,LAGOS,VERIFIED\n"
+
+BAD_AMOUNT_ROW = "9251b1ec-4957-41b7-9487-1d7473404774,MRC-000004,,POS,CARD_TRANSACTION,abc,SUCCESS,POS,LAGOS,VERIFIED\n"
+
+
+def skip_schema(monkeypatch):
+    """run_import / watch_import without creating tables and views, refreshing the views or writing the bitmap index."""
+    monkeypatch.setattr(import_activities, "_create_tables", lambda: None)
+    monkeypatch.setattr(import_activities, "SessionLocal", lambda: MagicMock(spec=Session))
+    monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: None)
+    monkeypatch.setattr(import_activities, "update_bitmap_index", lambda: ("unchanged", 0, 0))
+
+
+def use_source(monkeypatch, source):
+    """configure ANALYTICS_SOURCE, which decides the rollup and bitmap upkeep the importer does."""
+    monkeypatch.setattr(import_activities.settings, "analytics_source", source)
+
+
+def write_csv(tmp_path, *rows, name="activities_20240101.csv"):
+    """write a CSV file with the standard header and the given rows."""
+    path = tmp_path / name
+    path.write_text(HEADER + "".join(rows), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def cursor():
+    """mock psycopg2 cursor that records every COPY payload it receives."""
+    cursor = MagicMock()
+    cursor.copied = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: cursor.copied.append((sql, buffer.read()))
+    return cursor
+
+
+@pytest.fixture
+def db(cursor):
+    """mock session whose raw connection hands out the mock cursor (and with an empty import manifest)."""
+    db = MagicMock(spec=Session)
+    db.connection.return_value.connection.cursor.return_value = cursor
+    db.get.return_value = None
+    return db
+
+
+def make_batch(rows, end_offset=0):
+    """a Batch of already-validated rows."""
+    return Batch(rows, end_offset, len(rows), 0)
+
+
+def manifest_writes(db):
+    """bound parameters of every import_manifest upsert passed to db.execute, in order."""
+    statements = [c.args[0] for c in db.execute.call_args_list]
+    return [stmt.compile().params for stmt in statements if "import_manifest" in str(stmt)]
+
+
+def executed_sql(db):
+    """the text of every statement passed to db.execute, in order."""
+    return [str(c.args[0]) for c in db.execute.call_args_list]
+
+
+
+class TestImportCsvFileCopy:
+
+
+    def test_counts_processed_and_skipped_rows(self, tmp_path, db):
+        """valid rows are counted as processed, malformed ones as skipped (same as the insert path)."""
+
+        path = write_csv(tmp_path, VALID_ROW, BAD_UUID_ROW, NULL_TIMESTAMP_ROW, BAD_AMOUNT_ROW)
+        assert import_csv_file_copy(path, db) == (2, 2)
+
+
+    def test_streams_valid_rows_through_copy_expert(self, tmp_path, db, cursor):
+        """only validated rows reach COPY, in staging-table column order."""
+
+        path = write_csv(tmp_path, VALID_ROW, BAD_UUID_ROW, NULL_TIMESTAMP_ROW)
+        import_csv_file_copy(path, db)
+
+        assert len(cursor.copied) == 1
+        sql, payload = cursor.copied[0]
+        assert sql.startswith(f"COPY {STAGING_TABLE} ({', '.join(COPY_COLUMNS)}) FROM STDIN")
+
+        rows = list(csv.reader(io.StringIO(payload)))
+        assert [row[1] for row in rows] == ["MRC-000001", "MRC-000002"]
+        assert rows[0][5] == "1000.00"
+
+
+    def test_null_fields_written_as_empty(self, tmp_path, db, cursor):
+        """missing timestamp and optional columns are sent as empty fields (NULL for COPY csv)."""
+
+        path = write_csv(tmp_path, NULL_TIMESTAMP_ROW)
+        import_csv_file_copy(path, db)
+
+        row = next(csv.reader(io.StringIO(cursor.copied[0][1])))
+        assert row[2] == ""
+        assert row[7:] == ["", "", ""]
+
+
+    def test_large_file_is_copied_in_chunks(self, tmp_path, db, cursor, monkeypatch):
+        """COPY payloads are bounded by BATCH_SIZE so memory does not grow with the file."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        rows = [VALID_ROW.replace("MRC-000001", f"MRC-{i:06d}") for i in range(5)]
+        path = write_csv(tmp_path, *rows)
+
+        assert import_csv_file_copy(path, db) == (5, 0)
+        assert len(cursor.copied) == 3
+
+
+    def test_merges_staging_with_single_on_conflict_insert(self, tmp_path, db):
+        """the whole file is merged with one INSERT ... SELECT ... ON CONFLICT (event_id) DO NOTHING."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        import_csv_file_copy(path, db)
+
+        merges = [sql for sql in executed_sql(db) if "INSERT INTO merchant_activities" in sql]
+        assert len(merges) == 1
+        assert f"FROM {STAGING_TABLE}" in merges[0]
+        assert "ON CONFLICT (event_id) DO NOTHING" in merges[0]
+        db.commit.assert_called_once()
+
+
+    def test_merge_maintains_daily_rollups_in_the_same_statement(self, tmp_path, db, monkeypatch):
+        """the rows the merge actually inserts (RETURNING) are added to merchant_daily_rollups by the same statement."""
+
+        use_source(monkeypatch, "rollup")
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        import_csv_file_copy(path, db)
+
+        merge = next(sql for sql in executed_sql(db) if "INSERT INTO merchant_activities" in sql)
+        assert merge.startswith("WITH inserted AS")
+        assert "RETURNING" in merge
+        assert "INSERT INTO merchant_daily_rollups" in merge
+        assert "FROM inserted GROUP BY" in merge
+        assert "event_count = (merchant_daily_rollups.event_count + excluded.event_count)" in merge
+
+
+    def test_staging_table_is_unlogged(self, tmp_path, db):
+        """the staging table is created UNLOGGED and emptied before loading."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        import_csv_file_copy(path, db)
+
+        statements = executed_sql(db)
+        assert statements[0].startswith(f"CREATE UNLOGGED TABLE IF NOT EXISTS {STAGING_TABLE}")
+        assert statements[1] == f"TRUNCATE {STAGING_TABLE}"
+
+
+    def test_empty_file_returns_zero_counts(self, tmp_path, db, cursor):
+        """a file with no header is a no-op."""
+
+        path = tmp_path / "activities_20240102.csv"
+        path.write_text("", encoding="utf-8")
+
+        assert import_csv_file_copy(path, db) == (0, 0)
+        cursor.copy_expert.assert_not_called()
+        db.commit.assert_not_called()
+
+
+
+class TestDailyRollups:
+
+
+    @pytest.fixture(autouse=True)
+    def rollup_source(self, monkeypatch):
+        """the rollups are kept up only for a source that reads them."""
+        use_source(monkeypatch, "rollup")
+
+
+    def test_insert_batches_maintain_rollups(self, tmp_path, db):
+        """each INSERT batch feeds merchant_daily_rollups in the same statement, before its commit."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        import_csv_file(path, db)
+
+        statement, *sketches = executed_sql(db)
+        assert statement.startswith("WITH inserted AS")
+        assert "INSERT INTO merchant_activities" in statement
+        assert "ON CONFLICT (event_id) DO NOTHING RETURNING" in statement
+        assert "INSERT INTO merchant_daily_rollups" in statement
+        assert sketches and all("merchant_sketches" in sql for sql in sketches)
+        # the batch, then the file's sketches.
+        assert db.commit.call_count == 2
+
+
+    def test_insert_binds_one_array_per_column(self, tmp_path, db):
+        """a batch is sent as its column lists, unnested by the database, not as one set of parameters per row."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        import_csv_file(path, db)
+
+        statement, params = db.execute.call_args_list[0].args
+        assert "FROM unnest(CAST(%(event_id)s AS UUID[]), CAST(%(merchant_id)s AS VARCHAR(32)[])" in str(statement)
+        assert list(params) == list(COPY_COLUMNS)
+        assert params["merchant_id"] == ["MRC-000001", "MRC-000002"]
+        assert params["event_timestamp"][1] is None
+
+
+    @pytest.mark.parametrize("source", ["live", "views", "columnar"])
+    def test_sources_without_rollups_insert_only_the_rows(self, tmp_path, db, monkeypatch, source):
+        """no RETURNING, rollup upsert or bitmap log for an API that reads none of them."""
+
+        use_source(monkeypatch, source)
+        import_csv_file(write_csv(tmp_path, VALID_ROW), db)
+
+        statement = executed_sql(db)[0]
+        assert statement.startswith("INSERT INTO merchant_activities")
+        assert "RETURNING" not in statement and "merchant_daily_rollups" not in statement
+
+
+    def test_rollup_source_does_not_log_bitmap_memberships(self, tmp_path, db):
+        import_csv_file(write_csv(tmp_path, VALID_ROW), db)
+
+        statement = executed_sql(db)[0]
+        assert "INSERT INTO merchant_daily_rollups" in statement
+        assert "merchant_bitmap_updates" not in statement
+
+
+    def test_imports_without_upkeep_mark_it_stale(self, db, monkeypatch):
+        """the views, plus the rollups and bitmap index when this import does not keep them up."""
+
+        use_source(monkeypatch, "live")
+        import_activities.mark_views_stale(db)
+        names = db.execute.call_args.args[0].compile().params["view_name_1"]
+        assert names[-2:] == ["merchant_daily_rollups", "merchant_bitmap_index"]
+
+        use_source(monkeypatch, "bitmaps")
+        import_activities.mark_views_stale(db)
+        names = db.execute.call_args.args[0].compile().params["view_name_1"]
+        assert names == [view.name for view in import_activities.ANALYTICS_VIEWS]
+
+
+    @pytest.mark.parametrize("source, rebuilt", [("bitmaps", ["rollups", "index"]), ("rollup", ["rollups"]), ("live", [])])
+    def test_stale_derived_data_rebuilt_once_enabled(self, monkeypatch, source, rebuilt):
+        """after imports under a source that skipped them, the next run that needs the rollups or index rebuilds them."""
+
+        use_source(monkeypatch, source)
+        db = MagicMock(spec=Session)
+        db.__enter__.return_value = db
+        db.execute.return_value.scalars.return_value = ["merchant_daily_rollups", "merchant_bitmap_index"]
+        calls = []
+        monkeypatch.setattr(import_activities, "SessionLocal", lambda: db)
+        monkeypatch.setattr(import_activities, "rebuild_rollups", lambda db: calls.append("rollups"))
+        monkeypatch.setattr(import_activities, "update_bitmap_index", lambda rebuild: calls.append("index"))
+
+        import_activities._catch_up_derived_data()
+        assert calls == rebuilt
+        marked = [sql for sql in executed_sql(db) if sql.startswith("UPDATE analytics_view_refreshes SET refreshed_version")]
+        assert len(marked) == len(rebuilt)
+
+
+    def test_events_without_timestamp_roll_up_under_sentinel_day(self, tmp_path, db):
+        path = write_csv(tmp_path, NULL_TIMESTAMP_ROW)
+        import_csv_file(path, db)
+        assert "coalesce(CAST(inserted.event_timestamp AS DATE), '-infinity'::date)" in executed_sql(db)[0]
+
+
+    def test_rebuild_recomputes_from_raw_table(self, db):
+        import_activities.rebuild_rollups(db)
+
+        clear, insert = executed_sql(db)
+        assert clear == "DELETE FROM merchant_daily_rollups"
+        assert insert.startswith("INSERT INTO merchant_daily_rollups")
+        assert "FROM merchant_activities GROUP BY" in insert
+        db.commit.assert_not_called()
+
+
+    @pytest.mark.parametrize("existed, rebuilds", [(True, 0), (False, 1)])
+    def test_new_rollup_table_is_backfilled(self, monkeypatch, existed, rebuilds):
+        """when the rollup and sketch tables are first created next to existing data, they are filled from merchant_activities."""
+
+        inspector = MagicMock()
+        inspector.has_table.return_value = existed
+        calls = []
+        monkeypatch.setattr(import_activities, "inspect", lambda engine: inspector)
+        monkeypatch.setattr(import_activities.Base.metadata, "create_all", lambda bind: calls.append("create"))
+        monkeypatch.setattr(import_activities, "SessionLocal", lambda: MagicMock())
+        monkeypatch.setattr(import_activities, "rebuild_rollups", lambda db: calls.append("rebuild"))
+        monkeypatch.setattr(import_activities, "rebuild_sketches", lambda db: calls.append("sketches"))
+        monkeypatch.setattr(import_activities, "create_analytics_views", lambda: calls.append("views"))
+        monkeypatch.setattr(import_activities, "_catch_up_derived_data", lambda: calls.append("catch up"))
+
+        import_activities._create_tables()
+        assert calls == ["create"] + ["rebuild", "sketches"] * rebuilds + ["views", "catch up"]
+
+
+
+class TestMerchantSketches:
+
+
+    @staticmethod
+    def rows(tmp_path, *lines):
+        return next(_read_batches(write_csv(tmp_path, *lines), {"skipped": 0})).rows
+
+
+    def test_members_per_product_and_successful_month(self, tmp_path):
+        """every event counts for its product; only successful events with a timestamp count for their month."""
+
+        members = sketch_members(self.rows(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW))
+        assert members == {
+            ("product", "POS"): {"MRC-000001"},
+            ("month", "2024-01"): {"MRC-000001"},
+            ("product", "AIRTIME"): {"MRC-000002"},
+        }
+
+
+    def test_offset_timestamps_bucket_by_utc_month(self, tmp_path):
+        row = VALID_ROW.replace("2024-01-01T00:00:23", "2024-01-31T23:30:00-02:00")
+        assert ("month", "2024-02") in sketch_members(self.rows(tmp_path, row))
+
+
+    def test_merge_creates_then_locks_then_updates(self, db):
+        """missing sketches are created empty, then locked in key order and merged, all in the caller's transaction."""
+
+        empty = bytes(len(HyperLogLog().registers))
+        db.execute.return_value.all.return_value = [("month", "2024-01", empty), ("product", "POS", empty)]
+
+        merge_sketches(db, {("product", "POS"): {"MRC-000001"}, ("month", "2024-01"): {"MRC-000001", "MRC-000002"}})
+
+        create, lock, update = executed_sql(db)
+        assert create.startswith("INSERT INTO merchant_sketches") and "ON CONFLICT DO NOTHING" in create
+        assert lock.endswith("ORDER BY merchant_sketches.dimension, merchant_sketches.key FOR UPDATE")
+        assert update.startswith("UPDATE merchant_sketches")
+
+        merged = {(p["dimension"], p["key"]): HyperLogLog.from_bytes(p["registers"]).count() for p in db.execute.call_args.args[1]}
+        assert merged == {("month", "2024-01"): 2, ("product", "POS"): 1}
+        db.commit.assert_not_called()
+
+
+    def test_rebuild_replaces_sketches_without_truncate(self, db, monkeypatch):
+        """the old sketches are deleted in the rebuild's transaction, so readers are not locked out until commit."""
+
+        merged = []
+        monkeypatch.setattr(import_activities, "merge_sketches", lambda db, members: merged.append(members))
+        db.execute.return_value = [("product", "POS", "MRC-000001")]
+        import_activities.rebuild_sketches(db)
+
+        assert executed_sql(db)[2:] == ["DELETE FROM merchant_sketches"]
+        assert merged == [{("product", "POS"): {"MRC-000001"}}]
+
+
+    def test_nothing_to_merge(self, db):
+        merge_sketches(db, {})
+        db.execute.assert_not_called()
+
+
+    def test_copy_path_merges_once_per_file_before_commit(self, tmp_path, db, monkeypatch):
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 1)
+        events = []
+        monkeypatch.setattr(import_activities, "merge_sketches", lambda db, members: events.append(("sketch", members)))
+        db.commit.side_effect = lambda: events.append(("commit", None))
+
+        import_csv_file_copy(write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW), db)
+
+        (_, members), commit = events
+        assert commit == ("commit", None)
+        assert set(members) == {("product", "POS"), ("month", "2024-01"), ("product", "AIRTIME")}
+
+
+    def test_insert_path_merges_once_per_file_after_batches(self, tmp_path, db, monkeypatch):
+        """the batches commit without touching the sketches; the file's members are merged in a last transaction."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 1)
+        events = []
+        monkeypatch.setattr(import_activities, "merge_sketches", lambda db, members: events.append(("sketch", members)))
+        db.commit.side_effect = lambda: events.append(("commit", None))
+
+        import_csv_file(write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW), db)
+
+        assert [kind for kind, _ in events] == ["commit", "commit", "sketch", "commit"]
+        assert set(events[2][1]) == {("product", "POS"), ("month", "2024-01"), ("product", "AIRTIME")}
+
+
+    def test_recovered_file_merges_rows_committed_before_interruption(self, tmp_path, db, monkeypatch):
+        """the rows before the checkpoint were committed without their sketches, so they are re-read for them."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        merged = []
+        monkeypatch.setattr(import_activities, "merge_sketches", lambda db, members: merged.append(set(members)))
+        db.get.return_value = SimpleNamespace(
+            completed_at=None, file_size=path.stat().st_size, file_mtime=None,
+            content_hash=hashlib.sha256(path.read_bytes()).hexdigest(),
+            byte_offset=len(HEADER) + len(VALID_ROW), row_number=1, rows_processed=1, rows_skipped=0,
+        )
+
+        result = import_file(path, db)
+
+        assert (result.action, result.processed) == ("recover", 1)
+        assert merged == [{("product", "AIRTIME")}, {("product", "POS"), ("month", "2024-01")}]
+
+
+
+class TestMerchantBitmapIndex:
+
+
+    @pytest.fixture
+    def session(self, monkeypatch):
+        """the mocked session update_bitmap_index opens; execute results are queued with results(...)."""
+
+        db = MagicMock(spec=Session)
+        db.__enter__.return_value = db
+        monkeypatch.setattr(import_activities, "SessionLocal", lambda: db)
+        return db
+
+
+    @staticmethod
+    def results(db, version, memberships=None):
+        version_result = MagicMock()
+        version_result.scalar.return_value = version
+        memberships_result = MagicMock()
+        memberships_result.all.return_value = memberships or []
+        db.execute.side_effect = [version_result, memberships_result, MagicMock()]
+
+
+    def test_insert_statement_logs_bitmap_memberships(self, tmp_path, db, monkeypatch):
+        use_source(monkeypatch, "bitmaps")
+        import_csv_file(write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW), db)
+
+        statement = executed_sql(db)[0]
+        assert "bitmap_updates AS" in statement
+        assert "INSERT INTO merchant_bitmap_updates (month, product, event_type, status, merchant_id) SELECT DISTINCT" in statement
+        assert "FROM inserted" in statement.split("bitmap_updates AS")[1]
+
+
+    def test_rebuilt_from_rollups_without_an_index(self, tmp_path, session):
+        path = tmp_path / "merchant_bitmaps.idx"
+        self.results(session, 2, [
+            ("2024-01", "POS", "CARD_TRANSACTION", "SUCCESS", "MRC-000001"),
+            ("", "AIRTIME", "AIRTIME_PURCHASE", "FAILED", "MRC-000002"),
+        ])
+
+        assert import_activities.update_bitmap_index(path) == ("rebuilt", 2, 2)
+
+        _, rollups, clear = executed_sql(session)
+        assert "FROM merchant_daily_rollups" in rollups and "'-infinity'::date" in rollups
+        assert clear == "DELETE FROM merchant_bitmap_updates"
+        session.commit.assert_called_once()
+
+        index = MerchantBitmapIndex(path)
+        assert index.data_version == 2
+        assert index.count_by("product") == {"POS": 1, "AIRTIME": 1}
+
+
+    def test_pending_updates_applied_to_the_index(self, tmp_path, session):
+        path = tmp_path / "merchant_bitmaps.idx"
+        self.results(session, 2, [("2024-01", "POS", "CARD_TRANSACTION", "SUCCESS", "MRC-000001")])
+        import_activities.update_bitmap_index(path)
+
+        self.results(session, 3, [("2024-01", "POS", "CARD_TRANSACTION", "SUCCESS", "MRC-000002")])
+        assert import_activities.update_bitmap_index(path) == ("updated", 1, 3)
+        assert executed_sql(session)[-1].startswith("DELETE FROM merchant_bitmap_updates RETURNING")
+
+        index = MerchantBitmapIndex(path)
+        assert index.merchants() == ["MRC-000001", "MRC-000002"]
+        assert index.select(product="POS").bit_count() == 2
+
+
+    def test_up_to_date_index_is_left_alone(self, tmp_path, session):
+        path = tmp_path / "merchant_bitmaps.idx"
+        self.results(session, 2, [("2024-01", "POS", "CARD_TRANSACTION", "SUCCESS", "MRC-000001")])
+        import_activities.update_bitmap_index(path)
+        written = path.stat().st_ino
+
+        self.results(session, 2)
+        assert import_activities.update_bitmap_index(path) == ("unchanged", 1, 2)
+        assert path.stat().st_ino == written
+        session.rollback.assert_called_once()
+
+
+    @pytest.mark.parametrize("contents, version", [(b"garbage", 5), (None, 1)])
+    def test_unreadable_or_foreign_index_is_rebuilt(self, tmp_path, session, contents, version):
+        """a corrupt file, or one stamped ahead of the data (another database), is rebuilt from the rollups."""
+
+        path = tmp_path / "merchant_bitmaps.idx"
+        if contents is None:
+            self.results(session, 9)
+            import_activities.update_bitmap_index(path)
+        else:
+            path.write_bytes(contents)
+
+        self.results(session, version)
+        assert import_activities.update_bitmap_index(path)[0] == "rebuilt"
+        assert MerchantBitmapIndex(path).data_version == version
+
+
+
+class TestColumnSnapshot:
+
+
+    @pytest.fixture
+    def loads(self, monkeypatch):
+        """the load_columns calls update_column_snapshot makes, answered from a queue of (columns, full)."""
+
+        pytest.importorskip("numpy")
+        calls, answers = [], []
+
+        def fake_load_columns(connection, previous=None):
+            calls.append(previous)
+            answer = answers.pop(0)
+            # None: the data version has not moved, so the given columns come back.
+            return answer if answer is not None else (previous, False)
+
+        monkeypatch.setattr(import_activities, "engine", MagicMock())
+        monkeypatch.setattr(import_activities, "load_columns", fake_load_columns)
+        return calls, answers
+
+
+    @staticmethod
+    def columns(version, rows=1):
+        row = ("MRC-000001", "POS", "CARD_TRANSACTION", "SUCCESS", 100, 0)
+        return ActivityColumns.from_rows([row] * rows, version=version)
+
+
+    def test_first_snapshot_reads_every_row(self, tmp_path, loads):
+        calls, answers = loads
+        answers.append((self.columns(3, rows=2), True))
+
+        assert import_activities.update_column_snapshot(tmp_path) == ("rebuilt", 2, 3)
+        assert calls == [None]
+        assert open_snapshot(current_snapshot(tmp_path)).version == 3
+
+
+    def test_new_rows_appended_to_the_current_snapshot(self, tmp_path, loads):
+        calls, answers = loads
+        answers.append((self.columns(3), True))
+        import_activities.update_column_snapshot(tmp_path)
+        first = current_snapshot(tmp_path)
+
+        answers.append((self.columns(4, rows=2), False))
+        assert import_activities.update_column_snapshot(tmp_path) == ("updated", 2, 4)
+        assert calls[1].version == 3
+        assert current_snapshot(tmp_path) != first
+
+
+    def test_up_to_date_snapshot_is_left_alone(self, tmp_path, loads):
+        calls, answers = loads
+        answers.append((self.columns(3), True))
+        import_activities.update_column_snapshot(tmp_path)
+        written = current_snapshot(tmp_path)
+
+        answers.append(None)
+        assert import_activities.update_column_snapshot(tmp_path) == ("unchanged", 1, 3)
+        assert current_snapshot(tmp_path) == written
+
+
+    def test_only_written_for_an_api_reading_snapshots(self, monkeypatch):
+        monkeypatch.setattr(import_activities.settings, "analytics_source", "live")
+        assert not import_activities._column_snapshots_enabled()
+        monkeypatch.setattr(import_activities.settings, "analytics_source", "columnar")
+        assert import_activities._column_snapshots_enabled()
+        monkeypatch.setattr(import_activities.settings, "columnar_store", "memory")
+        assert not import_activities._column_snapshots_enabled()
+
+
+
+class TestDataVersion:
+
+
+    def test_version_bumped_with_the_final_commit(self, tmp_path, db):
+        path = write_csv(tmp_path, VALID_ROW)
+        import_file(path, db)
+
+        bump = executed_sql(db)[-1]
+        assert bump.startswith("INSERT INTO analytics_data_version")
+        assert "ON CONFLICT (id) DO UPDATE SET version = (analytics_data_version.version + %(version_1)s)" in bump
+
+
+    def test_file_without_valid_rows_leaves_version_alone(self, tmp_path, db):
+        path = write_csv(tmp_path, BAD_UUID_ROW)
+        import_file(path, db)
+        assert not any("analytics_data_version" in sql for sql in executed_sql(db))
+
+
+
+class TestAnalyticsViews:
+
+
+    @pytest.fixture
+    def connection(self, monkeypatch):
+        """the connection behind engine.begin(), recording statements instead of running them."""
+        fake_engine = MagicMock()
+        monkeypatch.setattr(import_activities, "engine", fake_engine)
+        return fake_engine.begin.return_value.__enter__.return_value
+
+
+    def test_views_are_created_with_unique_keys(self, connection):
+        """REFRESH ... CONCURRENTLY needs a unique index on every view."""
+
+        import_activities.create_analytics_views()
+
+        statements = executed_sql(connection)
+        assert statements[0].startswith("CREATE MATERIALIZED VIEW IF NOT EXISTS mv_merchant_totals AS SELECT")
+        assert statements[1] == "CREATE UNIQUE INDEX IF NOT EXISTS mv_merchant_totals_key ON mv_merchant_totals (merchant_id)"
+        kyc = next(sql for sql in statements if "mv_kyc_stage_counts AS" in sql)
+        assert "merchant_activities.product = 'KYC'" in kyc
+        assert "ON CONFLICT (view_name) DO NOTHING" in statements[-1]
+        assert len(statements) == 2 * 5 + 1
+
+
+    def test_refresh_is_concurrent_and_records_the_version_it_started_from(self, connection):
+        """a view is marked fresh at the data_version read before its refresh, never at a later one."""
+
+        connection.execute.return_value.one.return_value = (7, 6)
+        assert import_activities.refresh_analytics_views() == 5
+
+        statements = executed_sql(connection)
+        assert len(statements) == 3 * 5
+        select_version, refresh, mark = statements[:3]
+        assert select_version.startswith("SELECT analytics_view_refreshes.data_version, analytics_view_refreshes.refreshed_version")
+        assert refresh == "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_merchant_totals"
+        assert mark.startswith("UPDATE analytics_view_refreshes SET refreshed_version=")
+        assert connection.execute.call_args_list[2].args[0].compile().params["refreshed_version"] == 7
+
+
+    def test_fresh_views_are_not_refreshed(self, connection):
+        """a view no import marked stale since its last refresh is left as it is."""
+
+        connection.execute.return_value.one.return_value = (4, 4)
+        assert import_activities.refresh_analytics_views() == 0
+        assert not any(sql.startswith("REFRESH") for sql in executed_sql(connection))
+
+
+    def test_run_import_refreshes_after_loading(self, tmp_path, monkeypatch, capsys):
+        events = []
+        skip_schema(monkeypatch)
+        use_source(monkeypatch, "bitmaps")
+        monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: events.append("refresh") or 5)
+        monkeypatch.setattr(
+            import_activities, "update_bitmap_index", lambda: events.append("bitmaps") or ("updated", 3, 1)
+        )
+
+        def fake_sequential(csv_files, mode, queue_depth=0, force=False, decompress_thread=False, metrics=None):
+            events.append("load")
+            yield csv_files[0], FileResult(1, 0)
+
+        monkeypatch.setattr(import_activities, "_import_files_sequential", fake_sequential)
+        write_csv(tmp_path, VALID_ROW)
+        run_import(tmp_path)
+
+        assert events == ["load", "refresh", "bitmaps"]
+        out = capsys.readouterr().out
+        assert "Analytics views refreshed in" in out
+        assert "Merchant bitmap index updated in" in out
+
+
+    def test_run_without_new_rows_leaves_views_and_index_alone(self, tmp_path, monkeypatch, capsys):
+        """when every file is unchanged nothing was marked stale, and the bitmap index is not touched."""
+
+        skip_schema(monkeypatch)
+        monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: 0)
+        monkeypatch.setattr(import_activities, "update_bitmap_index", MagicMock())
+        monkeypatch.setattr(
+            import_activities, "_import_files_sequential",
+            lambda csv_files, *args: iter([(csv_files[0], FileResult(0, 0, "skip"))]),
+        )
+        write_csv(tmp_path, VALID_ROW)
+        run_import(tmp_path)
+
+        import_activities.update_bitmap_index.assert_not_called()
+        out = capsys.readouterr().out
+        assert "Analytics views up to date, not refreshed" in out
+        assert "Merchant bitmap index" not in out
+
+
+    def test_bitmap_index_only_updated_for_the_bitmaps_source(self, tmp_path, monkeypatch, capsys):
+        skip_schema(monkeypatch)
+        use_source(monkeypatch, "rollup")
+        monkeypatch.setattr(import_activities, "update_bitmap_index", MagicMock())
+        monkeypatch.setattr(
+            import_activities, "_import_files_sequential",
+            lambda csv_files, *args: iter([(csv_files[0], FileResult(1, 0))]),
+        )
+        write_csv(tmp_path, VALID_ROW)
+        run_import(tmp_path)
+
+        import_activities.update_bitmap_index.assert_not_called()
+        assert "Merchant bitmap index" not in capsys.readouterr().out
+
+
+    def test_file_marks_views_stale_before_its_rows(self, tmp_path, db, monkeypatch):
+        """the mark is committed before any row, so readers fall back to live queries while a file is ingested."""
+
+        events = []
+        monkeypatch.setattr(import_activities, "mark_views_stale", lambda db: events.append("stale"))
+        monkeypatch.setattr(import_activities, "_import_source", lambda *args: events.append("load") or (1, 0))
+        db.commit.side_effect = lambda: events.append("commit")
+
+        import_file(write_csv(tmp_path, VALID_ROW), db)
+        assert events[:3] == ["stale", "commit", "load"]
+
+
+    def test_unchanged_file_does_not_mark_views_stale(self, tmp_path, db, monkeypatch):
+        path = write_csv(tmp_path, VALID_ROW)
+        stat = path.stat()
+        db.get.return_value = SimpleNamespace(
+            completed_at=datetime.now(timezone.utc), file_size=stat.st_size,
+            file_mtime=import_activities._file_mtime(stat), byte_offset=stat.st_size, content_hash="",
+        )
+        stale = MagicMock()
+        monkeypatch.setattr(import_activities, "mark_views_stale", stale)
+
+        assert import_file(path, db).action == "skip"
+        stale.assert_not_called()
+
+
+
+class TestPipelinedImport:
+
+
+    def test_write_batches_flushes_everything_in_order(self):
+        """the writer thread sees every batch, in parse order, and the record count is returned."""
+
+        batches = [make_batch([i] * 3) for i in range(10)]
+        flushed = []
+        assert _write_batches(iter(batches), flushed.append, queue_depth=2) == 30
+        assert flushed == batches
+
+
+    def test_parser_is_held_back_by_queue_depth(self):
+        """a slow writer applies backpressure: at most queue_depth + 2 batches are alive at once."""
+
+        produced = []
+        flushed = []
+        peak = []
+
+        def batches():
+            for i in range(20):
+                produced.append(i)
+                peak.append(len(produced) - len(flushed))
+                yield make_batch([i])
+
+        def slow_flush(batch):
+            time.sleep(0.002)
+            flushed.append(batch)
+
+        _write_batches(batches(), slow_flush, queue_depth=2)
+        assert len(flushed) == 20
+        assert max(peak) <= 2 + 2
+
+
+    def test_flush_runs_on_writer_thread(self):
+        """with a queue depth the database work happens off the parsing thread."""
+
+        threads = set()
+        batches = iter([make_batch([1]), make_batch([2])])
+        _write_batches(batches, lambda batch: threads.add(threading.current_thread().name), queue_depth=1)
+        assert threads == {"import-writer"}
+
+
+    def test_writer_error_propagates_and_stops_parser(self):
+        """a failed flush is raised to the caller and the parser stops producing new batches."""
+
+        produced = []
+
+        def batches():
+            for i in range(1000):
+                produced.append(i)
+                yield make_batch([i])
+
+        def failing_flush(batch):
+            raise RuntimeError("write failed")
+
+        with pytest.raises(RuntimeError, match="write failed"):
+            _write_batches(batches(), failing_flush, queue_depth=1)
+        assert len(produced) < 1000
+
+
+    def test_insert_path_counts_match_synchronous_path(self, tmp_path, monkeypatch):
+        """pipelining changes when batches are written, not what is written."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        rows = [VALID_ROW.replace("MRC-000001", f"MRC-{i:06d}") for i in range(5)] + [BAD_UUID_ROW]
+        path = write_csv(tmp_path, *rows)
+
+        sync_db, piped_db = MagicMock(spec=Session), MagicMock(spec=Session)
+        assert import_csv_file(path, sync_db) == import_csv_file(path, piped_db, queue_depth=2) == (5, 1)
+        # one insert per batch, then creating, locking and updating the file's merchant sketches.
+        assert sync_db.execute.call_count == piped_db.execute.call_count == 3 + 3
+        assert piped_db.commit.call_count == 3 + 1
+
+
+    def test_copy_path_with_queue_depth(self, tmp_path, db, cursor, monkeypatch):
+        """the COPY path streams the same chunks when the writer runs on its own thread."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        rows = [VALID_ROW.replace("MRC-000001", f"MRC-{i:06d}") for i in range(5)]
+        path = write_csv(tmp_path, *rows)
+
+        assert import_csv_file_copy(path, db, queue_depth=1) == (5, 0)
+        assert len(cursor.copied) == 3
+        db.commit.assert_called_once()
+
+
+
+def manifest_entry(path, **overrides):
+    """a completed manifest entry describing the file as it is on disk right now."""
+    stat = path.stat()
+    data = path.read_bytes()
+    values = {
+        "file_name": path.name,
+        "file_size": stat.st_size,
+        "file_mtime": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        "content_hash": hashlib.sha256(data).hexdigest(),
+        "byte_offset": stat.st_size,
+        "rows_processed": 1,
+        "rows_skipped": 0,
+        "completed_at": datetime.now(timezone.utc),
+    }
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def plan(path, entry):
+    stat = path.stat()
+    return plan_import(path, entry, stat.st_size, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc))
+
+
+
+class TestImportManifest:
+
+
+    def test_new_file_is_imported_from_the_top(self, tmp_path):
+        """no manifest entry --> full import, with the hash of the whole file."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        action, offset, digest = plan(path, None)
+        assert (action, offset) == ("import", 0)
+        assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+    def test_unchanged_file_is_skipped(self, tmp_path):
+        """same size and mtime --> skip without reading the file."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        assert plan(path, manifest_entry(path))[0] == "skip"
+
+
+    def test_touched_but_identical_file_is_skipped(self, tmp_path):
+        """a new mtime alone does not trigger a re-import when the content hash still matches."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        entry = manifest_entry(path, file_mtime=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        assert plan(path, entry)[0] == "skip"
+
+
+    def test_appended_file_resumes_at_recorded_offset(self, tmp_path):
+        """a file that only grew resumes from the byte offset of the last import."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        entry = manifest_entry(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(NULL_TIMESTAMP_ROW)
+
+        action, offset, digest = plan(path, entry)
+        assert (action, offset) == ("resume", entry.file_size)
+        assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+    def test_rewritten_file_is_reimported(self, tmp_path):
+        """different content in the already-imported prefix --> full re-import."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        entry = manifest_entry(path)
+        write_csv(tmp_path, NULL_TIMESTAMP_ROW, VALID_ROW, BAD_UUID_ROW)
+
+        assert plan(path, entry)[:2] == ("reimport", 0)
+
+
+    def test_truncated_file_is_reimported(self, tmp_path):
+        """a file smaller than recorded cannot be an append."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        entry = manifest_entry(path)
+        write_csv(tmp_path, VALID_ROW)
+
+        assert plan(path, entry)[:2] == ("reimport", 0)
+
+
+    def test_watched_file_hashes_only_the_appended_bytes(self, tmp_path, monkeypatch):
+        """with the watcher's hash states, a grown file is read from its last hashed size on; the hash is the same."""
+
+        monkeypatch.setattr(import_activities, "_HASH_TAIL", 16)
+        path = write_csv(tmp_path, VALID_ROW, VALID_ROW)
+        hashes = {}
+        plan_import(path, None, path.stat().st_size, None, hashes)
+        entry = manifest_entry(path)
+
+        # rewriting the start of the prefix (before the re-read tail) goes unseen: those bytes are not read again.
+        content = path.read_bytes()
+        path.write_bytes(content[:-len(VALID_ROW)].replace(b"MRC-000001", b"MRC-999999", 1) + VALID_ROW.encode())
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(NULL_TIMESTAMP_ROW)
+
+        action, offset, digest = plan_import(path, entry, path.stat().st_size, None, hashes)
+        assert (action, offset) == ("resume", entry.file_size)
+        assert digest == hashlib.sha256(content + NULL_TIMESTAMP_ROW.encode()).hexdigest()
+        assert hashes[path.name].size == path.stat().st_size
+
+
+    def test_watched_file_with_a_rewritten_tail_is_reimported(self, tmp_path):
+        """the bytes just before the hashed size are read again; a change there means the whole file is hashed."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW)
+        hashes = {}
+        plan_import(path, None, path.stat().st_size, None, hashes)
+        entry = manifest_entry(path)
+        write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW.replace("210.8", "999.9"), BAD_UUID_ROW)
+
+        action, offset, digest = plan_import(path, entry, path.stat().st_size, None, hashes)
+        assert (action, offset) == ("reimport", 0)
+        assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+    def test_read_batches_from_offset_only_sees_new_rows(self, tmp_path):
+        """resuming parses the header from the top, then only the bytes after the offset."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        offset = path.stat().st_size
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(NULL_TIMESTAMP_ROW + BAD_UUID_ROW)
+
+        counts = {"skipped": 0}
+        rows = [row for batch in _read_batches(path, counts, start_offset=offset) for row in batch.rows]
+        assert [row[1] for row in rows] == ["MRC-000002"]
+        assert counts["skipped"] == 1
+
+
+    def test_read_batches_stops_at_end_offset(self, tmp_path):
+        """bytes written after the file was planned are left for the next run."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        size = path.stat().st_size
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(NULL_TIMESTAMP_ROW)
+
+        counts = {"skipped": 0}
+        rows = [row for batch in _read_batches(path, counts, end_offset=size) for row in batch.rows]
+        assert [row[1] for row in rows] == ["MRC-000001"]
+
+
+    def test_import_file_skips_unchanged_file(self, tmp_path, db):
+        """an unchanged file is not read and nothing is written."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        db.get.return_value = manifest_entry(path)
+
+        assert import_file(path, db) == FileResult(0, 0, "skip")
+        db.execute.assert_not_called()
+
+
+    def test_force_ignores_manifest(self, tmp_path, db):
+        """--force re-imports a file even if the manifest says it is unchanged."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        db.get.return_value = manifest_entry(path)
+
+        assert import_file(path, db, force=True)[:3] == (1, 0, "import")
+
+
+    def test_import_file_records_manifest_entry(self, tmp_path, db):
+        """after a file is loaded its size, hash, offset and counts are upserted into import_manifest."""
+
+        path = write_csv(tmp_path, VALID_ROW, BAD_UUID_ROW)
+        import_file(path, db)
+
+        params = manifest_writes(db)[-1]
+        assert params["file_name"] == path.name
+        assert params["byte_offset"] == params["file_size"] == path.stat().st_size
+        assert params["content_hash"] == hashlib.sha256(path.read_bytes()).hexdigest()
+        assert (params["row_number"], params["rows_processed"], params["rows_skipped"]) == (2, 1, 1)
+        assert params["completed_at"] is not None
+
+
+
+class TestCheckpoints:
+
+
+    @pytest.fixture
+    def rows(self):
+        return [VALID_ROW.replace("MRC-000001", f"MRC-{i:06d}") for i in range(5)]
+
+
+    def test_batches_carry_row_end_offsets(self, tmp_path, rows, monkeypatch):
+        """each batch ends exactly on a CSV row boundary."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        path = write_csv(tmp_path, *rows)
+        batches = list(_read_batches(path, {"skipped": 0}))
+
+        row_size = len(rows[0].encode())
+        assert [b.end_offset for b in batches] == [len(HEADER) + row_size * n for n in (2, 4, 5)]
+        assert [b.rows_read for b in batches] == [2, 2, 1]
+
+
+    def test_checkpoint_committed_with_every_insert_batch(self, tmp_path, db, rows, monkeypatch):
+        """each INSERT batch is followed by its checkpoint before the commit, in the same transaction."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        path = write_csv(tmp_path, *rows)
+        events = []
+        kinds = {"import_manifest": "manifest", "analytics_data_version": "version", "analytics_view_refreshes": "stale"}
+        db.execute.side_effect = lambda stmt, *params: events.append(
+            next((kind for table, kind in kinds.items() if table in str(stmt)), "insert")
+        )
+        db.commit.side_effect = lambda: events.append("commit")
+        monkeypatch.setattr(import_activities, "merge_sketches", lambda db, members: events.append("sketch"))
+
+        import_file(path, db)
+
+        # the data version moves on with the file's final commit, not per batch.
+        assert events == (
+            ["stale", "commit"] + ["insert", "manifest", "commit"] * 3 + ["sketch", "commit", "manifest", "version", "commit"]
+        )
+        checkpoints = manifest_writes(db)[:-1]
+        assert [c["row_number"] for c in checkpoints] == [2, 4, 5]
+        assert all(c["completed_at"] is None for c in checkpoints)
+
+
+    def test_checkpoint_advances_over_fully_rejected_batch(self, tmp_path, db, monkeypatch):
+        """a chunk without valid rows still moves the checkpoint forward."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 1)
+        path = write_csv(tmp_path, BAD_UUID_ROW, VALID_ROW)
+        import_file(path, db)
+
+        checkpoints = manifest_writes(db)[:-1]
+        assert [(c["row_number"], c["rows_skipped"]) for c in checkpoints] == [(1, 1), (2, 1)]
+
+
+    def test_interrupted_file_recovers_from_checkpoint(self, tmp_path, rows):
+        """an unfinished entry whose bytes are still on disk resumes at its checkpoint, not at byte 0."""
+
+        path = write_csv(tmp_path, *rows)
+        checkpoint = len(HEADER) + len(rows[0].encode()) * 2
+        entry = manifest_entry(path, byte_offset=checkpoint, row_number=2, completed_at=None)
+
+        assert plan(path, entry)[:2] == ("recover", checkpoint)
+
+
+    def test_interrupted_file_that_changed_is_reimported(self, tmp_path, rows):
+        """if the file under an unfinished entry was rewritten, the checkpoint is useless."""
+
+        path = write_csv(tmp_path, *rows)
+        entry = manifest_entry(path, byte_offset=100, completed_at=None)
+        write_csv(tmp_path, *reversed(rows))
+
+        assert plan(path, entry)[:2] == ("reimport", 0)
+
+
+    def test_recovered_file_continues_counts(self, tmp_path, db, rows):
+        """recovery reads only the rows after the checkpoint and continues the committed totals."""
+
+        path = write_csv(tmp_path, *rows)
+        checkpoint = len(HEADER) + len(rows[0].encode()) * 3
+        db.get.return_value = manifest_entry(
+            path, byte_offset=checkpoint, row_number=3, rows_processed=3, rows_skipped=0, completed_at=None
+        )
+
+        result = import_file(path, db)
+        assert (result.action, result.processed, result.start_offset) == ("recover", 2, checkpoint)
+        assert (manifest_writes(db)[-1]["row_number"], manifest_writes(db)[-1]["rows_processed"]) == (5, 5)
+
+
+    def test_copy_mode_checkpoints_commit_with_the_merge(self, tmp_path, db, rows, monkeypatch):
+        """in COPY mode the file is one transaction, so its checkpoints land with the merge commit."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        path = write_csv(tmp_path, *rows)
+        import_csv_file_copy(path, db, checkpoint=lambda batch: db.execute(f"checkpoint {batch.end_offset}"))
+
+        statements = executed_sql(db)
+        merge = next(i for i, sql in enumerate(statements) if "INSERT INTO merchant_activities" in sql)
+        assert sum(sql.startswith("checkpoint") for sql in statements[:merge]) == 3
+        db.commit.assert_called_once()
+
+
+    def test_copy_mode_records_the_file_once(self, tmp_path, db, rows, monkeypatch, cursor):
+        """a COPY file writes no per-batch checkpoints, only its final manifest entry with the totals of every batch."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        path = write_csv(tmp_path, *rows, BAD_UUID_ROW)
+
+        assert import_file(path, db, mode="copy").processed == 5
+        (entry,) = manifest_writes(db)
+        assert (entry["row_number"], entry["rows_processed"], entry["rows_skipped"]) == (6, 5, 1)
+        assert entry["completed_at"] is not None
+
+
+
+class TestCompressedSources:
+
+
+    @pytest.fixture
+    def rows(self):
+        return [VALID_ROW.replace("MRC-000001", f"MRC-{i:06d}") for i in range(5)]
+
+
+    def write_gzip(self, tmp_path, *rows, name="activities_20240101.csv.gz"):
+        path = tmp_path / name
+        path.write_bytes(gzip.compress((HEADER + "".join(rows)).encode()))
+        return path
+
+
+    def test_data_dir_pattern_matches_compressed_files(self):
+        """.csv.gz and .csv.zst files are picked up by the data directory scan; other suffixes are not."""
+
+        assert CSV_PATTERN.match("activities_20240101.csv.gz")
+        assert CSV_PATTERN.match("activities_20240101.csv.zst")
+        assert not CSV_PATTERN.match("activities_20240101.csv.bak")
+
+
+    @pytest.mark.parametrize("decompress_thread", [False, True])
+    def test_gzip_file_imports_like_plain(self, tmp_path, db, decompress_thread):
+        """a gzipped file yields the same counts as its plain equivalent."""
+
+        path = self.write_gzip(tmp_path, VALID_ROW, BAD_UUID_ROW, NULL_TIMESTAMP_ROW)
+        assert import_csv_file(path, db, decompress_thread=decompress_thread) == (2, 1)
+
+
+    def test_zstd_file_imports_like_plain(self, tmp_path, db):
+        zstandard = pytest.importorskip("zstandard")
+        path = tmp_path / "activities_20240101.csv.zst"
+        path.write_bytes(zstandard.ZstdCompressor().compress((HEADER + VALID_ROW + BAD_AMOUNT_ROW).encode()))
+
+        assert import_csv_file_copy(path, db) == (1, 1)
+
+
+    def test_offsets_count_decompressed_bytes(self, tmp_path, rows, monkeypatch):
+        """batch offsets in a compressed file are positions in its decompressed data."""
+
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        path = self.write_gzip(tmp_path, *rows)
+
+        row_size = len(rows[0].encode())
+        assert [b.end_offset for b in _read_batches(path, {"skipped": 0})] == [
+            len(HEADER) + row_size * n for n in (2, 4, 5)
+        ]
+
+
+    def test_compressed_file_resumes_by_reading_forward(self, tmp_path, rows):
+        """a start offset in a compressed file skips the rows before it without seeking the raw file."""
+
+        path = self.write_gzip(tmp_path, *rows)
+        start = len(HEADER) + len(rows[0].encode()) * 3
+        batches = list(_read_batches(path, {"skipped": 0}, start_offset=start))
+
+        assert [row[1] for batch in batches for row in batch.rows] == ["MRC-000003", "MRC-000004"]
+
+
+    def test_manifest_records_decompressed_end_offset(self, tmp_path, db, rows):
+        """the final manifest offset of a compressed file is where its decompressed data ended, not its size."""
+
+        path = self.write_gzip(tmp_path, *rows)
+        import_file(path, db)
+
+        final = manifest_writes(db)[-1]
+        assert final["byte_offset"] == len(HEADER) + len(rows[0].encode()) * 5
+        assert final["file_size"] == path.stat().st_size
+
+
+    def test_appended_gzip_member_resumes(self, tmp_path, db, rows):
+        """gzip data appended as a new member resumes after the rows already imported."""
+
+        path = self.write_gzip(tmp_path, *rows[:3])
+        stat = path.stat()
+        entry = manifest_entry(
+            path, byte_offset=len(HEADER) + len(rows[0].encode()) * 3, row_number=3, rows_processed=3,
+        )
+        with open(path, "ab") as file_object:
+            file_object.write(gzip.compress("".join(rows[3:]).encode()))
+        assert path.stat().st_size > stat.st_size
+        db.get.return_value = entry
+
+        result = import_file(path, db)
+        assert (result.action, result.processed) == ("resume", 2)
+
+
+    @pytest.mark.parametrize("compress", [lambda data: data, gzip.compress])
+    def test_stdin_source_skips_manifest(self, db, monkeypatch, compress):
+        """'-' reads (optionally compressed) CSV from stdin and never touches the import manifest."""
+
+        payload = compress((HEADER + VALID_ROW + BAD_UUID_ROW).encode())
+        monkeypatch.setattr(sys, "stdin", SimpleNamespace(buffer=io.BufferedReader(io.BytesIO(payload))))
+
+        result = import_file(import_activities.STDIN, db)
+        assert (result.processed, result.skipped) == (1, 1)
+        db.get.assert_not_called()
+        assert manifest_writes(db) == []
+
+
+
+class TestInitWorker:
+
+
+    @pytest.fixture
+    def worker_engine(self, monkeypatch):
+        """record the worker engine's arguments instead of creating it."""
+        create_engine = MagicMock()
+        monkeypatch.setattr(import_activities, "create_engine", create_engine)
+        monkeypatch.setattr(import_activities, "pin_session_time_zone", MagicMock())
+        monkeypatch.setattr(import_activities, "engine", MagicMock())
+        monkeypatch.setattr(import_activities, "_worker_session_factory", None)
+        monkeypatch.setattr(import_activities, "_worker_staging_table", None)
+        return create_engine
+
+
+    def test_worker_engine_uses_pool_settings(self, monkeypatch, worker_engine):
+        """the worker's engine gets the configured pool, like the API's engines."""
+
+        monkeypatch.setattr(import_activities.settings, "db_pool_size", 2)
+        monkeypatch.setattr(import_activities.settings, "db_pool_pre_ping", "never")
+        import_activities._init_worker(multiprocessing.Value("i", 0))
+
+        kwargs = worker_engine.call_args.kwargs
+        assert (kwargs["pool_size"], kwargs["pool_pre_ping"]) == (2, False)
+        assert kwargs["poolclass"] is import_activities.pool_options(import_activities.settings)["poolclass"]
+        assert import_activities._worker_staging_table == f"{STAGING_TABLE}_1"
+
+
+    def test_idle_pre_ping(self, monkeypatch, worker_engine):
+        """with the idle strategy the worker's connections are pinged only after sitting unused."""
+
+        ping = MagicMock()
+        monkeypatch.setattr(import_activities, "ping_idle_connections", ping)
+        monkeypatch.setattr(import_activities.settings, "db_pool_pre_ping", "idle")
+        import_activities._init_worker(multiprocessing.Value("i", 0))
+
+        ping.assert_called_once_with(worker_engine.return_value, import_activities.settings.db_pool_pre_ping_idle)
+
+
+    def test_sessions_run_in_utc(self, worker_engine):
+        import_activities._init_worker(multiprocessing.Value("i", 0))
+        import_activities.pin_session_time_zone.assert_called_once_with(worker_engine.return_value)
+
+
+
+class TestImportFileInWorker:
+
+
+    @pytest.fixture
+    def worker_db(self, monkeypatch, db):
+        """point the worker's private session factory at the mock session."""
+        monkeypatch.setattr(import_activities, "_worker_session_factory", lambda: db)
+        monkeypatch.setattr(import_activities, "_worker_staging_table", f"{STAGING_TABLE}_3")
+        return db
+
+
+    def test_returns_counts_and_no_error(self, tmp_path, worker_db):
+        """a successful file reports its counts and a None error."""
+
+        path = write_csv(tmp_path, VALID_ROW, BAD_UUID_ROW)
+        result = import_activities._import_file_in_worker(path, "copy")
+        assert (result.processed, result.skipped, result.action, result.error) == (1, 1, "import", None)
+        worker_db.close.assert_called_once()
+
+
+    def test_copy_mode_uses_worker_staging_table(self, tmp_path, worker_db, cursor):
+        """each worker copies into its own staging table so workers never contend on one table."""
+
+        path = write_csv(tmp_path, VALID_ROW)
+        import_activities._import_file_in_worker(path, "copy")
+        assert cursor.copied[0][0].startswith(f"COPY {STAGING_TABLE}_3 ")
+
+
+    def test_failure_is_returned_not_raised(self, tmp_path, worker_db):
+        """a failing file is reported back and its transaction rolled back."""
+
+        worker_db.execute.side_effect = RuntimeError("boom")
+        path = write_csv(tmp_path, VALID_ROW)
+
+        result = import_activities._import_file_in_worker(path, "insert")
+        assert (result.processed, result.skipped) == (0, 0)
+        assert result.error == "RuntimeError: boom"
+        worker_db.rollback.assert_called_once()
+        worker_db.close.assert_called_once()
+
+
+
+class TestRunImportWorkers:
+
+
+    @pytest.fixture(autouse=True)
+    def no_schema(self, monkeypatch):
+        """skip the schema and the view refresh; these tests never touch the database."""
+        skip_schema(monkeypatch)
+
+
+    def test_parallel_results_feed_totals_in_file_order(self, tmp_path, monkeypatch, capsys):
+        """per-file lines follow sorted file order and totals sum every file."""
+
+        for day in ("20240103", "20240101", "20240102"):
+            write_csv(tmp_path, VALID_ROW, name=f"activities_{day}.csv")
+
+        def fake_parallel(csv_files, mode, workers, queue_depth=0, force=False, decompress_thread=False):
+            for i, path in enumerate(csv_files, 1):
+                yield path, FileResult(i * 10, i)
+
+        monkeypatch.setattr(import_activities, "_import_files_parallel", fake_parallel)
+        run_import(tmp_path, workers=3)
+
+        out = capsys.readouterr().out
+        lines = [line.strip() for line in out.splitlines() if line.startswith("  ")]
+        assert lines == [
+            "activities_20240101.csv: 10 rows processed, 1 skipped (malformed)",
+            "activities_20240102.csv: 20 rows processed, 2 skipped (malformed)",
+            "activities_20240103.csv: 30 rows processed, 3 skipped (malformed)",
+        ]
+        assert "Total processed: 60, total skipped (malformed): 6" in out
+
+
+    def test_failed_file_does_not_stop_others(self, tmp_path, monkeypatch, capsys):
+        """a failed file is reported, the rest still count, and the run exits non-zero."""
+
+        for day in ("20240101", "20240102"):
+            write_csv(tmp_path, VALID_ROW, name=f"activities_{day}.csv")
+
+        def fake_parallel(csv_files, mode, workers, queue_depth=0, force=False, decompress_thread=False):
+            yield csv_files[0], FileResult(0, 0, error="OperationalError: connection lost")
+            yield csv_files[1], FileResult(5, 1)
+
+        monkeypatch.setattr(import_activities, "_import_files_parallel", fake_parallel)
+        with pytest.raises(SystemExit) as exc:
+            run_import(tmp_path, workers=2)
+
+        captured = capsys.readouterr()
+        assert exc.value.code == 1
+        assert "activities_20240101.csv: FAILED (OperationalError: connection lost)" in captured.err
+        assert "Total processed: 5, total skipped (malformed): 1" in captured.out
+
+
+    def test_explicit_sources_replace_directory_scan(self, tmp_path, monkeypatch, capsys):
+        """files named on the command line are imported in the given order, whatever their names."""
+
+        second = write_csv(tmp_path, VALID_ROW, name="b.csv")
+        first = write_csv(tmp_path, VALID_ROW, name="a.csv")
+        write_csv(tmp_path, VALID_ROW, name="activities_20240101.csv")
+        seen = []
+
+        def fake_sequential(csv_files, mode, queue_depth=0, force=False, decompress_thread=False, metrics=None):
+            seen.extend(csv_files)
+            return iter(())
+
+        monkeypatch.setattr(import_activities, "_import_files_sequential", fake_sequential)
+        run_import(tmp_path / "missing", sources=[second, first])
+        assert seen == [second, first]
+
+
+    def test_stdin_cannot_be_split_across_workers(self, tmp_path):
+        """stdin is read once by the parent process, so '-' with --workers is a usage error."""
+
+        with pytest.raises(SystemExit):
+            run_import(tmp_path, workers=2, sources=[import_activities.STDIN])
+
+
+    def test_workers_below_one_rejected(self, tmp_path):
+        """--workers 0 is a usage error."""
+
+        write_csv(tmp_path, VALID_ROW)
+        with pytest.raises(SystemExit):
+            run_import(tmp_path, workers=0)
+
+
+
+class TestBulkLoad:
+
+
+    @pytest.fixture
+    def connection(self, monkeypatch):
+        """mock engine whose begin() and connect() hand out one recording connection."""
+        fake_engine = MagicMock()
+        connection = MagicMock()
+        fake_engine.begin.return_value.__enter__.return_value = connection
+        fake_engine.connect.return_value.execution_options.return_value.__enter__.return_value = connection
+        monkeypatch.setattr(import_activities, "engine", fake_engine)
+        connection.engine = fake_engine
+        return connection
+
+
+    def sql(self, connection):
+        return [str(c.args[0]) for c in connection.execute.call_args_list]
+
+
+    def test_drops_every_secondary_index_but_not_the_primary_key(self, connection):
+        import_activities.drop_secondary_indexes()
+
+        statements = self.sql(connection)
+        assert len(statements) == 5
+        assert all(sql.startswith("DROP INDEX IF EXISTS ix_merchant_activities_") for sql in statements)
+        assert not any("pkey" in sql for sql in statements)
+
+
+    def test_rebuild_is_concurrent_and_outside_a_transaction(self, connection):
+        """CREATE INDEX CONCURRENTLY runs in autocommit, one statement per model index."""
+
+        connection.execute.return_value.scalars.return_value = []
+        import_activities.rebuild_secondary_indexes()
+
+        connection.engine.connect.return_value.execution_options.assert_called_with(isolation_level="AUTOCOMMIT")
+        creates = [sql for sql in self.sql(connection) if sql.startswith("CREATE")]
+        assert creates[0] == (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_merchant_activities_event_timestamp "
+            "ON merchant_activities (event_timestamp)"
+        )
+        assert len(creates) == 5
+
+
+    def test_rebuild_replaces_invalid_index(self, connection):
+        """an INVALID index left by an interrupted concurrent build is dropped before it is built again."""
+
+        connection.execute.return_value.scalars.return_value = ["ix_merchant_activities_status"]
+        import_activities.rebuild_secondary_indexes()
+
+        statements = self.sql(connection)
+        drop = statements.index("DROP INDEX CONCURRENTLY IF EXISTS ix_merchant_activities_status")
+        assert statements[drop + 1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_merchant_activities_status ")
+
+
+    @pytest.fixture
+    def phases(self, monkeypatch):
+        """record the bulk phases run_import goes through instead of running DDL."""
+        events = []
+        skip_schema(monkeypatch)
+        monkeypatch.setattr(import_activities, "drop_secondary_indexes", lambda: events.append("drop"))
+        monkeypatch.setattr(import_activities, "rebuild_secondary_indexes", lambda: events.append("rebuild"))
+        monkeypatch.setattr(import_activities, "analyze_activities", lambda: events.append("analyze"))
+        return events
+
+
+    def test_phases_run_in_order_and_are_timed(self, tmp_path, monkeypatch, phases, capsys):
+        write_csv(tmp_path, VALID_ROW)
+
+        def fake_sequential(csv_files, mode, queue_depth=0, force=False, decompress_thread=False, metrics=None):
+            phases.append("load")
+            yield csv_files[0], FileResult(1, 0)
+
+        monkeypatch.setattr(import_activities, "_import_files_sequential", fake_sequential)
+        run_import(tmp_path, bulk=True)
+
+        assert phases == ["drop", "load", "rebuild", "analyze"]
+        out = capsys.readouterr().out
+        assert "Bulk load phases: drop indexes" in out
+        assert all(name in out for name in ("load", "rebuild indexes", "analyze"))
+
+
+    def test_indexes_rebuilt_even_when_load_fails(self, tmp_path, monkeypatch, phases):
+        write_csv(tmp_path, VALID_ROW)
+
+        def fake_sequential(csv_files, mode, queue_depth=0, force=False, decompress_thread=False, metrics=None):
+            raise RuntimeError("connection reset")
+            yield
+
+        monkeypatch.setattr(import_activities, "_import_files_sequential", fake_sequential)
+        with pytest.raises(RuntimeError):
+            run_import(tmp_path, bulk=True)
+        assert phases == ["drop", "rebuild", "analyze"]
+
+
+    def test_without_bulk_indexes_are_untouched(self, tmp_path, monkeypatch, phases):
+        write_csv(tmp_path, VALID_ROW)
+        monkeypatch.setattr(
+            import_activities, "_import_files_sequential", lambda csv_files, *args: iter([(csv_files[0], FileResult(1, 0))])
+        )
+        run_import(tmp_path)
+        assert phases == []
+
+
+
+class TestWatch:
+
+
+    @pytest.fixture
+    def cycle(self, tmp_path, db):
+        """run one watch poll over tmp_path with shared observed/imported/hashes state."""
+        observed, imported, hashes = {}, {}, {}
+        return lambda: import_activities._watch_cycle(tmp_path, db, "insert", 0, False, observed, imported, hashes)
+
+
+    def test_partial_last_row_waits_for_its_newline(self, tmp_path, db):
+        """a row still being written is not imported (or rejected) until its line is complete."""
+
+        path = write_csv(tmp_path, VALID_ROW, NULL_TIMESTAMP_ROW[:20])
+        result = import_file(path, db, complete_lines=True)
+
+        assert (result.processed, result.skipped) == (1, 0)
+        assert manifest_writes(db)[-1]["file_size"] == len(HEADER) + len(VALID_ROW)
+
+
+    def test_growing_file_is_picked_up_each_poll(self, tmp_path, db, cycle, monkeypatch):
+        """new bytes are imported on the next poll; an unchanged file costs no manifest lookup."""
+
+        calls = []
+        monkeypatch.setattr(
+            import_activities, "import_file", lambda path, db, **kwargs: calls.append(path.name) or FileResult(1, 0)
+        )
+        path = write_csv(tmp_path, VALID_ROW)
+
+        assert cycle() == (1, 0)
+        assert cycle() == (0, 0)
+        with open(path, "a") as file_object:
+            file_object.write(NULL_TIMESTAMP_ROW)
+        assert cycle() == (1, 0)
+        assert calls == [path.name, path.name]
+
+
+    def test_hash_states_are_kept_across_polls(self, tmp_path, db, cycle, monkeypatch):
+        """each import_file call of the watcher gets the same hash states, so a grown file is hashed from where it was."""
+
+        seen = []
+        monkeypatch.setattr(
+            import_activities, "import_file", lambda path, db, **kwargs: seen.append(kwargs["hashes"]) or FileResult(1, 0)
+        )
+        path = write_csv(tmp_path, VALID_ROW)
+        cycle()
+        with open(path, "a") as file_object:
+            file_object.write(NULL_TIMESTAMP_ROW)
+        cycle()
+
+        assert len(seen) == 2 and seen[0] is seen[1] and isinstance(seen[0], dict)
+
+
+    def test_compressed_file_waits_until_stable(self, tmp_path, db, cycle, monkeypatch):
+        """a .gz file is only read once its size and mtime held still for a whole poll."""
+
+        calls = []
+        monkeypatch.setattr(
+            import_activities, "import_file", lambda path, db, **kwargs: calls.append(path.name) or FileResult(1, 0)
+        )
+        (tmp_path / "activities_20240101.csv.gz").write_bytes(gzip.compress((HEADER + VALID_ROW).encode()))
+
+        assert cycle() == (0, 0)
+        assert cycle() == (1, 0)
+        assert calls == ["activities_20240101.csv.gz"]
+
+
+    def test_broken_file_is_reported_and_not_retried(self, tmp_path, db, cycle, capsys):
+        """a file that fails is rolled back and retried only after it changes again."""
+
+        (tmp_path / "activities_20240101.csv.gz").write_bytes(b"not gzip at all")
+
+        cycle()
+        assert cycle() == (0, 0)
+        assert "activities_20240101.csv.gz: FAILED" in capsys.readouterr().err
+        db.rollback.assert_called_once()
+        assert cycle() == (0, 0)
+        db.rollback.assert_called_once()
+
+
+    def test_reconnects_after_losing_the_connection(self, tmp_path, monkeypatch, capsys):
+        """one connection serves every poll; it is only replaced when the database drops it."""
+
+        fake_engine = MagicMock()
+        monkeypatch.setattr(import_activities, "engine", fake_engine)
+        monkeypatch.setattr(import_activities, "Session", lambda bind, autoflush: MagicMock(spec=Session))
+        skip_schema(monkeypatch)
+
+        outcomes = iter([(5, 1), OperationalError("SELECT 1", {}, Exception("gone")), (3, 0), (0, 0)])
+
+        def fake_cycle(*args):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(import_activities, "_watch_cycle", fake_cycle)
+        monkeypatch.setattr(import_activities.time, "sleep", fake_sleep)
+        watch_import(tmp_path, interval=0.5)
+
+        captured = capsys.readouterr()
+        assert fake_engine.connect.call_count == 2
+        assert sleeps == [0.5] * 4
+        assert "reconnecting" in captured.err
+        assert "Stopped. Total processed: 8, total skipped (malformed): 1" in captured.out
+
+
+    def test_database_down_when_reconnecting(self, tmp_path, monkeypatch, capsys):
+        """a failed reconnect is retried on the next poll instead of ending the watch."""
+
+        fake_engine = MagicMock()
+        fake_engine.connect.side_effect = [
+            MagicMock(), OperationalError("connect", {}, Exception("refused")), MagicMock(),
+        ]
+        monkeypatch.setattr(import_activities, "engine", fake_engine)
+        monkeypatch.setattr(import_activities, "Session", lambda bind, autoflush: MagicMock(spec=Session))
+        skip_schema(monkeypatch)
+
+        outcomes = iter([OperationalError("SELECT 1", {}, Exception("gone")), (2, 0), (0, 0)])
+
+        def fake_cycle(*args):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(import_activities, "_watch_cycle", fake_cycle)
+        monkeypatch.setattr(import_activities.time, "sleep", fake_sleep)
+        watch_import(tmp_path, interval=0.5)
+
+        captured = capsys.readouterr()
+        assert fake_engine.connect.call_count == 3
+        assert captured.err.count("reconnecting") == 2
+        assert "refused" in captured.err
+        assert "Stopped. Total processed: 2, total skipped (malformed): 0" in captured.out
+
+
+    @pytest.mark.parametrize("every, refreshes", [(30.0, [0.0, 40.0, 80.0]), (0.0, [])])
+    def test_views_refreshed_at_most_once_per_period(self, tmp_path, monkeypatch, every, refreshes):
+        """a poll that read rows leaves the views stale; they are refreshed once the last refresh is `every` old."""
+
+        monkeypatch.setattr(import_activities, "engine", MagicMock())
+        monkeypatch.setattr(import_activities, "Session", lambda bind, autoflush: MagicMock(spec=Session))
+        skip_schema(monkeypatch)
+
+        clock = SimpleNamespace(now=0.0)
+        refreshed = []
+        outcomes = iter([(5, 0), (3, 0), (0, 0), (2, 0), (0, 0)])
+
+        def fake_sleep(seconds):
+            clock.now += 20.0
+            if clock.now > 80.0:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr(import_activities, "_watch_cycle", lambda *args: next(outcomes))
+        monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: refreshed.append(clock.now) or 5)
+        monkeypatch.setattr(import_activities.time, "perf_counter", lambda: clock.now)
+        monkeypatch.setattr(import_activities.time, "sleep", fake_sleep)
+        watch_import(tmp_path, interval=0.5, refresh_views_every=every)
+
+        # polls at 0, 20 and 60 read rows; those of 20 and 60 came too soon and wait for the refreshes at 40 and 80.
+        assert refreshed == refreshes
+
+
+    def test_interval_must_be_positive(self, tmp_path):
+        with pytest.raises(SystemExit):
+            watch_import(tmp_path, interval=0)
+
+
+    def test_refresh_period_must_not_be_negative(self, tmp_path):
+        with pytest.raises(SystemExit):
+            watch_import(tmp_path, refresh_views_every=-1)
+
+
+
+class TestParseArgs:
+
+
+    def test_defaults_to_insert_mode(self):
+        """without flags the importer keeps the original INSERT path."""
+
+        args = parse_args([])
+        assert args.mode == "insert"
+        assert args.data_dir is None
+        assert args.workers == 1
+        assert args.queue_depth == 0
+        assert args.force is False
+
+
+    def test_workers_flag(self):
+        """--workers N is parsed as an integer."""
+
+        assert parse_args(["--workers", "4"]).workers == 4
+
+
+    def test_copy_mode_selectable(self):
+        """--mode copy selects the COPY path."""
+
+        assert parse_args(["--mode", "copy"]).mode == "copy"
+
+
+    def test_queue_depth_flag(self):
+        """--queue-depth N enables the parse/write pipeline."""
+
+        assert parse_args(["--queue-depth", "4"]).queue_depth == 4
+
+
+    def test_force_flag(self):
+        """--force bypasses the import manifest."""
+
+        assert parse_args(["--force"]).force is True
+
+
+    def test_sources_and_decompress_thread(self):
+        """positional sources (including - for stdin) and --decompress-thread."""
+
+        args = parse_args(["a.csv.gz", "-", "--decompress-thread"])
+        assert [str(p) for p in args.sources] == ["a.csv.gz", "-"]
+        assert args.decompress_thread is True
+        assert parse_args([]).sources == []
+
+
+    def test_watch_flags(self):
+        """--watch with a custom --interval; the default interval is two seconds."""
+
+        args = parse_args(["--watch", "--interval", "0.5"])
+        assert (args.watch, args.interval) == (True, 0.5)
+        assert (parse_args([]).watch, parse_args([]).interval) == (False, 2.0)
+        assert parse_args([]).refresh_views_every == 60.0
+        assert parse_args(["--watch", "--refresh-views-every", "0"]).refresh_views_every == 0.0
+
+
+    def test_bulk_flag(self):
+        assert parse_args(["--bulk"]).bulk is True
+        assert parse_args([]).bulk is False
+
+
+    def test_rebuild_rollups_flag(self):
+        assert parse_args(["--rebuild-rollups"]).rebuild_rollups is True
+        assert parse_args([]).rebuild_rollups is False
+
+
+    def test_unknown_mode_rejected(self):
+        """an unknown mode is a usage error."""
+
+        with pytest.raises(SystemExit):
+            parse_args(["--mode", "bogus"])
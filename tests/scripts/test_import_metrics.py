@@ -0,0 +1,190 @@
+"""
+unit tests for the importer's instrumentation (src/scripts/import_metrics.py) and how the importer feeds it.
+
+run the test with: uv run pytest tests/scripts/test_import_metrics.py -v
+"""
+
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy.orm import Session
+from src.scripts import import_activities
+from src.scripts.import_activities import FileResult, _read_batches, import_csv_file, import_csv_file_copy, run_import
+from src.scripts.import_metrics import ImportMetrics, format_report, percentile
+
+
+HEADER = "event_id,merchant_id,event_timestamp,product,event_type,amount,status,channel,region,merchant_tier\n"
+
+ROWS = [
+    f"8a380d57-6b3d-40e1-b505-aeb1d462ca{i:02d},MRC-{i:06d},2024-01-01T00:00:23,POS,CARD_TRANSACTION,10.00,SUCCESS,POS,LAGOS,VERIFIED\n"
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "activities_20240101.csv"
+    path.write_text(HEADER + "".join(ROWS), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def db():
+    db = MagicMock(spec=Session)
+    db.get.return_value = None
+    return db
+
+
+
+class TestImportMetrics:
+
+
+    def test_percentile_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 0.50) == 50.0
+        assert percentile(values, 0.99) == 99.0
+        assert percentile([7.0], 0.9) == 7.0
+        assert percentile([], 0.5) == 0.0
+
+
+    def test_phase_accumulates(self):
+        metrics = ImportMetrics()
+        metrics.add("parse", 1.5)
+        with metrics.phase("parse"):
+            pass
+        metrics.add("commit", 0.25)
+
+        assert metrics.phases["parse"] >= 1.5
+        assert metrics.phases["commit"] == 0.25
+
+
+    def test_updates_from_several_threads_are_not_lost(self):
+        """the parser and writer threads add to the same counters."""
+
+        metrics = ImportMetrics()
+
+        def work():
+            for _ in range(10000):
+                metrics.add("execute", 1.0)
+                metrics.record_bytes(1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert metrics.phases["execute"] == 40000.0
+        assert metrics.bytes_read == 40000
+
+
+    def test_merge_worker_metrics(self):
+        """a worker's counters survive the trip through to_dict and add up in the parent."""
+
+        parent, worker = ImportMetrics(), ImportMetrics()
+        parent.add("parse", 1.0)
+        worker.add("parse", 2.0)
+        worker.add("merge", 0.5)
+        worker.record_batch(0.1)
+        worker.record_bytes(100)
+
+        parent.merge(worker.to_dict())
+        assert parent.phases == {"parse": 3.0, "merge": 0.5}
+        assert parent.batch_latencies == [0.1]
+        assert parent.bytes_read == 100
+
+
+    def test_report_and_summary(self):
+        metrics = ImportMetrics()
+        metrics.add("commit", 1.0)
+        metrics.add("parse", 3.0)
+        for ms in range(1, 11):
+            metrics.record_batch(ms / 1000)
+        metrics.record_bytes(2 * 1024 * 1024)
+
+        report = metrics.report(2.0, 1000, 5, mode="copy")
+        assert report["mode"] == "copy"
+        assert list(report["phases"]) == ["parse", "commit"]
+        assert (report["rows_per_second"], report["mb_per_second"]) == (500.0, 1.0)
+        assert report["batch_latency_ms"] == {"count": 10, "p50": 5.0, "p90": 9.0, "p99": 10.0, "max": 10.0}
+        json.dumps(report)
+
+        lines = format_report(report)
+        assert lines[1].split() == ["parse", "3.00s", "75.0%"]
+        assert "p50 5.0ms" in "\n".join(lines)
+        assert any(line.strip().startswith("peak RSS") for line in lines)
+
+
+
+class TestImporterFeedsMetrics:
+
+
+    def test_insert_path_records_every_phase_and_batch(self, path, db, monkeypatch):
+        monkeypatch.setattr(import_activities, "BATCH_SIZE", 2)
+        metrics = ImportMetrics()
+
+        import_csv_file(path, db, metrics=metrics)
+
+        assert {"parse", "validate", "build", "execute", "commit"} <= set(metrics.phases)
+        assert len(metrics.batch_latencies) == 3
+        assert metrics.bytes_read == path.stat().st_size
+
+
+    def test_copy_path_records_merge(self, path, db):
+        metrics = ImportMetrics()
+        import_csv_file_copy(path, db, metrics=metrics)
+        assert {"build", "execute", "merge", "commit"} <= set(metrics.phases)
+
+
+    def test_resumed_read_counts_only_bytes_parsed(self, path):
+        """bytes before a resume offset are not counted as read."""
+
+        start = len(HEADER) + len(ROWS[0]) * 3
+        metrics = ImportMetrics()
+        list(_read_batches(path, {"skipped": 0}, start_offset=start, metrics=metrics))
+        assert metrics.bytes_read == path.stat().st_size - start + len(HEADER)
+
+
+    def test_run_import_profile_and_json_report(self, path, tmp_path, monkeypatch, capsys):
+        """--profile adds per-file throughput and a summary; --report writes the same data as JSON."""
+
+        monkeypatch.setattr(import_activities, "_create_tables", lambda: None)
+        monkeypatch.setattr(import_activities, "SessionLocal", lambda: MagicMock(spec=Session))
+        monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: None)
+        monkeypatch.setattr(import_activities, "update_bitmap_index", lambda: ("updated", 3, 1))
+        monkeypatch.setattr(import_activities.settings, "analytics_source", "bitmaps")
+
+        def fake_parallel(csv_files, mode, workers, queue_depth=0, force=False, decompress_thread=False):
+            worker = ImportMetrics()
+            worker.add("execute", 0.5)
+            worker.record_batch(0.02)
+            yield csv_files[0], FileResult(5, 0, seconds=0.5, bytes_read=1024 * 1024, metrics=worker.to_dict())
+
+        monkeypatch.setattr(import_activities, "_import_files_parallel", fake_parallel)
+        report = tmp_path / "report.json"
+        run_import(path.parent, workers=2, profile=True, report=report)
+
+        out = capsys.readouterr().out
+        assert "activities_20240101.csv: 5 rows processed, 0 skipped (malformed) in 0.50s (10 rows/s, 2.00 MB/s)" in out
+        assert "Profile (phase times are cumulative" in out
+
+        data = json.loads(report.read_text())
+        assert (data["mode"], data["workers"], data["rows_processed"]) == ("insert", 2, 5)
+        assert data["phases"] == {"execute": 0.5}
+        assert data["batch_latency_ms"]["count"] == 1
+        assert data["files"][0]["mb_per_second"] == 2.0
+        assert {"refresh views", "bitmap index"} <= set(data["run_phases"])
+
+
+    def test_no_profile_output_by_default(self, path, monkeypatch, capsys):
+        monkeypatch.setattr(import_activities, "_create_tables", lambda: None)
+        monkeypatch.setattr(import_activities, "SessionLocal", lambda: MagicMock(spec=Session))
+        monkeypatch.setattr(import_activities, "refresh_analytics_views", lambda: None)
+        monkeypatch.setattr(import_activities, "update_bitmap_index", lambda: ("updated", 3, 1))
+        monkeypatch.setattr(
+            import_activities, "_import_files_sequential",
+            lambda csv_files, *args: iter([(csv_files[0], FileResult(5, 0, seconds=1.0))]),
+        )
+        run_import(path.parent)
+        assert "Profile" not in capsys.readouterr().out
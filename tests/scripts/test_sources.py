@@ -0,0 +1,119 @@
+"""
+unit tests for the importer's input sources (src/scripts/sources.py).
+
+run the test with: uv run pytest tests/scripts/test_sources.py -v
+"""
+
+import gzip
+import io
+import sys
+import threading
+from types import SimpleNamespace
+import pytest
+from src.scripts import sources
+from src.scripts.sources import STDIN, ThreadedReader, compression_of, open_source, skip_to
+
+
+DATA = b"".join(f"line {i}\n".encode() for i in range(10000))
+
+
+class TestOpenSource:
+
+
+    def test_compression_from_suffix(self, tmp_path):
+        assert compression_of(tmp_path / "a.csv.gz") == "gzip"
+        assert compression_of(tmp_path / "a.csv.zst") == "zstd"
+        assert compression_of(tmp_path / "a.csv") is None
+
+
+    @pytest.mark.parametrize("decompress_thread", [False, True])
+    def test_gzip_file(self, tmp_path, decompress_thread):
+        path = tmp_path / "a.csv.gz"
+        path.write_bytes(gzip.compress(DATA))
+
+        with open_source(path, decompress_thread) as stream:
+            assert stream.read() == DATA
+
+
+    @pytest.mark.parametrize("decompress_thread", [False, True])
+    def test_zstd_file_with_several_frames(self, tmp_path, decompress_thread):
+        """a .zst file appended to (several frames) reads back as one stream."""
+
+        zstandard = pytest.importorskip("zstandard")
+        compressor = zstandard.ZstdCompressor()
+        path = tmp_path / "a.csv.zst"
+        path.write_bytes(compressor.compress(DATA[:1000]) + compressor.compress(DATA[1000:]))
+
+        with open_source(path, decompress_thread) as stream:
+            assert stream.read() == DATA
+
+
+    def test_zstd_without_package_is_a_clear_error(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sources, "zstandard", None)
+        path = tmp_path / "a.csv.zst"
+        path.write_bytes(b"\x28\xb5\x2f\xfd")
+
+        with pytest.raises(RuntimeError, match="zstandard"):
+            with open_source(path):
+                pass
+
+
+    @pytest.mark.parametrize("compress", [lambda data: data, gzip.compress])
+    def test_stdin_compression_is_sniffed(self, monkeypatch, compress):
+        """stdin has no file name, so gzip is recognised by its magic bytes."""
+
+        stdin = io.BufferedReader(io.BytesIO(compress(DATA)))
+        monkeypatch.setattr(sys, "stdin", SimpleNamespace(buffer=stdin))
+
+        with open_source(STDIN) as stream:
+            assert stream.read() == DATA
+        assert not stdin.closed
+
+
+
+class TestThreadedReader:
+
+
+    def test_reads_everything_in_order_with_small_chunks(self):
+        with io.BufferedReader(ThreadedReader(io.BytesIO(DATA), chunk_size=7, depth=2)) as stream:
+            assert list(stream) == DATA.splitlines(keepends=True)
+
+
+    def test_reader_error_surfaces_in_caller(self):
+        """an exception on the decompression thread is raised by the read that reaches it."""
+
+        class Broken(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() >= 10:
+                    raise EOFError("truncated gzip")
+                return super().read(size)
+
+        with pytest.raises(EOFError, match="truncated"):
+            with io.BufferedReader(ThreadedReader(Broken(DATA), chunk_size=5)) as stream:
+                stream.read()
+
+
+    def test_close_stops_a_blocked_thread(self):
+        """closing early never leaves the background thread stuck on a full queue."""
+
+        reader = ThreadedReader(io.BytesIO(DATA), chunk_size=1, depth=1)
+        reader.read(1)
+        reader.close()
+        assert not any(t.name == "import-decompress" and t.is_alive() for t in threading.enumerate())
+
+
+
+class TestSkipTo:
+
+
+    def test_seekable_stream_seeks(self):
+        stream = io.BytesIO(DATA)
+        skip_to(stream, 0, 100)
+        assert stream.tell() == 100
+
+
+    def test_unseekable_stream_reads_forward(self):
+        with io.BufferedReader(ThreadedReader(io.BytesIO(DATA), chunk_size=64)) as stream:
+            stream.read(10)
+            skip_to(stream, 10, 100)
+            assert stream.read(5) == DATA[100:105]
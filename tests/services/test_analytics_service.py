@@ -7,10 +7,18 @@ no real database connection or running server is required.
 run the test with: uv run pytest tests/services/test_analytics_service.py -v
 """
 
+import asyncio
+import threading
 import pytest
-from unittest.mock import MagicMock, call, patch
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, call, patch
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import ProgrammingError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from src.services.analytics import AnalyticsService
+from src.services.analytics import AnalyticsService, AsyncAnalyticsService
+from src.services.bitmap_index import BitmapIndexBuilder, MerchantBitmapIndex
+from src.services.hyperloglog import HyperLogLog
 
 
 def make_row(**kwargs):
@@ -249,7 +257,7 @@ class TestGetKycFunnel:
     def test_returns_all_three_stages(self, service, db):
         """happy path: ensure all the 3 KYC stages are present with correct counts."""
 
-        db.execute.return_value.scalar.side_effect = [100, 75, 40]
+        db.execute.return_value.one.return_value = (100, 75, 40)
         result = service.get_kyc_funnel()
         assert result["documents_submitted"] == 100
         assert result["verifications_completed"] == 75
@@ -257,9 +265,9 @@ class TestGetKycFunnel:
 
 
     def test_no_kyc_data_returns_zeros(self, service, db):
-        """when scalar returns None (no rows), all counts default to 0."""
+        """when the counts come back None (no rows), all counts default to 0."""
 
-        db.execute.return_value.scalar.return_value = None
+        db.execute.return_value.one.return_value = (None, None, None)
         result = service.get_kyc_funnel()
         assert result["documents_submitted"] == 0
         assert result["verifications_completed"] == 0
@@ -269,7 +277,7 @@ class TestGetKycFunnel:
     def test_funnel_shape_decreases(self, service, db):
         """submitted >= completed >= upgraded is the expected funnel shape."""
 
-        db.execute.return_value.scalar.side_effect = [200, 150, 80]
+        db.execute.return_value.one.return_value = (200, 150, 80)
         result = service.get_kyc_funnel()
         assert result["documents_submitted"] >= result["verifications_completed"]
         assert result["verifications_completed"] >= result["tier_upgrades"]
@@ -278,7 +286,7 @@ class TestGetKycFunnel:
     def test_returns_dict_with_correct_keys(self, service, db):
         """return value must contain exactly the three expected keys."""
 
-        db.execute.return_value.scalar.side_effect = [10, 8, 5]
+        db.execute.return_value.one.return_value = (10, 8, 5)
         result = service.get_kyc_funnel()
         assert set(result.keys()) == {
             "documents_submitted",
@@ -287,18 +295,20 @@ class TestGetKycFunnel:
         }
 
 
-    def test_db_called_three_times(self, service, db):
-        """each KYC stage requires one separate DB call — total of 3."""
+    def test_db_called_once(self, service, db):
+        """all three stages come from one query (one scan, conditional aggregation with FILTER)."""
 
-        db.execute.return_value.scalar.side_effect = [50, 30, 10]
+        db.execute.return_value.one.return_value = (50, 30, 10)
         service.get_kyc_funnel()
-        assert db.execute.call_count == 3
+        assert db.execute.call_count == 1
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert sql.count("count(distinct(merchant_activities.merchant_id)) FILTER (WHERE") == 3
 
 
     def test_all_counts_are_integers(self, service, db):
         """all returned counts must be integers."""
 
-        db.execute.return_value.scalar.side_effect = [10, 8, 3]
+        db.execute.return_value.one.return_value = (10, 8, 3)
         result = service.get_kyc_funnel()
         for v in result.values():
             assert isinstance(v, int)
@@ -307,7 +317,7 @@ class TestGetKycFunnel:
     def test_partial_funnel_data(self, service, db):
         """only some stages have data — others should default to 0."""
 
-        db.execute.return_value.scalar.side_effect = [50, 0, None]
+        db.execute.return_value.one.return_value = (50, 0, None)
         result = service.get_kyc_funnel()
         assert result["documents_submitted"] == 50
         assert result["verifications_completed"] == 0
@@ -315,6 +325,93 @@ class TestGetKycFunnel:
 
 
 
+class TestGetFunnel:
+
+
+    STAGES = [("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "VERIFICATION_COMPLETED"), ("KYC", "TIER_UPGRADE")]
+
+
+    def compiled(self, db):
+        return str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+    def test_counts_and_conversion_per_stage(self, service, db):
+        db.execute.return_value.one.return_value = (200, 150, 0)
+        result = service.get_funnel(self.STAGES)
+
+        assert result == [
+            {"product": "KYC", "event_type": "DOCUMENT_SUBMITTED", "merchants": 200, "conversion_rate": 100.0},
+            {"product": "KYC", "event_type": "VERIFICATION_COMPLETED", "merchants": 150, "conversion_rate": 75.0},
+            {"product": "KYC", "event_type": "TIER_UPGRADE", "merchants": 0, "conversion_rate": 0.0},
+        ]
+
+
+    def test_empty_first_stage_has_no_conversion(self, service, db):
+        db.execute.return_value.one.return_value = (0, 0)
+        result = service.get_funnel(self.STAGES[:2])
+        assert [stage["conversion_rate"] for stage in result] == [0.0, 0.0]
+
+
+    def test_unordered_is_a_single_filtered_scan(self, service, db):
+        db.execute.return_value.one.return_value = (1, 1)
+        service.get_funnel([("POS", "CARD_TRANSACTION"), ("KYC", "TIER_UPGRADE")])
+
+        sql = self.compiled(db)
+        assert "FILTER (WHERE merchant_activities.product = 'POS' AND merchant_activities.event_type = 'CARD_TRANSACTION')" in sql
+        assert "(merchant_activities.product, merchant_activities.event_type) IN (('POS', 'CARD_TRANSACTION'), ('KYC', 'TIER_UPGRADE'))" in sql
+        assert "JOIN" not in sql
+
+
+    def test_window_bounds_event_timestamp(self, service, db):
+        db.execute.return_value.one.return_value = (1,)
+        service.get_funnel(self.STAGES[:1], start=datetime(2024, 1, 1), end=datetime(2024, 2, 1))
+
+        sql = self.compiled(db)
+        assert "merchant_activities.event_timestamp >= '2024-01-01 00:00:00'" in sql
+        assert "merchant_activities.event_timestamp < '2024-02-01 00:00:00'" in sql
+
+
+    def test_ordered_chains_each_stage_after_the_previous(self, service, db):
+        """ordered: one grouped scan, then per stage the earliest time at or after the previous stage's."""
+
+        db.execute.return_value.one.return_value = (3, 2, 1)
+        service.get_funnel(self.STAGES, ordered=True)
+
+        sql = self.compiled(db)
+        assert sql.count("FROM merchant_activities") == 1
+        assert "JOIN LATERAL" in sql
+        assert "times_1.event_timestamp >= reached_0.reached_at" in sql
+        assert "times_2.event_timestamp >= reached_1.reached_at" in sql
+
+
+    def test_rollup_source_serves_unordered_unbounded_funnels_only(self, db):
+        rollup = AnalyticsService(db, source="rollup")
+        db.execute.return_value.one.return_value = (1,)
+
+        rollup.get_funnel(self.STAGES[:1])
+        assert "FROM merchant_daily_rollups" in self.compiled(db)
+
+        rollup.get_funnel(self.STAGES[:1], ordered=True)
+        assert "FROM merchant_activities" in self.compiled(db)
+
+
+    @pytest.mark.parametrize("stages, window", [
+        ([], {}),
+        ([("KYC", "TIER_UPGRADE")] * 11, {}),
+        ([("KYC", "TIER_UPGRADE")], {"start": datetime(2024, 2, 1), "end": datetime(2024, 1, 1)}),
+    ])
+    def test_invalid_funnels_rejected(self, service, db, stages, window):
+        with pytest.raises(ValueError):
+            service.get_funnel(stages, **window)
+        db.execute.assert_not_called()
+
+
+    def test_db_error_raises_runtime_error(self, service, db):
+        db.execute.side_effect = SQLAlchemyError("boom")
+        with pytest.raises(RuntimeError, match="funnel"):
+            service.get_funnel(self.STAGES)
+
+
 
 class TestGetFailureRates:
 
@@ -413,4 +510,441 @@ class TestGetFailureRates:
             for i, p in enumerate(["POS", "AIRTIME", "BILLS", "KYC"], 1)
         ]
         result = service.get_failure_rates()
-        assert len(result) == 4
\ No newline at end of file
+        assert len(result) == 4
+
+
+class TestApproximateCounts:
+    """approx=True answers from the importer's HyperLogLog sketches instead of counting distinct rows."""
+
+
+    @staticmethod
+    def sketch_row(key, merchants):
+        sketch = HyperLogLog()
+        sketch.update(f"MRC-{i:06d}" for i in range(merchants))
+        return make_row(key=key, registers=sketch.to_bytes())
+
+
+    def test_monthly_active_merchants_sorted_by_month(self, service, db):
+        db.execute.return_value.all.return_value = [self.sketch_row("2024-02", 30), self.sketch_row("2024-01", 20)]
+
+        assert service.get_monthly_active_merchants(approx=True) == {"2024-01": 20, "2024-02": 30}
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "FROM merchant_sketches" in sql
+        assert "merchant_activities" not in sql
+
+
+    def test_product_adoption_sorted_by_count(self, service, db):
+        db.execute.return_value.all.return_value = [self.sketch_row("KYC", 5), self.sketch_row("POS", 50)]
+        assert list(service.get_product_adoption(approx=True).items()) == [("POS", 50), ("KYC", 5)]
+
+
+    def test_same_for_every_source(self, db):
+        db.execute.return_value.all.return_value = [self.sketch_row("POS", 3)]
+        for source in ("live", "rollup", "views"):
+            assert AnalyticsService(db, source=source).get_product_adoption(approx=True) == {"POS": 3}
+
+
+    def test_database_error_raises_runtime_error(self, service, db):
+        db.execute.side_effect = SQLAlchemyError("relation merchant_sketches does not exist")
+        with pytest.raises(RuntimeError, match="merchant sketches"):
+            service.get_monthly_active_merchants(approx=True)
+
+
+
+class TestRollupSource:
+    """source="rollup" answers every method from merchant_daily_rollups instead of the raw events."""
+
+
+    @pytest.fixture
+    def rollup_service(self, db):
+        return AnalyticsService(db, source="rollup")
+
+
+    def executed_sql(self, db):
+        return [
+            str(c.args[0].compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+            for c in db.execute.call_args_list
+        ]
+
+
+    @pytest.mark.parametrize("method", [
+        "get_top_merchant",
+        "get_monthly_active_merchants",
+        "get_product_adoption",
+        "get_kyc_funnel",
+        "get_failure_rates",
+    ])
+    def test_reads_rollups_not_raw_events(self, rollup_service, db, method):
+        db.execute.return_value.first.return_value = None
+        db.execute.return_value.all.return_value = []
+        db.execute.return_value.one.return_value = (0, 0, 0)
+
+        getattr(rollup_service, method)()
+
+        for sql in self.executed_sql(db):
+            assert "merchant_daily_rollups" in sql
+            assert "merchant_activities" not in sql
+
+
+    def test_top_merchant_sums_rollup_amounts(self, rollup_service, db):
+        db.execute.return_value.first.return_value = make_row(merchant_id="MRC-001", total=10.005)
+
+        assert rollup_service.get_top_merchant() == {"merchant_id": "MRC-001", "total_volume": 10.01}
+        assert "sum(merchant_daily_rollups.amount_sum)" in self.executed_sql(db)[0]
+
+
+    def test_monthly_skips_events_without_timestamp(self, rollup_service, db):
+        db.execute.return_value.all.return_value = [make_row(month="2024-01", count=3)]
+
+        assert rollup_service.get_monthly_active_merchants() == {"2024-01": 3}
+        assert "merchant_daily_rollups.day != '-infinity'::date" in self.executed_sql(db)[0]
+
+
+    def test_failure_rates_weight_by_event_count(self, rollup_service, db):
+        """a rollup row stands for event_count events, so the rates sum event_count, not rows."""
+
+        db.execute.return_value.all.return_value = [make_row(product="POS", failure_rate=12.345)]
+
+        assert rollup_service.get_failure_rates() == [{"product": "POS", "failure_rate": 12.3}]
+        assert "THEN merchant_daily_rollups.event_count" in self.executed_sql(db)[0]
+
+
+    def test_unknown_source_rejected(self, db):
+        with pytest.raises(ValueError):
+            AnalyticsService(db, source="cache")
+
+
+
+class TestViewsSource:
+    """source="views" reads the materialized views while they are fresh and the live queries otherwise."""
+
+
+    @pytest.fixture
+    def views_service(self, db):
+        return AnalyticsService(db, source="views")
+
+
+    def executed_sql(self, db):
+        return [
+            str(c.args[0].compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+            for c in db.execute.call_args_list
+        ]
+
+
+    @pytest.mark.parametrize("method, view", [
+        ("get_top_merchant", "mv_merchant_totals"),
+        ("get_monthly_active_merchants", "mv_monthly_active_merchants"),
+        ("get_product_adoption", "mv_product_adoption"),
+        ("get_kyc_funnel", "mv_kyc_stage_counts"),
+        ("get_failure_rates", "mv_product_failure_counts"),
+    ])
+    def test_fresh_view_is_read(self, views_service, db, method, view):
+        db.execute.return_value.scalar.return_value = True
+        db.execute.return_value.first.return_value = None
+        db.execute.return_value.all.return_value = []
+
+        getattr(views_service, method)()
+
+        check, query = self.executed_sql(db)
+        assert f"analytics_view_refreshes.view_name = '{view}'" in check
+        assert f"FROM {view}" in query
+        assert "merchant_activities" not in query
+
+
+    def test_stale_view_falls_back_to_live_query(self, views_service, db):
+        db.execute.return_value.scalar.return_value = False
+        db.execute.return_value.all.return_value = [make_row(product="POS", count=3)]
+
+        assert views_service.get_product_adoption() == {"POS": 3}
+        assert "FROM merchant_activities" in self.executed_sql(db)[1]
+
+
+    def test_missing_views_fall_back_to_live_query(self, views_service, db):
+        """before the importer has created the views, the freshness check fails and the live query answers."""
+
+        db.execute.side_effect = [
+            ProgrammingError("SELECT", {}, Exception("no such table")),
+            MagicMock(all=MagicMock(return_value=[make_row(product="POS", count=3)])),
+        ]
+
+        assert views_service.get_product_adoption() == {"POS": 3}
+        db.rollback.assert_called_once()
+
+
+    def test_kyc_funnel_from_stage_counts(self, views_service, db):
+        db.execute.return_value.scalar.return_value = True
+        db.execute.return_value.all.return_value = [
+            make_row(event_type="DOCUMENT_SUBMITTED", merchant_count=10),
+            make_row(event_type="TIER_UPGRADE", merchant_count=4),
+        ]
+
+        assert views_service.get_kyc_funnel() == {
+            "documents_submitted": 10,
+            "verifications_completed": 0,
+            "tier_upgrades": 4,
+        }
+
+
+    def test_failure_rate_computed_from_view_counts(self, views_service, db):
+        db.execute.return_value.scalar.return_value = True
+        db.execute.return_value.all.return_value = [make_row(product="POS", failure_rate=25.04)]
+
+        assert views_service.get_failure_rates() == [{"product": "POS", "failure_rate": 25.0}]
+        query = self.executed_sql(db)[1]
+        assert "mv_product_failure_counts.failed + mv_product_failure_counts.succeeded" in query
+
+
+
+class TestGetMerchantOverlap:
+
+
+    STAGES = [("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")]
+
+
+    def test_counts_merchants_with_every_stage(self, service, db):
+        db.execute.return_value.scalar.return_value = 12
+
+        assert service.get_merchant_overlap(self.STAGES) == {
+            "stages": [
+                {"product": "KYC", "event_type": "DOCUMENT_SUBMITTED"},
+                {"product": "KYC", "event_type": "TIER_UPGRADE"},
+            ],
+            "merchants": 12,
+        }
+        sql = str(db.execute.call_args.args[0].compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        ))
+        assert "HAVING count(distinct((merchant_activities.product, merchant_activities.event_type))) = 2" in sql
+
+
+    def test_repeated_stage_counts_once(self, service, db):
+        db.execute.return_value.scalar.return_value = 3
+        result = service.get_merchant_overlap(self.STAGES[:1] * 2)
+        assert len(result["stages"]) == 1
+        assert "= 1" in str(db.execute.call_args.args[0].compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        ))
+
+
+    def test_rollup_source_reads_rollups(self, db):
+        db.execute.return_value.scalar.return_value = 0
+        AnalyticsService(db, source="rollup").get_merchant_overlap(self.STAGES)
+        assert "FROM merchant_daily_rollups" in str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+
+
+    @pytest.mark.parametrize("stages", [[], [("KYC", f"STAGE_{i}") for i in range(11)]])
+    def test_invalid_stages_rejected(self, service, db, stages):
+        with pytest.raises(ValueError):
+            service.get_merchant_overlap(stages)
+        db.execute.assert_not_called()
+
+
+    def test_db_error_raises_runtime_error(self, service, db):
+        db.execute.side_effect = SQLAlchemyError("boom")
+        with pytest.raises(RuntimeError, match="merchant overlap"):
+            service.get_merchant_overlap(self.STAGES)
+
+
+
+class TestGetSummary:
+
+
+    ROWS = [
+        make_row(part="top_merchant", key="MRC-007", value=1234.567, total=None),
+        make_row(part="monthly_active_merchants", key="2024-02", value=5, total=None),
+        make_row(part="monthly_active_merchants", key="2024-01", value=8, total=None),
+        make_row(part="product_adoption", key="KYC", value=3, total=None),
+        make_row(part="product_adoption", key="POS", value=9, total=None),
+        make_row(part="kyc_funnel", key="DOCUMENT_SUBMITTED", value=3, total=None),
+        make_row(part="kyc_funnel", key="TIER_UPGRADE", value=1, total=None),
+        make_row(part="failure_rates", key="POS", value=1, total=3),
+        make_row(part="failure_rates", key="KYC", value=2, total=3),
+    ]
+
+
+    def test_every_result_from_one_statement(self, service, db):
+        db.execute.return_value.all.return_value = self.ROWS
+
+        assert service.get_summary() == {
+            "top_merchant": {"merchant_id": "MRC-007", "total_volume": 1234.57},
+            "monthly_active_merchants": {"2024-01": 8, "2024-02": 5},
+            "product_adoption": {"POS": 9, "KYC": 3},
+            "kyc_funnel": {"documents_submitted": 3, "verifications_completed": 0, "tier_upgrades": 1},
+            "failure_rates": [{"product": "KYC", "failure_rate": 66.7}, {"product": "POS", "failure_rate": 33.3}],
+        }
+        db.execute.assert_called_once()
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert sql.startswith("WITH grouped AS")
+        assert sql.count("FROM merchant_activities") == 1
+        assert sql.count("UNION ALL") == 4
+
+
+    def test_empty_table(self, service, db):
+        db.execute.return_value.all.return_value = []
+
+        assert service.get_summary() == {
+            "top_merchant": {"merchant_id": None, "total_volume": 0.00},
+            "monthly_active_merchants": {},
+            "product_adoption": {},
+            "kyc_funnel": {"documents_submitted": 0, "verifications_completed": 0, "tier_upgrades": 0},
+            "failure_rates": [],
+        }
+
+
+    @pytest.mark.parametrize("source", ["rollup", "views", "bitmaps"])
+    def test_other_sources_combine_their_results(self, db, source):
+        service = AnalyticsService(db, source=source)
+        results = {
+            "get_top_merchant": {"merchant_id": "M1", "total_volume": 1.0},
+            "get_monthly_active_merchants": {"2024-01": 1},
+            "get_product_adoption": {"POS": 1},
+            "get_kyc_funnel": {"documents_submitted": 1, "verifications_completed": 1, "tier_upgrades": 0},
+            "get_failure_rates": [],
+        }
+        with patch.multiple(service, **{name: MagicMock(return_value=value) for name, value in results.items()}):
+            summary = service.get_summary()
+
+        assert summary == {name.removeprefix("get_"): value for name, value in results.items()}
+        db.execute.assert_not_called()
+
+
+    def test_db_error_raises_runtime_error(self, service, db):
+        db.execute.side_effect = SQLAlchemyError("boom")
+        with pytest.raises(RuntimeError, match="summary"):
+            service.get_summary()
+
+
+
+class TestBitmapsSource:
+    """source="bitmaps" answers distinct-merchant counts from the bitmap index while it is at the current data version."""
+
+
+    @pytest.fixture
+    def bitmaps(self, tmp_path):
+        builder = BitmapIndexBuilder()
+        for key, merchants in [
+            (("2024-01", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS"), ["M1", "M2", "M3"]),
+            (("2024-02", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS"), ["M4"]),
+            (("2024-01", "KYC", "TIER_UPGRADE", "SUCCESS"), ["M2"]),
+            (("2024-02", "KYC", "TIER_UPGRADE", "SUCCESS"), ["M4"]),
+            (("2024-01", "POS", "CARD_TRANSACTION", "FAILED"), ["M5"]),
+            (("", "POS", "CARD_TRANSACTION", "SUCCESS"), ["M6"]),
+        ]:
+            for merchant_id in merchants:
+                builder.add(key, merchant_id)
+        builder.write(tmp_path / "merchant_bitmaps.idx", data_version=3)
+        return MerchantBitmapIndex(tmp_path / "merchant_bitmaps.idx")
+
+
+    @pytest.fixture
+    def bitmaps_service(self, db, bitmaps):
+        db.execute.return_value.scalar.return_value = 3
+        return AnalyticsService(db, source="bitmaps", bitmaps=bitmaps)
+
+
+    def test_monthly_active_merchants(self, bitmaps_service, db):
+        assert bitmaps_service.get_monthly_active_merchants() == {"2024-01": 3, "2024-02": 1}
+        # the only query is the data version check.
+        assert db.execute.call_count == 1
+        assert "analytics_data_version" in str(db.execute.call_args.args[0])
+
+
+    def test_product_adoption_counts_every_status(self, bitmaps_service):
+        assert list(bitmaps_service.get_product_adoption().items()) == [("KYC", 4), ("POS", 2)]
+
+
+    def test_kyc_funnel(self, bitmaps_service):
+        assert bitmaps_service.get_kyc_funnel() == {
+            "documents_submitted": 4,
+            "verifications_completed": 0,
+            "tier_upgrades": 2,
+        }
+
+
+    def test_merchant_overlap(self, bitmaps_service):
+        stages = [("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")]
+        assert bitmaps_service.get_merchant_overlap(stages)["merchants"] == 2
+        assert bitmaps_service.get_merchant_overlap(stages + [("POS", "CARD_TRANSACTION")])["merchants"] == 0
+
+
+    def test_unordered_funnel(self, bitmaps_service, db):
+        result = bitmaps_service.get_funnel([("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")])
+        assert [stage["merchants"] for stage in result] == [4, 2]
+        assert result[1]["conversion_rate"] == 50.0
+        assert db.execute.call_count == 1
+
+
+    def test_ordered_funnel_runs_sql(self, bitmaps_service, db):
+        db.execute.return_value.one.return_value = (4, 1)
+        bitmaps_service.get_funnel([("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")], ordered=True)
+        assert "FROM merchant_activities" in str(db.execute.call_args.args[0])
+
+
+    def test_lagging_index_falls_back_to_live_query(self, db, bitmaps):
+        db.execute.return_value.scalar.return_value = 4
+        db.execute.return_value.all.return_value = [make_row(product="POS", count=9)]
+
+        assert AnalyticsService(db, source="bitmaps", bitmaps=bitmaps).get_product_adoption() == {"POS": 9}
+        assert "FROM merchant_activities" in str(db.execute.call_args.args[0])
+
+
+    def test_no_index_falls_back_to_live_query(self, db):
+        db.execute.return_value.all.return_value = [make_row(product="POS", count=9)]
+        assert AnalyticsService(db, source="bitmaps").get_product_adoption() == {"POS": 9}
+        assert db.execute.call_count == 1
+
+
+
+class TestAsyncAnalyticsService:
+    """the async service runs the sync service's queries on the async session's sync facade."""
+
+
+    @pytest.fixture
+    def async_db(self, db):
+        async_db = MagicMock(spec=AsyncSession)
+        async_db.run_sync = AsyncMock(side_effect=lambda function: function(db))
+        return async_db
+
+
+    def test_runs_the_sync_query_through_run_sync(self, async_db, db):
+        db.execute.return_value.all.return_value = [make_row(product="POS", count=9)]
+        service = AsyncAnalyticsService(async_db, AnalyticsService)
+
+        assert asyncio.run(service.get_product_adoption()) == {"POS": 9}
+        async_db.run_sync.assert_awaited_once()
+        assert "FROM merchant_activities" in str(db.execute.call_args.args[0])
+
+
+    def test_service_built_for_each_call(self, async_db, db):
+        create_service = MagicMock()
+        create_service.return_value.get_funnel.return_value = []
+        service = AsyncAnalyticsService(async_db, create_service)
+
+        stages = [("KYC", "DOCUMENT_SUBMITTED")]
+        assert asyncio.run(service.get_funnel(stages, ordered=True)) == []
+        create_service.assert_called_once_with(db)
+        create_service.return_value.get_funnel.assert_called_once_with(stages, ordered=True, start=None, end=None)
+
+
+
+    def test_data_version_read_off_the_event_loop(self, async_db, db):
+        """with current_version, the version is read in a worker thread and handed to the service it is built with."""
+
+        threads = []
+        create_service = MagicMock()
+        create_service.return_value.get_summary.return_value = {}
+        service = AsyncAnalyticsService(async_db, create_service, lambda: threads.append(threading.get_ident()) or 7)
+
+        async def main():
+            await service.get_summary()
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(main())
+        create_service.assert_called_once_with(db, 7)
+        assert len(threads) == 1 and threads[0] != loop_thread
+
+
+    def test_errors_propagate(self, async_db):
+        service = AsyncAnalyticsService(async_db, AnalyticsService)
+        with pytest.raises(ValueError):
+            asyncio.run(service.get_funnel([("KYC", "TIER_UPGRADE")], start=datetime(2024, 2, 1), end=datetime(2024, 1, 1)))
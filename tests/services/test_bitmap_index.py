@@ -0,0 +1,189 @@
+"""
+unit tests for the merchant bitmap index (src/services/bitmap_index.py).
+
+run the test with: uv run pytest tests/services/test_bitmap_index.py -v
+"""
+
+import os
+import pytest
+from src.services.bitmap_index import (
+    ARRAY,
+    ARRAY_MAX,
+    BITMAP,
+    CHUNK_BITS,
+    BitmapIndexBuilder,
+    BitmapIndexLoader,
+    MerchantBitmapIndex,
+    bits_of,
+    decode_bitmap,
+    encode_bitmap,
+    write_index,
+)
+
+
+DOCS = ("2024-01", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS")
+TIER = ("2024-01", "KYC", "TIER_UPGRADE", "SUCCESS")
+POS_FEB = ("2024-02", "POS", "CARD_TRANSACTION", "SUCCESS")
+POS_FAILED = ("2024-01", "POS", "CARD_TRANSACTION", "FAILED")
+AIRTIME_UNDATED = ("", "AIRTIME", "AIRTIME_PURCHASE", "SUCCESS")
+
+
+@pytest.fixture
+def path(tmp_path):
+    """an index of five merchants: documents 0-2, tier upgrades 1-2, POS 2-3 (one failed), airtime without a date 4."""
+
+    builder = BitmapIndexBuilder()
+    for key, merchants in [
+        (DOCS, ["MRC-000", "MRC-001", "MRC-002"]),
+        (TIER, ["MRC-001", "MRC-002"]),
+        (POS_FEB, ["MRC-002", "MRC-003"]),
+        (POS_FAILED, ["MRC-003"]),
+        (AIRTIME_UNDATED, ["MRC-004"]),
+    ]:
+        for merchant_id in merchants:
+            builder.add(key, merchant_id)
+    path = tmp_path / "merchant_bitmaps.idx"
+    builder.write(path, data_version=7)
+    return path
+
+
+def container_kinds(bits):
+    """kind of every container in an encoded bitmap."""
+
+    data, kinds, offset = encode_bitmap(bits), [], 0
+    while offset < len(data):
+        kinds.append(data[offset + 2])
+        offset += 7 + int.from_bytes(data[offset + 3:offset + 7], "little")
+    return kinds
+
+
+
+class TestContainers:
+
+
+    @pytest.mark.parametrize("ids", [
+        [],
+        [0],
+        [5, 9, 65535],
+        list(range(0, 3 * CHUNK_BITS, 7)),
+        [1, CHUNK_BITS * 5 + 3],
+    ])
+    def test_round_trip(self, ids):
+        bits = bits_of(ids)
+        assert decode_bitmap(encode_bitmap(bits)) == bits
+
+
+    def test_sparse_chunk_is_an_array_dense_one_a_bitmap(self):
+        sparse = bits_of(range(ARRAY_MAX))
+        dense = bits_of(range(ARRAY_MAX + 1))
+        assert container_kinds(sparse) == [ARRAY]
+        assert container_kinds(dense) == [BITMAP]
+        assert len(encode_bitmap(sparse)) == 7 + 2 * ARRAY_MAX
+        assert len(encode_bitmap(dense)) == 7 + CHUNK_BITS // 8
+
+
+    def test_empty_chunks_take_no_space(self):
+        assert container_kinds(bits_of([1, 10 * CHUNK_BITS])) == [ARRAY, ARRAY]
+
+
+
+class TestMerchantBitmapIndex:
+
+
+    def test_header(self, path):
+        index = MerchantBitmapIndex(path)
+        assert index.data_version == 7
+        assert index.merchant_count == 5
+        assert index.merchants() == ["MRC-000", "MRC-001", "MRC-002", "MRC-003", "MRC-004"]
+        assert sorted(index.keys()) == sorted([DOCS, TIER, POS_FEB, POS_FAILED, AIRTIME_UNDATED])
+        assert index.cardinality(DOCS) == 3
+
+
+    def test_select_unions_matching_keys(self, path):
+        index = MerchantBitmapIndex(path)
+        assert index.select(product="POS").bit_count() == 2
+        assert index.select(status="SUCCESS").bit_count() == 5
+        assert index.select(product="KYC", event_type="TIER_UPGRADE") == bits_of([1, 2])
+        assert index.select(product="CARDS") == 0
+
+
+    def test_intersection(self, path):
+        index = MerchantBitmapIndex(path)
+        overlap = index.select(event_type="DOCUMENT_SUBMITTED") & index.select(event_type="TIER_UPGRADE")
+        assert overlap.bit_count() == 2
+
+
+    def test_count_by(self, path):
+        index = MerchantBitmapIndex(path)
+        assert index.count_by("month", status="SUCCESS") == {"2024-01": 3, "2024-02": 2, "": 1}
+        assert index.count_by("product") == {"KYC": 3, "POS": 2, "AIRTIME": 1}
+
+
+    def test_not_an_index_rejected(self, tmp_path):
+        path = tmp_path / "merchant_bitmaps.idx"
+        path.write_bytes(b"x" * 64)
+        with pytest.raises(ValueError):
+            MerchantBitmapIndex(path)
+
+
+
+class TestBitmapIndexBuilder:
+
+
+    def test_incremental_update_keeps_ids_and_adds_members(self, path):
+        builder = BitmapIndexBuilder(MerchantBitmapIndex(path))
+        builder.add(TIER, "MRC-000")
+        builder.add(TIER, "MRC-005")
+        builder.add(DOCS, "MRC-001")  # already a member: no change
+        builder.write(path, data_version=8)
+
+        index = MerchantBitmapIndex(path)
+        assert index.data_version == 8
+        assert index.merchants()[:5] == ["MRC-000", "MRC-001", "MRC-002", "MRC-003", "MRC-004"]
+        assert index.merchants()[5] == "MRC-005"
+        assert index.bitmap(TIER) == bits_of([0, 1, 2, 5])
+        assert index.cardinality(DOCS) == 3
+        assert index.bitmap(POS_FEB) == bits_of([2, 3])
+
+
+    def test_write_replaces_the_file_atomically(self, path):
+        before = os.stat(path).st_ino
+        write_index(path, 9, [], {})
+        assert os.stat(path).st_ino != before
+        assert [p.name for p in path.parent.iterdir()] == [path.name]
+        assert MerchantBitmapIndex(path).keys() == []
+
+
+
+class TestBitmapIndexLoader:
+
+
+    def test_missing_file_gives_none(self, tmp_path):
+        assert BitmapIndexLoader(tmp_path / "missing.idx", interval=0).current() is None
+
+
+    def test_reopens_a_replaced_file(self, path):
+        loader = BitmapIndexLoader(path, interval=0)
+        first = loader.current()
+        assert first.data_version == 7
+        assert loader.current() is first
+
+        builder = BitmapIndexBuilder(first)
+        builder.add(TIER, "MRC-000")
+        builder.write(path, data_version=8)
+        assert loader.current().data_version == 8
+        # readers that still hold the previous index keep using it.
+        assert first.bitmap(TIER) == bits_of([1, 2])
+
+
+    def test_checks_the_file_at_most_every_interval(self, path):
+        loader = BitmapIndexLoader(path, interval=3600)
+        first = loader.current()
+        write_index(path, 8, [], {})
+        assert loader.current() is first
+
+
+    def test_unreadable_file_gives_none(self, tmp_path):
+        path = tmp_path / "merchant_bitmaps.idx"
+        path.write_bytes(b"garbage")
+        assert BitmapIndexLoader(path, interval=0).current() is None
@@ -0,0 +1,150 @@
+"""
+unit tests for the columnar snapshot files (src/services/column_snapshot.py).
+
+run the test with: uv run pytest tests/services/test_column_snapshot.py -v
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.services.column_snapshot import (  # noqa: E402
+    CURRENT,
+    ColumnSnapshotStore,
+    current_snapshot,
+    open_snapshot,
+    read_column,
+    write_column,
+    write_snapshot,
+)
+from src.services.columnar import _NAT, ActivityColumns  # noqa: E402
+
+
+ROWS = [
+    ("MRC-001", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS", 0, 1_704_844_800_000_000),
+    ("MRC-002", "POS", "CARD_TRANSACTION", "FAILED", 150_050, 1_707_523_200_000_000),
+    ("MRC-001", "AIRTIME", "AIRTIME_PURCHASE", "SUCCESS", 5_000, _NAT),
+]
+
+
+def columns(version, rows=ROWS):
+    return ActivityColumns.from_rows(rows, version=version, filenode=16384, last_ctid=f"(0,{len(rows)})")
+
+
+
+class TestColumnFiles:
+
+
+    @pytest.mark.parametrize("values, dictionary", [
+        (np.array([2, 0, 1], dtype=np.int32), ["a", "b", "c"]),
+        (np.array([1, -5, 2 ** 40], dtype=np.int64), None),
+        (np.array(["2024-01-01T00:00", "NaT"], dtype="datetime64[us]"), None),
+        (np.array([], dtype=np.int32), []),
+    ])
+    def test_round_trip(self, tmp_path, values, dictionary):
+        path = tmp_path / "column.col"
+        write_column(path, values, dictionary)
+        read, read_dictionary = read_column(path)
+        assert read.dtype == values.dtype
+        assert read.tolist() == values.tolist()
+        assert read_dictionary == (dictionary or [])
+
+
+    def test_values_are_a_read_only_map(self, tmp_path):
+        path = tmp_path / "column.col"
+        write_column(path, np.arange(5, dtype=np.int64), ["x"])
+        values, _ = read_column(path)
+        assert not values.flags.writeable
+        # the values start 8-byte aligned, after the header and the dictionary.
+        assert values.ctypes.data % 8 == 0
+
+
+    def test_not_a_column_rejected(self, tmp_path):
+        path = tmp_path / "column.col"
+        path.write_bytes(b"x" * 64)
+        with pytest.raises(ValueError):
+            read_column(path)
+
+
+
+class TestSnapshots:
+
+
+    def test_round_trip(self, tmp_path):
+        directory = write_snapshot(tmp_path, columns(4))
+        assert current_snapshot(tmp_path) == directory
+        assert directory.name.startswith("v000000000004-")
+
+        snapshot = open_snapshot(directory)
+        assert (snapshot.version, snapshot.rows, snapshot.filenode, snapshot.last_ctid) == (4, 3, 16384, "(0,3)")
+        assert snapshot.dictionaries["merchant_id"] == ["MRC-001", "MRC-002"]
+        assert snapshot.codes["product"].tolist() == [0, 1, 2]
+        assert snapshot.amount.tolist() == [0, 150_050, 5_000]
+        assert np.isnat(snapshot.timestamp).tolist() == [False, False, True]
+
+
+    def test_appending_to_a_snapshot(self, tmp_path):
+        snapshot = open_snapshot(write_snapshot(tmp_path, columns(4, ROWS[:2])))
+        appended = ActivityColumns.from_rows(ROWS[2:], snapshot, version=5)
+        assert open_snapshot(write_snapshot(tmp_path, appended)).amount.tolist() == [0, 150_050, 5_000]
+        # the earlier snapshot is left as it was.
+        assert snapshot.rows == 2
+
+
+    def test_keeps_the_newest_snapshots(self, tmp_path):
+        for version in range(1, 5):
+            write_snapshot(tmp_path, columns(version), keep=2)
+
+        names = sorted(path.name for path in tmp_path.iterdir())
+        assert names[0] == CURRENT
+        assert [name[:13] for name in names[1:]] == ["v000000000003", "v000000000004"]
+
+
+    def test_nothing_written_yet(self, tmp_path):
+        assert current_snapshot(tmp_path) is None
+        assert current_snapshot(tmp_path / "missing") is None
+
+
+
+class TestColumnSnapshotStore:
+
+
+    def test_no_snapshot_gives_none(self, tmp_path):
+        store = ColumnSnapshotStore(tmp_path, interval=0)
+        assert store.columns is None
+        assert store.stats()["snapshot"] is None
+
+
+    def test_switches_to_a_new_snapshot(self, tmp_path):
+        write_snapshot(tmp_path, columns(4))
+        store = ColumnSnapshotStore(tmp_path, interval=0)
+        first = store.columns
+        assert first.version == 4
+        assert store.columns is first
+
+        write_snapshot(tmp_path, columns(5))
+        assert store.columns.version == 5
+        assert store.stats()["refreshes"] == 2
+        # requests that still hold the previous columns keep using them.
+        assert first.amount.tolist() == [0, 150_050, 5_000]
+
+
+    def test_checks_at_most_every_interval(self, tmp_path):
+        write_snapshot(tmp_path, columns(4))
+        store = ColumnSnapshotStore(tmp_path, interval=3600)
+        assert store.columns.version == 4
+
+        write_snapshot(tmp_path, columns(5))
+        store.request_refresh()
+        assert store.columns.version == 4
+        assert store.refresh().version == 5
+
+
+    def test_unreadable_snapshot_keeps_the_last_one(self, tmp_path):
+        write_snapshot(tmp_path, columns(4))
+        store = ColumnSnapshotStore(tmp_path, interval=0)
+        assert store.columns.version == 4
+
+        (tmp_path / CURRENT).write_text("v000000000005-gone\n")
+        assert store.columns.version == 4
+        assert store.stats()["failures"] == 1
@@ -0,0 +1,201 @@
+"""
+unit tests for the columnar analytics engine (src/services/columnar.py).
+
+the columns are built in memory from rows; no database connection is required. skipped when numpy is not installed.
+
+run the test with: uv run pytest tests/services/test_columnar.py -v
+"""
+
+import pytest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+from sqlalchemy.orm import Session
+
+np = pytest.importorskip("numpy")
+
+from src.services.columnar import _NAT, ActivityColumns, ColumnarAnalyticsService, ColumnarStore  # noqa: E402
+
+
+def micros(year, month, day):
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp() * 1_000_000)
+
+
+JAN, FEB = micros(2024, 1, 10), micros(2024, 2, 10)
+
+ROWS = [
+    # merchant, product, event_type, status, amount in kobo, timestamp
+    ("MRC-001", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS", 0, JAN),
+    ("MRC-001", "KYC", "VERIFICATION_COMPLETED", "SUCCESS", 0, JAN),
+    ("MRC-001", "KYC", "TIER_UPGRADE", "SUCCESS", 0, FEB),
+    ("MRC-002", "KYC", "DOCUMENT_SUBMITTED", "SUCCESS", 0, FEB),
+    ("MRC-002", "POS", "CARD_TRANSACTION", "SUCCESS", 150_050, FEB),
+    ("MRC-002", "POS", "CARD_TRANSACTION", "FAILED", 99_999_900, FEB),
+    ("MRC-003", "POS", "CARD_TRANSACTION", "SUCCESS", 100_025, JAN),
+    ("MRC-003", "AIRTIME", "AIRTIME_PURCHASE", "SUCCESS", 5_000, _NAT),
+    ("MRC-003", "AIRTIME", "AIRTIME_PURCHASE", "PENDING", 5_000, JAN),
+    ("MRC-004", "AIRTIME", "AIRTIME_PURCHASE", "FAILED", 5_000, JAN),
+]
+
+
+@pytest.fixture
+def db():
+    return MagicMock(spec=Session)
+
+
+@pytest.fixture
+def store():
+    """a store holding ROWS at data version 3."""
+
+    store = MagicMock(spec=ColumnarStore)
+    store.columns = ActivityColumns.from_rows(ROWS, version=3)
+    return store
+
+
+@pytest.fixture
+def versions():
+    versions = MagicMock()
+    versions.current.return_value = 3
+    return versions
+
+
+@pytest.fixture
+def service(db, store, versions):
+    return ColumnarAnalyticsService(db, store, versions)
+
+
+
+class TestActivityColumns:
+
+
+    def test_dictionary_encodes_strings(self):
+        columns = ActivityColumns.from_rows(ROWS)
+        assert columns.rows == len(ROWS)
+        assert columns.dictionaries["product"] == ["KYC", "POS", "AIRTIME"]
+        assert columns.codes["product"].tolist() == [0, 0, 0, 0, 1, 1, 1, 2, 2, 2]
+        assert columns.code("status", "FAILED") == 1
+        assert columns.code("product", "CARDS") == -1
+
+
+    def test_missing_timestamp_is_nat(self):
+        columns = ActivityColumns.from_rows(ROWS)
+        assert np.isnat(columns.timestamp).tolist() == [i == 7 for i in range(len(ROWS))]
+
+
+    def test_appending_keeps_existing_codes(self):
+        first = ActivityColumns.from_rows(ROWS[:4], version=1)
+        second = ActivityColumns.from_rows(ROWS[4:], first, version=2, last_ctid="(9,1)")
+        assert second.version == 2
+        assert second.last_ctid == "(9,1)"
+        assert second.rows == len(ROWS)
+        assert second.dictionaries["product"][:1] == first.dictionaries["product"]
+        assert second.codes["merchant_id"][:4].tolist() == first.codes["merchant_id"].tolist()
+        assert second.amount.tolist() == ActivityColumns.from_rows(ROWS).amount.tolist()
+        # the earlier columns are left as they were.
+        assert first.rows == 4
+
+
+    def test_no_rows(self):
+        columns = ActivityColumns.from_rows([])
+        assert columns.rows == 0
+        assert columns.dictionaries["merchant_id"] == []
+
+
+
+class TestColumnarAnalyticsService:
+
+
+    def test_top_merchant_sums_successful_amounts(self, service, db):
+        assert service.get_top_merchant() == {"merchant_id": "MRC-002", "total_volume": 1500.50}
+        db.execute.assert_not_called()
+
+
+    def test_top_merchant_without_successes(self, db, versions):
+        store = MagicMock(columns=ActivityColumns.from_rows([ROWS[-1]], version=3))
+        service = ColumnarAnalyticsService(db, store, versions)
+        assert service.get_top_merchant() == {"merchant_id": None, "total_volume": 0.00}
+
+
+    def test_monthly_active_merchants_skip_events_without_timestamp(self, service):
+        assert service.get_monthly_active_merchants() == {"2024-01": 2, "2024-02": 2}
+
+
+    def test_product_adoption_sorted_by_count(self, service):
+        assert list(service.get_product_adoption().items()) == [("KYC", 2), ("POS", 2), ("AIRTIME", 2)]
+
+
+    def test_kyc_funnel(self, service):
+        assert service.get_kyc_funnel() == {
+            "documents_submitted": 2,
+            "verifications_completed": 1,
+            "tier_upgrades": 1,
+        }
+
+
+    def test_funnel_window_leaves_out_events_without_timestamp(self, service):
+        stages = [("KYC", "DOCUMENT_SUBMITTED"), ("POS", "CARD_TRANSACTION")]
+        assert [stage["merchants"] for stage in service.get_funnel(stages)] == [2, 2]
+        january = service.get_funnel(stages, start=datetime(2024, 1, 1), end=datetime(2024, 2, 1))
+        assert [stage["merchants"] for stage in january] == [1, 1]
+        assert january[1]["conversion_rate"] == 100.0
+
+
+    def test_merchant_overlap(self, service):
+        result = service.get_merchant_overlap([("KYC", "DOCUMENT_SUBMITTED"), ("POS", "CARD_TRANSACTION")])
+        assert result["merchants"] == 1
+        assert service.get_merchant_overlap([("KYC", "DOCUMENT_SUBMITTED"), ("CARDS", "X")])["merchants"] == 0
+
+
+    def test_failure_rates_sorted_descending(self, service):
+        # PENDING events are neither failed nor succeeded.
+        assert service.get_failure_rates() == [
+            {"product": "AIRTIME", "failure_rate": 50.0},
+            {"product": "POS", "failure_rate": 33.3},
+            {"product": "KYC", "failure_rate": 0.0},
+        ]
+
+
+    def test_summary_from_the_columns(self, service, db):
+        summary = service.get_summary()
+        assert summary["top_merchant"] == service.get_top_merchant()
+        assert summary["failure_rates"] == service.get_failure_rates()
+        assert list(summary) == ["top_merchant", "monthly_active_merchants", "product_adoption", "kyc_funnel", "failure_rates"]
+        db.execute.assert_not_called()
+
+
+    def test_lagging_store_refreshes_and_answers_live(self, service, store, versions, db):
+        versions.current.return_value = 4
+        db.execute.return_value.all.return_value = []
+        assert service.get_monthly_active_merchants() == {}
+        store.request_refresh.assert_called_once()
+        db.execute.assert_called_once()
+
+
+    def test_version_read_by_the_caller_is_used(self, store, versions, db):
+        """the async path reads the data version off the event loop and hands it in; versions is not asked again."""
+
+        service = ColumnarAnalyticsService(db, store, versions, version=3)
+        assert service.get_product_adoption() == {"KYC": 2, "POS": 2, "AIRTIME": 2}
+        versions.current.assert_not_called()
+        assert ColumnarAnalyticsService(db, store, versions, version=4)._columns() is None
+
+
+    def test_empty_store_refreshes_and_answers_live(self, service, store, db):
+        store.columns = None
+        db.execute.return_value.first.return_value = None
+        assert service.get_top_merchant() == {"merchant_id": None, "total_volume": 0.00}
+        store.request_refresh.assert_called_once()
+
+
+    def test_approx_and_ordered_run_on_the_database(self, service, store, db):
+        db.execute.return_value.all.return_value = []
+        service.get_product_adoption(approx=True)
+        db.execute.return_value.one.return_value = (0, 0)
+        service.get_funnel([("KYC", "DOCUMENT_SUBMITTED"), ("KYC", "TIER_UPGRADE")], ordered=True)
+        assert db.execute.call_count == 2
+        store.request_refresh.assert_not_called()
+
+
+    def test_invalid_funnels_rejected_before_any_work(self, service, db):
+        with pytest.raises(ValueError):
+            service.get_funnel([("KYC", "TIER_UPGRADE")], start=datetime(2024, 2, 1), end=datetime(2024, 1, 1))
+        db.execute.assert_not_called()
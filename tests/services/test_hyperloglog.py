@@ -0,0 +1,103 @@
+"""
+unit tests for the HyperLogLog sketch (src/services/hyperloglog.py), including its accuracy on the sample data in data/.
+
+run the test with: uv run pytest tests/services/test_hyperloglog.py -v
+"""
+
+from pathlib import Path
+import pytest
+from src.scripts.import_activities import _read_batches, sketch_members
+from src.services.hyperloglog import HyperLogLog
+
+
+SAMPLE_FILES = sorted((Path(__file__).resolve().parents[2] / "data").glob("activities_*.csv"))
+
+
+def sample_members(*paths):
+    """exact merchant_id sets per sketch key, as the importer sees them, for some sample files."""
+
+    members = {}
+    for path in paths:
+        for batch in _read_batches(path, {"skipped": 0}):
+            for key, merchant_ids in sketch_members(batch.rows).items():
+                members.setdefault(key, set()).update(merchant_ids)
+    return members
+
+
+@pytest.fixture(scope="module")
+def files():
+    """exact members of the first two sample files, each on its own."""
+
+    return sample_members(SAMPLE_FILES[0]), sample_members(SAMPLE_FILES[1])
+
+
+def sketch(values):
+    result = HyperLogLog()
+    result.update(values)
+    return result
+
+
+
+class TestHyperLogLog:
+
+
+    def test_small_cardinalities_are_exact(self):
+        assert HyperLogLog().count() == 0
+        assert sketch(f"MRC-{i:06d}" for i in range(100)).count() == 100
+
+
+    def test_adding_again_changes_nothing(self):
+        once = sketch(["MRC-1", "MRC-2"])
+        twice = sketch(["MRC-1", "MRC-2", "MRC-2", "MRC-1"])
+        assert once.to_bytes() == twice.to_bytes()
+
+
+    def test_merge_is_the_sketch_of_the_union(self):
+        left = sketch(f"MRC-{i}" for i in range(3000))
+        right = sketch(f"MRC-{i}" for i in range(2000, 6000))
+
+        left.merge(right)
+        assert left.to_bytes() == sketch(f"MRC-{i}" for i in range(6000)).to_bytes()
+
+
+    def test_error_within_bounds_at_large_cardinality(self):
+        estimate = sketch(str(i) for i in range(200_000)).count()
+        assert abs(estimate - 200_000) / 200_000 < 3 * HyperLogLog().standard_error
+
+
+    def test_round_trips_through_bytes(self):
+        original = sketch(["MRC-1"])
+        restored = HyperLogLog.from_bytes(original.to_bytes())
+        assert (restored.precision, restored.count()) == (original.precision, 1)
+
+
+    def test_rejects_mismatched_registers(self):
+        with pytest.raises(ValueError):
+            HyperLogLog(10, bytes(100))
+        with pytest.raises(ValueError):
+            HyperLogLog(10).merge(HyperLogLog(12))
+
+
+
+@pytest.mark.skipif(len(SAMPLE_FILES) < 2, reason="sample data not present")
+class TestSketchesOnSampleData:
+    """the sketches the importer builds answer within the documented error of the exact distinct counts."""
+
+
+    def test_estimates_match_exact_counts(self, files):
+        assert {dimension for dimension, _ in files[0]} == {"month", "product"}
+
+        bound = 3 * HyperLogLog().standard_error
+        for key, merchant_ids in files[0].items():
+            exact = len(merchant_ids)
+            assert abs(sketch(merchant_ids).count() - exact) <= bound * exact, key
+
+
+    def test_per_file_sketches_merge_to_the_whole(self, files):
+        """what two import workers merge into the table equals one sketch over both files."""
+
+        first, second = files
+        for key in first.keys() | second.keys():
+            merged = sketch(first.get(key, ()))
+            merged.merge(sketch(second.get(key, ())))
+            assert merged.to_bytes() == sketch(first.get(key, set()) | second.get(key, set())).to_bytes()
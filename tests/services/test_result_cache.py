@@ -0,0 +1,591 @@
+"""
+unit tests for the analytics result cache (src/services/cache.py).
+
+the clock is injected and the database session and engine are mocked, so no real database is required.
+
+run the test with: uv run pytest tests/services/test_result_cache.py -v
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import pytest
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+from src.services.analytics import AnalyticsService, AsyncAnalyticsService
+from src.services.cache import AsyncCachedAnalyticsService, CachedAnalyticsService, DataVersionTracker, ResultCache, Revalidator, SharedResultCache
+from src.services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+class FakeClock:
+    """a clock the test moves forward by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return ResultCache(max_entries=2, ttl=60.0, clock=clock)
+
+
+def publish_repeatedly(directory, count):
+    """a worker process overwriting one entry with values of different sizes."""
+    cache = SharedResultCache(directory)
+    for i in range(count):
+        cache.put("failure-rates", [{"product": "POS", "failure_rate": float(i)}] * (1 + i % 50), version=1)
+
+
+
+class TestResultCache:
+
+
+    def test_hit_at_same_version_within_ttl(self, cache):
+        cache.put("a", {"x": 1}, version=5)
+        assert cache.get("a", 5).value == {"x": 1}
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+    def test_new_data_version_is_a_miss(self, cache):
+        cache.put("a", 1, version=5)
+        assert cache.get("a", 6) is None
+        assert cache.stats()["entries"] == 0
+
+
+    def test_expired_entry_is_a_miss(self, cache, clock):
+        cache.put("a", 1, version=5)
+        clock.now += 60.0
+        assert cache.get("a", 5) is None
+        assert cache.misses == 1
+
+
+    def test_least_recently_used_entry_is_evicted(self, cache):
+        cache.put("a", 1, version=1)
+        cache.put("b", 2, version=1)
+        cache.get("a", 1)
+        cache.put("c", 3, version=1)
+
+        assert cache.get("b", 1) is None
+        assert cache.get("a", 1).value == 1
+        assert cache.stats()["evictions"] == 1
+
+
+    def test_stale_lookup_ignores_version_but_not_ttl(self, cache, clock):
+        cache.put("a", 1, version=1)
+        assert cache.get_stale("a").version == 1
+
+        clock.now += 15
+        assert cache.age(cache.get_stale("a")) == 15
+        clock.now += 45
+        assert cache.get_stale("a") is None
+
+
+    def test_concurrent_use_keeps_counts(self):
+        cache = ResultCache(max_entries=16)
+
+        def work(n):
+            for i in range(1000):
+                key = (n, i % 20)
+                if cache.get(key, 1) is None:
+                    cache.put(key, i, 1)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        assert stats["hits"] + stats["misses"] == 4000
+        assert stats["entries"] <= 16
+
+
+
+class TestSharedResultCache:
+
+
+    @pytest.fixture
+    def shared(self, tmp_path, clock):
+        return SharedResultCache(tmp_path, max_entries=3, ttl=60.0, max_bytes=10_000, clock=clock)
+
+
+    def test_entry_published_by_one_worker_is_a_hit_in_another(self, tmp_path, shared, clock):
+        shared.put(("get_top_merchant", (), ()), {"merchant_id": "MRC-001", "total_volume": 1.5}, version=2)
+
+        other = SharedResultCache(tmp_path, clock=clock)
+        entry = other.get(("get_top_merchant", (), ()), 2)
+        assert entry.value == {"merchant_id": "MRC-001", "total_volume": 1.5}
+        assert (other.hits, shared.hits) == (1, 0)
+
+
+    def test_keyed_by_parameters_and_version(self, shared):
+        shared.put(("get_funnel", (("KYC", "TIER_UPGRADE"),), (("ordered", False),)), [1], version=2)
+
+        assert shared.get(("get_funnel", (("KYC", "TIER_UPGRADE"),), (("ordered", True),)), 2) is None
+        assert shared.get(("get_funnel", (("KYC", "TIER_UPGRADE"),), (("ordered", False),)), 3) is None
+
+
+    def test_only_older_versions_are_removed(self, shared):
+        """a worker that has not seen the new version yet must not delete entries computed at it."""
+
+        shared.put("a", 1, version=5)
+        assert shared.get("a", 4) is None
+        assert shared.stats()["entries"] == 1
+        assert shared.get("a", 6) is None
+        assert shared.stats()["entries"] == 0
+
+
+    def test_expired_entry_is_a_miss(self, shared, clock):
+        shared.put("a", 1, version=1)
+        clock.now += 60
+        assert shared.get("a", 1) is None
+
+
+    def test_least_recently_used_evicted_beyond_max_entries(self, shared, tmp_path):
+        for i, key in enumerate("abc"):
+            shared.put(key, i, version=1)
+            os.utime(shared._path(key), (100 + i, 100 + i))
+        shared.get("a", 1)
+
+        shared.put("d", 3, version=1)
+        assert shared.get("b", 1) is None
+        assert shared.get("a", 1) is not None
+        assert shared.evictions == 1
+
+
+    def test_size_bounded(self, shared):
+        for key in "abc":
+            shared.put(key, "x" * 4000, version=1)
+
+        stats = shared.stats()
+        assert stats["size_bytes"] <= 10_000
+        assert stats["entries"] == 2
+
+
+    def test_value_larger_than_the_bound_is_not_cached(self, shared):
+        shared.put("a", "x" * 20_000, version=1)
+        assert shared.stats()["entries"] == 0
+
+
+    def test_failed_publish_leaves_previous_entry_and_no_temporary_file(self, shared, tmp_path, monkeypatch):
+        shared.put("a", "old", version=1)
+        monkeypatch.setattr(os, "replace", lambda src, dst: (_ for _ in ()).throw(OSError("disk full")))
+
+        with pytest.raises(OSError):
+            shared.put("a", "new", version=1)
+        assert shared.get("a", 1).value == "old"
+        assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+    def test_unreadable_entry_is_dropped(self, shared):
+        shared._path("a").write_bytes(b"{not json")
+        assert shared.get("a", 1) is None
+        assert not shared._path("a").exists()
+
+
+    def test_readers_never_see_a_torn_entry(self, tmp_path):
+        """while other processes keep replacing an entry, every read is a miss or a complete value."""
+
+        writers = [multiprocessing.Process(target=publish_repeatedly, args=(tmp_path, 300)) for _ in range(2)]
+        for writer in writers:
+            writer.start()
+
+        reader = SharedResultCache(tmp_path)
+        while any(writer.is_alive() for writer in writers):
+            entry = reader.get("failure-rates", 1)
+            if entry is not None:
+                assert len({row["failure_rate"] for row in entry.value}) == 1
+        for writer in writers:
+            writer.join()
+            assert writer.exitcode == 0
+        assert len({row["failure_rate"] for row in reader.get("failure-rates", 1).value}) == 1
+
+
+
+class TestDataVersionTracker:
+
+
+    @pytest.fixture
+    def engine(self):
+        engine = MagicMock()
+        self.connection = engine.connect.return_value.__enter__.return_value
+        self.connection.execute.return_value.scalar.return_value = 7
+        return engine
+
+
+    def test_version_read_at_most_once_per_interval(self, engine, clock):
+        versions = DataVersionTracker(engine, interval=1.0, clock=clock)
+
+        assert versions.current() == 7
+        self.connection.execute.return_value.scalar.return_value = 8
+        clock.now += 0.5
+        assert versions.current() == 7
+        clock.now += 0.5
+        assert versions.current() == 8
+        assert engine.connect.call_count == 2
+
+
+    def test_missing_table_is_version_zero(self, engine, clock):
+        self.connection.execute.side_effect = ProgrammingError("SELECT", {}, Exception("no such table"))
+        assert DataVersionTracker(engine, clock=clock).current() == 0
+
+
+    def test_unreachable_database_keeps_last_version(self, engine, clock):
+        versions = DataVersionTracker(engine, interval=1.0, clock=clock)
+        versions.current()
+
+        self.connection.execute.side_effect = OperationalError("SELECT", {}, Exception("gone"))
+        clock.now += 5
+        assert versions.current() == 7
+
+
+
+    def test_unreachable_database_tried_once_per_interval(self, engine, clock):
+        engine.connect.side_effect = OperationalError("connect", {}, Exception("connection refused"))
+        versions = DataVersionTracker(engine, interval=1.0, clock=clock)
+
+        assert [versions.current() for _ in range(5)] == [0] * 5
+        assert engine.connect.call_count == 1
+        clock.now += 1.0
+        assert [versions.current() for _ in range(5)] == [0] * 5
+        assert engine.connect.call_count == 2
+
+
+    def test_others_keep_the_last_version_while_one_reads(self, engine, clock):
+        versions = DataVersionTracker(engine, interval=1.0, clock=clock)
+        versions.current()
+        reading, release = threading.Event(), threading.Event()
+
+        def slow_read(*args):
+            reading.set()
+            release.wait(5)
+            return MagicMock(scalar=MagicMock(return_value=8))
+
+        self.connection.execute.side_effect = slow_read
+        clock.now += 1.0
+        reader = threading.Thread(target=versions.current)
+        reader.start()
+        assert reading.wait(5)
+
+        assert [versions.current() for _ in range(3)] == [7] * 3
+        release.set()
+        reader.join(5)
+        assert versions.current() == 8
+        assert engine.connect.call_count == 2
+
+
+
+class TestCachedAnalyticsService:
+
+
+    @pytest.fixture
+    def db(self):
+        return MagicMock(spec=Session)
+
+
+    @pytest.fixture
+    def versions(self):
+        versions = MagicMock(spec=DataVersionTracker)
+        versions.current.return_value = 1
+        return versions
+
+
+    def test_hit_never_touches_the_session(self, db, cache, versions):
+        first = CachedAnalyticsService(AnalyticsService(db), cache, versions)
+        db.execute.return_value.all.return_value = []
+        first.get_failure_rates()
+
+        # a later request with its own session is answered from the cache.
+        other_db = MagicMock(spec=Session)
+        assert CachedAnalyticsService(AnalyticsService(other_db), cache, versions).get_failure_rates() == []
+        assert other_db.mock_calls == []
+
+
+    def test_funnel_cached_per_parameters(self, cache, versions):
+        service = MagicMock(spec=AnalyticsService)
+        service.get_funnel.return_value = []
+        cached = CachedAnalyticsService(service, cache, versions)
+
+        cached.get_funnel([("KYC", "DOCUMENT_SUBMITTED")])
+        cached.get_funnel([("KYC", "DOCUMENT_SUBMITTED")])
+        cached.get_funnel([("KYC", "DOCUMENT_SUBMITTED")], ordered=True)
+
+        assert service.get_funnel.call_count == 2
+
+
+    def test_summary_cached_as_one_result(self, cache, versions):
+        service = MagicMock(spec=AnalyticsService)
+        service.get_summary.return_value = {"top_merchant": {"merchant_id": None, "total_volume": 0.0}}
+        cached = CachedAnalyticsService(service, cache, versions)
+
+        assert cached.get_summary() == cached.get_summary()
+        service.get_summary.assert_called_once()
+
+
+    def test_errors_are_not_cached(self, cache, versions):
+        service = MagicMock(spec=AnalyticsService)
+        service.get_top_merchant.side_effect = [RuntimeError("Database is unreachable."), {"merchant_id": None}]
+        cached = CachedAnalyticsService(service, cache, versions)
+
+        with pytest.raises(RuntimeError):
+            cached.get_top_merchant()
+        assert cached.get_top_merchant() == {"merchant_id": None}
+
+
+    def test_shared_backend_round_trips_results(self, tmp_path, versions):
+        """what comes back from another worker is the same JSON the endpoint would send."""
+
+        service = MagicMock(spec=AnalyticsService)
+        service.get_product_adoption.return_value = {"POS": 10, "KYC": 3}
+        CachedAnalyticsService(service, SharedResultCache(tmp_path), versions).get_product_adoption()
+
+        other = MagicMock(spec=AnalyticsService)
+        assert CachedAnalyticsService(other, SharedResultCache(tmp_path), versions).get_product_adoption() == {"POS": 10, "KYC": 3}
+        other.get_product_adoption.assert_not_called()
+
+
+    def test_concurrent_misses_run_one_query(self, cache, versions):
+        """requests that miss together wait for the first one's query, which also fills the cache."""
+
+        release = threading.Event()
+        service = MagicMock(spec=AnalyticsService)
+        service.get_top_merchant.side_effect = lambda: release.wait() and {"merchant_id": "MRC-001"}
+        flights = SingleFlight()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(CachedAnalyticsService(service, cache, versions, flights).get_top_merchant())
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        while flights.coalesced < 7:
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == [{"merchant_id": "MRC-001"}] * 8
+        service.get_top_merchant.assert_called_once()
+        assert cache.stats()["entries"] == 1
+
+
+    def test_coalesces_without_a_cache(self, versions):
+        service = MagicMock(spec=AnalyticsService)
+        service.get_failure_rates.return_value = []
+        cached = CachedAnalyticsService(service, None, versions, SingleFlight())
+
+        assert cached.get_failure_rates() == []
+        assert cached.get_failure_rates() == []
+        assert service.get_failure_rates.call_count == 2
+        versions.current.assert_not_called()
+
+
+
+class TestAsyncCachedAnalyticsService:
+
+
+    @pytest.fixture
+    def versions(self):
+        versions = MagicMock(spec=DataVersionTracker)
+        versions.current.return_value = 1
+        return versions
+
+
+    @pytest.fixture
+    def service(self):
+        service = MagicMock(spec=AsyncAnalyticsService)
+        service.get_failure_rates.return_value = [{"product": "POS", "failure_rate": 1.0}]
+        return service
+
+
+    def test_miss_is_awaited_and_cached(self, cache, versions, service):
+        served = []
+        cached = AsyncCachedAnalyticsService(service, cache, versions, on_served=lambda *a: served.append(a))
+
+        assert asyncio.run(cached.get_failure_rates()) == asyncio.run(cached.get_failure_rates())
+        service.get_failure_rates.assert_awaited_once()
+        assert served == [(0.0, False), (0.0, False)]
+
+
+    def test_new_data_version_recomputes(self, cache, versions, service):
+        cached = AsyncCachedAnalyticsService(service, cache, versions)
+        asyncio.run(cached.get_funnel([["KYC", "DOCUMENT_SUBMITTED"]]))
+        versions.current.return_value = 2
+        asyncio.run(cached.get_funnel([("KYC", "DOCUMENT_SUBMITTED")]))
+
+        assert service.get_funnel.await_count == 2
+        assert service.get_funnel.await_args.args == ((("KYC", "DOCUMENT_SUBMITTED"),),)
+
+
+    def test_concurrent_misses_share_one_query(self, cache, versions, service):
+        async def failure_rates():
+            await asyncio.sleep(0.01)
+            return []
+
+        service.get_failure_rates.side_effect = failure_rates
+        flights = AsyncSingleFlight()
+        cached = AsyncCachedAnalyticsService(service, None, versions, flights)
+
+        async def main():
+            return await asyncio.gather(*(cached.get_failure_rates() for _ in range(4)))
+
+        assert asyncio.run(main()) == [[]] * 4
+        service.get_failure_rates.assert_awaited_once()
+        assert flights.coalesced == 3
+
+
+    def test_version_check_and_cache_io_run_off_the_event_loop(self, cache, versions, service):
+        threads = {}
+
+        def record(name, method):
+            def wrapper(*args, **kwargs):
+                threads.setdefault(name, set()).add(threading.get_ident())
+                return method(*args, **kwargs)
+            return wrapper
+
+        versions.current.side_effect = record("current", lambda: 1)
+        cache.get = record("get", cache.get)
+        cache.put = record("put", cache.put)
+        cached = AsyncCachedAnalyticsService(service, cache, versions)
+
+        async def main():
+            loop_thread = threading.get_ident()
+            await cached.get_failure_rates()
+            await cached.get_failure_rates()
+            return loop_thread
+
+        loop_thread = asyncio.run(main())
+        assert set(threads) == {"current", "get", "put"}
+        assert all(loop_thread not in idents for idents in threads.values())
+
+
+
+class TestStaleWhileRevalidate:
+    """CachedAnalyticsService with a Revalidator: stale results are served while recomputed in the background."""
+
+
+    @pytest.fixture
+    def versions(self):
+        versions = MagicMock(spec=DataVersionTracker)
+        versions.current.return_value = 1
+        return versions
+
+
+    @pytest.fixture
+    def background(self):
+        """the service the revalidator's background threads use."""
+
+        service = MagicMock(spec=AnalyticsService)
+        service.get_top_merchant.return_value = {"merchant_id": "MRC-NEW"}
+        return service
+
+
+    @pytest.fixture
+    def revalidator(self, cache, background):
+        @contextmanager
+        def service_factory():
+            yield background
+
+        revalidator = Revalidator(cache, service_factory, soft_ttl=10.0)
+        yield revalidator
+        revalidator.shutdown()
+
+
+    @pytest.fixture
+    def request_service(self):
+        service = MagicMock(spec=AnalyticsService)
+        service.get_top_merchant.return_value = {"merchant_id": "MRC-OLD"}
+        return service
+
+
+    @staticmethod
+    def settle(revalidator):
+        deadline = time.monotonic() + 5
+        while revalidator.stats()["pending"]:
+            assert time.monotonic() < deadline, "background recomputation did not finish"
+            time.sleep(0.001)
+
+
+    def served(self, request_service, cache, versions, revalidator):
+        served = []
+        cached = CachedAnalyticsService(request_service, cache, versions, None, revalidator, lambda *a: served.append(a))
+        return cached.get_top_merchant(), served
+
+
+    def test_new_data_version_serves_stale_and_recomputes_in_background(self, cache, versions, revalidator, request_service, background):
+        self.served(request_service, cache, versions, revalidator)
+        versions.current.return_value = 2
+
+        value, served = self.served(request_service, cache, versions, revalidator)
+        assert value == {"merchant_id": "MRC-OLD"}
+        assert served == [(0.0, True)]
+        self.settle(revalidator)
+
+        value, served = self.served(request_service, cache, versions, revalidator)
+        assert value == {"merchant_id": "MRC-NEW"}
+        assert served == [(0.0, False)]
+        request_service.get_top_merchant.assert_called_once()
+        assert revalidator.stats()["refreshes"] == 1
+
+
+    def test_soft_ttl_marks_result_stale(self, cache, clock, versions, revalidator, request_service, background):
+        self.served(request_service, cache, versions, revalidator)
+        clock.now += 12
+
+        value, served = self.served(request_service, cache, versions, revalidator)
+        assert value == {"merchant_id": "MRC-OLD"}
+        assert served == [(12.0, True)]
+        self.settle(revalidator)
+        background.get_top_merchant.assert_called_once()
+
+
+    def test_hard_ttl_recomputes_synchronously(self, cache, clock, versions, revalidator, request_service, background):
+        self.served(request_service, cache, versions, revalidator)
+        clock.now += 60
+
+        _, served = self.served(request_service, cache, versions, revalidator)
+        assert served == [(0.0, False)]
+        assert request_service.get_top_merchant.call_count == 2
+        background.get_top_merchant.assert_not_called()
+
+
+    def test_one_background_recomputation_per_key(self, cache, versions, revalidator, request_service, background):
+        release = threading.Event()
+        background.get_top_merchant.side_effect = lambda: release.wait() and {"merchant_id": "MRC-NEW"}
+        self.served(request_service, cache, versions, revalidator)
+        versions.current.return_value = 2
+
+        for _ in range(5):
+            self.served(request_service, cache, versions, revalidator)
+        release.set()
+        self.settle(revalidator)
+        background.get_top_merchant.assert_called_once()
+
+
+    def test_failed_recomputation_keeps_serving_stale(self, cache, versions, revalidator, request_service, background):
+        background.get_top_merchant.side_effect = RuntimeError("Database is unreachable.")
+        self.served(request_service, cache, versions, revalidator)
+        versions.current.return_value = 2
+
+        self.served(request_service, cache, versions, revalidator)
+        self.settle(revalidator)
+
+        value, served = self.served(request_service, cache, versions, revalidator)
+        assert value == {"merchant_id": "MRC-OLD"}
+        assert served[0][1] is True
+        assert revalidator.stats()["failures"] >= 1
@@ -0,0 +1,156 @@
+"""
+unit tests for single-flight call coalescing (src/services/single_flight.py).
+
+run the test with: uv run pytest tests/services/test_single_flight.py -v
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from src.services.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def run_concurrently(flight, key, function, callers):
+    """start callers threads on one key; returns (threads, results) where results holds each value or exception."""
+
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, function))
+        except Exception as error:
+            results.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+
+class TestSingleFlight:
+
+
+    @pytest.fixture
+    def flight(self):
+        return SingleFlight()
+
+
+    def test_concurrent_identical_calls_run_once(self, flight):
+        release, runs = threading.Event(), []
+
+        def query():
+            runs.append(1)
+            release.wait()
+            return {"merchant_id": "MRC-001"}
+
+        threads, results = run_concurrently(flight, "top-merchant", query, 10)
+        wait_for(lambda: flight.coalesced == 9)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(runs) == 1
+        assert results == [{"merchant_id": "MRC-001"}] * 10
+        assert flight.stats() == {"calls": 1, "coalesced": 9, "failures": 0, "in_flight": 0}
+
+
+    def test_failure_reaches_every_waiter(self, flight):
+        release = threading.Event()
+
+        def query():
+            release.wait()
+            raise RuntimeError("Database is unreachable.")
+
+        threads, results = run_concurrently(flight, "failure-rates", query, 5)
+        wait_for(lambda: flight.coalesced == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 5
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.failures == 1
+
+
+    def test_different_keys_do_not_wait_for_each_other(self, flight):
+        release = threading.Event()
+        threads, _ = run_concurrently(flight, "top-merchant", release.wait, 1)
+        wait_for(lambda: flight.stats()["in_flight"] == 1)
+
+        assert flight.do("failure-rates", lambda: []) == []
+        release.set()
+        threads[0].join()
+        assert flight.coalesced == 0
+
+
+    def test_finished_call_is_not_reused(self, flight):
+        """coalescing is not caching: a call after the last one finished runs again."""
+
+        values = iter([1, 2])
+        assert flight.do("key", lambda: next(values)) == 1
+        assert flight.do("key", lambda: next(values)) == 2
+        assert flight.calls == 2
+
+
+    def test_key_is_released_after_a_failure(self, flight):
+        with pytest.raises(ValueError):
+            flight.do("key", lambda: int("x"))
+        assert flight.do("key", lambda: 3) == 3
+
+
+
+class TestAsyncSingleFlight:
+
+
+    @pytest.fixture
+    def flight(self):
+        return AsyncSingleFlight()
+
+
+    def test_concurrent_identical_awaits_run_once(self, flight):
+        runs = []
+
+        async def query():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return {"merchant_id": "MRC-001"}
+
+        async def main():
+            return await asyncio.gather(*(flight.do("top-merchant", query) for _ in range(10)))
+
+        assert asyncio.run(main()) == [{"merchant_id": "MRC-001"}] * 10
+        assert len(runs) == 1
+        assert flight.stats() == {"calls": 1, "coalesced": 9, "failures": 0, "in_flight": 0}
+
+
+    def test_failure_reaches_every_waiter(self, flight):
+        async def query():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("Database is unreachable.")
+
+        async def main():
+            return await asyncio.gather(*(flight.do("failure-rates", query) for _ in range(5)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.failures == 1
+
+
+    def test_finished_call_is_not_reused(self, flight):
+        values = iter([1, 2])
+
+        async def query():
+            return next(values)
+
+        assert asyncio.run(flight.do("key", query)) == 1
+        assert asyncio.run(flight.do("key", query)) == 2
+        assert flight.calls == 2
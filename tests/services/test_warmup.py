@@ -0,0 +1,113 @@
+"""
+unit tests for the start-up warm-up (src/services/warmup.py).
+
+the engine is mocked, so no real database is required.
+
+run the test with: uv run pytest tests/services/test_warmup.py -v
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.exc import OperationalError
+from src.services.warmup import WarmUp
+
+
+@pytest.fixture
+def engine():
+    engine = MagicMock(spec=Engine)
+    engine.pool = MagicMock()
+    engine.pool.size.return_value = 5
+    return engine
+
+
+
+class TestWarmUp:
+
+
+    def test_opens_connections_together_then_precomputes(self, engine):
+        precompute = MagicMock()
+        warmup = WarmUp(engine, 3, precompute)
+        assert (warmup.state, warmup.ready) == ("pending", False)
+
+        warmup.run()
+
+        connection = engine.connect.return_value
+        # all three were checked out at once: none was returned before the last one was opened.
+        calls = [name for name, _, _ in engine.mock_calls if name in ("connect", "connect().close")]
+        assert calls == ["connect"] * 3 + ["connect().close"] * 3
+        assert connection.execute.call_count == 3
+        precompute.assert_called_once()
+        assert (warmup.state, warmup.ready) == ("done", True)
+        assert warmup.seconds is not None
+
+
+    def test_never_opens_more_than_the_pool_keeps(self, engine):
+        WarmUp(engine, 50, MagicMock()).run()
+        assert engine.connect.call_count == 5
+
+
+    def test_failure_is_reported_and_does_not_block_readiness(self, engine):
+        engine.connect.side_effect = OperationalError("SELECT 1", {}, Exception("connection refused"))
+        precompute = MagicMock()
+        warmup = WarmUp(engine, 3, precompute)
+
+        warmup.run()
+
+        assert (warmup.state, warmup.ready) == ("failed", True)
+        precompute.assert_not_called()
+
+
+    def test_connections_returned_when_precompute_fails(self, engine):
+        warmup = WarmUp(engine, 2, MagicMock(side_effect=RuntimeError("Database is unreachable.")))
+        warmup.run()
+
+        assert warmup.state == "failed"
+        assert engine.connect.return_value.close.call_count == 2
+
+
+    def test_disabled_is_ready_and_never_runs(self, engine):
+        precompute = MagicMock()
+        warmup = WarmUp(engine, 3, precompute, enabled=False)
+        warmup.run()
+
+        assert (warmup.state, warmup.ready) == ("disabled", True)
+        engine.connect.assert_not_called()
+        precompute.assert_not_called()
+
+
+    def test_runs_once(self, engine):
+        precompute = MagicMock()
+        warmup = WarmUp(engine, 1, precompute)
+        warmup.run()
+        warmup.run()
+        precompute.assert_called_once()
+
+
+
+    def test_async_engine_warmed_on_the_event_loop(self, engine):
+        """with DATABASE_DRIVER=async the asyncpg pool that serves the requests is filled too, on the serving loop."""
+
+        connection = MagicMock(spec=AsyncConnection)
+        async_engine = MagicMock(spec=AsyncEngine)
+        async_engine.sync_engine.pool.size.return_value = 2
+        async_engine.connect = AsyncMock(return_value=connection)
+        warmup = WarmUp(engine, 3, MagicMock(), async_engine=async_engine)
+
+        async def serve():
+            await asyncio.to_thread(warmup.run, asyncio.get_running_loop())
+
+        asyncio.run(serve())
+
+        assert warmup.state == "done"
+        assert async_engine.connect.await_count == 2
+        assert (connection.execute.await_count, connection.close.await_count) == (2, 2)
+        assert engine.connect.call_count == 3
+
+
+    def test_async_engine_left_cold_without_a_loop(self, engine):
+        async_engine = MagicMock(spec=AsyncEngine)
+        WarmUp(engine, 3, MagicMock(), async_engine=async_engine).run()
+        async_engine.connect.assert_not_called()